@@ -4,7 +4,7 @@
   This product is preferred for conducting geochem data QA/QC and analysis.
 
   Input
-         1) TillDB path
+         1) TillDB path (MS Access, or SQLite stand-in, see storage_backend.py)
          2) Output file path
          3) BCGS mapsheet path
            
@@ -15,9 +15,10 @@
   Additonal info
          1) The structure of "data_sheet.csv" is the similar to the one derived from the lithoDB.
          
-         2) Sub-routine "get_ntssheet" is for NTS 50k map grid tag retrieval based on the given sample
-            location and NTS map grid shape file. Both of them are assumed using the same
-            spatial reference system: NAD83 geographic (EPSG code = 4269).
+         2) The NAD83 geographic and UTM coordinates of the samples are read from the 'data_sample_geo'
+            table, filled by the sample info data loader (see sample_geo.py). Only the samples missing from
+            it, or whose coordinates were edited since, are computed, in batches. The NTS map grid tag is
+            not used (no NTS map grid shape file given).
             
          3) Pyproj replaces OGR/OSR for coordinate re-projecting, because the later does not address
             datum shift during re-projection. 
@@ -42,6 +43,34 @@
             (analyzed by the same method). This caused 2 columns: "Au_ppb_MA" and "Au1_ppb_MA" being
             created in the data product file. So these all columns of this type in the data product file
             should be examined mannually.
+
+         7) The UTM coordinates are in the zone of each sample (NAD83 UTM zones 1 to 23). Run with
+            --utm-zone=N to project all the samples to zone N instead, e.g. for a map across two zones.
+
+         8) Run with --bbox=west,south,east,north (NAD83 long. and lat.) to create the data product of the
+            samples in a bounding box only, found with the grid spatial index of the samples (see
+            sample_index.py).
+
+         9) Run with --join=<shape file>,<field>[,<field>...] to add the values of the given attribute fields
+            of the polygon holding each sample (e.g. mineral tenure, geology unit), after the UTM columns.
+            The shape file is read once and the samples are joined in bulk (see spatial_join.py). Repeat
+            the option to join several shape files.
+
+        10) Run with --export=gpkg,fgb to also write the data product to GeoPackage ('data_sheet.gpkg', with
+            an R-tree spatial index) and/or FlatGeobuf ('data_sheet.fgb', with a packed Hilbert R-tree),
+            as NAD83 points, so that it opens in desktop GIS without conversion. The csv file is streamed
+            and the features are written in chunks (see product_export.py).
+
+        11) Run with --tiles=<column>[,<column>...] to also build vector tiles of the samples for the web
+            map ('data_sheet.mbtiles', MBTiles), with the values of the given columns (e.g. key analytes)
+            as attributes, or with --tiles for the locations only. The samples are thinned at low zoom
+            levels. On the next run, only the tiles of the samples added, changed or removed are built
+            again, all of them if the run has another --bbox (see product_tiles.py).
+
+        12) Run with --aris-reports[=k] to add the distance of each sample to the location of its ARIS
+            report (ARIS_Report_km, the nearest one for the samples of several reports) and its k nearest
+            other reports (ARIS_Nearest, 3 by default), after the joined columns. The report locations are
+            read once from min_aris.mdb or its csv export (see aris_report_index.py).
           
   Status
          Operational
@@ -52,106 +81,86 @@
   Future improvement
          1) The hardcoded maximum number of repeated headers (mentioned above) should be removed.
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, re, ogr, osr
-from pyproj import Proj, transform
+import os, sys, csv, re, datetime
+import query_profiler, storage_backend, sample_geo, sample_index, spatial_join, product_export, product_tiles
+import aris_report_index
 #========================================== Sub-routines =======================================
-#Get an attribute value from a given table based on a given key attribute
-#Syntax: get_name(db_cursor, string, string, string, int) return string
-def get_name(db_cur, fld_name, tab_name, key_name, key_val):
-    db_cur.execute('select %s from %s where %s = %s' %(fld_name, tab_name, key_name, key_val))
-    record = db_cur.fetchone()
-    if record == None:
+#Get an attribute value from a given code table based on a given key attribute (see reference_cache.py)
+#Syntax: get_name(ReferenceCache, string, string, string, int) return string
+def get_name(refcache, fld_name, tab_name, key_name, key_val):
+    values = refcache.lookup(tab_name, key_name, fld_name)
+    if key_val not in values:
         print 'No such ' + key_name + ' exists in ' + tab_name + ' table!'
         sys.exit()
     else:
-        return record[0]
-
-#Project input coordinates to NAD83 long. and lat.
-#Syntax: project2nad83(float, float, int) returns [float, float]
-def project2nad83 (source_x, source_y, source_epsg):
-
-    if source_epsg == 4269: #Already in NAD83 and no projection needed
-        return [source_x, source_y]
-    
-    else:
-        source_epsg = "+init=EPSG:" + str(source_epsg)
-        source_srf = Proj(source_epsg)
-        target_srf = Proj("+init=EPSG:4269")
-
-        target_x, target_y = transform(source_srf, target_srf, source_x, source_y)
-        
-        return [target_x, target_y]
-
-#Project a pair of NAD83 long. and lat. to NAD83_UTM coordinates
-#Syntax: project2utm(float, float) returns [int, int, int]
-def project2utm (nad83_long, nad83_lat):
-
-    #Determine UTM zone
-    utm_zone = 0
-    epsg_id = 0
-    if (nad83_long >= -144) and (nad83_long <= -138):
-        utm_zone = 7
-        epsg_id = 26907
-    elif (nad83_long >= -138) and (nad83_long <= -132):
-        utm_zone = 8
-        epsg_id = 26908
-    elif (nad83_long >= -132) and (nad83_long <= -126):
-        utm_zone = 9
-        epsg_id = 26909
-    elif (nad83_long >= -126) and (nad83_long <= -120):
-        utm_zone = 10
-        epsg_id = 26910
-    elif (nad83_long >= -120) and (nad83_long <= -114):
-        utm_zone = 11
-        epsg_id = 26911
-    
-    if (utm_zone == 0) or (epsg_id == 0):
-        return [-1, -1, -1]
-    else:
-        source_srf = Proj("+init=EPSG:4269")
-        target_epsg = "+init=EPSG:" + str(epsg_id)
-        target_srf = Proj(target_epsg)
+        return values[key_val]
 
-        target_x, target_y = transform(source_srf, target_srf, nad83_long, nad83_lat)
-
-        return [int(target_x), int(target_y), utm_zone]
-    
-#Get NTS 50k mapsheet based on the given lat and long
-#Syntax: get_ntssheet(str, float, float) return str
-def get_ntssheet(mapsheet_file, nad83_long, nad83_lat):    
-    driver = ogr.GetDriverByName("ESRI Shapefile")
-    dataSource = driver.Open(mapsheet_file, 0)
-    layer = dataSource.GetLayer()
-    for feature in layer:
-        geom = feature.GetGeometryRef()
-        bbox = geom.GetEnvelope()
-        sheet_tag = feature.GetField("map_tile")
-        if ((nad83_long >= bbox[0]) and (nad83_long < bbox[1]) and \
-            (nad83_lat >= bbox[2]) and (nad83_lat < bbox[3])):
-            return sheet_tag
-    return ' ' #indicating boundary fall (out of provincial boudary)
 #========================================================================================================
-def main():
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_sheet = 'C:\\Project\\ARIS_Geochem_dev\\exports\\data_sheet.csv'):
     #Input info
-    db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb'
-    data_sheet = 'C:\\Project\\ARIS_Geochem_dev\\exports\\data_sheet.csv'
+    qprofile_file = 'C:\\Project\\ARIS_Geochem_dev\\exports\\query_profile_aris_geochem_product_creator_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
     #nts_mapsheet = 'C:\\Project\\ProvinceData\\topo_data\\nts_50k\\grid_50k_nts_ll83_poly.shp'
     
     #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
+    db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('aris_geochem_product_creator', '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
     csv_output = open(data_sheet, 'wb')
     csv_writer = csv.writer(csv_output, delimiter = ',')
     
+    #Derived sample locations, the stale ones computed first, optionally in a single UTM zone (see
+    #Additional info 2 and 7)
+    qprofile.set_stage('sample locations')
+    geo = sample_geo.read_geo(cur)
+    for arg in sys.argv[1:]:
+        if arg.startswith('--utm-zone='):
+            geo = sample_geo.force_utm_zone(geo, int(arg.partition('=')[2]))
+
     #Get all "sample_id"s from 'data_sample' table
+    qprofile.set_stage('sample list')
     sample_list = []
     cur.execute("""select sample_id from data_sample order by sample_id""")
     all_records = cur.fetchall()
     for record in all_records:
         sample_list.append(record[0])
+
+    #Keep the samples in a bounding box only (run with --bbox=west,south,east,north, see Additional info 8)
+    bbox = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--bbox='):
+            sample_index.create_table(cur)
+            sample_index.update(cur)
+            cur.commit()
+            [west, south, east, north] = [float(val) for val in arg.partition('=')[2].split(',')]
+            bbox = [west, south, east, north]
+            subset = set(sample_index.SampleIndex(cur).bbox(west, south, east, north))
+            sample_list = [sample for sample in sample_list if sample in subset]
+            print str(len(sample_list)) + ' sample(s) in the bounding box'
+
+    #Attributes of the polygons holding the samples (run with --join=<shape file>,<field>[,<field>...], see
+    #Additional info 9)
+    qprofile.set_stage('spatial join')
+    join_headers = list()
+    join_args = spatial_join.get_join_args(sys.argv[1:])
+    if join_args:
+        [join_headers, joined] = spatial_join.join_samples(dict([[sample, geo[sample]] for sample in sample_list]),
+                                                           join_args)
+
+    #Distance to the ARIS report locations (run with --aris-reports[=k], see Additional info 12)
+    qprofile.set_stage('ARIS reports')
+    aris_headers = list()
+    aris_k = aris_report_index.get_product_args(sys.argv[1:])
+    if aris_k is not None:
+        [aris_headers, aris_columns] = aris_report_index.get_product_columns(cur, geo, sample_list, aris_k)
     #+++++++++++++++++++++++++++++++++ Construct "data_sheet.csv" header ++++++++++++++++++++++++++
     print 'Creating header row ...'
+    qprofile.set_stage('header row')
     #Working variale to store the maximum number of publications related to a single sample
     max_issue = 0
 
@@ -169,10 +178,10 @@ def main():
             analyte = record[0].replace(' ', '')
 
             #method_id = record[1]
-            #method_group = get_name(cur, 'method_abbr', 'code_method', 'method_id', method_id)
+            #method_group = get_name(refcache, 'method_abbr', 'code_method', 'method_id', method_id)
 
             #unit_id = record[1]
-            #unit_name = get_name(cur, 'name', 'code_unit', 'unit_id', unit_id)
+            #unit_name = get_name(refcache, 'name', 'code_unit', 'unit_id', unit_id)
 
             item = str(analyte)
 
@@ -215,6 +224,10 @@ def main():
     file_header.insert(14, 'UTM_Easting')
     file_header.insert(15, 'UTM_Northing')
     file_header.insert(16, 'UTM_Zone')
+    for j in range(len(join_headers)):
+        file_header.insert(17 + j, join_headers[j])
+    for j in range(len(aris_headers)):
+        file_header.insert(17 + len(join_headers) + j, aris_headers[j])
 
     #Add pub_issues (dynamic) to the file_header
     for issue in range(0, max_issue):
@@ -228,6 +241,7 @@ def main():
 
     #+++++++++++++++++++++++++++++++++++++++++ Create file content ++++++++++++++++++++++++++++++++++++++++
     print 'Constructing data rows ...'
+    qprofile.set_stage('data rows')
     for sample in sample_list:
         #Create a list to store all values to be writen as a row to the output csv file
         data_row = ['']*len(file_header)
@@ -245,14 +259,19 @@ def main():
         if data_row[12] <> '':
             data_row[12] = str(int(round(float(data_row[12]))))
 
-        #Project to NAD83 geographic if needed
-        [data_row[10], data_row[11]] = project2nad83 (float(sample_row[10]), float(sample_row[11]), int(sample_row[14]))
+        #NAD83 geographic and UTM coordinates
+        [data_row[10], data_row[11], data_row[14], data_row[15], data_row[16]] = geo[sample][:5]
+
+        #Attributes of the polygons holding the sample
+        for j in range(len(join_headers)):
+            data_row[17 + j] = joined[sample][j]
 
-        #Project to NAD83 UTM if needed
-        [data_row[15], data_row[16], data_row[17]] = project2utm(data_row[10], data_row[11])
+        #Distance to the ARIS report locations
+        for j in range(len(aris_headers)):
+            data_row[17 + len(join_headers) + j] = aris_columns[sample][j]
 
         #Get NTS mapsheet
-        #data_row[18] = get_ntssheet(nts_mapsheet, data_row[14], data_row[15])
+        #data_row[18] = geo[sample][5]
         
         #Retrieve and populate "analyte_method_unit_size" items (dynamic) in "data_row"         
         cur.execute("""select analyte, abundance, method_id, unit_id from vw_data_analyte_ppm
@@ -263,10 +282,10 @@ def main():
             abundance = record[1].replace('None', '')   #All missing values are treated as blank
 
             #method_id = record[2]
-            #method_group = get_name(cur, 'method_abbr', 'code_method', 'method_id', method_id)
+            #method_group = get_name(refcache, 'method_abbr', 'code_method', 'method_id', method_id)
 
             #unit_id = record[2]
-            #unit_name = get_name(cur, 'name', 'code_unit', 'unit_id', unit_id)
+            #unit_name = get_name(refcache, 'name', 'code_unit', 'unit_id', unit_id)
 
             item = str(analyte)# + '_' +str(unit_name)
             
@@ -305,6 +324,7 @@ def main():
         csv_writer.writerow(data_row)
 
     csv_output.close()
+    qprofile.report(qprofile_file)
     db_conn.close()
 
     '''
@@ -326,7 +346,7 @@ def main():
 
     #Create a temp csv file
     file_path = os.path.dirname(data_sheet)
-    temp_sheet = file_path + '\\temp_sheet.csv'
+    temp_sheet = os.path.join(file_path, 'temp_sheet.csv')
     temp_file = open(temp_sheet, 'wb')
     temp_writer = csv.writer(temp_file, delimiter = ',')
 
@@ -361,7 +381,7 @@ def main():
             p2 = curr_item[curr_item.find('_'):]
             new_header[i] = p1 + p2
 
-    temp_sheet = file_path + '\\temp_sheet.csv'
+    temp_sheet = os.path.join(file_path, 'temp_sheet.csv')
     new_file = open(temp_sheet, 'wb')
     new_writer = csv.writer(new_file, delimiter = ',')
     new_writer.writerow(new_header)              
@@ -432,7 +452,7 @@ def main():
 
     #Create a temp csv file and write out the new header row
     file_path = os.path.dirname(data_sheet)
-    temp_sheet = file_path + '\\temp_sheet.csv'
+    temp_sheet = os.path.join(file_path, 'temp_sheet.csv')
     new_file = open(temp_sheet, 'wb')
     new_writer = csv.writer(new_file, delimiter = ',')
     new_writer.writerow(new_header)
@@ -453,6 +473,16 @@ def main():
     os.remove(data_sheet)
     os.rename(temp_sheet, data_sheet)
 '''
+    #Spatial formats of the data product (run with --export=gpkg,fgb, see Additional info 10)
+    export_formats = product_export.get_export_args(sys.argv[1:])
+    if export_formats:
+        product_export.export(data_sheet, export_formats)
+
+    #Vector tiles of the data product (run with --tiles=<column>[,<column>...], see Additional info 11)
+    tiles_fields = product_tiles.get_tiles_args(sys.argv[1:])
+    if tiles_fields is not None:
+        product_tiles.build(data_sheet, tiles_fields, bbox)
+
     print 'Job done!'
     
 if __name__ == "__main__":
@@ -9,6 +9,7 @@
    Input
          1) Path to the directory containing the staged xlsx files
          2) Path to the aris geochem staginb database, ARIS_geochem_stage.accdb
+            (or its SQLite stand-in, see storage_backend.py)
          
   Output
          Data inserted into the above table in ARIS_geochem_stage.accdb
@@ -43,6 +44,22 @@
 
             All these problems are difficult to spot in data screening. They need to be examined visually in
             the final data products.
+
+         9) Each certificate is committed together with its row in the 'load_manifest' table (see
+            load_manifest.py). Files already loaded are skipped, and a file modified since it was loaded is
+            rejected: nothing is loaded until it is restored or renamed.
+
+        10) Run with --plan for a dry run: the new and the skipped (already in the database) certificates
+            are computed from an in-memory index of the database (see load_planner.py) and printed.
+            Nothing is written to the database.
+
+        11) The staged files are read by worker processes (--workers=N, default: number of CPUs - 1) and
+            written one after the other by this script while the next ones are being read, in the order
+            of the directory listing (see load_pipeline.py). The ids are assigned as in a serial load.
+
+        12) Run with --merge to load each certificate through a staging table (see load_merge.py): it is
+            merged with "insert ... select ... where not exists", the database engine checking that its
+            cert_no is not in the database yet.
   Status
       Operational
 
@@ -52,8 +69,9 @@
   Last update
       2017-06-07
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
+import query_profiler, storage_backend, load_manifest, load_planner, load_pipeline, load_merge
 #========================================== Sub-routines =================================================
 #Get next row number of a given field and table
 #Syntax: get_rownum(db_cursor, string, string) return int
@@ -65,53 +83,160 @@ def get_rownum(db_cur, fld_name, tab_name):
         return 1
     else:
         return int(max_val[0]) + 1
-    
-#============================================= Main routine =========================================
-
-db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb'
-data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Certificate\\'
-
-#Database connection
-db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
-cur = db_conn.cursor()
-
-#Collect all xls file name under the specified directory
-xls_list = os.listdir(data_dir)
 
-#Loop through each file in the drectory
-for f in range(len(xls_list)):
-    xls_name = data_dir + xls_list[f]
-
-    # Get next id value from table: 'data_cert'
-    cert_id = get_rownum(cur, 'cert_id', 'data_cert')
-
-    #Open and exam each xls file
-    wb = load_workbook(filename = xls_name)
+#Read the certificate of a staged file (run in the worker processes of the load pipeline, see
+#load_pipeline.py): [cert_no, cert_date, lab_id, prep_id]
+#Syntax: read_staged_file(string, string, int) returns list
+def read_staged_file(data_dir, xls_file, rows_loaded):
+    #Open and exam the xls file
+    wb = load_workbook(filename = data_dir + xls_file)
     ws = wb[wb.sheetnames[0]]
-    print xls_name + ' is being loaded ...'
 
-    #Step through the data rows (values are all read in as strings)
-    #-------------------------------------- Update the relevent table  -----------------------------------
     cert_no = str(ws.cell(row = 2, column = 1).value).replace(' ', '')
-    cur.execute("""select cert_id from data_cert where cert_id = ?""", cert_no)
-    check_cert = cur.fetchone()
+    cert_date = str(ws.cell(row = 2, column = 2).value)
+    lab_id = str(ws.cell(row=2, column=3).value).replace(' ', '')
+    prep_id = str(ws.cell(row=2, column=4).value).replace(' ', '')
+    return [cert_no, cert_date, lab_id, prep_id]
+
+#Staging table of the merge load path (see Additional info 12 and load_merge.py)
+STAGE_TABLES = [
+    ['load_stage_cert', [['cert_id', 'integer'], ['cert_no', 'varchar(255)'], ['cert_date', 'varchar(255)'],
+                         ['lab_id', 'integer'], ['prep_id', 'integer'], ['comments', 'varchar(255)']],
+     [['cert_no']]]]
+
+#Columns of the load plan (see Additional info 10)
+PLAN_COLUMNS = [['certs_new', 'new certs'], ['certs_skipped', 'certs in db']]
+
+#Compute the plan of the load from an in-memory index of the database, without writing anything
+#Syntax: plan_load(db_cursor, string, list, dict, int) returns LoadPlan
+def plan_load(db_cur, data_dir, load_list, next_ids, workers):
+    plan = load_planner.LoadPlan('aris_geochem_stagingdb_certificates_data_loader', PLAN_COLUMNS)
+
+    #Bulk index: certificate numbers already in the database
+    db_cur.execute("""select cert_no from data_cert""")
+    cert_nos = set([str(record[0]) for record in db_cur.fetchall()])
+
+    for [[data_dir, xls_file, rows_loaded], staged_file] in load_pipeline.read_files(read_staged_file,
+            [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list], workers):
+        cert_no = staged_file[0]
+
+        counts = plan.add_file(xls_file)
+        if cert_no in cert_nos:
+            counts['certs_skipped'] = counts['certs_skipped'] + 1
+        else:
+            counts['certs_new'] = counts['certs_new'] + 1
+            cert_nos.add(cert_no)
+            next_ids['cert_id'] = next_ids['cert_id'] + 1
+
+    return plan
+    
+#============================================= Main routine =========================================
+
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Certificate\\',
+         db_conn = None):
+    qprofile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\query_profile_aris_geochem_stagingdb_certificates_data_loader_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
+
+    #Database connection (shared with the other stages when run from aris_ingestion.py)
+    own_conn = db_conn is None
+    if own_conn:
+        db_conn = storage_backend.connect(db_path)
+    cur = db_conn.cursor()
+
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('aris_geochem_stagingdb_certificates_data_loader',
+                                           '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Collect all xls file name under the specified directory
+    xls_list = os.listdir(data_dir)
+
+    #Skip the files already loaded and reject the modified ones (see Additional
+    #info 9)
+    qprofile.set_stage('load manifest')
+    plan_mode = '--plan' in sys.argv[1:]
+    merge_mode = '--merge' in sys.argv[1:]
+    workers = load_pipeline.get_workers(sys.argv[1:])
+    manifest = load_manifest.LoadManifest(cur, 'aris_geochem_stagingdb_certificates_data_loader', data_dir, plan_mode)
+    [load_list, skipped, rejected] = manifest.check_files(xls_list)
+    if not manifest.report(skipped, rejected) and not plan_mode:
+        if own_conn:
+            db_conn.close()
+        sys.exit()
+
+    #Dry run: print the plan of the load and stop (see Additional info 10)
+    if plan_mode:
+        qprofile.set_stage('plan')
+        next_ids = {'cert_id': get_rownum(cur, 'cert_id', 'data_cert')}
+        plan = plan_load(cur, data_dir, load_list, next_ids, workers)
+        plan.report(skipped, rejected, next_ids)
+        qprofile.report(qprofile_file)
+        if own_conn:
+            db_conn.close()
+        return
+
+    #Merge load path: staging tables (see Additional info 12)
+    if merge_mode:
+        qprofile.set_stage('staging tables')
+        load_merge.create_stage_tables(cur, STAGE_TABLES)
+
+    #Loop through each file in the drectory. The files are read in worker processes while the previous ones
+    #are being written (see Additional info 11).
+    qprofile.set_stage('load files')
+    for [[data_dir, xls_file, rows_loaded], staged_file] in load_pipeline.read_files(read_staged_file,
+            [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list], workers):
+        [cert_no, cert_date, lab_id, prep_id] = staged_file
+        xls_name = data_dir + xls_file
+
+        # Get next id value from table: 'data_cert'
+        cert_id = get_rownum(cur, 'cert_id', 'data_cert')
+
+        print xls_name + ' is being loaded ...'
+        manifest.start(xls_file, 1, {'cert_id': cert_id})
+
+        #Merge the certificate in one transaction (see Additional info 12)
+        if merge_mode:
+            load_merge.clear_stage_tables(cur, STAGE_TABLES)
+            load_merge.copy_rows(cur, 'load_stage_cert', [[cert_id, cert_no, cert_date, int(lab_id), int(prep_id), '']])
+            cur.execute("""insert into data_cert select cert_id, cert_no, cert_date, lab_id, prep_id, comments
+                           from load_stage_cert s
+                           where not exists (select * from data_cert d where d.cert_no = s.cert_no)""")
+            if cur.rowcount == 0:
+                print xls_file + ' cert_no: ' + cert_no + ' is already in the database and will not be re-imported'
+            else:
+                manifest.checkpoint(xls_file, 1, {'cert_id': cert_id + 1})
+            cur.commit()
+            manifest.finish(xls_file)
+            continue
+
+        #-------------------------------------- Update the relevent table  -----------------------------------
+        cur.execute("""select cert_id from data_cert where cert_no = ?""", cert_no)
+        check_cert = cur.fetchone()
             
-    #The current certificate is already in 'data_cert' table (which won't be updated).
-    if check_cert <> None:
-        print xls_list[f] + ' cert_no: ' + cert_no + ' is already in the database and will not be re-imported'
-    #The current certificate is not in 'data_cert' table (which is to be updated)
-    else:
-        cert_date = str(ws.cell(row = 2, column = 2).value)
-        lab_id = str(ws.cell(row=2, column=3).value).replace(' ', '')
-        prep_id = str(ws.cell(row=2, column=4).value).replace(' ', '')
+        #The current certificate is already in 'data_cert' table (which won't be updated).
+        if check_cert <> None:
+            print xls_file + ' cert_no: ' + cert_no + ' is already in the database and will not be re-imported'
+        #The current certificate is not in 'data_cert' table (which is to be updated)
+        else:
+            #Assemble a row of values to be written to 'data_cert' table
+            cert_values = [cert_id, cert_no, cert_date, int(lab_id), int(prep_id), '']
 
-        #Assemble a row of values to be written to 'data_cert' table
-        cert_values = [cert_id, cert_no, cert_date, int(lab_id), int(prep_id), '']
+            #----------------------------- Add to the "data_cert" table ------------------------------------------
+            cur.execute("""insert into data_cert values (?, ?, ?, ?, ?, ?)""", cert_values)
+            manifest.checkpoint(xls_file, 1, {'cert_id': cert_id + 1})
+            cur.commit()
 
-        #----------------------------- Add to the "data_cert" table ------------------------------------------
-        cur.execute("""insert into data_cert values (?, ?, ?, ?, ?, ?)""", cert_values)
-        cur.commit()
+        manifest.finish(xls_file)
 
             
-db_conn.close()
-print 'Job done!'
+    if merge_mode:
+        load_merge.drop_stage_tables(cur, STAGE_TABLES)
+
+    qprofile.report(qprofile_file)
+    if own_conn:
+        db_conn.close()
+    print 'Job done!'
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@
    Input
          1) Path to the directory containing the staged xlsx files
          2) Path to the aris geochem staginb database, ARIS_geochem_stage.accdb
+            (or its SQLite stand-in, see storage_backend.py)
          
   Output
          Data inserted into the above 2 tables in ARIS_geochem_stage.accdb
@@ -43,6 +44,35 @@
 
             All these problems are difficult to spot in data screening. They need to be examined visually in
             the final data products.
+
+         9) The units, methods, certificates and samples of each staged file are resolved before any of its
+            rows is inserted, from the code tables and certificates read once for the batch and the samples
+            read once per AR number. A file with keys that can not be resolved is not loaded: its unresolved
+            keys are listed at the end of the run and the other files are loaded. The keys are compared
+            without case and surrounding blanks, as in the per-row Access queries they replace.
+
+        10) The inserts of each sample row are committed together with a checkpoint in the 'load_manifest'
+            table (see load_manifest.py). Files already loaded are skipped, a file partly loaded (e.g. the
+            script died halfway) is resumed after its last committed row, and a file modified since it was
+            loaded is rejected: nothing is loaded until it is restored or renamed.
+
+        11) Run with --plan for a dry run: the unresolved keys, and the new analyte rows and skipped
+            duplicates of each staged file, are computed from in-memory indexes of the database (see
+            load_planner.py) and printed. Nothing is written to the database.
+
+        12) The staged files are read by worker processes (--workers=N, default: number of CPUs - 1) and
+            written one after the other by this script while the next ones are being read, in the order
+            of the directory listing (see load_pipeline.py). The ids are assigned as in a serial load.
+
+        13) Run with --merge to load each staged file through a staging table (see load_merge.py): the
+            analyte values are copied in bulk, the duplicates are found by a set-based query and the new
+            rows are merged with "insert ... select". The rows inserted and their ids are the same as in the
+            row by row load.
+
+        14) In the row by row load, the analyte rows already in 'data_analyte' for the samples of a staged
+            file are read once (a few queries, see load_planner.select_in) before the file is written, and
+            the values already loaded are skipped with an in-memory lookup instead of a query per value. The
+            new values of each sample row are inserted with a single executemany().
   Status
       Operational
 
@@ -50,10 +80,11 @@
       Gabe Fortin
       
   Last update
-      2017-06-07
+      2026-10-19
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
+import query_profiler, storage_backend, reference_cache, load_manifest, load_planner, load_pipeline, load_merge
 
 
 # ========================================== Sub-routines =================================================
@@ -69,16 +100,26 @@ def get_rownum(db_cur, fld_name, tab_name):
         return int(max_val[0]) + 1
 
 
-# Get unit_id with the given unit_name as defined in 'code_unit' table
-# Syntax: get_unitid (db_cursor, list) return list
-def get_unitid(db_cur, name_list):
-    temp_id = []
-    temp_name = []
-    db_cur.execute("""select unit_id, name from code_unit""")
-    all_records = db_cur.fetchall()
-    for record in all_records:
-        temp_id.append(record[0])
-        temp_name.append(record[1])
+# Get the lookup key of a unit name, method abbreviation, certificate number or sample name. The keys are
+# compared without surrounding blanks and case, as the Access "=" comparisons they replace.
+# Syntax: get_key (variable) return string
+def get_key(value):
+    return str(value).strip().lower()
+
+# Get a lookup dict with its keys as given by get_key (the first of the keys differing only in case is kept)
+# Syntax: get_key_dict (dict) return dict
+def get_key_dict(values):
+    key_dict = {}
+    for key in sorted(values):
+        if key is not None:
+            key_dict.setdefault(get_key(key), values[key])
+    return key_dict
+
+# Get unit_id's of the given unit names as defined in 'code_unit' table. Unknown units are added to "problems"
+# and get a None unit_id.
+# Syntax: get_unitid (ReferenceCache, list, list, string) return list
+def get_unitid(refcache, name_list, problems, xls_file):
+    unit_ids = get_key_dict(refcache.lookup('code_unit', 'name', 'unit_id'))
 
     unitid_list = []
     for i in range(len(name_list)):
@@ -89,139 +130,380 @@ def get_unitid(db_cur, name_list):
             name_list[i] = 'g'
 
         # Validate
-        if name_list[i] in temp_name:
-            indx = temp_name.index(name_list[i])
-            unitid_list.append(temp_id[indx])
+        if get_key(name_list[i]) in unit_ids:
+            unitid_list.append(unit_ids[get_key(name_list[i])])
         else:
-            print 'Invalid unit: ' + name_list[i]
-            sys.exit()
+            unitid_list.append(None)
+            add_problem(problems, xls_file, 'invalid unit: ' + name_list[i])
 
     return unitid_list
 
-# Get method_id with the given method_abbr as defined in 'code_method' table
-# Syntax: get_methodid (db_cursor, list) return list
-def get_methodid(db_cur, name_list):
-    temp_id = []
-    temp_name = []
-
+# Get method_id's of the given method_abbr's as defined in 'code_method' table. Unknown methods are added to
+# "problems" and get a None method_id.
+# Syntax: get_methodid (ReferenceCache, list, list, string) return list
+def get_methodid(refcache, name_list, problems, xls_file):
+    method_ids = get_key_dict(refcache.lookup('code_method', 'method_abbr', 'method_id'))
 
     methodid_list = []
     for i in range(len(name_list)):
-        db_cur.execute("""select method_id from code_method where (method_abbr = ?)""", name_list[i])
-        method_id = db_cur.fetchone()[0]
-        methodid_list.append(method_id)
+        if get_key(name_list[i]) in method_ids:
+            methodid_list.append(method_ids[get_key(name_list[i])])
+        else:
+            methodid_list.append(None)
+            add_problem(problems, xls_file, 'invalid method: ' + name_list[i])
 
     return methodid_list
 
+# Add a problem of a staged file to "problems", once
+# Syntax: add_problem (list, string, string) return None
+def add_problem(problems, xls_file, problem):
+    if [xls_file, problem] not in problems:
+        problems.append([xls_file, problem])
+
+# Read the header rows and the sample rows of a staged results file:
+# [ar_number, cert_no, analyte_list, unit_list, mdl_list, method_list, [[sample_name, abundance list], ...]]
+# Syntax: read_results (string, string) return list
+def read_results(data_dir, xls_file):
+    # Open and exam the xls file
+    wb = load_workbook(filename=data_dir + xls_file)
+    ws = wb[wb.sheetnames[0]]
+
+    #Get AR number from filename
+    ar_number = xls_file.partition('_')[0]
+
+    # Extract the top 4 rows from results xlsx
+    analyte_list = list()
+    unit_list = list()
+    mdl_list = list()
+    method_list = list()
+
+    reallastcolumn = ws.max_column
+    for i in range(ws.max_column, 3, -1):
+        if (ws.cell(row=1, column=i)).value is None:
+            reallastcolumn = i - 1
+    for c in range(3, reallastcolumn + 1):
+        analyte_list.append(str(ws.cell(row=1, column=c).value).replace(' ', ''))
+        unit_list.append(str(ws.cell(row=2, column=c).value).replace(' ', ''))
+        mdl_list.append(str(ws.cell(row=3, column=c).value).replace(' ', ''))
+        method_list.append(str(ws.cell(row=4, column=c).value).replace(' ', ''))
+
+    cert_no = str((ws.cell(row=6, column=2)).value)
+
+    # Step through the remaining rows (values are all read in as strings)
+    if (ws.cell(row=ws.max_row, column=1)).value is None:
+        reallastrow = ws.max_row - 1
+    else:
+        reallastrow = ws.max_row
+    sample_rows = list()
+    for r in range(6, reallastrow + 1):
+        abundance = list()
+        for c in range(3, reallastcolumn + 1):
+            abundance.append(str(ws.cell(row=r, column=c).value).replace('<', '-'))
+        sample_rows.append([str((ws.cell(row=r, column=1)).value), abundance])
+
+    return [ar_number, cert_no, analyte_list, unit_list, mdl_list, method_list, sample_rows]
+
+# Read the keys of the batch from the database: the cert_no's already in 'data_analyte' and the cert_id's of
+# the cert_no's of 'data_cert'. The sample_id's are read by resolve_file(), once per AR number.
+# Syntax: get_keys (db_cursor) return dict
+def get_keys(db_cur):
+    keys = {'certs_in_analyte': set(), 'cert_ids': {}, 'sample_ids': {}, 'ar_numbers': set(), 'batch_certs': {}}
+    db_cur.execute("""select cert_no from vw_certs_in_data_analyte""")
+    keys['certs_in_analyte'] = set([get_key(record[0]) for record in db_cur.fetchall()])
+
+    db_cur.execute("""select cert_no, cert_id from data_cert""")
+    for record in db_cur.fetchall():
+        keys['cert_ids'].setdefault(get_key(record[0]), record[1])   # {cert_no key: cert_id}
+    return keys
+
+# Resolve the units, methods, certificate and samples of a staged file with the keys of the batch (see
+# get_keys). The unresolved keys are added to "problems". Returns [unitid_list, methodid_list, cert_id,
+# sampleid_list].
+# Syntax: resolve_file (db_cursor, ReferenceCache, list, string, int, dict, list) return list
+def resolve_file(db_cur, refcache, results, xls_file, rows_loaded, keys, problems):
+    [ar_number, cert_no, analyte_list, unit_list, mdl_list, method_list, sample_rows] = results
+
+    unitid_list = get_unitid(refcache, unit_list, problems, xls_file)
+    methodid_list = get_methodid(refcache, method_list, problems, xls_file)
+
+    #Check that there is no data from this certificate in data_analyte (unless the file is being resumed)
+    cert_key = get_key(cert_no)
+    if (cert_key in keys['certs_in_analyte']) and (rows_loaded == 0):
+        add_problem(problems, xls_file, 'certificate ' + cert_no + ' already has data in the data_analyte ' +
+                    'table, it has likely already been imported')
+    if cert_key in keys['batch_certs']:
+        add_problem(problems, xls_file, 'certificate ' + cert_no + ' is also in ' + keys['batch_certs'][cert_key])
+    keys['batch_certs'][cert_key] = xls_file
+    if cert_key not in keys['cert_ids']:
+        add_problem(problems, xls_file, 'certificate ' + cert_no + ' is not in the data_cert table')
+
+    #Find sample id based on AR number and sample_name, the samples of each AR number being read once
+    if ar_number not in keys['ar_numbers']:
+        db_cur.execute("""select sample_name, sample_id from vw_ar_no_sampid_link where (ar_number = ?)""", ar_number)
+        for record in db_cur.fetchall():
+            keys['sample_ids'].setdefault((ar_number, get_key(record[0])), record[1])
+        keys['ar_numbers'].add(ar_number)
+    sampleid_list = list()
+    for [sample_name, abundance] in sample_rows:
+        sampleid_list.append(keys['sample_ids'].get((ar_number, get_key(sample_name))))
+        if sampleid_list[-1] is None:
+            add_problem(problems, xls_file, 'sample ' + sample_name + ' of AR ' + ar_number + ' is not in the database')
+
+    return [unitid_list, methodid_list, keys['cert_ids'].get(cert_key), sampleid_list]
+
+# Get the analyte rows of the given samples already in 'data_analyte', as the keys of the duplicate check:
+# {(analyte, abundance, mdl, unit_id, method_id, sample_id, cert_id), ...} (see Additional info 14)
+# Syntax: get_analyte_rows (db_cursor, list) return set
+def get_analyte_rows(db_cur, sample_ids):
+    return set([(str(record[0]), str(record[1]), str(record[2]), record[3], record[4], record[5], record[6])
+                for record in load_planner.select_in(db_cur, """select analyte, abundance, mdl, unit_id, method_id,
+                                                        sample_id, cert_id from data_analyte
+                                                        where sample_id in (%s)""", sample_ids)])
+
+# Staging table of the merge load path (see Additional info 13 and load_merge.py)
+STAGE_TABLES = [
+    ['load_stage_analyte', [['row_no', 'integer'], ['col_no', 'integer'], ['ins', 'integer'], ['analyte_id', 'integer'],
+                            ['analyte', 'varchar(255)'], ['abundance', 'varchar(255)'], ['mdl', 'varchar(255)'],
+                            ['unit_id', 'integer'], ['method_id', 'integer'], ['sample_id', 'integer'],
+                            ['cert_id', 'integer']],
+     [['sample_id', 'analyte'], ['row_no', 'col_no']]]]
+
+# Merge the sample rows of a staged file, from row first_row, into 'data_analyte' through the staging table
+# (the caller commits). Returns the next analyte_id.
+# Syntax: merge_file (db_cursor, list, list, int, int) return int
+def merge_file(db_cur, results, resolved_keys, first_row, analyte_id):
+    [ar_number, cert_no, analyte_list, unit_list, mdl_list, method_list, sample_rows] = results
+    [unitid_list, methodid_list, cert_id, sampleid_list] = resolved_keys
+    load_merge.clear_stage_tables(db_cur, STAGE_TABLES)
+
+    stage_analytes = list()
+    for r in range(first_row, len(sample_rows)):
+        abundance = sample_rows[r][1]
+        for i in range(len(analyte_list)):
+            if (abundance[i] <> '') and (abundance[i] <> 'None'):
+                stage_analytes.append([r, i, 0, None, analyte_list[i], abundance[i], mdl_list[i], int(unitid_list[i]),
+                                       int(methodid_list[i]), sampleid_list[r], cert_id])
+    load_merge.copy_rows(db_cur, 'load_stage_analyte', stage_analytes)
+
+    # Values neither in the database nor before in the file
+    db_cur.execute("""update load_stage_analyte set ins = 1
+                      where not exists (select * from data_analyte d
+                                        where (d.sample_id = load_stage_analyte.sample_id) and
+                                              (d.analyte = load_stage_analyte.analyte) and
+                                              (d.abundance = load_stage_analyte.abundance) and
+                                              (d.mdl = load_stage_analyte.mdl) and
+                                              (d.unit_id = load_stage_analyte.unit_id) and
+                                              (d.method_id = load_stage_analyte.method_id) and
+                                              (d.cert_id = load_stage_analyte.cert_id))
+                        and not exists (select * from load_stage_analyte e
+                                        where (e.sample_id = load_stage_analyte.sample_id) and
+                                              (e.analyte = load_stage_analyte.analyte) and
+                                              (e.abundance = load_stage_analyte.abundance) and
+                                              (e.mdl = load_stage_analyte.mdl) and
+                                              (e.unit_id = load_stage_analyte.unit_id) and
+                                              (e.method_id = load_stage_analyte.method_id) and
+                                              ((e.row_no < load_stage_analyte.row_no) or
+                                               ((e.row_no = load_stage_analyte.row_no) and
+                                                (e.col_no < load_stage_analyte.col_no))))""")
+    analyte_id = load_merge.number_rows(db_cur, 'load_stage_analyte', 'analyte_id', ['row_no', 'col_no'], analyte_id)
+    db_cur.execute("""insert into data_analyte
+                      select analyte_id, analyte, abundance, mdl, unit_id, method_id, sample_id, cert_id
+                      from load_stage_analyte where ins = 1""")
+    return analyte_id
+
+# Columns of the load plan (see Additional info 11)
+PLAN_COLUMNS = [['rows', 'samples'], ['analytes_new', 'new analytes'], ['analytes_skipped', 'skipped dups'],
+                ['values_empty', 'empty']]
+
+# Compute the plan of the load of the resolved batch from an in-memory index of the database, without
+# writing anything. Files with unresolved keys are listed as problems and left out of the plan.
+# Syntax: plan_load (db_cursor, list, list, list, list, dict) return LoadPlan
+def plan_load(db_cur, xls_list, batch, resolved, problems, next_ids):
+    plan = load_planner.LoadPlan('aris_geochem_stagingdb_results_data_loader', PLAN_COLUMNS)
+    for [xls_file, problem] in problems:
+        plan.add_problem(xls_file, problem)
+    problem_files = set([xls_file for [xls_file, problem] in problems])
+
+    # Bulk index: analyte rows of the certificates of the batch already in the database
+    cert_ids = [resolved[f][2] for f in range(len(xls_list)) if xls_list[f] not in problem_files]
+    analyte_rows = set([(str(record[0]), str(record[1]), str(record[2]), record[3], record[4], record[5], record[6])
+                        for record in load_planner.select_in(db_cur, """select analyte, abundance, mdl, unit_id,
+                                                              method_id, sample_id, cert_id from data_analyte
+                                                              where cert_id in (%s)""", cert_ids)])
+
+    # Step through the rows with the rules of the load
+    for f in range(len(xls_list)):
+        if xls_list[f] in problem_files:
+            continue
+        [ar_number, cert_no, analyte_list, unit_list, mdl_list, method_list, sample_rows] = batch[f]
+        [unitid_list, methodid_list, cert_id, sampleid_list] = resolved[f]
+        counts = plan.add_file(xls_list[f])
+        for r in range(len(sample_rows)):
+            counts['rows'] = counts['rows'] + 1
+            abundance = sample_rows[r][1]
+            for i in range(len(analyte_list)):
+                key = (analyte_list[i], abundance[i], mdl_list[i], int(unitid_list[i]), int(methodid_list[i]),
+                       sampleid_list[r], cert_id)
+                if key in analyte_rows:
+                    counts['analytes_skipped'] = counts['analytes_skipped'] + 1
+                elif (abundance[i] == '') or (abundance[i] == 'None'):
+                    counts['values_empty'] = counts['values_empty'] + 1
+                else:
+                    counts['analytes_new'] = counts['analytes_new'] + 1
+                    analyte_rows.add(key)
+                    next_ids['analyte_id'] = next_ids['analyte_id'] + 1
+
+    return plan
+
 
 # ============================================= Main routine =========================================
-def main():
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Results\\',
+         db_conn = None, refcache = None):
     # File path
-    db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb'
-    data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Results\\'
+    qprofile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\query_profile_aris_geochem_stagingdb_results_data_loader_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
 
-    # Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' + db_path)
+    # Database connection (shared with the other stages when run from aris_ingestion.py)
+    own_conn = db_conn is None
+    if own_conn:
+        db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('aris_geochem_stagingdb_results_data_loader',
+                                           '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    # Code tables are looked up in memory (see reference_cache.py)
+    qprofile.set_stage('reference data')
+    if refcache is None:
+        refcache = reference_cache.ReferenceCache(db_path)
+    refcache.load(cur, ['code_unit', 'code_method'])
+
     # Get next id values from tables ''data_analyte'
+    qprofile.set_stage('next ids')
     analyte_id = get_rownum(cur, 'analyte_id', 'data_analyte')
 
     # Collect all xls file name under the specified directory
     xls_list = os.listdir(data_dir)
 
-    # Loop through each file in the directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-        print xls_name + ' is being loaded ...'
-
-        #Get AR number from filename
-        ar_number = xls_list[f].partition('_')[0]
-
-        # Extract the top 4 rows from results xlsx
-        analyte_list = list()
-        unit_list = list()
-        mdl_list = list()
-        method_list = list()
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-        for c in range(3, reallastcolumn + 1):
-            analyte_list.append(str(ws.cell(row=1, column=c).value).replace(' ', ''))
-            unit_list.append(str(ws.cell(row=2, column=c).value).replace(' ', ''))
-            mdl_list.append(str(ws.cell(row=3, column=c).value).replace(' ', ''))
-            method_list.append(str(ws.cell(row=4, column=c).value).replace(' ', ''))
-
-        #Check that there is no data from this certificate in data_analyte
-        certs_in_analyte = list()  # Build a list of method_id using current database values
-        cur.execute("""select cert_no from vw_certs_in_data_analyte""")
-        val_rows = cur.fetchall()
-        for i in range(len(val_rows)):
-            certs_in_analyte.append(str(val_rows[i][0]))
-
-        impt_cert_no = (ws.cell(row=6, column=2)).value
-
-        if impt_cert_no in certs_in_analyte:
-            print 'Certificate already has data in the data_analyte table, it has likely already been imported.'
-            sys.exit()
-
-        #get cert_id from impt_cert_no
-        cur.execute("""select cert_id from data_cert where (cert_no = ?)""", impt_cert_no)
-        cert_id = cur.fetchone()[0]
-
-        # Get 'unit_id' for the retrieved unit names
-        unitid_list = get_unitid(cur, unit_list)
-
-        methodid_list = get_methodid(cur, method_list)
-
-        # Step through the remaining rows (values are all read in as strings)
-        if (ws.cell(row=ws.max_row, column=1)).value is None:
-            reallastrow = ws.max_row - 1
+    # Skip the files already loaded, resume a file partly loaded and reject the modified ones (see Additional
+    # info 10)
+    qprofile.set_stage('load manifest')
+    plan_mode = '--plan' in sys.argv[1:]
+    merge_mode = '--merge' in sys.argv[1:]
+    manifest = load_manifest.LoadManifest(cur, 'aris_geochem_stagingdb_results_data_loader', data_dir, plan_mode)
+    [load_list, skipped, rejected] = manifest.check_files(xls_list)
+    if not manifest.report(skipped, rejected) and not plan_mode:
+        if own_conn:
+            db_conn.close()
+        sys.exit()
+    xls_list = [xls_file for [xls_file, rows_loaded] in load_list]
+
+    # Dry run: read and resolve all the staged files, print the plan of the load and stop (see Additional
+    # info 11)
+    workers = load_pipeline.get_workers(sys.argv[1:])
+    loaded_rows = dict(load_list)
+    if plan_mode:
+        qprofile.set_stage('plan')
+        keys = get_keys(cur)
+        problems = list()
+        batch = list()
+        resolved = list()
+        for [[data_dir, xls_file], results] in load_pipeline.read_files(read_results,
+                [[data_dir, xls_file] for xls_file in xls_list], workers):
+            rows_loaded = loaded_rows[xls_file]
+            resolved.append(resolve_file(cur, refcache, results, xls_file, rows_loaded, keys, problems))
+            # Only the rows not loaded yet of a file being resumed
+            results[6] = results[6][rows_loaded:]
+            resolved[-1][3] = resolved[-1][3][rows_loaded:]
+            batch.append(results)
+        next_ids = {'analyte_id': analyte_id}
+        plan = plan_load(cur, xls_list, batch, resolved, problems, next_ids)
+        plan.report(skipped, rejected, next_ids)
+        qprofile.report(qprofile_file)
+        if own_conn:
+            db_conn.close()
+        return
+
+    # Merge load path: staging table (see Additional info 13)
+    if merge_mode:
+        qprofile.set_stage('staging tables')
+        load_merge.create_stage_tables(cur, STAGE_TABLES)
+
+    # ----------------------------- Add to the "data_analyte" table -----------------------------------------
+    # The staged files are read in the worker processes while the previous ones are being written (see
+    # Additional info 12), and the keys of each file are resolved before it is written (see Additional info 9)
+    qprofile.set_stage('load files')
+    keys = get_keys(cur)
+    problems = list()
+    for [[data_dir, xls_file], results] in load_pipeline.read_files(read_results,
+            [[data_dir, xls_file] for xls_file in xls_list], workers):
+        rows_loaded = loaded_rows[xls_file]
+        [ar_number, cert_no, analyte_list, unit_list, mdl_list, method_list, sample_rows] = results
+        file_problems = list()
+        [unitid_list, methodid_list, cert_id, sampleid_list] = resolve_file(cur, refcache, results, xls_file,
+                                                                            rows_loaded, keys, file_problems)
+        if file_problems:
+            print data_dir + xls_file + ' is not loaded, ' + str(len(file_problems)) + ' unresolved key(s)'
+            problems.extend(file_problems)
+            continue
+
+        if rows_loaded > 0:
+            print data_dir + xls_file + ' is being loaded from sample ' + str(rows_loaded + 1) + ' (resumed) ...'
         else:
-            reallastrow = ws.max_row
-        for r in range(6, reallastrow + 1):
-
-            #Find sample id based on AR number and sample_name
-            cur.execute("""select sample_id from vw_ar_no_sampid_link where (ar_number = ?) and (sample_name = ?)""",
-                        ar_number, str((ws.cell(row=r, column=1)).value))
-            sample_id = cur.fetchone()[0]
-
-            # Retrieve analyte values
-            abundance = list()
-            reallastcolumn = ws.max_column
-            for i in range(ws.max_column, 3, -1):
-                if (ws.cell(row=1, column=i)).value is None:
-                    reallastcolumn = i - 1
-            for c in range(3, reallastcolumn + 1):
-                abundance.append(str(ws.cell(row=r, column=c).value).replace('<', '-'))
-
-            # ----------------------------- Add to the "data_analyte" table -----------------------------------------
+            print data_dir + xls_file + ' is being loaded ...'
+        manifest.start(xls_file, len(sample_rows), {'analyte_id': analyte_id})
+
+        # Merge the whole file in one transaction (see Additional info 13)
+        if merge_mode:
+            analyte_id = merge_file(cur, results, [unitid_list, methodid_list, cert_id, sampleid_list], rows_loaded,
+                                    analyte_id)
+            manifest.checkpoint(xls_file, len(sample_rows), {'analyte_id': analyte_id})
+            cur.commit()
+            manifest.finish(xls_file)
+            continue
+
+        # Analyte rows of the samples of the file already in the database (see Additional info 14)
+        analyte_rows = get_analyte_rows(cur, sampleid_list[rows_loaded:])
+
+        for r in range(rows_loaded, len(sample_rows)):
+            sample_id = sampleid_list[r]
+            abundance = sample_rows[r][1]
+            analyte_values = list()
             for i in range(len(analyte_list)):
-                cur.execute("""select count(*) from data_analyte where (analyte = ?) and (abundance = ?) and
-                           (mdl = ?) and (unit_id = ?) and (method_id = ?) and  (sample_id = ?) and
-                           (cert_id = ?)""", analyte_list[i], abundance[i], mdl_list[i], int(unitid_list[i]), \
-                            int(methodid_list[i]), sample_id, cert_id)
-                check_analyte = cur.fetchone()
-
-                if (check_analyte[0] == 0) and (abundance[i] <> '') and (abundance[i] <> 'None'):
-                    cur.execute("""insert into data_analyte values (?, ?, ?, ?, ?, ?, ?, ?)""", analyte_id, \
-                                analyte_list[i], abundance[i], mdl_list[i], int(unitid_list[i]), \
-                                int(methodid_list[i]), sample_id, cert_id)
-                    cur.commit()
+                key = (analyte_list[i], abundance[i], mdl_list[i], int(unitid_list[i]), int(methodid_list[i]),
+                       sample_id, cert_id)
+
+                if (key not in analyte_rows) and (abundance[i] <> '') and (abundance[i] <> 'None'):
+                    analyte_values.append([analyte_id] + list(key))
+                    analyte_rows.add(key)
                     analyte_id = analyte_id + 1
+            if analyte_values:
+                cur.executemany("""insert into data_analyte values (?, ?, ?, ?, ?, ?, ?, ?)""", analyte_values)
 
+            # Commit the row together with its checkpoint in the load manifest
+            manifest.checkpoint(xls_file, r + 1, {'analyte_id': analyte_id})
+            cur.commit()
 
+        manifest.finish(xls_file)
 
-#db_conn.close()
-print 'Job done!'
+    if merge_mode:
+        load_merge.drop_stage_tables(cur, STAGE_TABLES)
+
+    # The files with unresolved keys are left out, to be loaded once their keys are fixed (see Additional info 9)
+    if problems:
+        print '\n' + str(len(set([xls_file for [xls_file, problem] in problems]))) + ' file(s) not loaded, ' + \
+            str(len(problems)) + ' unresolved key(s):'
+        for [xls_file, problem] in problems:
+            print '    ' + xls_file + ': ' + problem
+
+    qprofile.report(qprofile_file)
+    if own_conn:
+        db_conn.close()
+    print 'Job done!'
 
 
 if __name__ == "__main__":
     main()
-
@@ -9,6 +9,7 @@
    Input
          1) Path to the directory containing the staged xlsx files
          2) Path to the aris geochem staginb database, ARIS_geochem_stage.accdb
+            (or its SQLite stand-in, see storage_backend.py)
          
   Output
          Data inserted into the above 2 tables in ARIS_geochem_stage.accdb
@@ -43,6 +44,30 @@
 
             All these problems are difficult to spot in data screening. They need to be examined visually in
             the final data products.
+
+         9) The inserts of each data row are committed together with a checkpoint in the 'load_manifest'
+            table (see load_manifest.py). Files already loaded are skipped, a file partly loaded (e.g. the
+            script died halfway) is resumed after its last committed row, and a file modified since it was
+            loaded is rejected: nothing is loaded until it is restored or renamed.
+
+        10) Run with --plan for a dry run: the new samples and AR links, and the skipped duplicates, of each
+            staged file are computed from in-memory indexes of the database (see load_planner.py) and
+            printed. Nothing is written to the database.
+
+        11) The staged files are read by worker processes (--workers=N, default: number of CPUs - 1) and
+            written one after the other by this script while the next ones are being read, in the order
+            of the directory listing (see load_pipeline.py). The ids are assigned as in a serial load.
+
+        12) Run with --merge to load each staged file through staging tables (see load_merge.py): the rows
+            are copied in bulk, the duplicate samples and AR links are found by a few set-based queries and
+            the new rows are merged with "insert ... select". The rows inserted and their ids are the same
+            as in the row by row load.
+
+        13) The NAD83 geographic and UTM coordinates of the new samples of each staged file are computed in
+            batches once the file is loaded, and stored in the 'data_sample_geo' table (see sample_geo.py),
+            where the product creator reads them. The new samples are also added to the grid spatial index
+            of the samples (see sample_index.py). A file resumed is located from its first sample, so that
+            the samples inserted before the interruption are included.
   Status
       Operational
 
@@ -50,10 +75,12 @@
       Gabe Fortin
       
   Last update
-      2017-06-07
+      2026-10-19
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
+import query_profiler, storage_backend, load_manifest, load_planner, load_pipeline, load_merge, sample_geo
+import sample_index
 #========================================== Sub-routines =================================================
 #Get next row number of a given field and table
 #Syntax: get_rownum(db_cursor, string, string) return int
@@ -65,33 +92,89 @@ def get_rownum(db_cur, fld_name, tab_name):
         return 1
     else:
         return int(max_val[0]) + 1
-    
-#============================================= Main routine =========================================
 
-db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb'
-data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Location\\'
+#Staging tables of the merge load path (see Additional info 12 and load_merge.py)
+STAGE_TABLES = [
+    ['load_stage_sample', [['row_no', 'integer'], ['sample_id', 'integer'], ['new_sample', 'integer'],
+                           ['ar_number', 'varchar(255)'], ['ins', 'integer'], ['ar_id', 'integer'],
+                           ['sample_name', 'varchar(255)'], ['station_name', 'varchar(255)'],
+                           ['sample_type', 'varchar(255)'], ['sample_subtype', 'varchar(255)'],
+                           ['sample_depth', 'varchar(255)'], ['sample_colour', 'longtext'], ['sample_desp', 'longtext'],
+                           ['duplicate', 'varchar(255)'], ['x_coord', 'varchar(255)'], ['y_coord', 'varchar(255)'],
+                           ['z_coord', 'varchar(255)'], ['epsg_srid', 'integer'], ['coord_conf', 'varchar(255)'],
+                           ['sample_date', 'varchar(255)']],
+     [['sample_id', 'ar_number'], ['row_no']]]]
 
-#Database connection
-db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
-cur = db_conn.cursor()
+#Merge the rows of a staged file into the database through the staging tables (the caller commits).
+#next_ids is updated with the ids used.
+#Syntax: merge_file(db_cursor, list, dict) returns None
+def merge_file(db_cur, staged_file, next_ids):
+    [ar_number, row_count, sample_rows] = staged_file
+    load_merge.clear_stage_tables(db_cur, STAGE_TABLES)
 
-#Get next id values from tables: 'data_sample' and 'data_ar'
-sample_id = get_rownum(cur, 'sample_id', 'data_sample')
-ar_id = get_rownum(cur, 'ar_id', 'data_ar')
+    #Samples of the file already in the database (looked up without the spaces in their name), in bulk
+    sample_ids = {}
+    for record in load_planner.select_in(db_cur, """select sample_name, min(sample_id) from data_sample
+                                                    where sample_name in (%s) group by sample_name""",
+                                         [row[0].replace(' ', '') for row in sample_rows]):
+        sample_ids[str(record[0])] = record[1]
 
-#Collect all xls file name under the specified directory
-xls_list = os.listdir(data_dir)
+    #Copy the rows to the staging table, with the sample_id of each row (a new sample is inserted by its
+    #first row, with its name as is)
+    stage_samples = list()
+    for r in range(len(sample_rows)):
+        [sample_name, sample_values] = sample_rows[r]
+        if sample_name.replace(' ', '') in sample_ids:
+            new_sample = 0
+            sample_id = sample_ids[sample_name.replace(' ', '')]
+            epsg_srid = None
+        else:
+            new_sample = 1
+            sample_id = next_ids['sample_id']
+            epsg_srid = int(sample_values[11])
+            sample_ids.setdefault(sample_name, sample_id)
+            next_ids['sample_id'] = next_ids['sample_id'] + 1
+
+        stage_samples.append([r, sample_id, new_sample, ar_number, 0, None] + sample_values[:11] +
+                             [epsg_srid] + sample_values[12:])
+    load_merge.copy_rows(db_cur, 'load_stage_sample', stage_samples)
+
+    #----------------------------- Add to the "data_sample" table ------------------------------------------
+    db_cur.execute("""insert into data_sample
+                      select sample_id, sample_name, station_name, sample_type, sample_subtype, sample_depth,
+                             sample_colour, sample_desp, duplicate, x_coord, y_coord, z_coord, epsg_srid, coord_conf,
+                             sample_date
+                      from load_stage_sample where new_sample = 1""")
 
-#Loop through each file in the drectory
-for f in range(len(xls_list)):
-    xls_name = data_dir + xls_list[f]
+    #---------------------------------- Update 'data_ar' table ----------------------------------------
+    #Links neither in the database nor on a previous row of the file
+    db_cur.execute("""update load_stage_sample set ins = 1
+                      where not exists (select * from data_ar d
+                                        where (d.sample_id = load_stage_sample.sample_id) and
+                                              (d.ar_number = load_stage_sample.ar_number))
+                        and not exists (select * from load_stage_sample e
+                                        where (e.sample_id = load_stage_sample.sample_id) and
+                                              (e.ar_number = load_stage_sample.ar_number) and
+                                              (e.row_no < load_stage_sample.row_no))""")
+    next_ids['ar_id'] = load_merge.number_rows(db_cur, 'load_stage_sample', 'ar_id', ['row_no'], next_ids['ar_id'])
+    db_cur.execute("""insert into data_ar select ar_id, ar_number, sample_id from load_stage_sample
+                      where ins = 1""")
+
+#Columns of the load plan (see Additional info 10)
+PLAN_COLUMNS = [['rows', 'rows'], ['samples_new', 'new samples'], ['samples_found', 'samples in db'],
+                ['links_new', 'new AR links'], ['links_skipped', 'skipped links']]
+
+#Read and normalize the data rows of a staged file, after the rows_loaded first ones (run in the worker
+#processes of the load pipeline, see load_pipeline.py):
+#[ar_number, number of data rows, [[sample name, 'data_sample' values without sample_id], ...]]
+#Syntax: read_staged_file(string, string, int) returns list
+def read_staged_file(data_dir, xls_file, rows_loaded):
     #extract the publication id (i.e. ARIS report number) from the file name
-    ar_number = xls_list[f].partition('_')[0]
+    ar_number = xls_file.partition('_')[0]
 
-    #Open and exam each xls file
-    wb = load_workbook(filename = xls_name)
+    #Open and exam the xls file
+    wb = load_workbook(filename = data_dir + xls_file)
     ws = wb[wb.sheetnames[0]]
-    print xls_name + ' is being loaded ...'
 
     #Step through the data rows (values are all read in as strings)
     if (ws.cell(row = ws.max_row, column = 1)).value is None:
@@ -99,90 +182,247 @@ for f in range(len(xls_list)):
     else:
         reallastrow = ws.max_row
 
-    for r in range(2, reallastrow + 1):
+    sample_rows = list()
+    for r in range(2 + rows_loaded, reallastrow + 1):
+        sample_name = str(ws.cell(row = r, column = 1).value)
 
-        #-------------------------------------- Update the 2 relevent tables  -----------------------------------
-        sample_name = str(ws.cell(row = r, column = 1).value).replace(' ', '')
-        cur.execute("""select sample_id from data_sample where sample_name = ?""", sample_name)
-        check_sample = cur.fetchone()
+        station_name = str(ws.cell(row = r, column = 2).value)
+        if (station_name == '' or station_name == 'None'):
+            station_name = ''
             
-        #The current sample is already in 'data_sample' table (which won't be updated).
-        if check_sample <> None:
-            #----------------------------- Update 'data_ar' table if applicable ----------------------------
-            cur.execute("""select count(*) from data_ar where (sample_id = ?) and (ar_number = ?)""",
-                            check_sample[0], ar_number)
-            rec_count = cur.fetchone()
-            if rec_count[0] == 0:
-                cur.execute("""insert into data_ar values (?, ?, ?)""", ar_id, ar_number, check_sample[0])
-                cur.commit()
-                ar_id = ar_id + 1
-
-        #The current sample is not in 'data_sample' table (which is to be updated)
+        sample_type = str(ws.cell(row = r, column = 3).value)
+
+        sample_subtype = str(ws.cell(row = r, column = 4).value)
+        if (sample_subtype == '' or sample_subtype == 'None'):
+            sample_subtype = ''
+
+        sample_depth = str(ws.cell(row = r, column = 5).value).replace(' ', '')
+        if (sample_depth == '' or sample_depth == 'None'):
+            sample_depth = ''
+
+        if (ws.cell(row = r, column = 6).value) == None:
+            sample_colour = None
+        else:
+            sample_colour = str((ws.cell(row = r, column = 6).value).replace(u'\xb1',"+/-"))
+            if (sample_colour == '' or sample_colour == 'None'):
+                sample_colour = ''
+
+        if (ws.cell(row = r, column = 7).value) == None:
+            sample_desp = None
         else:
-            sample_name = str(ws.cell(row = r, column = 1).value)
+            sample_desp = str((ws.cell(row = r, column = 7).value).replace(u'\xb1',"+/-"))
+            if (sample_desp == '' or sample_desp == 'None'):
+                sample_desp = ''
+
+        duplicate = str(ws.cell(row = r, column = 8).value).replace(' ', '')
+        if (duplicate == '' or duplicate == 'None'):
+            duplicate = ''
+
+        x_coord = str(ws.cell(row = r, column = 9).value).replace(' ', '')
+        y_coord = str(ws.cell(row = r, column = 10).value).replace(' ', '')
+        z_coord = str(ws.cell(row = r, column = 11).value).replace(' ', '')
+        if z_coord == 'None':
+            z_coord = None
+        epsg_srid = str(ws.cell(row = r, column = 12).value).replace(' ', '')
+        coord_conf = str(ws.cell(row = r, column = 13).value).replace(' ', '').upper()
 
-            station_name = str(ws.cell(row = r, column = 2).value)
-            if (station_name == '' or station_name == 'None'):
-                station_name = ''
-                    
-            sample_type = str(ws.cell(row = r, column = 3).value)
+        sample_date = str(ws.cell(row = r, column = 14).value)
+        if (sample_date == '' or sample_date == 'None'):
+            sample_date = None
 
-            sample_subtype = str(ws.cell(row = r, column = 4).value)
-            if (sample_subtype == '' or sample_subtype == 'None'):
-                sample_subtype = ''
+        #'data_sample' values (the EPSG code is converted to int when the sample is inserted)
+        sample_values = [sample_name, station_name, sample_type, sample_subtype, sample_depth, sample_colour,
+                         sample_desp, duplicate, x_coord, y_coord, z_coord, epsg_srid, coord_conf, sample_date]
+        sample_rows.append([sample_name, sample_values])
 
-            sample_depth = str(ws.cell(row = r, column = 5).value).replace(' ', '')
-            if (sample_depth == '' or sample_depth == 'None'):
-                sample_depth = ''
+    return [ar_number, reallastrow - 1, sample_rows]
 
-            if (ws.cell(row = r, column = 6).value) == None:
-                sample_colour = None
+#Compute the plan of the load from in-memory indexes of the database, without writing anything
+#Syntax: plan_load(db_cursor, string, list, dict, int) returns LoadPlan
+def plan_load(db_cur, data_dir, load_list, next_ids, workers):
+    plan = load_planner.LoadPlan('aris_geochem_stagingdb_sample_info_data_loader', PLAN_COLUMNS)
+
+    #Read the staged files: [[file name, AR number, [sample name, ...]], ...]
+    staged = list()
+    for [[data_dir, xls_file, rows_loaded], staged_file] in load_pipeline.read_files(read_staged_file,
+            [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list], workers):
+        print data_dir + xls_file + ' has been read ...'
+        [ar_number, row_count, sample_rows] = staged_file
+        staged.append([xls_file, ar_number, [row[0] for row in sample_rows]])
+
+    #Bulk indexes: {sample_name: sample_id}, and the AR links of the samples of the batch already in the
+    #database
+    db_cur.execute("""select sample_name, sample_id from data_sample order by sample_id""")
+    sample_ids = {}
+    for record in db_cur.fetchall():
+        sample_ids.setdefault(str(record[0]), record[1])
+    found_ids = [sample_ids[name.replace(' ', '')] for [xls_file, ar_number, sample_names] in staged
+                 for name in sample_names if name.replace(' ', '') in sample_ids]
+    ar_links = set([(record[0], str(record[1])) for record in
+                    load_planner.select_in(db_cur, """select sample_id, ar_number from data_ar
+                                                       where sample_id in (%s)""", found_ids)])
+
+    #Step through the rows with the rules of the load (samples are looked up without spaces in their
+    #name, but new samples are inserted with their name as is)
+    for [xls_file, ar_number, sample_names] in staged:
+        counts = plan.add_file(xls_file)
+        for sample_name in sample_names:
+            counts['rows'] = counts['rows'] + 1
+            if sample_name.replace(' ', '') in sample_ids:
+                counts['samples_found'] = counts['samples_found'] + 1
+                sample_id = sample_ids[sample_name.replace(' ', '')]
             else:
-                sample_colour = str((ws.cell(row = r, column = 6).value).replace(u'\xb1',"+/-"))
-                if (sample_colour == '' or sample_colour == 'None'):
-                    sample_colour = ''
+                counts['samples_new'] = counts['samples_new'] + 1
+                sample_id = next_ids['sample_id']
+                sample_ids.setdefault(sample_name, sample_id)
+                next_ids['sample_id'] = sample_id + 1
 
-            if (ws.cell(row = r, column = 7).value) == None:
-                sample_desp = None
+            if (sample_id, ar_number) in ar_links:
+                counts['links_skipped'] = counts['links_skipped'] + 1
             else:
-                sample_desp = str((ws.cell(row = r, column = 7).value).replace(u'\xb1',"+/-"))
-                if (sample_desp == '' or sample_desp == 'None'):
-                    sample_desp = ''
-
-            duplicate = str(ws.cell(row = r, column = 8).value).replace(' ', '')
-            if (duplicate == '' or duplicate == 'None'):
-                duplicate = ''
-
-            x_coord = str(ws.cell(row = r, column = 9).value).replace(' ', '')
-            y_coord = str(ws.cell(row = r, column = 10).value).replace(' ', '')
-            z_coord = str(ws.cell(row = r, column = 11).value).replace(' ', '')
-            if z_coord == 'None':
-                z_coord = None
-            epsg_srid = str(ws.cell(row = r, column = 12).value).replace(' ', '')
-            coord_conf = str(ws.cell(row = r, column = 13).value).replace(' ', '').upper()
-
-            sample_date = str(ws.cell(row = r, column = 14).value)
-            if (sample_date == '' or sample_date == 'None'):
-                sample_date = None
-
-            #Assemble a row of values to be written to 'data_sample' table
-            sample_values = [sample_id, sample_name, station_name, sample_type, sample_subtype, sample_depth,
-                                sample_colour, sample_desp, duplicate, x_coord, y_coord, z_coord, int(epsg_srid),
-                                coord_conf, sample_date]
-
-            #----------------------------- Add to the "data_sample" table ------------------------------------------
-            cur.execute("""insert into data_sample values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", sample_values)
+                counts['links_new'] = counts['links_new'] + 1
+                ar_links.add((sample_id, ar_number))
+                next_ids['ar_id'] = next_ids['ar_id'] + 1
+
+    return plan
+    
+#============================================= Main routine =========================================
+
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Location\\',
+         db_conn = None):
+    qprofile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\query_profile_aris_geochem_stagingdb_sample_info_data_loader_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
+
+    #Database connection (shared with the other stages when run from aris_ingestion.py)
+    own_conn = db_conn is None
+    if own_conn:
+        db_conn = storage_backend.connect(db_path)
+    cur = db_conn.cursor()
+
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('aris_geochem_stagingdb_sample_info_data_loader',
+                                           '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Get next id values from tables: 'data_sample' and 'data_ar'
+    qprofile.set_stage('next ids')
+    sample_id = get_rownum(cur, 'sample_id', 'data_sample')
+    ar_id = get_rownum(cur, 'ar_id', 'data_ar')
+
+    #Collect all xls file name under the specified directory
+    xls_list = os.listdir(data_dir)
+
+    #Skip the files already loaded, resume a file partly loaded and reject the modified ones (see Additional
+    #info 9)
+    qprofile.set_stage('load manifest')
+    plan_mode = '--plan' in sys.argv[1:]
+    merge_mode = '--merge' in sys.argv[1:]
+    workers = load_pipeline.get_workers(sys.argv[1:])
+    manifest = load_manifest.LoadManifest(cur, 'aris_geochem_stagingdb_sample_info_data_loader', data_dir, plan_mode)
+    [load_list, skipped, rejected] = manifest.check_files(xls_list)
+    if not manifest.report(skipped, rejected) and not plan_mode:
+        if own_conn:
+            db_conn.close()
+        sys.exit()
+
+    #Dry run: print the plan of the load and stop (see Additional info 10)
+    if plan_mode:
+        qprofile.set_stage('plan')
+        next_ids = {'sample_id': sample_id, 'ar_id': ar_id}
+        plan = plan_load(cur, data_dir, load_list, next_ids, workers)
+        plan.report(skipped, rejected, next_ids)
+        qprofile.report(qprofile_file)
+        if own_conn:
+            db_conn.close()
+        return
+
+    #Side table of the sample locations and spatial index (see Additional info 13)
+    sample_geo.create_table(cur)
+    sample_index.create_table(cur)
+
+    #Merge load path: staging tables (see Additional info 12)
+    if merge_mode:
+        qprofile.set_stage('staging tables')
+        load_merge.create_stage_tables(cur, STAGE_TABLES)
+
+    #Loop through each file in the drectory. The files are read in worker processes while the previous ones
+    #are being written (see Additional info 11).
+    qprofile.set_stage('load files')
+    for [[data_dir, xls_file, rows_loaded], staged_file] in load_pipeline.read_files(read_staged_file,
+            [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list], workers):
+        [ar_number, row_count, sample_rows] = staged_file
+        xls_name = data_dir + xls_file
+        if rows_loaded > 0:
+            print xls_name + ' is being loaded from row ' + str(2 + rows_loaded) + ' (resumed) ...'
+        else:
+            print xls_name + ' is being loaded ...'
+        #The samples inserted by an interrupted load of the file are located too (see Additional info 13)
+        first_ids = manifest.start(xls_file, row_count, {'sample_id': sample_id, 'ar_id': ar_id})
+        first_sample_id = first_ids.get('sample_id', sample_id)
+
+        #Merge the whole file in one transaction (see Additional info 12)
+        if merge_mode:
+            next_ids = {'sample_id': sample_id, 'ar_id': ar_id}
+            merge_file(cur, staged_file, next_ids)
+            [sample_id, ar_id] = [next_ids['sample_id'], next_ids['ar_id']]
+            sample_geo.refresh(cur, None, [first_sample_id, sample_id])
+            sample_index.update(cur, [first_sample_id, sample_id])
+            manifest.checkpoint(xls_file, rows_loaded + len(sample_rows), next_ids)
             cur.commit()
-            #---------------------------------- Update 'data_ar' table ----------------------------------------
-            cur.execute("""select count(*) from data_ar where (sample_id = ?) and (ar_number = ?)""",
-                        sample_id, ar_number)
-            rec_count = cur.fetchone()
-            if rec_count[0] == 0:
-                cur.execute("""insert into data_ar values (?, ?, ?)""", ar_id, ar_number, sample_id)
-                cur.commit()
-                ar_id = ar_id + 1
-
-            sample_id = sample_id + 1
+            manifest.finish(xls_file)
+            continue
+
+        for r in range(len(sample_rows)):
+            [sample_name, sample_values] = sample_rows[r]
+
+            #-------------------------------------- Update the 2 relevent tables  -----------------------------------
+            cur.execute("""select sample_id from data_sample where sample_name = ?""", sample_name.replace(' ', ''))
+            check_sample = cur.fetchone()
             
-db_conn.close()
-print 'Job done!'
+            #The current sample is already in 'data_sample' table (which won't be updated).
+            if check_sample <> None:
+                #----------------------------- Update 'data_ar' table if applicable ----------------------------
+                cur.execute("""select count(*) from data_ar where (sample_id = ?) and (ar_number = ?)""",
+                                check_sample[0], ar_number)
+                rec_count = cur.fetchone()
+                if rec_count[0] == 0:
+                    cur.execute("""insert into data_ar values (?, ?, ?)""", ar_id, ar_number, check_sample[0])
+                    ar_id = ar_id + 1
+
+            #The current sample is not in 'data_sample' table (which is to be updated)
+            else:
+                #Assemble a row of values to be written to 'data_sample' table
+                sample_values = [sample_id] + sample_values[:11] + [int(sample_values[11])] + sample_values[12:]
+
+                #----------------------------- Add to the "data_sample" table ------------------------------------------
+                cur.execute("""insert into data_sample values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", sample_values)
+                #---------------------------------- Update 'data_ar' table ----------------------------------------
+                cur.execute("""select count(*) from data_ar where (sample_id = ?) and (ar_number = ?)""",
+                            sample_id, ar_number)
+                rec_count = cur.fetchone()
+                if rec_count[0] == 0:
+                    cur.execute("""insert into data_ar values (?, ?, ?)""", ar_id, ar_number, sample_id)
+                    ar_id = ar_id + 1
+
+                sample_id = sample_id + 1
+
+            #Commit the row together with its checkpoint in the load manifest
+            manifest.checkpoint(xls_file, rows_loaded + r + 1, {'sample_id': sample_id, 'ar_id': ar_id})
+            cur.commit()
+
+        #Locations of the new samples, committed with the end of the file (see Additional info 13)
+        sample_geo.refresh(cur, None, [first_sample_id, sample_id])
+        sample_index.update(cur, [first_sample_id, sample_id])
+        manifest.finish(xls_file)
+
+    if merge_mode:
+        load_merge.drop_stage_tables(cur, STAGE_TABLES)
+
+    qprofile.report(qprofile_file)
+    if own_conn:
+        db_conn.close()
+    print 'Job done!'
+
+if __name__ == "__main__":
+    main()
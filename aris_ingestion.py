@@ -0,0 +1,134 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This script runs the ingestion of the staged ARIS geochem data into the ARIS geochem staging database
+   in a single process. It
+         1) discovers the staging folders under the data directory:
+                  '_AR Data Staging Certificate'  certificates   aris_geochem_stagingdb_certificates_data_loader.py
+                  '_AR Data Staging Location'     sample info    aris_geochem_stagingdb_sample_info_data_loader.py
+                  '_AR Data Staging Results'      results        aris_geochem_stagingdb_results_data_loader.py
+         2) orders the stages after their dependencies: the results refer to the certificates (cert_id)
+            and to the samples and AR numbers (sample_id) loaded by the two other stages;
+         3) runs the loaders one after the other on a single database connection, sharing the reference
+            cache of the code tables (see reference_cache.py);
+         4) reports the number of staged files and the run time of each stage.
+
+   A stage with no staged file is skipped. If a loader stops (e.g. a staged file is rejected by the load
+   manifest), the stages after it are not run. A results file whose keys can not be resolved is left out
+   by the results loader, which loads the other files.
+
+   The options of the loaders are passed on: --plan, --merge, --workers=N and --query-profile. Note that
+   with --plan nothing is written, so the results plan reports the certificates and samples that are
+   only staged as unresolved keys.
+
+   Input
+         1) Path to the aris geochem staging database, ARIS_geochem_stage.accdb
+         2) Path to the data directory containing the staging folders
+
+   Output
+         Rows loaded into the database, and the timings of the stages (printed)
+
+   Usage
+         python aris_ingestion.py [<database path> <data directory>] [--plan] [--merge] [--workers=N]
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, time
+import storage_backend, reference_cache
+import aris_geochem_stagingdb_certificates_data_loader
+import aris_geochem_stagingdb_sample_info_data_loader
+import aris_geochem_stagingdb_results_data_loader
+
+#Stages: [name, staging folder, loader module, stages it depends on], in the order they are run when they
+#do not depend on each other
+STAGES = [['certificates', '_AR Data Staging Certificate', aris_geochem_stagingdb_certificates_data_loader, []],
+          ['sample info', '_AR Data Staging Location', aris_geochem_stagingdb_sample_info_data_loader, []],
+          ['results', '_AR Data Staging Results', aris_geochem_stagingdb_results_data_loader,
+           ['certificates', 'sample info']]]
+
+#Order the stages after their dependencies
+#Syntax: get_stage_order(list) returns list
+def get_stage_order(stages):
+    ordered = list()
+    done = set()
+    while len(ordered) < len(stages):
+        ready = [stage for stage in stages if (stage[0] not in done) and set(stage[3]).issubset(done)]
+        if not ready:
+            print 'Circular dependencies between the stages: ' + \
+                ', '.join([stage[0] for stage in stages if stage[0] not in done])
+            sys.exit()
+        ordered.append(ready[0])
+        done.add(ready[0][0])
+    return ordered
+
+#Find the staging folders under the data directory (folder names are matched regardless of case) and
+#build the plan: [[name, staging folder path or None, loader module, number of staged files], ...]
+#Syntax: get_plan(string) returns list
+def get_plan(data_root):
+    folders = dict([[folder.lower(), folder] for folder in os.listdir(data_root)
+                    if os.path.isdir(os.path.join(data_root, folder))])
+    plan = list()
+    for [name, folder, loader, depends] in get_stage_order(STAGES):
+        if folder.lower() in folders:
+            data_dir = os.path.join(data_root, folders[folder.lower()]) + os.sep
+            plan.append([name, data_dir, loader, len(os.listdir(data_dir))])
+        else:
+            plan.append([name, None, loader, 0])
+    return plan
+
+#Print the timings of the stages
+#Syntax: print_timings(list) returns None
+def print_timings(timings):
+    print '\n' + 'stage'.ljust(14) + 'files'.rjust(7) + 'seconds'.rjust(10) + '  status'
+    for [name, file_count, seconds, status] in timings:
+        print name.ljust(14) + str(file_count).rjust(7) + ('%.2f' % seconds).rjust(10) + '  ' + status
+    print 'total'.ljust(14) + str(sum([timing[1] for timing in timings])).rjust(7) + \
+        ('%.2f' % sum([timing[2] for timing in timings])).rjust(10)
+
+#============================================= Main routine =========================================
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_root = 'C:\\Project\\ARIS_Geochem_dev\\data\\'):
+    plan = get_plan(data_root)
+    print 'Ingestion plan:'
+    for [name, data_dir, loader, file_count] in plan:
+        if data_dir is None:
+            print '    ' + name + ': no staging folder'
+        else:
+            print '    ' + name + ': ' + str(file_count) + ' staged file(s) in ' + data_dir
+
+    #Shared database connection and reference cache of the code tables
+    db_conn = storage_backend.connect(db_path)
+    refcache = reference_cache.ReferenceCache(db_path)
+
+    timings = list()
+    try:
+        for [name, data_dir, loader, file_count] in plan:
+            if file_count == 0:
+                timings.append([name, 0, 0.0, 'skipped (nothing staged)'])
+                continue
+
+            print '\n========== ' + name + ' =========='
+            start_time = time.time()
+            try:
+                if loader is aris_geochem_stagingdb_results_data_loader:
+                    loader.main(db_path, data_dir, db_conn = db_conn, refcache = refcache)
+                else:
+                    loader.main(db_path, data_dir, db_conn = db_conn)
+            except SystemExit:
+                timings.append([name, file_count, time.time() - start_time, 'stopped'])
+                print '\n' + name + ' stopped, the stages after it are not run'
+                break
+            timings.append([name, file_count, time.time() - start_time, 'done'])
+    finally:
+        db_conn.close()
+        print_timings(timings)
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) == 2:
+        main(args[0], args[1])
+    else:
+        main()
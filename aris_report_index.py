@@ -0,0 +1,372 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps an in-memory index of the locations of the ARIS assessment reports, so that each
+   sample can be compared with the location of its own report (the ARIS number of its staged file, or its
+   'data_ar' rows) and with the reports around it:
+         1) the report locations (ARIS number, NAD83 long. and lat.) are read once per run from the
+            minimal ARIS database (min_aris.mdb, with REPORT_QUERY), or from its csv export (EXPORT_FILE)
+            when the database is missing or has not changed since the export was written; the export is
+            written again after each read of the database, so that the machines without the MS Access
+            driver use it;
+         2) the reports are put in a grid of CELL_SIZE degree cells;
+         3) the distance of samples to their own report is computed for all the samples at once (arrays);
+         4) the k nearest reports of samples are found cell by cell: the samples of a cell are compared
+            with the reports of the square of cells around it at once, and the square is doubled in size
+            for the samples whose k-th nearest report is not nearer than the edge of the square.
+   The distances are great circle distances on a sphere of radius sample_index.EARTH_RADIUS. A report
+   listed more than once keeps its first location.
+
+   Input
+         1) Minimal ARIS database (MS Access, table and columns in REPORT_QUERY), or its csv export
+         2) ARIS numbers and NAD83 long. and lat. of samples (arrays)
+
+   Output
+         Distances in km to the own reports, [[ARIS number, km], ...] of the nearest other reports, and
+         the ARIS_Report_km and ARIS_Nearest columns of the ARIS geochem data product
+
+   Usage
+         index = aris_report_index.get_index()
+         km = index.distances(ar_numbers, nad83_long, nad83_lat)
+         nearest = index.nearest(nad83_long, nad83_lat, k, ar_numbers)
+
+         In the ARIS geochem product creator: --aris-reports[=k]
+
+         From the command line:
+         python aris_report_index.py report <ARIS number> [k]
+         python aris_report_index.py nearest <long.> <lat.> <k>
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, csv, hashlib
+import numpy as np
+import sample_geo, sample_index
+
+#Minimal ARIS database and its csv export (ARIS number, NAD83 long., NAD83 lat.)
+ARIS_DB = 'C:\\min_aris\\min_aris.mdb'
+EXPORT_FILE = 'C:\\min_aris\\min_aris_locations.csv'
+
+#Report locations in the minimal ARIS database: ARIS number, NAD83 long. and lat.
+REPORT_QUERY = """select asses_num, longitude, latitude from aris_report"""
+
+#Largest distance in km between a sample and the location of its report (see data_screener_sample_info.py)
+REPORT_DISTANCE = 10.0
+
+#Size of the grid cells in degrees (about 28 km north-south, 15 to 20 km east-west in the province)
+CELL_SIZE = 0.25
+
+#Largest number of points compared with the reports of a square of cells at once
+BATCH_SIZE = 1000
+
+#Number of nearest other reports in the data product column (run with --aris-reports)
+NEAREST_COUNT = 3
+
+#Columns added to the ARIS geochem data product
+PRODUCT_HEADERS = ['ARIS_Report_km', 'ARIS_Nearest']
+
+#Indices already loaded, {(database path, export path): ArisReportIndex or None}
+indexes = {}
+
+#Get the ARIS number of a value of the database, a staged file name or a data_ar row as a string (e.g.
+#12345.0, u'12345' and ' 12345' are all '12345')
+#Syntax: get_ar_number(variable) returns string
+def get_ar_number(value):
+    ar_number = unicode(value).strip()
+    try:
+        if float(ar_number) == int(float(ar_number)):
+            return str(int(float(ar_number)))
+    except (ValueError, OverflowError):
+        pass
+    return ar_number
+
+#Get the great circle distances in km between arrays of points in long. and lat.
+#Syntax: get_distances(array, array, array, array) returns array
+def get_distances(long1, lat1, long2, lat2):
+    [long1, lat1, long2, lat2] = [np.radians(val) for val in [long1, lat1, long2, lat2]]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    return 2 * sample_index.EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+#Read the report locations from the minimal ARIS database: [[ARIS number, long., lat.], ...]
+#Syntax: read_database(string) returns list
+def read_database(aris_db):
+    import pyodbc
+    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' + aris_db)
+    cur = db_conn.cursor()
+    cur.execute(REPORT_QUERY)
+    locations = [[get_ar_number(record[0]), record[1], record[2]] for record in cur.fetchall()
+                 if (record[0] is not None) and (record[1] is not None) and (record[2] is not None)]
+    db_conn.close()
+    return locations
+
+#Read the report locations from the csv export: [[ARIS number, long., lat.], ...]
+#Syntax: read_export(string) returns list
+def read_export(export_file):
+    csv_input = open(export_file, 'rU')
+    rows = csv.reader(csv_input)
+    rows.next()
+    locations = [[row[0], row[1], row[2]] for row in rows if len(row) >= 3]
+    csv_input.close()
+    return locations
+
+#Write the report locations to the csv export
+#Syntax: write_export(string, list) returns None
+def write_export(export_file, locations):
+    csv_output = open(export_file, 'wb')
+    csv_writer = csv.writer(csv_output, delimiter = ',')
+    csv_writer.writerow(['ar_number', 'nad83_long', 'nad83_lat'])
+    for [ar_number, nad83_long, nad83_lat] in locations:
+        csv_writer.writerow([ar_number.encode('utf-8'), repr(float(nad83_long)), repr(float(nad83_lat))])
+    csv_output.close()
+
+#Read the report locations from the database, or from the export when it is at least as recent as the
+#database (see 1) above). Returns [source file, locations], or None if neither exists.
+#Syntax: load_locations(string, string) returns list
+def load_locations(aris_db, export_file):
+    if os.path.isfile(export_file) and ((not os.path.isfile(aris_db)) or
+                                        (os.path.getmtime(export_file) >= os.path.getmtime(aris_db))):
+        return [export_file, read_export(export_file)]
+    if os.path.isfile(aris_db):
+        locations = read_database(aris_db)
+        try:
+            write_export(export_file, locations)
+        except IOError:
+            print 'Warning: can not write ' + export_file
+        return [aris_db, locations]
+    return None
+
+class ArisReportIndex(object):
+    #Build the index of report locations [[ARIS number, long., lat.], ...] read from a source file
+    #Syntax: ArisReportIndex(list, string)
+    def __init__(self, locations, source = ''):
+        self.source = source
+        self.ar_numbers = list()
+        self.positions = {}     #{ARIS number: position}
+        coords = list()
+        for [ar_number, nad83_long, nad83_lat] in locations:
+            ar_number = get_ar_number(ar_number)
+            if ar_number in self.positions:
+                continue
+            try:
+                [nad83_long, nad83_lat] = [float(nad83_long), float(nad83_lat)]
+            except ValueError:
+                continue
+            if not (np.isfinite(nad83_long) and np.isfinite(nad83_lat)):
+                continue
+            self.positions[ar_number] = len(self.ar_numbers)
+            self.ar_numbers.append(ar_number)
+            coords.append([nad83_long, nad83_lat])
+        coords = np.array(coords, dtype = float).reshape(-1, 2)
+        [self.nad83_long, self.nad83_lat] = [coords[:, 0], coords[:, 1]]
+
+        #Reports of each grid cell, {(cell_x, cell_y): array of positions}
+        cell_x = np.floor(self.nad83_long / CELL_SIZE).astype(np.int64)
+        cell_y = np.floor(self.nad83_lat / CELL_SIZE).astype(np.int64)
+        order = np.lexsort([cell_y, cell_x])
+        self.cells = {}
+        if len(order):
+            keys = np.column_stack([cell_x[order], cell_y[order]])
+            starts = np.flatnonzero(np.any(np.diff(keys, axis = 0) <> 0, axis = 1)) + 1
+            for positions in np.split(order, starts):
+                self.cells[(int(cell_x[positions[0]]), int(cell_y[positions[0]]))] = positions
+
+    #Version of the index for the screening cache (source file, number of reports and md5 hash of the reports
+    #and their locations)
+    #Syntax: repr(ArisReportIndex) returns string
+    def __repr__(self):
+        md5 = hashlib.md5()
+        md5.update(u','.join(self.ar_numbers).encode('utf-8'))
+        md5.update(self.nad83_long.astype('<f8').tostring())
+        md5.update(self.nad83_lat.astype('<f8').tostring())
+        return 'ArisReportIndex(' + repr([self.source, len(self.ar_numbers), md5.hexdigest()]) + ')'
+
+    #Get the location [long., lat.] of a report (None if not in the index)
+    #Syntax: location(string) returns list
+    def location(self, ar_number):
+        position = self.positions.get(get_ar_number(ar_number))
+        if position is None:
+            return None
+        return [float(self.nad83_long[position]), float(self.nad83_lat[position])]
+
+    #Get the positions of ARIS numbers in the index (-1 if not in the index)
+    #Syntax: get_positions(list) returns array
+    def get_positions(self, ar_numbers):
+        return np.array([self.positions.get(get_ar_number(ar_number), -1) for ar_number in ar_numbers],
+                        dtype = np.int64)
+
+    #Get the distances in km of points to their reports (NaN if the report is not in the index)
+    #Syntax: distances(list, array, array) returns array
+    def distances(self, ar_numbers, nad83_long, nad83_lat):
+        positions = self.get_positions(ar_numbers)
+        km = np.zeros(len(positions)) + np.nan
+        found = positions >= 0
+        if found.any():
+            km[found] = get_distances(np.asarray(nad83_long, dtype = float)[found],
+                                      np.asarray(nad83_lat, dtype = float)[found],
+                                      self.nad83_long[positions[found]], self.nad83_lat[positions[found]])
+        return km
+
+    #Get the positions of the reports in a square of cells
+    #Syntax: get_cells(int, int, int, int) returns array
+    def get_cells(self, cell_x1, cell_y1, cell_x2, cell_y2):
+        if (cell_x2 - cell_x1 + 1) * (cell_y2 - cell_y1 + 1) > len(self.cells):
+            found = [positions for [cell, positions] in self.cells.items()
+                     if (cell_x1 <= cell[0] <= cell_x2) and (cell_y1 <= cell[1] <= cell_y2)]
+        else:
+            found = [self.cells[(cell_x, cell_y)] for cell_x in range(cell_x1, cell_x2 + 1)
+                     for cell_y in range(cell_y1, cell_y2 + 1) if (cell_x, cell_y) in self.cells]
+        if not found:
+            return np.zeros(0, dtype = np.int64)
+        return np.concatenate(found)
+
+    #Get the k reports nearest to points, closest first: [[[ARIS number, km], ...], ...] (one list per
+    #point). The own report of each point (ARIS numbers, optional) is left out.
+    #Syntax: nearest(array, array, int, list) returns list
+    def nearest(self, nad83_long, nad83_lat, k, ar_numbers = None):
+        nad83_long = np.asarray(nad83_long, dtype = float)
+        nad83_lat = np.asarray(nad83_lat, dtype = float)
+        found = [list() for i in range(len(nad83_long))]
+        if (k <= 0) or (len(self.ar_numbers) == 0):
+            return found
+        excluded = np.zeros(len(nad83_long), dtype = np.int64) - 1
+        if ar_numbers is not None:
+            excluded = self.get_positions(ar_numbers)
+
+        #Points by grid cell, in batches of BATCH_SIZE points
+        valid = np.flatnonzero(np.isfinite(nad83_long) & np.isfinite(nad83_lat))
+        cell_x = np.floor(nad83_long[valid] / CELL_SIZE).astype(np.int64)
+        cell_y = np.floor(nad83_lat[valid] / CELL_SIZE).astype(np.int64)
+        groups = {}
+        for i in range(len(valid)):
+            groups.setdefault((int(cell_x[i]), int(cell_y[i])), list()).append(valid[i])
+        batches = [[cell, np.array(points[start:start + BATCH_SIZE], dtype = np.int64)]
+                   for [cell, points] in groups.items() for start in range(0, len(points), BATCH_SIZE)]
+
+        for [[x, y], points] in batches:
+            ring = 1
+            while len(points):
+                candidates = self.get_cells(x - ring, y - ring, x + ring, y + ring)
+
+                #Distances of the points (rows) to the reports of the square (columns), own reports left out
+                km = get_distances(nad83_long[points][:, np.newaxis], nad83_lat[points][:, np.newaxis],
+                                   self.nad83_long[candidates][np.newaxis, :],
+                                   self.nad83_lat[candidates][np.newaxis, :])
+                km[candidates[np.newaxis, :] == excluded[points][:, np.newaxis]] = np.inf
+                order = np.argsort(km, axis = 1, kind = 'mergesort')[:, :k]
+                sorted_km = km[np.arange(len(points))[:, np.newaxis], order]
+
+                #Distance from the points to the nearest edge of the square: any report closer than it is in
+                #the square (see sample_index.SampleIndex.nearest)
+                lat_edge = np.minimum(nad83_lat[points] - (y - ring) * CELL_SIZE,
+                                      (y + ring + 1) * CELL_SIZE - nad83_lat[points])
+                long_edge = np.minimum(nad83_long[points] - (x - ring) * CELL_SIZE,
+                                       (x + ring + 1) * CELL_SIZE - nad83_long[points])
+                cos_lat = np.cos(np.radians(np.minimum(89.0, np.abs(nad83_lat[points]) + lat_edge)))
+                edge_km = np.radians(np.minimum(lat_edge, long_edge * cos_lat)) * sample_index.EARTH_RADIUS
+
+                if len(candidates) == len(self.ar_numbers):
+                    done = np.ones(len(points), dtype = bool)
+                elif sorted_km.shape[1] < k:
+                    done = np.zeros(len(points), dtype = bool)
+                else:
+                    done = sorted_km[:, -1] <= edge_km
+                for i in np.flatnonzero(done):
+                    found[points[i]] = [[self.ar_numbers[candidates[order[i, j]]], float(sorted_km[i, j])]
+                                        for j in range(order.shape[1]) if np.isfinite(sorted_km[i, j])]
+                points = points[~done]
+                ring = ring * 2
+        return found
+
+#Get the index of the report locations, loaded once per run (None if neither the database nor the export
+#exists)
+#Syntax: get_index(string, string) returns ArisReportIndex
+def get_index(aris_db = None, export_file = None):
+    if aris_db is None:
+        aris_db = ARIS_DB
+    if export_file is None:
+        export_file = EXPORT_FILE
+    if (aris_db, export_file) not in indexes:
+        loaded = load_locations(aris_db, export_file)
+        if loaded is None:
+            print 'Warning: no ARIS report locations (' + aris_db + ' or ' + export_file + ')'
+            indexes[(aris_db, export_file)] = None
+        else:
+            indexes[(aris_db, export_file)] = ArisReportIndex(loaded[1], loaded[0])
+    return indexes[(aris_db, export_file)]
+
+#Get the number of nearest reports of the data product column from the command line arguments
+#(--aris-reports[=k]). Returns None without the option.
+#Syntax: get_product_args(list) returns int
+def get_product_args(args):
+    k = None
+    for arg in args:
+        if arg == '--aris-reports':
+            k = NEAREST_COUNT
+        elif arg.startswith('--aris-reports='):
+            k = int(arg.partition('=')[2])
+    return k
+
+#Get the data product columns of the samples of the locations read by sample_geo.read_geo(): the distance
+#to the nearest of their own reports ('data_ar' table) and the k nearest other reports, e.g.
+#"12345 (1.234km); 23456 (5.678km)". Returns the headers of the columns and {sample_id: [values]} (blank
+#without location, report or index).
+#Syntax: get_product_columns(db_cursor, dict, list, int) returns [list, dict]
+def get_product_columns(db_cur, geo, sample_ids, k):
+    columns = dict([[sample_id, [''] * len(PRODUCT_HEADERS)] for sample_id in sample_ids])
+    index = get_index()
+    if index is None:
+        return [PRODUCT_HEADERS, columns]
+
+    #Reports of the samples, in one query
+    own_reports = {}
+    db_cur.execute("""select sample_id, ar_number from data_ar""")
+    for record in db_cur.fetchall():
+        if (record[0] in columns) and (record[1] is not None):
+            own_reports.setdefault(record[0], list()).append(get_ar_number(record[1]))
+
+    #The samples without a location are left blank (see sample_geo.has_location)
+    located = [[sample_id, float(geo[sample_id][0]), float(geo[sample_id][1])] for sample_id in sample_ids
+               if (sample_id in geo) and sample_geo.has_location(geo[sample_id])]
+    nad83_long = np.array([row[1] for row in located], dtype = float)
+    nad83_lat = np.array([row[2] for row in located], dtype = float)
+
+    #Distance to the nearest own report: one array per rank of the reports of a sample
+    km = np.zeros(len(located)) + np.nan
+    max_reports = max([len(own_reports.get(row[0], [])) for row in located] + [0])
+    for rank in range(max_reports):
+        reports = [(own_reports.get(row[0], []) + [''] * max_reports)[rank] for row in located]
+        km = np.fmin(km, index.distances(reports, nad83_long, nad83_lat))
+
+    #Nearest reports other than the own ones
+    nearest = index.nearest(nad83_long, nad83_lat, k + max_reports)
+    for i in range(len(located)):
+        own = own_reports.get(located[i][0], [])
+        if not np.isnan(km[i]):
+            columns[located[i][0]][0] = '%.3f' % km[i]
+        columns[located[i][0]][1] = '; '.join([ar_number + ' (' + ('%.3f' % report_km) + 'km)'
+                                               for [ar_number, report_km] in nearest[i]
+                                               if ar_number not in own][:k])
+    return [PRODUCT_HEADERS, columns]
+
+#============================================= Main routine =========================================
+def main(query, values):
+    index = get_index()
+    if index is None:
+        sys.exit()
+    if query == 'report':
+        location = index.location(values[0])
+        if location is None:
+            print 'No ARIS record was found for report ' + values[0]
+            return
+        print values[0] + ',' + ','.join([repr(val) for val in location])
+        if len(values) > 1:
+            for [ar_number, km] in index.nearest([location[0]], [location[1]], int(values[1]), [values[0]])[0]:
+                print ar_number + ',' + ('%.3f' % km)
+    elif query == 'nearest':
+        for [ar_number, km] in index.nearest([float(values[0])], [float(values[1])], int(values[2]))[0]:
+            print ar_number + ',' + ('%.3f' % km)
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2:])
@@ -7,24 +7,38 @@
    
    Input
          1) Path to the directory where the staged certificate xlsx files reside
-         2) ARIS Geochem stage Database path
+         2) ARIS Geochem stage Database path (MS Access, or SQLite stand-in, see storage_backend.py)
          3) Some hardcoded parameters
          
    Output
          Display identified problems
 
    Operation note
-         1) The script has many independent code-blocks targeting different types of errors as listed
-            below. Though each code-block can be executed randomly, it is strongly recommended to
-            run them sequentially in the given order, one at a time. For example, it should start with
-            checking format related problems in the xlsx files by commenting out all other code-blocks
-            which are for checking other types of errors. Once the format-related errors are identified
-            and fixed, the format-checking code-block should be commented out and then move on to the
-            "analyte name checking block" ...
+         1) The script has many independent checks targeting different types of errors as listed
+            below. Each check is an entry of the "checks" list in main(). Though each check can be
+            executed randomly, it is strongly recommended to run them sequentially in the given order,
+            one at a time. For example, it should start with checking format related problems in the
+            xlsx files by commenting out all other entries which are for checking other types of errors.
+            Once the format-related errors are identified and fixed, the format-checking entry should be
+            commented out and then move on to the "analyte name checking" entry ...
 
          2) Duplicate samples should be given different "sample_code". Re-published samples should
             have the same 'sample_code' across all publications. Sections 15 and 16 are designed to
             ensure if the above requirements are met.
+
+         3) The problems found are kept in a screening cache (see screening_cache.py). A re-run only
+            re-screens the files whose content changed and the checks whose rules or reference data
+            (code tables, hardcoded lists) changed. The problems of the rest are replayed from the cache.
+            Run the script with --rescreen to discard the cache and screen all files again.
+
+         4) Run the script with --watch to keep it running after screening (see staging_watcher.py).
+            The staging directory is polled and a file added or changed is re-screened on its own, with
+            the reference data kept in memory, so a fix can be verified right after saving the file.
+
+         5) Run the script with --profile to record the wall time, cells visited, database queries and
+            workbook loads of each check on each file (see screening_profiler.py). A summary table is
+            printed at the end of the run and all the records are saved to a JSON file next to the
+            screening cache.
             
     This script is able to check the following:
 
@@ -41,9 +55,17 @@
   Last update
       2017-06-08
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
 from dateutil.parser import parse
+import screener_runner, screening_cache, staging_watcher, screening_profiler
+import query_profiler, storage_backend, reference_cache
+
+#Version of the rule set below. It is part of the screening cache key. The code of the checks and of the
+#helpers they call, and the reference data in "refs", are versioned by the cache itself (see
+#screening_cache.py), so bump it only for a change the cache can not see, e.g. a module-level constant read
+#by a check or an openpyxl upgrade changing the values read from the workbooks.
+RULESET_VERSION = '2017.1'
 
 # This function is to check if a given string can be converted to a decimal number
 # Syntax: is_number(string) return logic
@@ -85,137 +107,147 @@ def project2nad83 (x_coord, y_coord, source_epsg):
     
     return [str(point.GetX(0)), str(point.GetY(0))]
     
-def main():   
+
+#============================================ Checks ==================================================
+#Each check examines the worksheet of one staged xlsx file and returns the problems found in it. A problem
+#is the text printed after the file name. See screener_runner.py.
+#Syntax: check_xxx(string, worksheet, dict) returns list
+
+#====================================== 1. Check xls file format ======================================
+def check_format(xls_file, ws, refs):
+    problems = list()
+    if (str(ws.cell(row = 1, column = 1).value)).lower() <> 'cert_no':
+        problems.append(': Wrong cert_no column header')
+    if (str(ws.cell(row = 1, column = 2).value)).lower() <> 'cert_date':
+        problems.append(': Wrong cert_date column header')
+    if (str(ws.cell(row = 1, column = 3).value)).lower() <> 'lab_id':
+        problems.append(': Wrong lab_id column header')
+    if (str(ws.cell(row = 1, column = 4).value)).lower() <> 'prep_id':
+        problems.append(': Wrong pre_id column header')
+    return problems
+
+#=============================== 2. Verify lab_id ===========================
+def check_lab(xls_file, ws, refs):
+    problems = list()
+    if str(ws.cell(row = 2, column = 3).value) not in refs['lab_list']:
+        problems.append(': ' + str(ws.cell(row = 2, column = 3).value) + ' lab_id not in list')
+    return problems
+
+#==================================== 3. Check prep_id ======================================
+def check_prep(xls_file, ws, refs):
+    problems = list()
+    if str(ws.cell(row=2, column=4).value) not in refs['prep_list']:
+        problems.append(': ' + str(ws.cell(row=2, column=4).value) + ' prep_id not in list')
+    return problems
+
+# ----------------------------------4.Check date validity-----------------------------------------------------
+def check_date(xls_file, ws, refs):
+    problems = list()
+    date_cell = str(ws.cell(row=2, column=2).value)
+
+    if not ((date_cell == '') or (date_cell == 'None')):
+        if not (date_cell.isupper() or (date_cell.islower())):
+            try:
+                parse(date_cell)
+            except ValueError:
+                problems.append(': ' + str(ws.cell(row=2, column=2).value) + ' is not a proper date')
+        else:
+            problems.append(': ' + str(ws.cell(row=2, column=2).value) + ' is not a proper date')
+    else:
+        problems.append(': ' + str(ws.cell(row=2, column=2).value) + ' certificate date is missing')
+    return problems
+
+# =============================== 5. Verify cert_no ===========================
+def check_cert_no(xls_file, ws, refs):
+    problems = list()
+    if str(ws.cell(row=2, column=1).value) in refs['cert_list']:
+        problems.append(': ' + str(ws.cell(row=2, column=1).value) + ' cert_no already in db')
+    elif str(ws.cell(row=2, column=1).value) == 'None':
+        problems.append(': ' + str(ws.cell(row=2, column=1).value) + ' cert_no missing')
+
+    # extract the cert_no from the file name and compare to that in the sheet
+    cert_no = xls_file.partition('_')[2]
+    cert_no = cert_no[:-10]
+    if cert_no <> str(ws.cell(row=2, column=1).value):
+        problems.append(': ' + str(ws.cell(row=2, column=1).value) + \
+                        ' cert_no in file name does not match cert_no within sheet' + cert_no)
+    return problems
+
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Certificate\\',
+         cache_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\screening_cache_certificates.pkl'):
     #File path
-    db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb'
-    data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Certificate\\'
+    profile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\screening_profile_certificates_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
+    qprofile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\query_profile_data_screener_certificates_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
 
     #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
+    db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('data_screener_certificates', '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Record the time, cells, queries and workbook loads of each check (see Operation note 5)
+    profile = None
+    if '--profile' in sys.argv[1:]:
+        profile = screening_profiler.ScreeningProfile('data_screener_certificates')
+        cur = profile.cursor(cur)
+
     #Collect year sub-directories under given "data_dir"
     xls_list = os.listdir(data_dir)
-    #====================================== 1. Check xls file format ======================================
 
-    print '1. Examine file format ...'
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (str(ws.cell(row = 1, column = 1).value)).lower() <> 'cert_no':
-            print '    ' + xls_list[f] + ': Wrong cert_no column header'
-        if (str(ws.cell(row = 1, column = 2).value)).lower() <> 'cert_date':
-            print '    ' + xls_list[f] + ': Wrong cert_date column header'
-        if (str(ws.cell(row = 1, column = 3).value)).lower() <> 'lab_id':
-            print '    ' + xls_list[f] + ': Wrong lab_id column header'
-        if (str(ws.cell(row = 1, column = 4).value)).lower() <> 'prep_id':
-            print '    ' + xls_list[f] + ': Wrong pre_id column header'
-
-    #=============================== 2. Verify lab_id ===========================
-    print '\n2. Examine lab_id...'
-    lab_list = list()  #Build a list of lab id's using current database values
-    cur.execute("""select lab_id from code_lab""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        lab_list.append(str(val_rows[i][0]))
+    #------------------------------- Reference data from the database ----------------------------------
+    qprofile.set_stage('reference data')
+    if profile is not None:
+        profile.start_stage('reference data')
+    refcache = reference_cache.ReferenceCache(db_path)    #Code tables kept in memory (see reference_cache.py)
+    refcache.load(cur, ['code_lab', 'code_prep'])
 
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if str(ws.cell(row = 2, column = 3).value) not in lab_list:
-            print '    ' + xls_list[f] + ': ' + str(ws.cell(row = 2, column = 3).value) + \
-                    ' lab_id not in list'
-
-    #==================================== 3. Check prep_id ======================================
-    print '\n3. Examine prep_id...'
-    prep_list = list()  # Build a list of lab id's using current database values
-    cur.execute("""select prep_id from code_prep""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        prep_list.append(str(val_rows[i][0]))
-
-    # Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if str(ws.cell(row=2, column=4).value) not in prep_list:
-            print '    ' + xls_list[f] + ': ' + str(ws.cell(row=2, column=4).value) + \
-                  ' prep_id not in list'
-
-    # ----------------------------------4.Check date validity-----------------------------------------------------
-    print '\n4.Examine sample dates ...'
-    # Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        date_cell = str(ws.cell(row=2, column=2).value)
-
-        if not ((date_cell == '') or (date_cell == 'None')):
-            if not (date_cell.isupper() or (date_cell.islower())):
-                try:
-                    parse(date_cell)
-                except ValueError:
-                    print '    ' + xls_name + ': ' + str(ws.cell(row=2, column=2).value) + \
-                            ' is not a proper date'
-            else:
-                print '    ' + xls_name + ': ' + str(ws.cell(row=2, column=2).value) + \
-                        ' is not a proper date'
-        else:
-            print '    ' + xls_name + ': ' + str(ws.cell(row=2, column=2).value) + \
-                  ' certificate date is missing'
+    #Build lists of lab id's and prep id's using current database values
+    lab_list = [str(lab_id) for lab_id in refcache.column('code_lab', 'lab_id')]
+    prep_list = [str(prep_id) for prep_id in refcache.column('code_prep', 'prep_id')]
 
-    # =============================== 5. Verify cert_no ===========================
-    print '\n5. Examine cert_no...'
-    cert_list = list()  # Build a list of lab id's using current database values
+    cert_list = list()  # Build a list of cert_no's using current database values
     cur.execute("""select cert_no from data_cert""")
     val_rows = cur.fetchall()
     for i in range(len(val_rows)):
         cert_list.append(str(val_rows[i][0]))
 
-    # Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if str(ws.cell(row=2, column=1).value) in cert_list:
-            print '    ' + xls_list[f] + ': ' + str(ws.cell(row=2, column=1).value) + \
-                    ' cert_no already in db'
-        elif str(ws.cell(row=2, column=1).value) == 'None':
-            print '    ' + xls_list[f] + ': ' + str(ws.cell(row=2, column=1).value) + \
-                    ' cert_no missing'
-
-        # extract the cert_no from the file name and compare to that in the sheet
-        cert_no = xls_list[f].partition('_')[2]
-        cert_no = cert_no[:-10]
-        if cert_no <> str(ws.cell(row=2, column=1).value):
-            print '    ' + xls_list[f] + ': ' + str(ws.cell(row=2, column=1).value) + \
-                    ' cert_no in file name does not match cert_no within sheet' + cert_no
-
-
-'''   
-db_conn.close()
-'''
-print '\nJob done.'
+    refs = {'lab_list': lab_list, 'prep_list': prep_list, 'cert_list': set(cert_list)}
+
+    #------------------------------------------- Checks ------------------------------------------------
+    #Comment out entries to skip checks (see Operation note 1)
+    checks = [['1. Examine file format ...', check_format, []],
+              ['\n2. Examine lab_id...', check_lab, ['lab_list']],
+              ['\n3. Examine prep_id...', check_prep, ['prep_list']],
+              ['\n4.Examine sample dates ...', check_date, []],
+              ['\n5. Examine cert_no...', check_cert_no, ['cert_list']]]
+
+    #Problems are printed after the file name
+    def report(xls_file, problem):
+        print '    ' + xls_file + problem
+
+    #Replay the problems of unchanged files from the screening cache (see Operation note 3)
+    if profile is not None:
+        profile.start_stage('screening cache')
+    cache = screening_cache.ScreeningCache(cache_file, RULESET_VERSION, screening_cache.get_ref_versions(refs),
+                                           '--rescreen' in sys.argv[1:])
+
+    #Keep re-screening the changed files (see Operation note 4)
+    if '--watch' in sys.argv[1:]:
+        staging_watcher.watch(data_dir, checks, refs, report, cache)
+    else:
+        screener_runner.run_checks(data_dir, xls_list, checks, refs, report, cache, profile = profile)
+        if profile is not None:
+            profile.print_summary()
+            profile.save_json(profile_file)
+
+    qprofile.report(qprofile_file)
+    db_conn.close()
+    print '\nJob done.'
 
 if __name__ == "__main__":
     main()
@@ -7,24 +7,38 @@
    
    Input
          1) Path to the directory where the staged results xlsx files reside
-         2) ARIS Geochem stage Database path
+         2) ARIS Geochem stage Database path (MS Access, or SQLite stand-in, see storage_backend.py)
          3) Some hardcoded parameters
          
    Output
          Display identified problems
 
    Operation note
-         1) The script has many independent code-blocks targeting different types of errors as listed
-            below. Though each code-block can be executed randomly, it is strongly recommended to
-            run them sequentially in the given order, one at a time. For example, it should start with
-            checking format related problems in the xlsx files by commenting out all other code-blocks
-            which are for checking other types of errors. Once the format-related errors are identified
-            and fixed, the format-checking code-block should be commented out and then move on to the
-            "analyte name checking block" ...
+         1) The script has many independent checks targeting different types of errors as listed
+            below. Each check is an entry of the "checks" list in main(). Though each check can be
+            executed randomly, it is strongly recommended to run them sequentially in the given order,
+            one at a time. For example, it should start with checking format related problems in the
+            xlsx files by commenting out all other entries which are for checking other types of errors.
+            Once the format-related errors are identified and fixed, the format-checking entry should be
+            commented out and then move on to the "analyte name checking" entry ...
 
          2) Duplicate samples should be given different "sample_code". Re-published samples should
             have the same 'sample_code' across all publications. Sections 15 and 16 are designed to
             ensure if the above requirements are met.
+
+         3) The problems found are kept in a screening cache (see screening_cache.py). A re-run only
+            re-screens the files whose content changed and the checks whose rules or reference data
+            (code tables, hardcoded lists) changed. The problems of the rest are replayed from the cache.
+            Run the script with --rescreen to discard the cache and screen all files again.
+
+         4) Run the script with --watch to keep it running after screening (see staging_watcher.py).
+            The staging directory is polled and a file added or changed is re-screened on its own, with
+            the reference data kept in memory, so a fix can be verified right after saving the file.
+
+         5) Run the script with --profile to record the wall time, cells visited, database queries and
+            workbook loads of each check on each file (see screening_profiler.py). A summary table is
+            printed at the end of the run and all the records are saved to a JSON file next to the
+            screening cache.
             
     This script is able to check the following:
          1)  if format of staged xlsx files is correct;
@@ -80,8 +94,16 @@
   Last update
       2016-12-15
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
+import screener_runner, screening_cache, staging_watcher, screening_profiler
+import query_profiler, storage_backend, reference_cache
+
+#Version of the rule set below. It is part of the screening cache key. The code of the checks and of the
+#helpers they call, and the reference data in "refs", are versioned by the cache itself (see
+#screening_cache.py), so bump it only for a change the cache can not see, e.g. a module-level constant read
+#by a check or an openpyxl upgrade changing the values read from the workbooks.
+RULESET_VERSION = '2017.1'
 
 # This function is to check if a given string can be converted to a decimal number
 # Syntax: is_number(string) return logic
@@ -122,16 +144,248 @@ def project2nad83 (x_coord, y_coord, source_epsg):
     point.Transform(transform)
     
     return [str(point.GetX(0)), str(point.GetY(0))]
-    
-def main():   
+
+#Get the last analyte column of a results sheet (blank analyte headers at the end are not counted)
+#Syntax: get_lastcolumn(worksheet) returns int
+def get_lastcolumn(ws):
+    reallastcolumn = ws.max_column
+    for i in range(ws.max_column, 3, -1):
+        if (ws.cell(row=1, column=i)).value is None:
+            reallastcolumn = i - 1
+    return reallastcolumn
+
+#Get the last sample row of a results sheet (a blank row at the end is not counted)
+#Syntax: get_lastrow(worksheet) returns int
+def get_lastrow(ws):
+    if (ws.cell(row=ws.max_row, column=1)).value is None:
+        return ws.max_row - 1
+    else:
+        return ws.max_row
+
+#============================================ Checks ==================================================
+#Each check examines the worksheet of one staged xlsx file and returns the problems found in it. A problem
+#is the text printed after the file name. See screener_runner.py.
+#Syntax: check_xxx(string, worksheet, dict) returns list
+
+#====================================== 1. Check xls file format ======================================
+def check_format(xls_file, ws, refs):
+    problems = list()
+    if (str(ws.cell(row = 5, column = 1).value)).lower() <> 'sample_name':
+        problems.append(': Wrong Sample_Name column header')
+    if (str(ws.cell(row = 5, column = 2).value)).lower() <> 'cert_no':
+        problems.append(': Wrong Cert_No column header')
+
+    if (str(ws.cell(row = 1, column = 2).value)).lower() <> 'analyte':
+        problems.append(': Wrong Analyte row header')
+    if (str(ws.cell(row = 2, column = 2).value)).lower() <> 'unit':
+        problems.append(': Wrong Unit row header')
+    if (str(ws.cell(row = 3, column = 2).value)).lower() <> 'd_limit':
+        problems.append(': Wrong D_Limit row header')
+    if (str(ws.cell(row = 4, column = 2).value)).lower() <> 'method_id':
+        problems.append(': Wrong Method_ID row header')
+    return problems
+
+#===================================== 2. Check analyte name =======================================
+def check_analyte_name(xls_file, ws, refs):
+    problems = list()
+    for c in range(3, get_lastcolumn(ws) + 1):
+        if str(ws.cell(row = 1, column = c).value) not in refs['element_list']:
+            problems.append(', Column ' + str(c) + ': ' + str(ws.cell(row = 1, column = c).value) + \
+                            ' analyte name not in list, check name')
+    return problems
+
+#=============================== 3. Verify analyte unit against database ===========================
+#should check if units are lower case, if not, convert to lower case before running checks. Alternatively
+# use .lower to run check then convert to lower case in import script.
+def check_unit(xls_file, ws, refs):
+    problems = list()
+    for c in range(3, get_lastcolumn(ws) + 1):
+        if str(ws.cell(row = 2, column = c).value) not in refs['unit_list']:
+            problems.append(', Column ' + str(c) + ': ' + str(ws.cell(row = 2, column = c).value) + \
+                            ' unit not in list, check units')
+    return problems
+
+#==================================== 4. Check detection limit ======================================
+#Detection limit is not mandatory, which can be left blank.
+def check_detection_limit(xls_file, ws, refs):
+    problems = list()
+    for c in range(3, get_lastcolumn(ws) + 1):
+        dlimit_cell = str(ws.cell(row = 3, column = c).value)
+        analyte_cell = str(ws.cell(row = 1, column = c).value)
+        if (dlimit_cell == 'None') or dlimit_cell.isspace():
+            if analyte_cell not in refs['nolimit_list']:
+                problems.append(', Column ' + str(c) + ': ' + dlimit_cell + ' missing detection limit')
+    return problems
+
+#==================================== 5. Check method_id ======================================
+def check_method(xls_file, ws, refs):
+    problems = list()
+    for c in range(3, get_lastcolumn(ws) + 1):
+        if str(ws.cell(row = 4, column = c).value) not in refs['method_list']:
+            problems.append(', Column ' + str(c) + ': ' + str(ws.cell(row = 4, column = c).value) + \
+                            ' method not in DB, check method')
+    return problems
+
+#================= 6. Check duplicate columns (i.e. same analyte, method, and lab) =============
+# It should be noted that duplicate columns may exist. For example, an analyte was initally
+# and re-analyzed using the same method by the same lab and with the same size fration. This will
+# result in 2 columns for this analyte. Extra caution should be excersized when dealing with these
+# cases.
+def check_duplicate_column(xls_file, ws, refs):
+    problems = list()
+    work_analyte = []
+    work_method = []
+
+    reallastcolumn = get_lastcolumn(ws)
+    for c in range(3, reallastcolumn + 1):
+        work_analyte.append(str(ws.cell(row = 1, column = c).value))
+        work_method.append(str(ws.cell(row = 4, column = c).value))
+
+    temp_analyte = list(work_analyte)
+    for i in range(len(work_analyte)):
+        temp_analyte[i] = str(i)
+        if work_analyte[i] in temp_analyte:
+            indx = temp_analyte.index(work_analyte[i])
+            if (work_method[i] == work_method[indx]) :
+                problems.append(', Column ' + str(reallastcolumn) + ': ' + work_analyte[i] + ' duplicate analyte')
+    return problems
+
+#===================================== 7. Check method-dependent unit =================================
+#This should be refined to account for each method's 'allowed' or possible units rather than only one unit
+#type allowed per element. The check is currently ignored, its former code-block is kept below.
+def check_dependent_unit(xls_file, ws, refs):
+    '''
+    for c in range(3, get_lastcolumn(ws) + 1):
+        analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
+        unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
+        method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
+
+        right_unit = refs['standard_unit'][refs['element_list'].index(analyte_cell)]
+        #check_code = group_list[method_list.index(method_cell)]
+        #if analyte_cell in dependent_analyte:
+        #    if check_code == dependent_method[dependent_analyte.index(analyte_cell)]:
+        #        right_unit = dependent_unit[dependent_analyte.index(analyte_cell)]
+
+        if unit_cell <> right_unit:
+            problems.append(', Column ' + str(c) + ': ' + analyte_cell + ' ' + unit_cell + \
+                            ' should be ' + right_unit)
+    '''
+    return list()
+
+#======================================== 8. Check fixed analyte-method combo ====================================
+#this may not be useful for the aris geochem db... to be revisited
+def check_fixed_method(xls_file, ws, refs):
+    problems = list()
+    fix_analyte = refs['fix_analyte']
+    for c in range(3, get_lastcolumn(ws) + 1):
+        analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
+        method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
+        if analyte_cell in fix_analyte:
+            right_method = refs['fix_method'][fix_analyte.index(analyte_cell)]
+            if method_cell <> right_method:
+                problems.append(', Column ' + str(c) + ': ' + analyte_cell + ' ' + method_cell + \
+                                ' should be ' + right_method)
+    return problems
+
+#========================================== 9. Check analyte value ==============================================
+def check_analyte_value(xls_file, ws, refs):
+    problems = list()
+    reallastcolumn = get_lastcolumn(ws)
+    reallastrow = get_lastrow(ws)
+
+    for c in range(3, reallastcolumn + 1):
+        analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
+        unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
+        d_limit_cell = str(ws.cell(row = 3, column = c).value).replace(' ', '')
+
+        for r in range(6, reallastrow + 1):
+            analyte_value = str(ws.cell(row = r, column = c).value)
+
+            if analyte_value == 'None':
+                continue
+            elif analyte_value == '0':
+                problems.append('->' + analyte_cell + ': ' + \
+                                analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value')
+            elif (not is_number(analyte_value)):
+                if (analyte_value[0] <> '>') and (analyte_value[0] <> '<'):
+                    problems.append('->' + analyte_cell + ': ' + \
+                                    analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value')
+                elif (analyte_value[0] == '<') and analyte_value[1:] <> d_limit_cell:
+                    problems.append('->' + analyte_cell + ': ' + analyte_value + '(' + str(r) + ',' + str(c) + \
+                                    ') less than entry does not match detection limit')
+            elif (unit_cell == '%') and (is_number(analyte_value)):
+                #Greater-than-100% value is not allowed if anayte unit is %
+                if (analyte_cell <> 'Total') and float(analyte_value) > 100.0:
+                    problems.append('->' + analyte_cell + ': ' + analyte_value + ' > 100%')
+
+    #Examine rows without any analytic values
+    for r in range(6, reallastrow + 1):
+        val_count = 0
+        for c in range(3, reallastcolumn + 1):
+            if is_number(str(ws.cell(row = r, column = c).value).replace(' ', '')):
+                val_count = val_count + 1
+            elif (analyte_value[0] <> '<') or (analyte_value[0] <> '>'):
+                val_count = val_count + 1
+        if val_count == 0:
+            problems.append(': Row = ' + str(r) + ' Blank row without any analytic values')
+    return problems
+
+# ==================================== 10. Check sample in db ======================================
+def check_sample_in_db(xls_file, ws, refs):
+    problems = list()
+
+    # extract the publication id (i.e. ARIS report number) from the file name
+    ar_number = xls_file.partition('_')[0]
+
+    for r in range(6, get_lastrow(ws) + 1):
+        sample_name = str(ws.cell(row=r, column=1).value)
+        smpdblkey = ar_number + "_" + sample_name
+
+        if smpdblkey not in refs['sample_list']:
+            problems.append(': ' + smpdblkey + ' not in DB')
+    return problems
+
+# ==================================== 11. Check cert_no ======================================
+def check_cert_no(xls_file, ws, refs):
+    problems = list()
+
+    # extract the cert_no from the file name and compare to that in the sheet
+    cert_no_file = xls_file.partition('_')[2]
+    cert_no_file = cert_no_file[:-13]
+
+    for r in range(6, get_lastrow(ws) + 1):
+        cert_no_sheet = str(ws.cell(row=r, column=2).value)
+
+        if cert_no_file <> cert_no_sheet:
+            problems.append(': ' + cert_no_file + \
+                            ' cert_no in file name does not match cert_no within sheet ' + cert_no_sheet)
+        if cert_no_sheet not in refs['cert_list']:
+            problems.append(': ' + cert_no_sheet + ' certificate not in DB')
+    return problems
+
+def main(db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb',
+         data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Results\\',
+         cache_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\screening_cache_results.pkl'):
     #File path
-    db_path = 'C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb'
-    data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data\\_AR Data Staging Results\\'
+    profile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\screening_profile_results_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
+    qprofile_file = 'C:\\Project\\ARIS_Geochem_dev\\data\\query_profile_data_screener_results_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
 
     #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
+    db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('data_screener_results', '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Record the time, cells, queries and workbook loads of each check (see Operation note 5)
+    profile = None
+    if '--profile' in sys.argv[1:]:
+        profile = screening_profiler.ScreeningProfile('data_screener_results')
+        cur = profile.cursor(cur)
+
     #Standard list of analyte elements (provided by Alexei).
     element_list = ['Si','Al','Ca','Fe','K','Mg','Na','P','S','SO3','CO2','Sn','Sr','SiO2',\
                     'TiO2', 'Al2O3','Fe2O3(T)','FeO(T)','FeO','MnO','MgO','CaO','Na2O','K2O','P2O5',\
@@ -168,368 +422,75 @@ def main():
 
     #Collect year sub-directories under given "data_dir"
     xls_list = os.listdir(data_dir)
-    #====================================== 1. Check xls file format ======================================
-
-    print '1. Examine file format ...'
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (str(ws.cell(row = 5, column = 1).value)).lower() <> 'sample_name':
-            print '    ' + xls_list[f] + ': Wrong Sample_Name column header'
-        if (str(ws.cell(row = 5, column = 2).value)).lower() <> 'cert_no':
-            print '    ' + xls_list[f] + ': Wrong Cert_No column header'
-
-        if (str(ws.cell(row = 1, column = 2).value)).lower() <> 'analyte':
-            print '    ' + xls_list[f] + ': Wrong Analyte row header'
-        if (str(ws.cell(row = 2, column = 2).value)).lower() <> 'unit':
-            print '    ' + xls_list[f] + ': Wrong Unit row header'
-        if (str(ws.cell(row = 3, column = 2).value)).lower() <> 'd_limit':
-            print '    ' + xls_list[f] + ': Wrong D_Limit row header'
-        if (str(ws.cell(row = 4, column = 2).value)).lower() <> 'method_id':
-            print '    ' + xls_list[f] + ': Wrong Method_ID row header'
-
-    #===================================== 2. Check analyte name =======================================
-    print '\n2. Examine analyte names ...'
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column,3,-1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            if str(ws.cell(row = 1, column = c).value) not in element_list:
-                print '    ' + xls_list[f] + ', Column ' + str(c) + ': ' + str(ws.cell(row = 1, column = c).value) + \
-                      ' analyte name not in list, check name'
 
-    #=============================== 3. Verify analyte unit against database ===========================
+    #------------------------------- Reference data from the database ----------------------------------
+    qprofile.set_stage('reference data')
+    if profile is not None:
+        profile.start_stage('reference data')
+    refcache = reference_cache.ReferenceCache(db_path)    #Code tables kept in memory (see reference_cache.py)
+    refcache.load(cur, ['code_unit', 'code_method'])
 
-    #should check if units are lower case, if not, convert to lower case before running checks. Alternatively
-    # use .lower to run check then convert to lower case in import script.
-
-    print '\n3. Examine unit name ...'
-    unit_list = list()  #Build a list of unit name using current database values
-    cur.execute("""select name from code_unit""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        unit_list.append(str(val_rows[i][0]))
+    #Build a list of unit name using current database values
+    unit_list = [str(name) for name in refcache.column('code_unit', 'name')]
     unit_list.pop(0)    #Remove 1st item: 'unknown'
 
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            if str(ws.cell(row = 2, column = c).value) not in unit_list:
-                print '    ' + xls_list[f] + ', Column ' + str(c) + ': ' + str(ws.cell(row = 2, column = c).value) + \
-                      ' unit not in list, check units'
-
-    #==================================== 4. Check detection limit ======================================
-    #Detection limit is not mandatory, which can be left blank.
-    #Loop through xls files
-    print '\n4. Examine detection limit ...'
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            dlimit_cell = str(ws.cell(row = 3, column = c).value)
-            analyte_cell = str(ws.cell(row = 1, column = c).value)
-            if (dlimit_cell == 'None') or dlimit_cell.isspace():
-                if analyte_cell not in nolimit_list:
-                    print '    ' + xls_list[f] + ', Column ' + str(c) + ': ' + dlimit_cell + ' missing detection limit'
-    #==================================== 5. Check method_id ======================================
-    print '\n5. Examine method_id ...'
-    method_list = list()   #Build a list of method_id using current database values
-    cur.execute("""select method_abbr from code_method""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        method_list.append(str(val_rows[i][0]))
+    #Build a list of method_abbr using current database values
+    method_list = [str(method_abbr) for method_abbr in refcache.column('code_method', 'method_abbr')]
     method_list.pop(0)     #Remove 1st item: 'unknown'
-       
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            if str(ws.cell(row = 4, column = c).value) not in method_list:
-                print '    ' + xls_list[f] + ', Column ' + str(c) + ': ' + str(ws.cell(row = 4, column = c).value) + \
-                      ' method not in DB, check method'
-
-    #================= 6. Check duplicate columns (i.e. same analyte, method, and lab) =============
-    # It should be noted that duplicate columns may exist. For example, an analyte was initally
-    # and re-analyzed using the same method by the same lab and with the same size fration. This will
-    # result in 2 columns for this analyte. Extra caution should be excersized when dealing with these
-    # cases.
-    print '\n6. Examine duplicate columns within each xls file ...'
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
 
-        work_analyte = []
-        work_method = []
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            work_analyte.append(str(ws.cell(row = 1, column = c).value))
-            work_method.append(str(ws.cell(row = 4, column = c).value))
-
-        temp_analyte = list(work_analyte)
-        for i in range(len(work_analyte)):
-            temp_analyte[i] = str(i)
-            if work_analyte[i] in temp_analyte:
-                indx = temp_analyte.index(work_analyte[i])
-                if (work_method[i] == work_method[indx]) :
-                    print '    ' + xls_list[f] + ', Column ' + str(c) + ': ' + work_analyte[i] + ' duplicate analyte'
-
-    #===================================== 7. Check method-dependent unit =================================
-    print '\n7.Examine method-dependent analyte unit ... (this check is currently ignored)'
-    #This should be refined to account for each method's 'allowed' or possible units rather than only one unit
-    #type allowed per element.
-    '''
-    method_list = list()    #Build a list of method_id using current database values
-    cur.execute("""select method_abbr from code_method""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        method_list.append(str(val_rows[i][0]))
-
-    #group_list = list()     #Build a list of method_group using current database values
-    #cur.execute("""select method_group from code_method""")
-    #val_rows = cur.fetchall()
-    #for i in range(len(val_rows)):
-    #    group_list.append(str(val_rows[i][0]))
-
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
-            unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
-            method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
-
-            right_unit = standard_unit[element_list.index(analyte_cell)]
-            #check_code = group_list[method_list.index(method_cell)]
-            #if analyte_cell in dependent_analyte:
-            #    if check_code == dependent_method[dependent_analyte.index(analyte_cell)]:
-            #        right_unit = dependent_unit[dependent_analyte.index(analyte_cell)]
-            
-            if unit_cell <> right_unit:
-                print '    ' + xls_list[f] +  ', Column ' + str(c) + ': ' + analyte_cell + ' ' + unit_cell + \
-                      ' should be ' + right_unit
-    '''
-    #======================================== 8. Check fixed analyte-method combo ====================================
-    #this may not be useful for the aris geochem db... to be revisited
-    print '\n8.Examine fixed analyte-method combo ...'
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        reallastcolumn = ws.max_column
-        for i in range(ws.max_column, 3, -1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
-            method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
-            if analyte_cell in fix_analyte:
-                right_method = fix_method[fix_analyte.index(analyte_cell)]
-                if method_cell <> right_method:
-                    print '    ' + xls_list[f] + ', Column ' + str(c) + ': ' + analyte_cell + ' ' + method_cell + \
-                          ' should be ' + right_method
-
-    #========================================== 9. Check analyte value ==============================================
-    print '\n9.Examine analyte values ...'
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        freallastcolumn = ws.max_column
-        for i in range(ws.max_column,3,-1):
-            if (ws.cell(row=1, column=i)).value is None:
-                reallastcolumn = i - 1
-
-        for c in range(3, reallastcolumn + 1):
-            analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
-            unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
-            d_limit_cell = str(ws.cell(row = 3, column = c).value).replace(' ', '')
-
-            if (ws.cell(row=ws.max_row, column=1)).value is None:
-                reallastrow = ws.max_row - 1
-            else:
-                reallastrow = ws.max_row
-
-            for r in range(6, reallastrow + 1):
-                analyte_value = str(ws.cell(row = r, column = c).value)
-                
-                if analyte_value == 'None':
-                    continue
-                elif analyte_value == '0':
-                    print '    ' + xls_list[f] + '->' + analyte_cell + ': ' + \
-                            analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value'
-                elif (not is_number(analyte_value)):
-                    if (analyte_value[0] <> '>') and (analyte_value[0] <> '<'):
-                        print '    ' + xls_list[f] + '->' + analyte_cell + ': ' + \
-                        analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value'
-                    elif (analyte_value[0] == '<') and analyte_value[1:] <> d_limit_cell:
-                        print '    ' + xls_list[f] + '->' + analyte_cell + ': ' + \
-                        analyte_value + '(' + str(r) + ',' + str(c) + ') less than entry does not match detection limit'
-                elif (unit_cell == '%') and (is_number(analyte_value)):
-                    #Greater-than-100% value is not allowed if anayte unit is % 
-                    if (analyte_cell <> 'Total') and float(analyte_value) > 100.0:
-                        print '    ' + xls_list[f] + '->' + analyte_cell + ': ' + analyte_value + ' > 100%'
-
-        #Examine rows without any analytic values
-        if (ws.cell(row=ws.max_row, column=1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        for r in range(6, reallastrow + 1):
-            val_count = 0
-            reallastcolumn = ws.max_column
-            for i in range(ws.max_column, 3, -1):
-                if (ws.cell(row=1, column=i)).value is None:
-                    reallastcolumn = i - 1
-
-            for c in range(3, reallastcolumn + 1):
-                if is_number(str(ws.cell(row = r, column = c).value).replace(' ', '')):
-                    val_count = val_count + 1
-                elif (analyte_value[0] <> '<') or (analyte_value[0] <> '>'):
-                    val_count = val_count + 1
-            if val_count == 0:
-                print '    ' + xls_list[f] + ': Row = ' + str(r) + ' Blank row without any analytic values'
-
-    # ==================================== 10. Check sample in db ======================================
-    print '\n10. Examine sample existence in db for each result ...'
-    sample_list = list()  # Build a list of method_id using current database values
+    sample_list = list()  # Build a list of sample double keys using current database values
     cur.execute("""select samp_dbl_key from vw_sample_dblkey""")
     val_rows = cur.fetchall()
     for i in range(len(val_rows)):
         sample_list.append(str(val_rows[i][0]))
 
-    # Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # extract the publication id (i.e. ARIS report number) from the file name
-        ar_number = xls_list[f].partition('_')[0]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if (ws.cell(row=ws.max_row, column=1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        for r in range(6, reallastrow + 1):
-            sample_name = str(ws.cell(row=r, column=1).value)
-            smpdblkey = ar_number + "_" + sample_name
-
-            if smpdblkey not in sample_list:
-                print '    ' + xls_list[f] + ': ' + smpdblkey + ' not in DB'
-
-    # ==================================== 11. Check cert_no ======================================
-    print '\n11. Examine cert_no to match with filename ...'
-    cert_list = list()  # Build a list of method_id using current database values
+    cert_list = list()  # Build a list of cert_no using current database values
     cur.execute("""select cert_no from data_cert""")
     val_rows = cur.fetchall()
     for i in range(len(val_rows)):
         cert_list.append(str(val_rows[i][0]))
 
-    # Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # extract the cert_no from the file name and compare to that in the sheet
-        cert_no_file = xls_list[f].partition('_')[2]
-        cert_no_file = cert_no_file[:-13]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if (ws.cell(row=ws.max_row, column=1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        for r in range(6, reallastrow + 1):
-            cert_no_sheet = str(ws.cell(row=r, column=2).value)
-
-            if cert_no_file <> cert_no_sheet:
-                print '    ' + xls_list[f] + ': ' + cert_no_file + \
-                    ' cert_no in file name does not match cert_no within sheet ' + cert_no_sheet
-            if cert_no_sheet not in cert_list:
-                print '    ' + xls_list[f] + ': ' + cert_no_sheet + ' certificate not in DB'
-'''   
-db_conn.close()
-'''
-print '\nJob done.'
+    refs = {'element_list': element_list, 'standard_unit': standard_unit, 'nolimit_list': nolimit_list,
+            'fix_analyte': fix_analyte, 'fix_method': fix_method, 'unit_list': unit_list,
+            'method_list': method_list, 'sample_list': set(sample_list), 'cert_list': set(cert_list)}
+
+    #------------------------------------------- Checks ------------------------------------------------
+    #Comment out entries to skip checks (see Operation note 1)
+    checks = [['1. Examine file format ...', check_format, []],
+              ['\n2. Examine analyte names ...', check_analyte_name, ['element_list']],
+              ['\n3. Examine unit name ...', check_unit, ['unit_list']],
+              ['\n4. Examine detection limit ...', check_detection_limit, ['nolimit_list']],
+              ['\n5. Examine method_id ...', check_method, ['method_list']],
+              ['\n6. Examine duplicate columns within each xls file ...', check_duplicate_column, []],
+              ['\n7.Examine method-dependent analyte unit ... (this check is currently ignored)',
+               check_dependent_unit, []],
+              ['\n8.Examine fixed analyte-method combo ...', check_fixed_method, ['fix_analyte', 'fix_method']],
+              ['\n9.Examine analyte values ...', check_analyte_value, []],
+              ['\n10. Examine sample existence in db for each result ...', check_sample_in_db, ['sample_list']],
+              ['\n11. Examine cert_no to match with filename ...', check_cert_no, ['cert_list']]]
+
+    #Problems are printed after the file name
+    def report(xls_file, problem):
+        print '    ' + xls_file + problem
+
+    #Replay the problems of unchanged files from the screening cache (see Operation note 3)
+    if profile is not None:
+        profile.start_stage('screening cache')
+    cache = screening_cache.ScreeningCache(cache_file, RULESET_VERSION, screening_cache.get_ref_versions(refs),
+                                           '--rescreen' in sys.argv[1:])
+
+    #Keep re-screening the changed files (see Operation note 4)
+    if '--watch' in sys.argv[1:]:
+        staging_watcher.watch(data_dir, checks, refs, report, cache)
+    else:
+        screener_runner.run_checks(data_dir, xls_list, checks, refs, report, cache, profile = profile)
+        if profile is not None:
+            profile.print_summary()
+            profile.save_json(profile_file)
+
+    qprofile.report(qprofile_file)
+    db_conn.close()
+    print '\nJob done.'
 
 if __name__ == "__main__":
     main()
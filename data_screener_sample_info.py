@@ -22,25 +22,70 @@
          Display identified problems
 
    Operation note
-         1) The script has many independent code-blocks targeting different types of errors as listed
-            below. Though each code-block can be executed randomly, it is strongly recommended to
-            run them sequentially in the given order, one at a time. For example, it should start with
-            checking format related problems in the xlsx files by commenting out all other code-blocks
-            which are for checking other types of errors. Once the format-related errors are identified
-            and fixed, the format-checking code-block should be commented out and then move on to the
-            "analyte name checking block" ...
+         1) The script has many independent checks targeting different types of errors as listed
+            below. Each check is an entry of the "checks" list in main(). Though each check can be
+            executed randomly, it is strongly recommended to run them sequentially in the given order,
+            one at a time. For example, it should start with checking format related problems in the
+            xlsx files by commenting out all other entries which are for checking other types of errors.
+            Once the format-related errors are identified and fixed, the format-checking entry should be
+            commented out and then move on to the "analyte name checking" entry ...
 
          2) Duplicate samples should be given different "sample_code". Re-published samples should
             have the same 'sample_code' across all publications. Sections 15 and 16 are designed to
             ensure if the above requirements are met.
+
+         3) Run the script with --autofix (e.g. "python data_screener_sample_info.py --autofix") to apply
+            the safe corrections before screening: trimming leading/trailing blanks, lower casing sample_type,
+            replacing the plus-minus sign in sample_colour and sample_desp with "+/-", and upper casing
+            coord_conf. All corrections of a file are made in memory and the file is saved once. A copy of
+            each corrected file is put in the backup directory and every correction is listed on the
+            'AutoFixes' sheet of the check report.
+
+         4) The problems found are kept in a screening cache (see screening_cache.py). A re-run only
+            re-screens the files whose content changed and the checks whose rules or reference data
+            (hardcoded lists, BC boundary and ARIS buffer shape files) changed. The problems of the rest
+            are replayed from the cache. Run the script with --rescreen to discard the cache and screen
+            all files again.
+
+         5) Run the script with --watch to keep it running after screening (see staging_watcher.py).
+            The staging directory is polled and a file added or changed is re-screened on its own, with
+            the reference data and the shape file layers kept in memory. The check report is re-written
+            after each re-screen, so a fix can be verified right after saving the file. --autofix is
+            only applied once, before the watch starts.
+
+         6) Run the script with --profile to record the wall time, cells visited, database queries and
+            workbook loads of each check on each file (see screening_profiler.py). A summary table is
+            printed at the end of the run and all the records are saved to a JSON file next to the
+            screening cache.
+
+         7) The BC boundary and the ARIS buffer shape files are read from their geometry caches
+            ('.gcache' files in a folder of the user, see geometry_cache.py), built on the first run and
+            whenever the shape files change. Checks 6 and 8 only test a point against the polygons of its
+            grid index cell whose bounding box holds it.
+
+         8) Check 2 compares z_coord with the elevation of the DEM raster (dem_file in main()) at the sample
+            location, the samples of a sheet being looked up at once; only the raster blocks holding samples
+            are read, and they are kept for the next files (see dem_check.py). A z_coord is reported when it
+            differs from the DEM by more than dem_check.TOLERANCE metres. Without the DEM file, or outside
+            the DEM, z_coord is checked against the 0 to 3000m range as before.
+
+         9) Check 8 compares the sample locations with the location of the report of the file (ARIS number
+            of the file name) in the ARIS report index, loaded once from min_aris.mdb or its csv export (see
+            aris_report_index.py), the samples of a sheet at once. A sample farther than
+            aris_report_index.REPORT_DISTANCE km is reported with its distance and the nearest other report.
+            Without the index, the 10km ARIS buffer shape file is used as before; it is only read (and hashed
+            for the screening cache) in that case. Without either of them, check 8 is skipped and the other
+            checks are run. The report locations can also be given as a csv export of their own
+            (aris_export in main(), e.g. the one written by synthetic_data_generator.py).
             
     This script is able to check the following:
          1)  Check the format of the spreadsheet to ensure that all necessary columns are present, properly named and in
             the right order.
          2) Check that x, y, z coordinates and epsg codes are present and are in fact numeric. Check that z values, when
-            present are between 0 and 3000 metres.
-         3) Check that values entered in the sample_type column match the pre-determined options. The script will 
-            automatically turn any upper case character to lower case.
+            present, are within a tolerance of the DEM elevation at the sample location (see Operation note 8), or
+            between 0 and 3000 metres where there is no DEM elevation.
+         3) Check that values entered in the sample_type column match the pre-determined options. Upper case
+            characters are reported; they are turned to lower case when the script is run with --autofix.
          4)  Check that values in sample_subtype match accepted values. This column is case sensitive.
          5)  Check that values entered in coord_conf match accepted values.
          6)  Confirm that points actually plot within the province of BC by computing NAD83 Lat Long on the fly and
@@ -61,9 +106,19 @@
   Last update
       2017-05-21
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, ogr, osr, datetime, openpyxl, pyodbc
+import os, sys, shutil, ogr, osr, datetime, openpyxl
 from openpyxl import load_workbook
 from dateutil.parser import parse
+import screener_runner, screening_cache, staging_watcher, screening_profiler
+import sample_geo, datum_shift, geometry_cache, dem_check, aris_report_index
+import numpy as np
+
+#Version of the rule set below. It is part of the screening cache key. The code of the checks and of the
+#helpers they call, and the reference data in "refs", are versioned by the cache itself (see
+#screening_cache.py), so bump it only for a change the cache can not see: a module-level constant read by a
+#check, a new NTv2 grid file (datum_shift.py), or a library upgrade (openpyxl, pyproj) changing the results.
+RULESET_VERSION = '2017.2'
+
 
 # This function is to check if a given string can be converted to a decimal number
 # Syntax: is_number(string) return logic
@@ -87,6 +142,12 @@ def is_string(s):
 #Syntax: project2nad83(float, float, int) returns [nad83_long, nad83_lat]
 def project2nad83 (x_coord, y_coord, source_epsg):
 
+    #NAD27 coordinates are shifted with the NTv2 grid, as when the samples are loaded (see datum_shift.py)
+    if datum_shift.is_nad27(source_epsg):
+        [nad83_long, nad83_lat] = sample_geo.project2nad83(np.array([x_coord]), np.array([y_coord]),
+                                                           np.array([source_epsg]))
+        return [str(float(nad83_long[0])), str(float(nad83_lat[0]))]
+
     #Create a point geometry using the given coordinates
     point = ogr.Geometry(ogr.wkbPoint)
     point.AddPoint(x_coord, y_coord)
@@ -104,12 +165,296 @@ def project2nad83 (x_coord, y_coord, source_epsg):
     point.Transform(transform)
     
     return [str(point.GetX(0)), str(point.GetY(0))]
+
+#Collect the safe corrections (blanks, case, plus-minus sign) for the data rows of a sample info sheet.
+#Nothing is written to the sheet.
+#Syntax: collect_fixes(worksheet, int) returns [[row, column, old_value, new_value, fix], ...]
+def collect_fixes(ws, reallastrow):
+    fix_list = list()
+    for r in range(2, reallastrow + 1):
+        for c in range(1, 15):
+            old_value = ws.cell(row = r, column = c).value
+            if not isinstance(old_value, basestring):
+                continue
+
+            new_value = old_value
+            fix = list()
+            if new_value.strip() != new_value:
+                new_value = new_value.strip()
+                fix.append('blanks trimmed')
+            if (c == 3) and (new_value != new_value.lower()):
+                new_value = new_value.lower()
+                fix.append('sample_type lower cased')
+            if (c == 6 or c == 7) and (u'\xb1' in new_value):
+                new_value = new_value.replace(u'\xb1', '+/-')
+                fix.append('plus-minus sign replaced')
+            if (c == 13) and (new_value != new_value.upper()):
+                new_value = new_value.upper()
+                fix.append('coord_conf upper cased')
+
+            if new_value != old_value:
+                fix_list.append([r, c, old_value, new_value, ', '.join(fix)])
+
+    return fix_list
     
-def main():   
+
+#Get the last sample row of a sample info sheet (a blank row at the end is not counted)
+#Syntax: get_lastrow(worksheet) returns int
+def get_lastrow(ws):
+    if (ws.cell(row = ws.max_row, column = 1)).value is None:
+        return ws.max_row - 1
+    else:
+        return ws.max_row
+
+#============================================ Checks ==================================================
+#Each check examines the worksheet of one staged xlsx file and returns the problems found in it. A problem
+#is a list [check type, problem, row, column] written to the check report (check 6 adds the sample name
+#for the console). See screener_runner.py.
+#Syntax: check_xxx(string, worksheet, dict) returns list
+
+#====================================== 1. Check xls file format ======================================
+def check_format(xls_file, ws, refs):
+    problems = list()
+    if (str(ws.cell(row = 1, column = 1).value)).lower() <> 'sample_name':
+        problems.append(['File Format', 'Wrong sample_name column header', 1, 1])
+    if (str(ws.cell(row = 1, column = 2).value)).lower() <> 'station_name':
+        problems.append(['File Format', 'Wrong station_name column header', 1, 2])
+    if (str(ws.cell(row = 1, column = 3).value)).lower() <> 'sample_type':
+        problems.append(['File Format', 'Wrong sample_type column header', 1, 3])
+    if (str(ws.cell(row = 1, column = 4).value)).lower() <> 'sample_subtype':
+        problems.append(['File Format', 'Wrong sample_subtype column header', 1, 4])
+    if (str(ws.cell(row = 1, column = 5).value)).lower() <> 'sample_depth':
+        problems.append(['File Format', 'Wrong sample_depth column header', 1, 5])
+    if (str(ws.cell(row = 1, column = 6).value)).lower() <> 'sample_colour':
+        problems.append(['File Format', 'Wrong sample_colour column header', 1, 6])
+    if (str(ws.cell(row = 1, column = 7).value)).lower() <> 'sample_desp':
+        problems.append(['File Format', 'Wrong sample_desp column header', 1, 7])
+    if (str(ws.cell(row = 1, column = 8).value)).lower() <> 'duplicate':
+        problems.append(['File Format', 'Wrong duplicate column header', 1, 8])
+    if (str(ws.cell(row = 1, column = 9).value)).lower() <> 'x_coord':
+        problems.append(['File Format', 'Wrong x_coord column header', 1, 9])
+    if (str(ws.cell(row = 1, column = 10).value)).lower() <> 'y_coord':
+        problems.append(['File Format', 'Wrong y_coord column header', 1, 10])
+    if (str(ws.cell(row = 1, column = 11).value)).lower() <> 'z_coord':
+        problems.append(['File Format', 'Wrong z_coord column header', 1, 11])
+    if (str(ws.cell(row = 1, column = 12).value)).lower() <> 'epsg_srid':
+        problems.append(['File Format', 'Wrong epsg_srid column header', 1, 12])
+    if (str(ws.cell(row = 1, column = 13).value)).lower() <> 'coord_conf':
+        problems.append(['File Format', 'Wrong coord_conf column header', 1, 13])
+    if (str(ws.cell(row = 1, column = 14).value)).lower() <> 'sample_date':
+        problems.append(['File Format', 'Wrong sample_date column header', 1, 1])
+    return problems
+
+#============================ 2. Check x_coord, y_coord, z_coord, and epsg_srid ==========================
+def check_coordinates(xls_file, ws, refs):
+    problems = list()
+
+    #DEM elevations of the rows with numeric coordinates, in one lookup for the sheet (see dem_check.py)
+    dem_elevations = {}
+    if refs['dem'] is not None:
+        located = list()
+        for r in range(2, get_lastrow(ws) + 1):
+            cells = [str(ws.cell(row = r, column = c).value).replace(' ', '') for c in [9, 10, 12]]
+            if is_number(cells[0]) and is_number(cells[1]) and (cells[2] in refs['epsg_list']):
+                located.append([r, float(cells[0]), float(cells[1]), int(cells[2])])
+        if located:
+            elevations = refs['dem'].sample([row[1] for row in located], [row[2] for row in located],
+                                            [row[3] for row in located])
+            for i in range(len(located)):
+                if not np.isnan(elevations[i]):
+                    dem_elevations[located[i][0]] = float(elevations[i])
+
+    for r in range(2, get_lastrow(ws) + 1):
+
+        x_cell = str(ws.cell(row = r, column = 9).value).replace(' ', '')
+        if not is_number(x_cell):
+            problems.append(['Coordinates', 'x_coord is not a number', str(r), 9])
+
+        y_cell = str(ws.cell(row = r, column = 10).value).replace(' ', '')
+        if not is_number(y_cell):
+            problems.append(['Coordinates', 'y_coord is not a number', str(r), 10])
+
+        z_cell = str(ws.cell(row = r, column = 11).value).replace(' ', '')
+        if not ((z_cell == '') or (z_cell == 'None')):
+            if (not is_number(z_cell)):
+                problems.append(['Coordinates', 'z_coord is not a number', str(r), 11])
+            elif r in dem_elevations:
+                if refs['dem'].deviates([float(z_cell)], [dem_elevations[r]])[0]:
+                    problems.append(['Coordinates', 'z_coord differs from the DEM elevation (' +
+                                     str(int(round(dem_elevations[r]))) + 'm) by more than ' +
+                                     str(int(refs['dem'].tolerance)) + 'm', str(r), 11])
+            elif float(z_cell) < 0 or float(z_cell) > 3000:
+                problems.append(['Coordinates', 'z_coord is out of range (i.e. not between 0 and 3000m)', str(r), 11])
+
+        epsg_cell = str(ws.cell(row = r, column = 12).value).replace(' ', '')
+        if not is_number(epsg_cell):
+            problems.append(['Coordinates', 'epsg_srid is not a number', str(r), 12])
+        else:
+            if epsg_cell not in refs['epsg_list']:
+                problems.append(['Coordinates', 'epsg_srid not in list', str(r), 12])
+    return problems
+
+# ============================ 3. Check sample_type ==========================
+def check_sample_type(xls_file, ws, refs):
+    problems = list()
+
+    #sample_type has to be lower case (corrected by --autofix) and match an option in list
+    for r in range(2, get_lastrow(ws) + 1):
+        samptype_cell = str(ws.cell(row=r, column=3).value)
+        if samptype_cell != samptype_cell.lower():
+            problems.append(['Sample Type', 'sample_type not lower case', str(r), 3])
+        if samptype_cell.lower() not in refs['samptype_list']:
+            problems.append(['Sample Type', 'sample_type not in list', str(r), 3])
+    return problems
+
+#============================ 4. Check sample_subtype ==========================
+def check_sample_subtype(xls_file, ws, refs):
+    problems = list()
+    for r in range(2, get_lastrow(ws) + 1):
+
+        subtype_cell = str(ws.cell(row = r, column = 4).value)
+        if not subtype_cell == 'None':
+            if subtype_cell not in refs['subtype_list']:
+                problems.append(['Sample Subtype', 'sample_subtype not in list', str(r), 4])
+    return problems
+
+#====================================== 5. Check coord_conf =====================================
+def check_coord_conf(xls_file, ws, refs):
+    problems = list()
+    for r in range(2, get_lastrow(ws) + 1):
+        work_cell = (str(ws.cell(row = r, column = 13).value).replace(' ', '')).lower()
+        if (work_cell <> 'l') and (work_cell <> 'm') and (work_cell <> 'h'):
+            problems.append(['Coordinate Confidence', 'coord_conf not in list (l,m,h)', str(r), 13])
+    return problems
+
+#================== 6. Check points are within BC =============
+#Looking for samples that do not fall in BC to identify possible coordinate issues
+def check_in_bc(xls_file, ws, refs):
+    problems = list()
+    bc_layer = refs['bc_layer']
+
+    for r in range(2, get_lastrow(ws) + 1):
+        cell_sample = str(ws.cell(row = r, column = 1).value).replace(' ', '')
+        cell_xc = str(ws.cell(row = r, column = 9).value).replace(' ', '')
+        cell_yc = str(ws.cell(row = r, column = 10).value).replace(' ', '')
+        cell_epsg = str(ws.cell(row = r, column = 12).value).replace(' ', '')
+
+        if cell_epsg <> '4269': #NAD83 geographic
+            [cell_xc, cell_yc] = project2nad83 (float(cell_xc), float(cell_yc), int(cell_epsg))
+
+        #Examine sample locations
+        coordcheck = 2
+
+        # go over the polygons touching the point (cached layer, see geometry_cache.py) see if one include it
+        [pt_x, pt_y] = [float(cell_xc), float(cell_yc)]
+        for ply in bc_layer.candidates(pt_x, pt_y):
+            if not bc_layer.intersects(ply, pt_x, pt_y):
+                continue
+            # test
+            if bc_layer.within(ply, pt_x, pt_y):
+                coordcheck = 1
+            else:
+                coordcheck = 0
+
+        if coordcheck != 1:
+            problems.append(['Location', 'Location not in BC', str(r), '', cell_sample])
+    return problems
+
+#----------------------------------7.Check date validity-----------------------------------------------------
+def check_date(xls_file, ws, refs):
+    problems = list()
+    for r in range(2, get_lastrow(ws) + 1):
+
+        date_cell = str(ws.cell(row = r, column = 14).value)
+
+        if not ((date_cell == '') or (date_cell == 'None')):
+            if not (date_cell.isupper() or (date_cell.islower())):
+                try:
+                    parse(date_cell)
+                except ValueError:
+                    problems.append(['Date', str(ws.cell(row=r, column=14).value) + 'is not a proper date', str(r), 14])
+            else:
+                problems.append(['Date', str(ws.cell(row=r, column=14).value) + 'is not a proper date', str(r), 14])
+    return problems
+
+#================== 8. Check points are within 10km of ARIS point=============
+def check_near_aris(xls_file, ws, refs):
+    problems = list()
+    ar_number = xls_file.partition('_')[0]
+
+    #Distances to the report location in the ARIS report index, for the sheet at once (see Operation note 9)
+    aris_index = refs['aris_index']
+    if aris_index is not None:
+        if aris_index.location(ar_number) is None:
+            for r in range(2, get_lastrow(ws) + 1):
+                problems.append(['Location', 'No ARIS record was found for this report', str(r), ''])
+            return problems
+
+        located = list()
+        for r in range(2, get_lastrow(ws) + 1):
+            cells = [str(ws.cell(row = r, column = c).value).replace(' ', '') for c in [9, 10, 12]]
+            if is_number(cells[0]) and is_number(cells[1]) and (cells[2] in refs['epsg_list']):
+                located.append([r, float(cells[0]), float(cells[1]), int(cells[2])])
+        if not located:
+            return problems
+        [nad83_long, nad83_lat] = sample_geo.project2nad83(np.array([row[1] for row in located]),
+                                                           np.array([row[2] for row in located]),
+                                                           np.array([row[3] for row in located]))
+        km = aris_index.distances([ar_number] * len(located), nad83_long, nad83_lat)
+        with np.errstate(invalid = 'ignore'):
+            far = np.flatnonzero(km > aris_report_index.REPORT_DISTANCE)
+        nearest = aris_index.nearest(nad83_long[far], nad83_lat[far], 1, [ar_number] * len(far))
+        for i in range(len(far)):
+            problem = 'Location not within ' + str(int(aris_report_index.REPORT_DISTANCE)) + \
+                'km of ARIS report location (' + ('%.1f' % km[far[i]]) + 'km'
+            if nearest[i]:
+                problem = problem + ', nearest report: ' + nearest[i][0][0] + ' at ' + \
+                    ('%.1f' % nearest[i][0][1]) + 'km'
+            problems.append(['Location', problem + ')', str(located[far[i]][0]), ''])
+        return problems
+
+    #Without the index, the 10km ARIS buffer shape file (slow)
+    aris_layer = refs['aris_layer']
+    asses_indx = aris_layer.field_index('asses_num')
+
+    for r in range(2, get_lastrow(ws) + 1):
+        cell_xc = str(ws.cell(row = r, column = 9).value).replace(' ', '')
+        cell_yc = str(ws.cell(row = r, column = 10).value).replace(' ', '')
+        cell_epsg = str(ws.cell(row = r, column = 12).value).replace(' ', '')
+
+        if cell_epsg <> '4269': #NAD83 geographic
+            [cell_xc, cell_yc] = project2nad83 (float(cell_xc), float(cell_yc), int(cell_epsg))
+
+        # go over the polygons touching the point (cached layer, see geometry_cache.py)
+        [pt_x, pt_y] = [float(cell_xc), float(cell_yc)]
+        for ply in aris_layer.candidates(pt_x, pt_y):
+            if not aris_layer.intersects(ply, pt_x, pt_y):
+                continue
+            if aris_layer.values[ply][asses_indx] == ar_number:
+                # test
+                if not aris_layer.within(ply, pt_x, pt_y):
+                    problems.append(['Location', 'Location not within 10km of ARIS report location', str(r), ''])
+            else:
+                problems.append(['Location', 'No ARIS record was found for this report', str(r), ''])
+    return problems
+    
+def main(data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\_AR Data Staging Location\\',
+         cache_file = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\screening_cache_sample_info.pkl',
+         chkrpt_dir = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\checkreports\\',
+         aris_export = None):
     #File path
-    data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\_AR Data Staging Location\\'
-    chkrpt_nm = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\checkreports\\SampleInfoCheckReport_' + \
+    chkrpt_nm = chkrpt_dir + 'SampleInfoCheckReport_' + \
         datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.xlsx'
+    backup_dir = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\autofix_backup\\' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '\\'
+    profile_file = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\screening_profile_sample_info_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
+    bc_shp = 'prov_ab_p_geo83_e.shp'
+    aris_shp = 'aris_10km_buffer.shp'
+    dem_file = 'C:\\Project\\ProvinceData\\dem\\bc_dem_25m.tif'
+
+    #Apply the safe corrections to the staged files before screening (see Operation note 3)
+    autofix = '--autofix' in sys.argv[1:]
 
 
     #Minimum long. and lat. difference between sample locations in degree
@@ -132,374 +477,137 @@ def main():
     #create check report xlsx file and 'open' it
     chkwb = openpyxl.Workbook()
     chkwb.remove_sheet(chkwb.get_sheet_by_name('Sheet'))
-    chkws = chkwb.create_sheet(title='CheckResults')
-    chkws.cell(row=1, column=1).value = 'File Name'
-    chkws.cell(row=1, column=2).value = 'Check Type'
-    chkws.cell(row=1, column=3).value = 'Problem'
-    chkws.cell(row=1, column=4).value = 'Row'
-    chkws.cell(row=1, column=5).value = 'Column'
+
+    #function to (re)create the sheet of problems in the check report xlsx
+    def create_rpt_sheet():
+        if 'CheckResults' in chkwb.sheetnames:
+            chkwb.remove_sheet(chkwb.get_sheet_by_name('CheckResults'))
+        chkws = chkwb.create_sheet(title='CheckResults', index=0)
+        chkws.cell(row=1, column=1).value = 'File Name'
+        chkws.cell(row=1, column=2).value = 'Check Type'
+        chkws.cell(row=1, column=3).value = 'Problem'
+        chkws.cell(row=1, column=4).value = 'Row'
+        chkws.cell(row=1, column=5).value = 'Column'
 
     #function to write problems to check report xlsx
     def write_rpt_err(file,check,problem,row,column):
+        chkws = chkwb.get_sheet_by_name('CheckResults')
         chkws.cell(row=chkws.max_row + 1, column=1).value = file
         chkws.cell(row=chkws.max_row, column=2).value = check
         chkws.cell(row=chkws.max_row, column=3).value = problem
         chkws.cell(row=chkws.max_row, column=4).value = row
         chkws.cell(row=chkws.max_row, column=5).value = column
 
-    #====================================== 1. Check xls file format ======================================
-    print '1. Examine file format ...'
-
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        #get total number of rows in the spreadsheet, this code avoids counting empty rows as the last row and
-        #reduces the number of false errors.
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        if (str(ws.cell(row = 1, column = 1).value)).lower() <> 'sample_name':
-            write_rpt_err(xls_list[f],'File Format','Wrong sample_name column header',1,1)
-        if (str(ws.cell(row = 1, column = 2).value)).lower() <> 'station_name':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong station_name column header', 1, 2)
-        if (str(ws.cell(row = 1, column = 3).value)).lower() <> 'sample_type':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong sample_type column header', 1, 3)
-        if (str(ws.cell(row = 1, column = 4).value)).lower() <> 'sample_subtype':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong sample_subtype column header', 1, 4)
-        if (str(ws.cell(row = 1, column = 5).value)).lower() <> 'sample_depth':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong sample_depth column header', 1, 5)
-        if (str(ws.cell(row = 1, column = 6).value)).lower() <> 'sample_colour':
-            pwrite_rpt_err(xls_list[f],'File Format','Wrong sample_colour column header',1,6)
-        if (str(ws.cell(row = 1, column = 7).value)).lower() <> 'sample_desp':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong sample_desp column header', 1, 7)
-        if (str(ws.cell(row = 1, column = 8).value)).lower() <> 'duplicate':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong duplicate column header', 1, 8)
-        if (str(ws.cell(row = 1, column = 9).value)).lower() <> 'x_coord':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong x_coord column header', 1, 9)
-        if (str(ws.cell(row = 1, column = 10).value)).lower() <> 'y_coord':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong y_coord column header', 1, 10)
-        if (str(ws.cell(row = 1, column = 11).value)).lower() <> 'z_coord':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong z_coord column header', 1, 11)
-        if (str(ws.cell(row = 1, column = 12).value)).lower() <> 'epsg_srid':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong epsg_srid column header', 1, 12)
-        if (str(ws.cell(row = 1, column = 13).value)).lower() <> 'coord_conf':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong coord_conf column header', 1, 13)
-        if (str(ws.cell(row = 1, column = 14).value)).lower() <> 'sample_date':
-            write_rpt_err(xls_list[f], 'File Format', 'Wrong sample_date column header', 1, 1)
-
-    chkwb.save(chkrpt_nm) #save results to the xlsx report
-
-    #============================ 2. Check x_coord, y_coord, z_coord, and epsg_srid ==========================
-    print '\n2.Examine x-coord, y-coord, z-coord and epsg_srid ...'
-
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        for r in range(2, reallastrow + 1):
-            
-            x_cell = str(ws.cell(row = r, column = 9).value).replace(' ', '')
-            if not is_number(x_cell):
-                write_rpt_err(xls_list[f], 'Coordinates', 'x_coord is not a number', str(r), 9)
-
-            y_cell = str(ws.cell(row = r, column = 10).value).replace(' ', '')
-            if not is_number(y_cell):
-                write_rpt_err(xls_list[f], 'Coordinates', 'y_coord is not a number', str(r), 10)
-
-            z_cell = str(ws.cell(row = r, column = 11).value).replace(' ', '')
-            if not ((z_cell == '') or (z_cell == 'None')):
-                if (not is_number(z_cell)):
-                    write_rpt_err(xls_list[f], 'Coordinates', 'z_coord is not a number', str(r), 11)
-                if float(z_cell) < 0 or float(z_cell) > 3000:
-                    write_rpt_err(xls_list[f], 'Coordinates', 'z_coord is out of range (i.e. not between 0 and 3000m)' \
-                                  , str(r), 11)
-            
-            epsg_cell = str(ws.cell(row = r, column = 12).value).replace(' ', '')
-            if not is_number(epsg_cell):
-                write_rpt_err(xls_list[f], 'Coordinates', 'epsg_srid is not a number', str(r), 12)
-            else:
-                if epsg_cell not in epsg_list:
-                    write_rpt_err(xls_list[f], 'Coordinates', 'epsg_srid not in list', str(r), 12)
-
-    chkwb.save(chkrpt_nm) #save results to the xlsx report
-
-    # ============================ 3. Check sample_type ==========================
-    print '\n3.Examine sample_type ...'
-
-    # Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        # Open and exam each xls file
-        wb = load_workbook(filename=xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (ws.cell(row=ws.max_row, column=1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        #if sample_type not all lowercase, convert and save to xlsx
-        for r in range(2, reallastrow + 1):
-            samptype_cell = str(ws.cell(row=r, column=3).value)
-            if samptype_cell != str.lower(samptype_cell):
-                ws.cell(row=r, column=3).value = str.lower(samptype_cell)
-                wb.save(xls_name)
-
-        #check that sample_type matches an option in list
-        for r in range(2, reallastrow + 1):
-            samptype_cell = str(ws.cell(row=r, column=3).value)
-            if samptype_cell not in samptype_list:
-                write_rpt_err(xls_list[f], 'Sample Type', 'sample_type not in list', str(r), 3)
-
-    chkwb.save(chkrpt_nm)  # save results to the xlsx report
-
-    #============================ 4. Check sample_subtype ==========================
-    print '\n4.Examine sample subtype ...'
-
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        for r in range(2, reallastrow + 1):
-
-            subtype_cell = str(ws.cell(row = r, column = 4).value)
-            if not subtype_cell == 'None':
-                if subtype_cell not in subtype_list:
-                    write_rpt_err(xls_list[f], 'Sample Subtype', 'sample_subtype not in list', str(r), 4)
-
-    chkwb.save(chkrpt_nm)  # save results to the xlsx report
-
-    #====================================== 5. Check coord_conf =====================================
-    print '\n5.Examine Coord_Conf ...'
-
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-        for r in range(2, reallastrow + 1):
-            work_cell = (str(ws.cell(row = r, column = 13).value).replace(' ', '')).lower()
-            if (work_cell <> 'l') and (work_cell <> 'm') and (work_cell <> 'h'):
-                write_rpt_err(xls_list[f], 'Coordinate Confidence', 'coord_conf not in list (l,m,h)', str(r), 13)
-
-    chkwb.save(chkrpt_nm)  # save results to the xlsx report
-
-    #================== 6. Check points are within BC and within 10km of ARIS point=============
-    print '\n6.Examine sample locations to ensure they fall in BC  ...'
-
-    #Looking for samples that do not fall in BC to identify possible coordinate issues
-
-    # load the shape file as a layer
-    drv    = ogr.GetDriverByName('ESRI Shapefile')
-    ds_in  = drv.Open("prov_ab_p_geo83_e.shp")
-    lyr_in = ds_in.GetLayer(0)
-
-    # field index for which i want the data extracted
-    # ("satreg2" was what i was looking for)
-    idx_reg = lyr_in.GetLayerDefn().GetFieldIndex("NAME")
-
-    #Loop through the xls files
-    xls_sample = list()  #Build a list for sample_code in xlsx files
-    xls_xc = list()      #Build a list for x_coord in xlsx files
-    xls_yc = list()      #Build a list for y_coord in xlsx files
-    xls_file = list()    #Build a list for xlsx file names
-    xls_row = list()
-    xls_loccheck = list()
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-
-        for r in range(2, reallastrow + 1):
-            cell_sample = str(ws.cell(row = r, column = 1).value).replace(' ', '')
-            cell_xc = str(ws.cell(row = r, column = 9).value).replace(' ', '')
-            cell_yc = str(ws.cell(row = r, column = 10).value).replace(' ', '')
-            cell_epsg = str(ws.cell(row = r, column = 12).value).replace(' ', '')
-            cell_row = str(r)
-
-            xls_sample.append(cell_sample)
-
-            if cell_epsg <> '4269': #NAD83 geographic
-                [cell_xc, cell_yc] = project2nad83 (float(cell_xc), float(cell_yc), int(cell_epsg))
-            xls_xc.append(cell_xc)
-            xls_yc.append(cell_yc)
-            xls_file.append(xls_name)
-            xls_row.append(cell_row)
-
-
-    #Loop through to check each sample coord
-    for i in range(len(xls_sample)):
-        #Examine sample locations
-        coordcheck = 2
-
-        # create point geometry
-        pt = ogr.Geometry(ogr.wkbPoint)
-        pt.SetPoint_2D(0, float(xls_xc[i]), float(xls_yc[i]))
-        lyr_in.SetSpatialFilter(pt)
-
-        # go over all the polygons in the layer see if one include the point
-        for feat_in in lyr_in:
-            # roughly subsets features, instead of go over everything
-            ply = feat_in.GetGeometryRef()
-            # test
-            if pt.Within(ply):
-                coordcheck = 1
-            else:
-                coordcheck = 0
-
-        if coordcheck != 1:
-            print xls_file[i] + ', Row: ' + xls_row[i] + ', Sample: ' + xls_sample[i]+ ': Location not in BC'
-            write_rpt_err(xls_file[i], 'Location', 'Location not in BC', xls_row[i], '')
-
-    chkwb.save(chkrpt_nm)  # save results to the xlsx report
-
-    #----------------------------------7.Check date validity-----------------------------------------------------
-    print '\n7.Examine sample dates ...'
-
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
+    create_rpt_sheet()
+
+    #====================================== 0. Apply safe corrections ======================================
+    if autofix:
+        print '0. Apply safe corrections ...'
+
+        #Fix log in the check report
+        fixws = chkwb.create_sheet(title='AutoFixes')
+        fixws.append(['File Name', 'Row', 'Column', 'Old Value', 'New Value', 'Fix'])
+
+        #Loop through xls files
+        for f in range(len(xls_list)):
+            xls_name = data_dir + xls_list[f]
+
+            #Open and exam each xls file
+            wb = load_workbook(filename = xls_name)
+            ws = wb[wb.sheetnames[0]]
+
+            fix_list = collect_fixes(ws, get_lastrow(ws))
+            if len(fix_list) == 0:
+                continue
+
+            #Keep a copy of the original file, then apply all corrections and save the file once
+            if not os.path.isdir(backup_dir):
+                os.makedirs(backup_dir)
+            shutil.copy2(xls_name, backup_dir + xls_list[f])
+
+            for [r, c, old_value, new_value, fix] in fix_list:
+                ws.cell(row = r, column = c).value = new_value
+                fixws.append([xls_list[f], r, c, old_value, new_value, fix])
+            wb.save(xls_name)
+            print '    ' + xls_list[f] + ': ' + str(len(fix_list)) + ' cell(s) corrected'
+
+        chkwb.save(chkrpt_nm) #save fix log to the xlsx report
+
+    #------------------------------------ Reference data ------------------------------------------------
+    #Record the time, cells and workbook loads of each check (see Operation note 6)
+    profile = None
+    if '--profile' in sys.argv[1:]:
+        profile = screening_profiler.ScreeningProfile('data_screener_sample_info')
+        profile.start_stage('reference data')
+
+    # load the BC boundary shape file from its geometry cache
+    refs = {'epsg_list': epsg_list, 'samptype_list': samptype_list, 'subtype_list': subtype_list,
+            'bc_layer': geometry_cache.get_layer(bc_shp)}
+    ref_files = {'bc_layer': bc_shp}
+
+    # open the DEM for the elevation check (see Operation note 8), or keep the 0 to 3000m range without it
+    refs['dem'] = None
+    if os.path.exists(dem_file):
+        refs['dem'] = dem_check.DemRaster(dem_file)
+    else:
+        print 'No DEM ' + dem_file + ', z_coord is checked against the 0 to 3000m range'
+
+    # load the ARIS report locations for check 8 (see Operation note 9), or the 10km ARIS buffer shape file from
+    # its geometry cache without them
+    refs['aris_index'] = aris_report_index.get_index(None, aris_export)
+    aris_refs = ['aris_index', 'epsg_list']
+    if refs['aris_index'] is None:
+        aris_refs = None
+        if os.path.exists(aris_shp):
+            refs['aris_layer'] = geometry_cache.get_layer(aris_shp)
+            ref_files['aris_layer'] = aris_shp
+            aris_refs = ['aris_layer']
         else:
-            reallastrow = ws.max_row
-
-        for r in range(2, reallastrow + 1):
-
-            date_cell = str(ws.cell(row = r, column = 14).value)
-
-            if not ((date_cell == '') or (date_cell == 'None')):
-                if not (date_cell.isupper() or (date_cell.islower())):
-                    try:
-                        parse(date_cell)
-                    except ValueError:
-                        write_rpt_err(xls_list[f], 'Date', str(ws.cell(row=r, column=14).value) + \
-                                      'is not a proper date', str(r), 14)
-                else:
-                    write_rpt_err(xls_list[f], 'Date', str(ws.cell(row=r, column=14).value) + \
-                                  'is not a proper date', str(r), 14)
-
-    chkwb.save(chkrpt_nm)  # save results to the xlsx report
-
-    #================== 8. Check points are within 10km of ARIS point=============
-    print '\n8. Check points are within 10km of ARIS point  ...'
-
-    #This check is currently very slow. Needs to be improved.... can be ignored if time is an issue.
-
-    #Looking for samples that do not fall in BC to identify possible coordinate issues
-
-    # load the shape file as a layer
-    drv    = ogr.GetDriverByName('ESRI Shapefile')
-    ds_in  = drv.Open("aris_10km_buffer.shp")
-    lyr_in = ds_in.GetLayer(0)
-
-    # field index for which i want the data extracted
-    # ("satreg2" was what i was looking for)
-    idx_reg = lyr_in.GetLayerDefn().GetFieldIndex("asses_num")
-
-    #Loop through the xls files
-    xls_sample = list()  #Build a list for sample_code in xlsx files
-    xls_xc = list()      #Build a list for x_coord in xlsx files
-    xls_yc = list()      #Build a list for y_coord in xlsx files
-    xls_file = list()    #Build a list for xlsx file names
-    xls_row = list()
-    xls_loccheck = list()
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        if (ws.cell(row = ws.max_row, column = 1)).value is None:
-            reallastrow = ws.max_row - 1
-        else:
-            reallastrow = ws.max_row
-
-
-        for r in range(2, reallastrow + 1):
-            cell_sample = str(ws.cell(row = r, column = 1).value).replace(' ', '')
-            cell_xc = str(ws.cell(row = r, column = 9).value).replace(' ', '')
-            cell_yc = str(ws.cell(row = r, column = 10).value).replace(' ', '')
-            cell_epsg = str(ws.cell(row = r, column = 12).value).replace(' ', '')
-            cell_row = str(r)
-
-            xls_sample.append(cell_sample)
-
-            if cell_epsg <> '4269': #NAD83 geographic
-                [cell_xc, cell_yc] = project2nad83 (float(cell_xc), float(cell_yc), int(cell_epsg))
-            xls_xc.append(cell_xc)
-            xls_yc.append(cell_yc)
-            xls_file.append(xls_name)
-            xls_row.append(cell_row)
-
-
-    #Loop through to check each sample coord
-    for i in range(len(xls_sample)):
-        #Examine sample locations
-
-        # create point geometry
-        pt = ogr.Geometry(ogr.wkbPoint)
-        pt.SetPoint_2D(0, float(xls_xc[i]), float(xls_yc[i]))
-        lyr_in.SetSpatialFilter(pt)
-
-        # go over all the polygons in the layer see if one include the point
-        for feat_in in lyr_in:
-            if feat_in.GetFieldAsString("asses_num") == xls_list[f].partition('_')[0]:
-                # roughly subsets features, instead of go over everything
-                ply = feat_in.GetGeometryRef()
-                # test
-                if not pt.Within(ply):
-                    print 'sample is within 10k of aris'
-                    write_rpt_err(xls_file[i], 'Location', 'Location not within 10km of ARIS report location', \
-                                  xls_row[i], '')
-            else:
-                write_rpt_err(xls_file[i], 'Location', 'No ARIS record was found for this report', \
-                              xls_row[i], '')
-
-    chkwb.save(chkrpt_nm)  # save results to the xlsx report
+            print 'ARIS distance check skipped: no report index or buffer (' + aris_shp + ')'
+
+    #------------------------------------------- Checks ------------------------------------------------
+    #Comment out entries to skip checks (see Operation note 1)
+    checks = [['1. Examine file format ...', check_format, []],
+              ['\n2.Examine x-coord, y-coord, z-coord and epsg_srid ...', check_coordinates, ['epsg_list', 'dem']],
+              ['\n3.Examine sample_type ...', check_sample_type, ['samptype_list']],
+              ['\n4.Examine sample subtype ...', check_sample_subtype, ['subtype_list']],
+              ['\n5.Examine Coord_Conf ...', check_coord_conf, []],
+              ['\n6.Examine sample locations to ensure they fall in BC  ...', check_in_bc, ['bc_layer']],
+              ['\n7.Examine sample dates ...', check_date, []]]
+    if aris_refs is not None:
+        checks.append(['\n8. Check points are within 10km of ARIS point  ...', check_near_aris, aris_refs])
+
+    #Problems are written to the check report
+    def report(xls_file, problem):
+        if problem[1] == 'Location not in BC':
+            print data_dir + xls_file + ', Row: ' + problem[2] + ', Sample: ' + problem[4] + ': Location not in BC'
+        write_rpt_err(xls_file, problem[0], problem[1], problem[2], problem[3])
+
+    #Replay the problems of unchanged files from the screening cache (see Operation note 4)
+    if profile is not None:
+        profile.start_stage('screening cache')
+    ref_versions = screening_cache.get_ref_versions(refs, ref_files)
+    cache = screening_cache.ScreeningCache(cache_file, RULESET_VERSION, ref_versions, '--rescreen' in sys.argv[1:])
+
+    #Keep re-screening the changed files (see Operation note 5). The check report is re-written with the
+    #problems of all the staged files after each re-screen.
+    if '--watch' in sys.argv[1:]:
+        def refresh(file_results):
+            create_rpt_sheet()
+            for i in range(len(checks)):
+                for xls_file in file_results:
+                    for problem in file_results[xls_file][i]:
+                        write_rpt_err(xls_file, problem[0], problem[1], problem[2], problem[3])
+            chkwb.save(chkrpt_nm)  # save results to the xlsx report
+
+        staging_watcher.watch(data_dir, checks, refs, report, cache, refresh)
+    else:
+        screener_runner.run_checks(data_dir, xls_list, checks, refs, report, cache, profile = profile)
+        if profile is not None:
+            profile.print_summary()
+            profile.save_json(profile_file)
+
+        chkwb.save(chkrpt_nm)  # save results to the xlsx report
 
     print '\nJob done.'
     
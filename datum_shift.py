@@ -0,0 +1,191 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module converts NAD27 coordinates (legacy publications, EPSG codes 4267 and NAD27 UTM zones
+   26701 to 26722, e.g. 26709 and 26710 in the province) to NAD83 geographic (EPSG code = 4269) with the
+   NTv2 grid shift file of the national transformation (NTv2_0.gsb), rather than with the grids pyproj
+   happens to find (NTv1 or none):
+         1) the grid shift file is read from a local path once per run: the headers of its sub-grids are
+            parsed and their shift records are memory-mapped (numpy.memmap), nothing else is loaded;
+         2) NAD27 UTM coordinates are converted to NAD27 long. and lat. on the Clarke 1866 ellipsoid in one
+            pyproj transformation per zone (arrays);
+         3) the shifts are interpolated bilinearly for all the points at once, sub-grid by sub-grid, a
+            point taking the shift of the densest sub-grid holding it (children after their parents).
+   The points outside the grids, or all the points if the grid shift file is missing, are converted by
+   pyproj as before, with a warning (see sample_geo.project2nad83).
+
+   The rows of the NAD27 samples in 'data_sample_geo' record the grid shift file they were converted with
+   (see get_grid_tag() and sample_geo.py): the rows converted by pyproj, e.g. before the grid shift file was
+   installed, are computed again with the grid at the next refresh of the table.
+
+   Input
+         1) NAD27 coordinates (arrays) and their EPSG code
+         2) NTv2 grid shift file (NTV2_FILE)
+
+   Output
+         NAD83 long. and lat. (arrays)
+
+   Usage
+         if datum_shift.is_nad27(epsg):
+             [nad83_long, nad83_lat] = datum_shift.nad27_to_nad83(x_coords, y_coords, epsg)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, struct
+import numpy as np
+from pyproj import Proj
+
+#NTv2 grid shift file of the NAD27 to NAD83 transformation
+NTV2_FILE = 'C:\\Project\\ProvinceData\\grids\\NTv2_0.gsb'
+
+#NAD27 EPSG codes: geographic, and UTM zone N = 26700 + N
+NAD27_GEOGRAPHIC = 4267
+NAD27_UTM_ZONES = range(26701, 26723)
+
+#Size of the header records and of the shift records of NTv2 files
+RECORD_SIZE = 16
+HEADER_RECORDS = 11
+
+#Grid shift files already read, {path: [sub-grids] or None if missing}
+grids = {}
+
+#NAD27 UTM zones already set up (Clarke 1866 ellipsoid, no datum shift), {zone: Proj}
+utm_projections = {}
+
+#Whether an EPSG code is a NAD27 coordinate system converted with the grid
+#Syntax: is_nad27(int) returns bool
+def is_nad27(epsg):
+    return (int(epsg) == NAD27_GEOGRAPHIC) or (int(epsg) in NAD27_UTM_ZONES)
+
+#Read the header records of an NTv2 file: {name: value}. The types of the values are given by the names.
+#Syntax: read_header(file, string, list, list) returns dict
+def read_header(gsb_input, endian, int_names, float_names):
+    header = {}
+    for i in range(HEADER_RECORDS):
+        record = gsb_input.read(RECORD_SIZE)
+        name = record[:8].strip()
+        if name in int_names:
+            header[name] = struct.unpack(endian + 'i', record[8:12])[0]
+        elif name in float_names:
+            header[name] = struct.unpack(endian + 'd', record[8:16])[0]
+        else:
+            header[name] = record[8:16].strip()
+    return header
+
+#Read an NTv2 grid shift file: [sub-grid, ...] ordered parents first, each a dict with the limits of the
+#sub-grid in seconds (long. positive west, as in the file) and its memory-mapped shift records
+#(rows x columns x [lat. shift, long. shift, lat. accuracy, long. accuracy], seconds). Returns None if the
+#file is missing.
+#Syntax: read_grid(string) returns list
+def read_grid(gsb_file):
+    if not os.path.exists(gsb_file):
+        return None
+    gsb_input = open(gsb_file, 'rb')
+
+    #Overview header; the byte order is found from the number of its records (11)
+    endian = '<'
+    if struct.unpack('<i', gsb_input.read(RECORD_SIZE)[8:12])[0] <> HEADER_RECORDS:
+        endian = '>'
+    gsb_input.seek(0)
+    overview = read_header(gsb_input, endian, ['NUM_OREC', 'NUM_SREC', 'NUM_FILE'], [])
+
+    subgrids = list()
+    for i in range(overview['NUM_FILE']):
+        header = read_header(gsb_input, endian, ['GS_COUNT'],
+                             ['S_LAT', 'N_LAT', 'E_LONG', 'W_LONG', 'LAT_INC', 'LONG_INC'])
+        row_count = int(round((header['N_LAT'] - header['S_LAT']) / header['LAT_INC'])) + 1
+        column_count = int(round((header['W_LONG'] - header['E_LONG']) / header['LONG_INC'])) + 1
+        header['shifts'] = np.memmap(gsb_file, dtype = endian + 'f4', mode = 'r', offset = gsb_input.tell(),
+                                     shape = (row_count, column_count, 4))
+        subgrids.append(header)
+        gsb_input.seek(header['GS_COUNT'] * RECORD_SIZE, 1)
+    gsb_input.close()
+
+    #Parents before their children
+    names = dict([[subgrid['SUB_NAME'], subgrid] for subgrid in subgrids])
+    def get_depth(subgrid):
+        depth = 0
+        while (subgrid['PARENT'] in names) and (depth < len(subgrids)):
+            subgrid = names[subgrid['PARENT']]
+            depth = depth + 1
+        return depth
+    return sorted(subgrids, key = get_depth)
+
+#Get the sub-grids of the grid shift file, read once per run (None if the file is missing)
+#Syntax: get_grid(string) returns list
+def get_grid(gsb_file = None):
+    if gsb_file is None:
+        gsb_file = NTV2_FILE
+    if gsb_file not in grids:
+        grids[gsb_file] = read_grid(gsb_file)
+        if grids[gsb_file] is None:
+            print 'Warning: no NTv2 grid shift file ' + gsb_file + ', NAD27 coordinates are converted by pyproj'
+    return grids[gsb_file]
+
+#Get the tag of the grid shift file recorded with the NAD27 locations: the name of the file, or '' if it is
+#missing (the points are converted by pyproj)
+#Syntax: get_grid_tag(string) returns string
+def get_grid_tag(gsb_file = None):
+    if gsb_file is None:
+        gsb_file = NTV2_FILE
+    if get_grid(gsb_file) is None:
+        return ''
+    return os.path.basename(gsb_file.replace('\\', '/'))
+
+#Shift arrays of NAD27 long. and lat. to NAD83 with the sub-grids of a grid shift file. The points outside
+#the grids are NaN.
+#Syntax: shift_nad27(list, array, array) returns [array, array]
+def shift_nad27(subgrids, nad27_long, nad27_lat):
+    nad83_long = np.zeros(len(nad27_long)) + np.nan
+    nad83_lat = np.zeros(len(nad27_lat)) + np.nan
+    long_sec = -nad27_long * 3600.0     #Positive west, as in the file
+    lat_sec = nad27_lat * 3600.0
+
+    for subgrid in subgrids:
+        mask = (lat_sec >= subgrid['S_LAT']) & (lat_sec <= subgrid['N_LAT']) & \
+            (long_sec >= subgrid['E_LONG']) & (long_sec <= subgrid['W_LONG'])
+        if not mask.any():
+            continue
+        shifts = subgrid['shifts']
+        [row_count, column_count] = shifts.shape[:2]
+
+        #Grid node south-east of each point and the position of the point in the cell
+        row = (lat_sec[mask] - subgrid['S_LAT']) / subgrid['LAT_INC']
+        column = (long_sec[mask] - subgrid['E_LONG']) / subgrid['LONG_INC']
+        row_indx = np.minimum(np.floor(row).astype(np.int64), row_count - 2)
+        column_indx = np.minimum(np.floor(column).astype(np.int64), column_count - 2)
+        row_frac = row - row_indx
+        column_frac = column - column_indx
+
+        #Bilinear interpolation of the lat. and long. shifts (only the records needed are read)
+        shift = np.zeros((mask.sum(), 2))
+        for [row_step, column_step, weight] in [[0, 0, (1 - row_frac) * (1 - column_frac)],
+                                                [0, 1, (1 - row_frac) * column_frac],
+                                                [1, 0, row_frac * (1 - column_frac)],
+                                                [1, 1, row_frac * column_frac]]:
+            shift = shift + shifts[row_indx + row_step, column_indx + column_step, :2] * weight[:, np.newaxis]
+
+        nad83_lat[mask] = nad27_lat[mask] + shift[:, 0] / 3600.0
+        nad83_long[mask] = nad27_long[mask] - shift[:, 1] / 3600.0
+    return [nad83_long, nad83_lat]
+
+#Convert arrays of coordinates in a NAD27 coordinate system to NAD83 long. and lat. The points outside the
+#grids are NaN. Returns None if the grid shift file is missing.
+#Syntax: nad27_to_nad83(array, array, int, string) returns [array, array]
+def nad27_to_nad83(x_coords, y_coords, epsg, gsb_file = None):
+    subgrids = get_grid(gsb_file)
+    if subgrids is None:
+        return None
+
+    #NAD27 long. and lat. on the Clarke 1866 ellipsoid, without datum shift
+    if int(epsg) == NAD27_GEOGRAPHIC:
+        [nad27_long, nad27_lat] = [x_coords, y_coords]
+    else:
+        zone = int(epsg) - 26700
+        if zone not in utm_projections:
+            utm_projections[zone] = Proj('+proj=utm +zone=' + str(zone) + ' +ellps=clrk66 +units=m +no_defs')
+        nad27_long, nad27_lat = utm_projections[zone](x_coords, y_coords, inverse = True)
+    return shift_nad27(subgrids, np.asarray(nad27_long, dtype = float), np.asarray(nad27_lat, dtype = float))
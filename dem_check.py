@@ -0,0 +1,136 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module checks the reported elevation (z_coord) of samples against the ground elevation of a
+   local DEM raster (GeoTIFF or any raster GDAL reads), rather than against a fixed 0 to 3000 m range:
+         1) the sample locations are projected to NAD83 (see sample_geo.project2nad83, NAD27 included),
+            then to the coordinate system of the DEM, as arrays;
+         2) the pixels holding the samples are grouped by raster block (the tiles or strips of the
+            file), and only the blocks holding samples are read, once per run: they are kept for the next
+            staged files, up to MAX_BLOCKS blocks;
+         3) a sample is flagged when its elevation differs from the DEM elevation of its pixel by more
+            than the tolerance (TOLERANCE metres by default).
+   Samples outside the DEM, or on its no-data pixels, get no DEM elevation (NaN); the screener falls back
+   to the range check for them.
+
+   Input
+         1) DEM raster file (single band, elevations in metres)
+         2) Sample coordinates and EPSG codes (arrays)
+
+   Output
+         DEM elevations of the samples (array)
+
+   Usage
+         dem = dem_check.DemRaster('C:\\Project\\ProvinceData\\dem\\bc_dem_25m.tif')
+         elevations = dem.sample(x_coords, y_coords, epsg_codes)
+         flagged = dem.deviates(z_coords, elevations)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, gdal, osr
+import numpy as np
+from pyproj import transform
+import sample_geo
+
+#Largest difference in metres between a reported elevation and the DEM
+TOLERANCE = 150.0
+
+#Largest number of raster blocks kept in memory
+MAX_BLOCKS = 256
+
+class DemRaster(object):
+    #Open a DEM raster: its geotransform, block size, no-data value and coordinate system (EPSG code)
+    #Syntax: DemRaster(string, float)
+    def __init__(self, dem_file, tolerance = TOLERANCE):
+        self.dem_file = dem_file
+        self.tolerance = tolerance
+        self.dataset = gdal.Open(dem_file, gdal.GA_ReadOnly)
+        if self.dataset is None:
+            print 'Can not open ' + dem_file
+            sys.exit()
+        self.band = self.dataset.GetRasterBand(1)
+        self.nodata = self.band.GetNoDataValue()
+        self.geotransform = self.dataset.GetGeoTransform()
+        [self.block_width, self.block_height] = self.band.GetBlockSize()
+        [self.width, self.height] = [self.dataset.RasterXSize, self.dataset.RasterYSize]
+
+        self.epsg = 4269
+        srs = osr.SpatialReference(self.dataset.GetProjection())
+        srs.AutoIdentifyEPSG()
+        if srs.GetAuthorityCode(None) is not None:
+            self.epsg = int(srs.GetAuthorityCode(None))
+
+        self.blocks = {}        #Blocks read so far, {(block column, block row): array}
+
+    #Version of the DEM for the screening cache (file, modification time, size and tolerance)
+    #Syntax: repr(DemRaster) returns string
+    def __repr__(self):
+        return 'DemRaster(' + repr([self.dem_file, os.path.getmtime(self.dem_file), os.path.getsize(self.dem_file),
+                                    self.tolerance]) + ')'
+
+    #Read a block of the raster (no-data pixels as NaN)
+    #Syntax: read_block(int, int) returns array
+    def read_block(self, block_column, block_row):
+        if (block_column, block_row) not in self.blocks:
+            if len(self.blocks) >= MAX_BLOCKS:
+                self.blocks = {}
+            x_offset = block_column * self.block_width
+            y_offset = block_row * self.block_height
+            block = self.band.ReadAsArray(x_offset, y_offset, min(self.block_width, self.width - x_offset),
+                                          min(self.block_height, self.height - y_offset)).astype(float)
+            if self.nodata is not None:
+                block[block == self.nodata] = np.nan
+            self.blocks[(block_column, block_row)] = block
+        return self.blocks[(block_column, block_row)]
+
+    #Get the DEM elevations of arrays of NAD83 long. and lat. (NaN outside the DEM)
+    #Syntax: get_elevations(array, array) returns array
+    def get_elevations(self, nad83_long, nad83_lat):
+        [x, y] = [np.asarray(nad83_long, dtype = float), np.asarray(nad83_lat, dtype = float)]
+        elevations = np.zeros(len(x)) + np.nan
+        if len(x) == 0:
+            return elevations
+        if self.epsg <> 4269:
+            x, y = transform(sample_geo.get_proj(4269), sample_geo.get_proj(self.epsg), x, y)
+            [x, y] = [np.asarray(x, dtype = float), np.asarray(y, dtype = float)]
+
+        #Pixels of the points (north-up raster)
+        [x_origin, pixel_width, x_rotation, y_origin, y_rotation, pixel_height] = self.geotransform
+        with np.errstate(invalid = 'ignore'):
+            columns = np.floor((x - x_origin) / pixel_width)
+            rows = np.floor((y - y_origin) / pixel_height)
+            inside = np.isfinite(columns) & np.isfinite(rows) & (columns >= 0) & (columns < self.width) & \
+                (rows >= 0) & (rows < self.height)
+        indices = np.flatnonzero(inside)
+        columns = columns[indices].astype(np.int64)
+        rows = rows[indices].astype(np.int64)
+
+        #Read each block holding points once
+        block_keys = (columns // self.block_width) * ((self.height + self.block_height - 1) // self.block_height) + \
+            rows // self.block_height
+        for block_key in np.unique(block_keys):
+            mask = block_keys == block_key
+            [block_column, block_row] = [int(columns[mask][0] // self.block_width),
+                                         int(rows[mask][0] // self.block_height)]
+            block = self.read_block(block_column, block_row)
+            elevations[indices[mask]] = block[rows[mask] - block_row * self.block_height,
+                                              columns[mask] - block_column * self.block_width]
+        return elevations
+
+    #Get the DEM elevations of arrays of source coordinates and EPSG codes (NaN outside the DEM)
+    #Syntax: sample(array, array, array) returns array
+    def sample(self, x_coords, y_coords, epsg_codes):
+        [nad83_long, nad83_lat] = sample_geo.project2nad83(np.asarray(x_coords, dtype = float),
+                                                           np.asarray(y_coords, dtype = float),
+                                                           np.asarray(epsg_codes, dtype = np.int64))
+        return self.get_elevations(nad83_long, nad83_lat)
+
+    #Whether reported elevations differ from the DEM elevations by more than the tolerance (False where there
+    #is no DEM elevation)
+    #Syntax: deviates(array, array) returns array
+    def deviates(self, z_coords, elevations):
+        with np.errstate(invalid = 'ignore'):
+            return np.abs(np.asarray(z_coords, dtype = float) - elevations) > self.tolerance
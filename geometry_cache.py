@@ -0,0 +1,348 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps binary caches of the polygon shape files read by the screeners, the loaders and the
+   product creators (prov_ab_p_geo83_e.shp, aris_10km_buffer.shp, grid_50k_nts_ll83_poly.shp, ...), so that
+   they are parsed by OGR once rather than at each run:
+         1) the cache file ('<shape file name>_<md5 of its path>.gcache' in CACHE_DIR, a folder of the
+            user, so that nothing is written next to the shape files of the repository or of a read-only
+            share) holds the WKB of the polygons, their bounding boxes, the values of all their attribute
+            fields (unicode strings, as given by GetFieldAsString) and a grid index of the bounding boxes
+            (the polygons of each grid cell, in the order of the shape file);
+         2) later runs read its header and memory-map the arrays (numpy.memmap); a polygon is only
+            decoded from its WKB (shapely) when a point has to be tested against it;
+         3) the cache is keyed by the modification time and size of the files of the shape file (.shp,
+            .shx, .dbf, .prj) and by the md5 hash of their content. When the times differ but the content
+            is the same (e.g. the files were copied), the key of the cache is updated without parsing the
+            shape file again; when the content differs, the cache is built again.
+   If the cache file can not be written (e.g. no user folder), the layer is used from memory.
+
+   Input
+         Polygon shape file
+
+   Output
+         Cache file in CACHE_DIR, cached layer
+
+   Usage
+         layer = geometry_cache.get_layer('prov_ab_p_geo83_e.shp')
+         layer.values[i][layer.field_index('map_tile')]   #Field value of polygon i
+         candidates = layer.candidates(long, lat)         #Polygons whose bounding box holds the point
+         layer.intersects(i, long, lat), layer.within(i, long, lat)
+         indices = layer.first_envelope(long_array, lat_array)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, json, struct, hashlib, ogr
+import numpy as np
+from shapely import wkb
+from shapely.geometry import Point
+from shapely.prepared import prep
+
+#File format of the caches
+CACHE_MAGIC = 'GEOCACH1'
+CACHE_EXTENSION = '.gcache'
+
+#Folder of the cache files: %LOCALAPPDATA%\\geometry_cache on Windows, ~/.cache/geometry_cache elsewhere
+CACHE_DIR = os.path.join(os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         'geometry_cache')
+
+#Files of a shape file that are part of the cache key
+SHAPE_EXTENSIONS = ['.shp', '.shx', '.dbf', '.prj']
+
+#Largest number of grid index cells along each axis
+MAX_GRID_CELLS = 512
+
+#Arrays of the cache files: [name, numpy type, number of columns]
+CACHE_ARRAYS = [['bboxes', '<f8', 4], ['wkb_offsets', '<i8', 1], ['cell_starts', '<i8', 1],
+                ['cell_features', '<i8', 1], ['wkb', 'u1', 1]]
+
+#Get the files of a shape file with their modification time and size: [[path, mtime, size], ...]
+#Syntax: get_source_stats(string) returns list
+def get_source_stats(shp_file):
+    stats = list()
+    for extension in SHAPE_EXTENSIONS:
+        path = os.path.splitext(shp_file)[0] + extension
+        if os.path.exists(path):
+            stats.append([os.path.basename(path), os.path.getmtime(path), os.path.getsize(path)])
+    return stats
+
+#Get the md5 hash of the files of a shape file
+#Syntax: get_source_hash(string) returns string
+def get_source_hash(shp_file):
+    md5 = hashlib.md5()
+    for extension in SHAPE_EXTENSIONS:
+        path = os.path.splitext(shp_file)[0] + extension
+        if os.path.exists(path):
+            with open(path, 'rb') as in_file:
+                for block in iter(lambda: in_file.read(1 << 20), ''):
+                    md5.update(block)
+    return md5.hexdigest()
+
+#Get a field value of a shape file as unicode (the header of the cache is JSON), from UTF-8 or cp1252
+#Syntax: to_unicode(string) returns unicode
+def to_unicode(text):
+    try:
+        return text.decode('utf-8')
+    except UnicodeDecodeError:
+        return text.decode('cp1252', 'replace')
+
+#Read a shape file with OGR: [fields, [[field values], ...], bboxes, wkb_offsets, wkb]. The bounding boxes
+#are [min long., min lat., max long., max lat.].
+#Syntax: read_shapefile(string) returns list
+def read_shapefile(shp_file):
+    driver = ogr.GetDriverByName("ESRI Shapefile")
+    dataSource = driver.Open(shp_file, 0)
+    if dataSource is None:
+        print 'Can not open ' + shp_file
+        sys.exit()
+    layer = dataSource.GetLayer()
+    layer_defn = layer.GetLayerDefn()
+    fields = [layer_defn.GetFieldDefn(i).GetName() for i in range(layer_defn.GetFieldCount())]
+
+    [values, bboxes, blobs] = [list(), list(), list()]
+    for feature in layer:
+        geom = feature.GetGeometryRef()
+        if geom is None:
+            continue
+        envelope = geom.GetEnvelope()
+        bboxes.append([envelope[0], envelope[2], envelope[1], envelope[3]])
+        blobs.append(bytes(geom.ExportToWkb()))
+        values.append([to_unicode(feature.GetFieldAsString(field)) for field in fields])
+
+    wkb_offsets = np.zeros(len(blobs) + 1, dtype = np.int64)
+    wkb_offsets[1:] = np.cumsum([len(blob) for blob in blobs])
+    return [fields, values, np.array(bboxes, dtype = float).reshape(-1, 4), wkb_offsets,
+            np.frombuffer(''.join(blobs), dtype = np.uint8)]
+
+#Build the grid index of bounding boxes: [grid, cell_starts, cell_features]. The polygons of cell c are
+#cell_features[cell_starts[c]:cell_starts[c + 1]], in the order of the shape file.
+#Syntax: build_grid(array) returns list
+def build_grid(bboxes):
+    if len(bboxes) == 0:
+        grid = {'origin': [0.0, 0.0], 'cell': [1.0, 1.0], 'shape': [1, 1]}
+        return [grid, np.zeros(2, dtype = np.int64), np.zeros(0, dtype = np.int64)]
+    [min_x, min_y] = [bboxes[:, 0].min(), bboxes[:, 1].min()]
+    [max_x, max_y] = [bboxes[:, 2].max(), bboxes[:, 3].max()]
+    cell_count = int(min(MAX_GRID_CELLS, max(1, 2 * int(len(bboxes) ** 0.5))))
+    cell = [max((max_x - min_x) / cell_count, 1e-9), max((max_y - min_y) / cell_count, 1e-9)]
+    grid = {'origin': [float(min_x), float(min_y)], 'cell': cell, 'shape': [cell_count, cell_count]}
+
+    cells = [list() for i in range(cell_count * cell_count)]
+    for i in range(len(bboxes)):
+        [x1, y1] = get_cells(grid, bboxes[i, 0], bboxes[i, 1])
+        [x2, y2] = get_cells(grid, bboxes[i, 2], bboxes[i, 3])
+        for cell_x in range(x1, x2 + 1):
+            for cell_y in range(y1, y2 + 1):
+                cells[cell_x * cell_count + cell_y].append(i)
+    cell_starts = np.zeros(len(cells) + 1, dtype = np.int64)
+    cell_starts[1:] = np.cumsum([len(features) for features in cells])
+    cell_features = np.array([i for features in cells for i in features], dtype = np.int64)
+    return [grid, cell_starts, cell_features]
+
+#Get the grid cells (column, row) of coordinates (numbers or arrays), clipped to the grid
+#Syntax: get_cells(dict, object, object) returns [object, object]
+def get_cells(grid, x, y):
+    cell_x = np.clip(np.floor((np.asarray(x) - grid['origin'][0]) / grid['cell'][0]), 0, grid['shape'][0] - 1)
+    cell_y = np.clip(np.floor((np.asarray(y) - grid['origin'][1]) / grid['cell'][1]), 0, grid['shape'][1] - 1)
+    if np.ndim(cell_x) == 0:
+        return [int(cell_x), int(cell_y)]
+    return [cell_x.astype(np.int64), cell_y.astype(np.int64)]
+
+#Get the cache file of a shape file: its name and the md5 hash of its absolute path, in CACHE_DIR
+#Syntax: get_cache_file(string) returns string
+def get_cache_file(shp_file):
+    shp_path = os.path.normcase(os.path.abspath(shp_file))
+    if isinstance(shp_path, unicode):
+        shp_path = shp_path.encode('utf-8')
+    path_hash = hashlib.md5(shp_path).hexdigest()
+    return os.path.join(CACHE_DIR, os.path.basename(os.path.splitext(shp_file)[0]) + '_' + path_hash[:12] +
+                        CACHE_EXTENSION)
+
+#Write a cache file: magic, header length, JSON header, then the arrays (8-byte aligned). The folder of the
+#cache file is created if missing.
+#Syntax: write_cache(string, dict, dict) returns None
+def write_cache(cache_file, header, arrays):
+    if not os.path.isdir(os.path.dirname(cache_file)):
+        os.makedirs(os.path.dirname(cache_file))
+    header = dict(header)
+    header['arrays'] = {}
+    offset = 0
+    for [name, dtype, columns] in CACHE_ARRAYS:
+        data = np.ascontiguousarray(arrays[name], dtype = dtype)
+        header['arrays'][name] = [offset, len(data)]
+        offset = offset + (data.nbytes + 7) // 8 * 8
+    header_data = json.dumps(header)
+
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'wb') as out_file:
+        out_file.write(CACHE_MAGIC + struct.pack('<Q', len(header_data)) + header_data)
+        out_file.write('\0' * (-out_file.tell() % 8))
+        for [name, dtype, columns] in CACHE_ARRAYS:
+            data = np.ascontiguousarray(arrays[name], dtype = dtype).tostring()
+            out_file.write(data + '\0' * (-len(data) % 8))
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    os.rename(temp_file, cache_file)
+
+#Read the header of a cache file and memory-map its arrays: [header, {name: array}]. Returns None if the file
+#is missing or not a cache file.
+#Syntax: read_cache(string) returns list
+def read_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return None
+    with open(cache_file, 'rb') as in_file:
+        start = in_file.read(16)
+        if (len(start) < 16) or (start[:8] <> CACHE_MAGIC):
+            return None
+        header_data = in_file.read(struct.unpack('<Q', start[8:])[0])
+    header = json.loads(header_data)
+    data_start = (16 + len(header_data) + 7) // 8 * 8
+
+    arrays = {}
+    for [name, dtype, columns] in CACHE_ARRAYS:
+        [offset, count] = header['arrays'][name]
+        shape = (count, columns) if columns > 1 else (count,)
+        if count == 0:
+            arrays[name] = np.zeros(shape, dtype = dtype)
+        else:
+            arrays[name] = np.memmap(cache_file, dtype = dtype, mode = 'r', offset = data_start + offset, shape = shape)
+    return [header, arrays]
+
+class CachedLayer(object):
+    #Layer of a cache: the field values and arrays of the polygons
+    #Syntax: CachedLayer(dict, dict)
+    def __init__(self, header, arrays):
+        self.fields = header['fields']
+        self.values = header['values']
+        self.grid = header['grid']
+        self.bboxes = arrays['bboxes']
+        self.wkb_offsets = arrays['wkb_offsets']
+        self.cell_starts = arrays['cell_starts']
+        self.cell_features = arrays['cell_features']
+        self.wkb = arrays['wkb']
+        self.geometries = {}       #Prepared polygons decoded so far, {index: prepared polygon}
+
+    #Get the position of a field in the field values of the polygons (names are not case sensitive, as in OGR)
+    #Syntax: field_index(string) returns int
+    def field_index(self, name):
+        names = [field.lower() for field in self.fields]
+        if name.lower() not in names:
+            print 'No field ' + name + ' in the cached layer (' + ', '.join(self.fields) + ')'
+            sys.exit()
+        return names.index(name.lower())
+
+    #Get the number of polygons
+    #Syntax: len(CachedLayer) returns int
+    def __len__(self):
+        return len(self.bboxes)
+
+    #Get a polygon, decoded from its WKB once
+    #Syntax: get_geometry(int) returns prepared geometry
+    def get_geometry(self, i):
+        if i not in self.geometries:
+            self.geometries[i] = prep(wkb.loads(self.wkb[self.wkb_offsets[i]:self.wkb_offsets[i + 1]].tostring()))
+        return self.geometries[i]
+
+    #Get the polygons whose bounding box holds a point (edges included), in the order of the shape file
+    #Syntax: candidates(float, float) returns list
+    def candidates(self, x, y):
+        if len(self.bboxes) == 0:
+            return list()
+        [cell_x, cell_y] = get_cells(self.grid, x, y)
+        cell = cell_x * self.grid['shape'][1] + cell_y
+        found = list()
+        for i in self.cell_features[self.cell_starts[cell]:self.cell_starts[cell + 1]]:
+            bbox = self.bboxes[i]
+            if (bbox[0] <= x <= bbox[2]) and (bbox[1] <= y <= bbox[3]):
+                found.append(int(i))
+        return found
+
+    #Whether a point intersects polygon i (inside or on its edge)
+    #Syntax: intersects(int, float, float) returns bool
+    def intersects(self, i, x, y):
+        return self.get_geometry(i).intersects(Point(x, y))
+
+    #Whether a point is within polygon i (edge excluded)
+    #Syntax: within(int, float, float) returns bool
+    def within(self, i, x, y):
+        return self.get_geometry(i).contains(Point(x, y))
+
+    #Get the first polygon (in the order of the shape file) whose bounding box holds each point, the west and
+    #south edges included and the east and north edges excluded (-1 if none)
+    #Syntax: first_envelope(array, array) returns array
+    def first_envelope(self, x, y):
+        x = np.asarray(x, dtype = float)
+        y = np.asarray(y, dtype = float)
+        found = np.zeros(len(x), dtype = np.int64) - 1
+        valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        if (len(self.bboxes) == 0) or (len(valid) == 0):
+            return found
+
+        #Points grouped by grid cell, each cell tested against its polygons in order
+        [cell_x, cell_y] = get_cells(self.grid, x[valid], y[valid])
+        cells = cell_x * self.grid['shape'][1] + cell_y
+        order = np.argsort(cells, kind = 'mergesort')
+        bounds = np.flatnonzero(np.diff(cells[order])) + 1
+        for group in np.split(order, bounds):
+            points = valid[group]
+            cell = cells[group[0]]
+            untagged = np.ones(len(points), dtype = bool)
+            for i in self.cell_features[self.cell_starts[cell]:self.cell_starts[cell + 1]]:
+                bbox = self.bboxes[i]
+                mask = untagged & (x[points] >= bbox[0]) & (x[points] < bbox[2]) & \
+                    (y[points] >= bbox[1]) & (y[points] < bbox[3])
+                if mask.any():
+                    found[points[mask]] = i
+                    untagged[mask] = False
+                    if not untagged.any():
+                        break
+        return found
+
+#Layers already loaded in this run, {shape file: CachedLayer}
+layers = {}
+
+#Get the cached layer of a shape file: the cache file is read if it is up to date, or built again from the
+#shape file (see the module notes)
+#Syntax: get_layer(string) returns CachedLayer
+def get_layer(shp_file):
+    if shp_file in layers:
+        return layers[shp_file]
+    cache_file = get_cache_file(shp_file)
+    stats = get_source_stats(shp_file)
+
+    cache = read_cache(cache_file)
+    if (cache is not None) and (cache[0]['stats'] <> stats):
+        #Same content with other times (e.g. copied): update the key of the cache
+        if cache[0]['hash'] == get_source_hash(shp_file):
+            header = dict(cache[0])
+            header['stats'] = stats
+            arrays = dict([[name, np.array(cache[1][name])] for name in cache[1]])
+            cache = None
+            try:
+                write_cache(cache_file, header, arrays)
+                cache = read_cache(cache_file)
+            except (IOError, OSError):
+                cache = [header, arrays]
+        else:
+            cache = None
+
+    if cache is None:
+        print 'Caching the geometries of ' + shp_file + ' ...'
+        [fields, values, bboxes, wkb_offsets, wkb_data] = read_shapefile(shp_file)
+        [grid, cell_starts, cell_features] = build_grid(bboxes)
+        header = {'stats': stats, 'hash': get_source_hash(shp_file), 'fields': fields, 'values': values,
+                  'grid': grid}
+        arrays = {'bboxes': bboxes, 'wkb_offsets': wkb_offsets, 'cell_starts': cell_starts,
+                  'cell_features': cell_features, 'wkb': wkb_data}
+        try:
+            write_cache(cache_file, header, arrays)
+            cache = read_cache(cache_file)
+        except (IOError, OSError):
+            print 'Warning: can not write ' + cache_file + ', the geometries are used from memory'
+            cache = [json.loads(json.dumps(header)), arrays]
+
+    layers[shp_file] = CachedLayer(cache[0], cache[1])
+    return layers[shp_file]
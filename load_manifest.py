@@ -0,0 +1,173 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps the load manifest of the data loaders: a 'load_manifest' table in the TillDB or
+   the ARIS geochem staging database with one row per loader and staged file, holding
+         1) file name and md5 hash of the file content;
+         2) number of data rows in the file and number of rows loaded so far;
+         3) first and next values of the ids assigned to the file (e.g. 'sample_id=101,analyte_id=2001');
+         4) status ('loading' or 'loaded'), start and finish time.
+
+   The loaders commit the inserts of each data row together with a checkpoint of the manifest, so that
+   after a crash the manifest tells exactly which rows of which file were loaded. On the next run,
+         1) a file whose content was already loaded (same hash, under any file name) is skipped without
+            being opened;
+         2) a file left 'loading' with an unchanged hash is resumed after its last loaded row;
+         3) a file that was loaded (or partly loaded) and has been modified since is rejected. Nothing is
+            loaded until the rejected files are restored or renamed.
+
+   Input
+         1) Database cursor
+         2) Name of the loader
+         3) Path to the directory containing the staged xlsx files
+
+   Output
+         Rows inserted and updated in the 'load_manifest' table (created if missing)
+
+   Usage
+         manifest = load_manifest.LoadManifest(cur, 'tillDB_data_loader', data_dir)
+         [load_list, skipped, rejected] = manifest.check_files(xls_list)
+         first_ids = manifest.start(xls_file, row_count, {'sample_id': sample_id})
+         ... (per data row) manifest.checkpoint(xls_file, rows_loaded, {'sample_id': sample_id}); cur.commit()
+         manifest.finish(xls_file)
+
+         Dry run (nothing written): load_manifest.LoadManifest(cur, 'tillDB_data_loader', data_dir, True)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import datetime
+import screening_cache
+
+#Column types are those understood by both MS Access and SQLite
+MANIFEST_DDL = """create table load_manifest (load_id integer, loader varchar(64), file_name varchar(255),
+                  file_hash varchar(32), row_count integer, rows_loaded integer, first_ids varchar(255),
+                  next_ids varchar(255), status varchar(16), started varchar(19), finished varchar(19))"""
+
+#Write a dict of ids as text, e.g. 'analyte_id=2001,sample_id=101'
+#Syntax: format_ids(dict) returns string
+def format_ids(ids):
+    return ','.join([name + '=' + str(ids[name]) for name in sorted(ids)])
+
+#Read a dict of ids written by format_ids()
+#Syntax: parse_ids(string) returns dict
+def parse_ids(text):
+    ids = {}
+    for item in text.split(','):
+        [name, sep, value] = item.partition('=')
+        if sep:
+            ids[name] = int(value)
+    return ids
+
+class LoadManifest(object):
+    #Read the manifest rows of a loader (the table is created if missing, unless read_only, e.g. in the
+    #dry-run mode of the loaders)
+    #Syntax: LoadManifest(db_cursor, string, string, bool)
+    def __init__(self, db_cur, loader, data_dir, read_only = False):
+        self.cur = db_cur
+        self.loader = loader
+        self.data_dir = data_dir
+
+        #{file name: [load_id, file hash, rows loaded, status, started, first ids]} and {hash of loaded file: file name}
+        self.entries = {}
+        self.loaded_hashes = {}
+
+        #Hashes of the files checked in this run
+        self.hashes = {}
+
+        try:
+            db_cur.execute("""select max(load_id) from load_manifest""")
+        except Exception:
+            if read_only:
+                self.next_load_id = 1
+                return
+            db_cur.execute(MANIFEST_DDL)
+            db_cur.commit()
+            db_cur.execute("""select max(load_id) from load_manifest""")
+        max_val = db_cur.fetchone()
+        if max_val[0] == None:
+            self.next_load_id = 1
+        else:
+            self.next_load_id = int(max_val[0]) + 1
+
+        db_cur.execute("""select load_id, file_name, file_hash, rows_loaded, status, started, first_ids
+                          from load_manifest where loader = ? order by load_id""", loader)
+        for record in db_cur.fetchall():
+            self.entries[str(record[1])] = [record[0], str(record[2]), record[3], str(record[4]), str(record[5]),
+                                            parse_ids(str(record[6] or ''))]
+            if str(record[4]) == 'loaded':
+                self.loaded_hashes[str(record[2])] = str(record[1])
+
+    #Sort the staged files into files to load, files to skip and files to reject:
+    #   load list:  [[file name, number of rows already loaded], ...]
+    #   skipped:    [[file name, reason], ...]
+    #   rejected:   [[file name, reason], ...]
+    #Syntax: check_files(list) returns [list, list, list]
+    def check_files(self, xls_list):
+        load_list = list()
+        skipped = list()
+        rejected = list()
+        for xls_file in xls_list:
+            file_hash = screening_cache.file_hash(self.data_dir + xls_file)
+            self.hashes[xls_file] = file_hash
+            entry = self.entries.get(xls_file)
+
+            if (entry is not None) and (entry[1] <> file_hash):
+                rejected.append([xls_file, 'modified since it was ' + entry[3] + ' on ' + entry[4]])
+            elif file_hash in self.loaded_hashes:
+                if self.loaded_hashes[file_hash] == xls_file:
+                    skipped.append([xls_file, 'already loaded'])
+                else:
+                    skipped.append([xls_file, 'already loaded as ' + self.loaded_hashes[file_hash]])
+            elif entry is not None:
+                load_list.append([xls_file, entry[2]])
+            else:
+                load_list.append([xls_file, 0])
+        return [load_list, skipped, rejected]
+
+    #Record the start of the load of a file (or keep the row of a file being resumed), and commit. Returns
+    #the first ids of the file: those recorded when its load was started, for a file being resumed.
+    #Syntax: start(string, int, dict) returns dict
+    def start(self, xls_file, row_count, first_ids):
+        if xls_file in self.entries:
+            return dict(self.entries[xls_file][5])
+        started = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.cur.execute("""insert into load_manifest values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                         self.next_load_id, self.loader, xls_file, self.hashes[xls_file], row_count, 0,
+                         format_ids(first_ids), format_ids(first_ids), 'loading', started, None)
+        self.cur.commit()
+        self.entries[xls_file] = [self.next_load_id, self.hashes[xls_file], 0, 'loading', started, dict(first_ids)]
+        self.next_load_id = self.next_load_id + 1
+        return dict(first_ids)
+
+    #Record the rows loaded so far and the next ids. The caller commits it together with the inserts of
+    #the rows.
+    #Syntax: checkpoint(string, int, dict) returns None
+    def checkpoint(self, xls_file, rows_loaded, next_ids):
+        self.cur.execute("""update load_manifest set rows_loaded = ?, next_ids = ? where load_id = ?""",
+                         rows_loaded, format_ids(next_ids), self.entries[xls_file][0])
+        self.entries[xls_file][2] = rows_loaded
+
+    #Record the end of the load of a file, and commit
+    #Syntax: finish(string) returns None
+    def finish(self, xls_file):
+        finished = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.cur.execute("""update load_manifest set status = ?, finished = ? where load_id = ?""",
+                         'loaded', finished, self.entries[xls_file][0])
+        self.cur.commit()
+        self.entries[xls_file][3] = 'loaded'
+        self.loaded_hashes[self.hashes[xls_file]] = xls_file
+
+    #Print the skipped and rejected files. Returns True if the load can go ahead (no rejected file).
+    #Syntax: report(list, list) returns bool
+    def report(self, skipped, rejected):
+        for [xls_file, reason] in skipped:
+            print self.data_dir + xls_file + ' is skipped: ' + reason
+        if rejected:
+            print '\nNothing loaded, ' + str(len(rejected)) + ' file(s) rejected (see load_manifest.py):'
+            for [xls_file, reason] in rejected:
+                print '    ' + xls_file + ': ' + reason
+            return False
+        return True
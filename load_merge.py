@@ -0,0 +1,107 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module supports the merge load path of the data loaders (run with --merge). Instead of looking
+   up each row and each analyte value with a query of its own before inserting it, a loader
+         1) looks up the samples of the file already in the database in bulk ("... in (...)" queries, see
+            load_planner.select_in) and gives each row its sample_id;
+         2) copies the rows of the file into staging tables ('load_stage_...') with a single
+            executemany() per table;
+         3) flags the rows to insert with a few set-based "update ... where not exists (...)" statements,
+            so that the database engine does the duplicate checks (against the data tables and against
+            the rows of the same file before them, as in the row by row load);
+         4) numbers the flagged rows in the order of the staged file (same ids as the row by row load),
+            with a single "update ... from (select ..., row_number() over (order by ...))" statement on
+            SQLite 3.33 or later; MS Access has no row numbering function and does not take aggregate
+            subqueries in updates, so there the ids are set with one keyed update per row in a single
+            executemany();
+         5) merges them into the data tables with "insert into ... select ... from load_stage_...".
+   Each staged file is merged in one transaction, committed with its row in the load manifest.
+
+   The staging tables are created at the start of the load (dropped first if left over by a failed
+   load), emptied for each file and dropped at the end. Key columns are varchar(255) and long text
+   columns longtext, which MS Access and SQLite both understand (TEXT affinity in SQLite).
+
+   Input
+         1) Database cursor
+         2) Staging tables: [[table name, [[column name, type], ...], [index columns, ...]], ...]
+
+   Output
+         Staging tables (temporary)
+
+   Usage
+         load_merge.create_stage_tables(cur, STAGE_TABLES)
+         load_merge.copy_rows(cur, 'load_stage_sample', sample_rows)
+         next_id = load_merge.number_rows(cur, 'load_stage_analyte', 'analyte_id', ['row_no', 'col_no'], next_id)
+         load_merge.drop_stage_tables(cur, STAGE_TABLES)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import sqlite3
+import storage_backend
+
+#Create the staging tables (dropped first if they are left over by a failed load), and commit
+#Syntax: create_stage_tables(db_cursor, list) returns None
+def create_stage_tables(db_cur, stage_tables):
+    drop_stage_tables(db_cur, stage_tables)
+    for [table, columns, indexes] in stage_tables:
+        db_cur.execute('create table %s (%s)' % (table, ', '.join([name + ' ' + col_type
+                                                                   for [name, col_type] in columns])))
+        for i in range(len(indexes)):
+            db_cur.execute('create index ix_%s_%d on %s (%s)' % (table, i + 1, table, ', '.join(indexes[i])))
+    db_cur.commit()
+
+#Drop the staging tables, and commit
+#Syntax: drop_stage_tables(db_cursor, list) returns None
+def drop_stage_tables(db_cur, stage_tables):
+    for [table, columns, indexes] in stage_tables:
+        try:
+            db_cur.execute('drop table %s' % table)
+        except Exception:
+            pass
+    db_cur.commit()
+
+#Empty the staging tables (for the next file, in the transaction of the file)
+#Syntax: clear_stage_tables(db_cursor, list) returns None
+def clear_stage_tables(db_cur, stage_tables):
+    for [table, columns, indexes] in stage_tables:
+        db_cur.execute('delete from %s' % table)
+
+#Copy rows into a staging table (values in the column order of the table)
+#Syntax: copy_rows(db_cursor, string, list) returns None
+def copy_rows(db_cur, table, rows):
+    if rows:
+        db_cur.executemany('insert into %s values (%s)' % (table, ', '.join(['?'] * len(rows[0]))), rows)
+
+#Check whether the database numbers rows in a set-based update (SQLite 3.33 or later: "update ... from" and
+#row_number())
+#Syntax: has_row_number(db_cursor) returns bool
+def has_row_number(db_cur):
+    return isinstance(db_cur, storage_backend.SQLiteCursor) and (sqlite3.sqlite_version_info >= (3, 33, 0))
+
+#Give the rows of a staging table flagged for insertion (ins = 1) consecutive ids from next_id, in the
+#order of the given key columns. Returns the next id.
+#Syntax: number_rows(db_cursor, string, string, list, int) returns int
+def number_rows(db_cur, table, id_column, key_columns, next_id):
+    if has_row_number(db_cur):
+        db_cur.execute('select count(*) from %s where ins = 1' % table)
+        row_count = db_cur.fetchone()[0]
+        if row_count:
+            db_cur.execute("""update %s set %s = ? + numbered.row_number
+                              from (select rowid as stage_row, row_number() over (order by %s) - 1 as row_number
+                                    from %s where ins = 1) as numbered
+                              where %s.rowid = numbered.stage_row""" %
+                           (table, id_column, ', '.join(key_columns), table, table), next_id)
+        return next_id + row_count
+
+    db_cur.execute('select %s from %s where ins = 1 order by %s' % (', '.join(key_columns), table,
+                                                                      ', '.join(key_columns)))
+    keys = [list(record) for record in db_cur.fetchall()]
+    if keys:
+        db_cur.executemany('update %s set %s = ? where %s' % (table, id_column, ' and '.join([column + ' = ?'
+                                                                                            for column in key_columns])),
+                           [[next_id + i] + keys[i] for i in range(len(keys))])
+    return next_id + len(keys)
@@ -0,0 +1,77 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module is the load pipeline of the data loaders. Reading a staged xlsx file with openpyxl and
+   writing its rows to the database used to alternate file by file, so that the CPU was idle during the
+   database calls and the database was idle while the next file was being read. In the pipeline,
+         1) a pool of worker processes reads and normalizes the staged files (the read function of the
+            loader), several files at a time;
+         2) the read files are handed over in the order of the load list through a bounded queue: at most
+            QUEUE_SIZE files are read ahead of the one being written, which bounds the memory used;
+         3) the loader (a single writer, the process holding the database connection) writes the files one
+            after the other, in order, so that the ids are assigned exactly as in a serial load and the
+            load manifest checkpoints stay valid.
+
+   The number of worker processes is given with --workers=N on the command line (default: number of
+   CPUs - 1). With --workers=0 (the default on a single CPU) the files are read by the writer itself,
+   one after the other.
+
+   Input
+         1) Read function of the loader (a module-level function, so that it can be run in the workers)
+         2) Arguments of the read function of each file, in load order
+         3) Number of worker processes
+
+   Output
+         [arguments, result of the read function] of each file, in load order
+
+   Usage
+         for [[data_dir, xls_file, rows_loaded], staged] in load_pipeline.read_files(read_staged_file,
+                 [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list],
+                 load_pipeline.get_workers(sys.argv[1:])):
+             ... write the rows of staged
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import threading, Queue, multiprocessing
+
+#Number of files read ahead of the file being written
+QUEUE_SIZE = 4
+
+#Get the number of worker processes from the command line arguments (--workers=N)
+#Syntax: get_workers(list) returns int
+def get_workers(args):
+    for arg in args:
+        if arg.startswith('--workers='):
+            return int(arg.partition('=')[2])
+    return multiprocessing.cpu_count() - 1
+
+#Read the files in the worker processes and yield them in load order (see the module notes). Reading
+#errors are raised in the writer, when the file is reached.
+#Syntax: read_files(function, list, int) returns generator
+def read_files(read_func, arg_list, workers):
+    if (workers == 0) or (len(arg_list) < 2):
+        for args in arg_list:
+            yield [args, read_func(*args)]
+        return
+
+    pool = multiprocessing.Pool(min(workers, len(arg_list)))
+    queue = Queue.Queue(QUEUE_SIZE)
+
+    #Submit the files to the pool, blocking while QUEUE_SIZE files are waiting to be written
+    def submit():
+        for args in arg_list:
+            queue.put([args, pool.apply_async(read_func, args)])
+    producer = threading.Thread(target = submit)
+    producer.daemon = True
+    producer.start()
+
+    try:
+        for i in range(len(arg_list)):
+            [args, result] = queue.get()
+            yield [args, result.get()]
+    finally:
+        pool.terminate()
+        pool.join()
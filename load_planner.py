@@ -0,0 +1,99 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module supports the dry-run mode of the data loaders (run with --plan). In this mode a loader
+   reads the staged files and the keys it would check in the database, and computes what the load
+   would do without writing anything:
+         1) the database rows needed for the checks are read once, in bulk, into in-memory indexes
+            (dicts and sets) instead of being queried row by row;
+         2) each staged file is stepped through with the same rules as the load, and the indexes are
+            updated with the rows the load would insert, so that duplicates within the batch are caught;
+         3) a per-file summary of the rows to insert and skip is printed, with the totals and the next
+            ids after the load.
+
+   Input
+         1) Name of the loader
+         2) Columns of the summary: [[count name, heading], ...]
+
+   Output
+         Per-file summary (printed)
+
+   Usage
+         plan = load_planner.LoadPlan('tillDB_data_loader', [['samples_new', 'new samples'], ...])
+         counts = plan.add_file(xls_file)
+         counts['samples_new'] = counts['samples_new'] + 1
+         plan.report(skipped, rejected, next_ids)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import load_manifest
+
+#Number of values in each "in (...)" list (MS Access limits the length of a query)
+IN_CHUNK = 500
+
+#Run a query on a list of key values, in chunks of IN_CHUNK values. The query has a single %s where the
+#"?, ?, ..." list of the chunk goes.
+#Syntax: select_in(db_cursor, string, list) returns list
+def select_in(db_cur, sql, values):
+    values = sorted(set(values))
+    rows = list()
+    for i in range(0, len(values), IN_CHUNK):
+        chunk = values[i:i + IN_CHUNK]
+        db_cur.execute(sql % ', '.join(['?'] * len(chunk)), chunk)
+        rows.extend(db_cur.fetchall())
+    return rows
+
+class LoadPlan(object):
+    #Start an empty plan
+    #Syntax: LoadPlan(string, list)
+    def __init__(self, loader, columns):
+        self.loader = loader
+        self.columns = columns
+        self.files = list()         #[[file name, {count name: count}], ...]
+        self.problems = list()      #[[file name, problem], ...]
+
+    #Add a file to the plan. Returns its counts (all 0) to be updated by the caller.
+    #Syntax: add_file(string) returns dict
+    def add_file(self, xls_file):
+        counts = dict([[name, 0] for [name, heading] in self.columns])
+        self.files.append([xls_file, counts])
+        return counts
+
+    #Record a problem that would stop the load of a file
+    #Syntax: add_problem(string, string) returns None
+    def add_problem(self, xls_file, problem):
+        if [xls_file, problem] not in self.problems:
+            self.problems.append([xls_file, problem])
+
+    #Print the per-file summary, the totals and the next ids after the load
+    #Syntax: report(list, list, dict) returns None
+    def report(self, skipped, rejected, next_ids):
+        name_width = max([len(xls_file) for [xls_file, counts] in self.files] + [len('total')])
+        headings = ['file'.ljust(name_width)] + [heading.rjust(max(len(heading), 8))
+                                                 for [name, heading] in self.columns]
+
+        print '\nLoad plan of ' + self.loader + ' (nothing written to the database)'
+        print '  '.join(headings)
+        totals = dict([[name, 0] for [name, heading] in self.columns])
+        for [xls_file, counts] in self.files:
+            line = [xls_file.ljust(name_width)]
+            for c in range(len(self.columns)):
+                name = self.columns[c][0]
+                line.append(str(counts[name]).rjust(len(headings[c + 1])))
+                totals[name] = totals[name] + counts[name]
+            print '  '.join(line)
+        print '  '.join(['total'.ljust(name_width)] + [str(totals[self.columns[c][0]]).rjust(len(headings[c + 1]))
+                                                       for c in range(len(self.columns))])
+
+        print str(len(self.files)) + ' file(s) to load, ' + str(len(skipped)) + ' skipped, ' + \
+            str(len(rejected)) + ' rejected'
+        for [xls_file, reason] in rejected:
+            print '    rejected ' + xls_file + ': ' + reason
+        if self.problems:
+            print str(len(self.problems)) + ' problem(s) that would stop the load:'
+            for [xls_file, problem] in self.problems:
+                print '    ' + xls_file + ': ' + problem
+        print 'Next ids after the load: ' + load_manifest.format_ids(next_ids)
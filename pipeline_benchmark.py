@@ -0,0 +1,369 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This script benchmarks the screen -> load -> product pipeline of the TillDB and of the ARIS geochem
+   staging database over synthetic data sets of increasing size (see synthetic_data_generator.py).
+   For each data set size, the stages are run in pipeline order:
+         TillDB: tillDB_data_screener, tillDB_data_loader, tillDB_product_creator
+         ARIS:   data_screener_sample_info, aris_geochem_stagingdb_sample_info_data_loader,
+                 data_screener_certificates, aris_geochem_stagingdb_certificates_data_loader,
+                 data_screener_results, aris_geochem_stagingdb_results_data_loader,
+                 aris_geochem_product_creator
+   and for each stage it records
+         1) wall time, and throughput in rows/s (analyte values; location rows or certificates for the
+            ARIS sample info and certificate stages) and samples/s;
+         2) peak resident memory (RSS) of the stage;
+         3) number of database queries and commits (see query_profiler.py).
+   Each stage is run in its own process, so that its peak RSS is not that of an earlier stage.
+
+   Input
+         1) Work directory (the synthetic data of each size are generated under <work dir>\\size_<n>)
+         2) Options (--name=value), all optional:
+               sizes          samples per staged file of each data set (default 100,1000)
+               stages         comma-separated list of the stages to run (default all)
+               baseline       benchmark JSON file of an earlier run to compare with
+               tolerance      throughput drop or RSS increase flagged as a regression (default 0.2, 20%)
+               nts_mapsheet   NTS 50k grid shapefile used by tillDB_data_loader and tillDB_product_creator
+                              (the NTS tags are left blank if it is missing)
+            and the options of synthetic_data_generator.py (e.g. --analytes=60, --tilldb_files=10).
+            The tilldb_samples and aris_samples options are set by the sizes.
+
+   Output
+         1) Benchmark tables printed for each data set size
+         2) <work dir>\\benchmark_<date>.json, the records of all the stages
+         3) Comparison with the baseline (if given). The script exits with code 1 when a regression is
+            found: throughput lower or peak RSS higher than the baseline by more than the tolerance, more
+            queries than the baseline, or a stage failing that did not in the baseline.
+
+   Operation note
+         1) The output of the stages is saved to <work dir>\\size_<n>\\<stage>.log.
+
+         2) The stages are run from the directory of this script, where the screeners find their
+            shapefiles (e.g. prov_ab_p_geo83_e.shp). The ARIS distance check of data_screener_sample_info
+            uses the report locations written by the generator (aris_report_locations.csv).
+
+         3) Peak RSS is not available on Windows (no 'resource' module) and is recorded as null.
+
+         4) Compare runs with the same options (seed included) only: the query counts depend on the data.
+
+   Usage
+         python pipeline_benchmark.py C:\\temp\\benchmark --sizes=100,1000,5000
+         python pipeline_benchmark.py C:\\temp\\benchmark --sizes=100,1000,5000
+                                      --baseline=C:\\temp\\benchmark\\benchmark_2026_10_18_09_30.json
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, json, time, shutil, datetime, subprocess, traceback
+import query_profiler, storage_backend, synthetic_data_generator
+try:
+    import resource
+except ImportError:     #Not available on Windows (see Operation note 3)
+    resource = None
+
+#Default options of the benchmark (the other options are those of synthetic_data_generator.py)
+DEFAULTS = {'sizes': '100,1000', 'stages': '', 'baseline': '', 'tolerance': 0.2,
+            'nts_mapsheet': 'C:\\Project\\ProvinceData\\topo_data\\nts_50k\\grid_50k_nts_ll83_poly.shp'}
+
+#Stages in pipeline order: [script (module) name, data set]
+STAGES = [['tillDB_data_screener', 'tilldb'], ['tillDB_data_loader', 'tilldb'], ['tillDB_product_creator', 'tilldb'],
+          ['data_screener_sample_info', 'aris'], ['aris_geochem_stagingdb_sample_info_data_loader', 'aris'],
+          ['data_screener_certificates', 'aris'], ['aris_geochem_stagingdb_certificates_data_loader', 'aris'],
+          ['data_screener_results', 'aris'], ['aris_geochem_stagingdb_results_data_loader', 'aris'],
+          ['aris_geochem_product_creator', 'aris']]
+
+#============================================= Sub-routines ===============================================
+#Database connection wrapper whose cursors record their statements in a query profile
+class CountingConnection(object):
+    def __init__(self, db_conn, qprofile):
+        self.db_conn = db_conn
+        self.qprofile = qprofile
+
+    def cursor(self):
+        return query_profiler.InstrumentedCursor(self.db_conn.cursor(), self.qprofile)
+
+    def commit(self):
+        start = time.time()
+        self.db_conn.commit()
+        self.qprofile.add('commit', time.time() - start, 1)
+
+    def __getattr__(self, name):
+        return getattr(self.db_conn, name)
+
+#Get the peak RSS of the current process in MB (None if not available)
+#Syntax: get_peak_rss() returns float
+def get_peak_rss():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak_rss / 1048576.0     #bytes
+    return peak_rss / 1024.0            #KB
+
+#Get the benchmark options and the generator options from the command line arguments
+#Syntax: get_options(list) returns [dict, dict]
+def get_options(args):
+    options = dict(DEFAULTS)
+    generator_args = list()
+    for arg in args:
+        if not arg.startswith('--'):
+            continue
+        [name, sep, value] = arg[2:].partition('=')
+        if name not in DEFAULTS:
+            generator_args.append(arg)
+        elif isinstance(DEFAULTS[name], float):
+            options[name] = float(value)
+        else:
+            options[name] = value
+    return [options, synthetic_data_generator.get_options(generator_args)]
+
+#Get the keyword arguments of the main() of a stage script
+#Syntax: get_stage_kwargs(string, dict, string, dict) returns dict
+def get_stage_kwargs(stage, manifest, run_dir, options):
+    tilldb = manifest['tilldb']
+    aris = manifest['aris']
+    if stage == 'tillDB_data_screener':
+        return {'db_path': tilldb['db_path'], 'data_dir': tilldb['data_dir'],
+                'cache_file': os.path.join(run_dir, stage + '.pkl')}
+    elif stage == 'tillDB_data_loader':
+        return {'db_path': tilldb['db_path'], 'data_dir': tilldb['data_dir'],
+                'nts_mapsheet': options['nts_mapsheet']}
+    elif stage == 'tillDB_product_creator':
+        return {'db_path': tilldb['db_path'], 'data_sheet': os.path.join(run_dir, 'tilldb_data_sheet.csv'),
+                'nts_mapsheet': options['nts_mapsheet']}
+    elif stage == 'data_screener_sample_info':
+        return {'data_dir': aris['loc_dir'], 'cache_file': os.path.join(run_dir, stage + '.pkl'),
+                'chkrpt_dir': run_dir + os.sep, 'aris_export': aris.get('report_export')}
+    elif stage == 'aris_geochem_stagingdb_sample_info_data_loader':
+        return {'db_path': aris['db_path'], 'data_dir': aris['loc_dir']}
+    elif stage == 'data_screener_certificates':
+        return {'db_path': aris['db_path'], 'data_dir': aris['cert_dir'],
+                'cache_file': os.path.join(run_dir, stage + '.pkl')}
+    elif stage == 'aris_geochem_stagingdb_certificates_data_loader':
+        return {'db_path': aris['db_path'], 'data_dir': aris['cert_dir']}
+    elif stage == 'data_screener_results':
+        return {'db_path': aris['db_path'], 'data_dir': aris['results_dir'],
+                'cache_file': os.path.join(run_dir, stage + '.pkl')}
+    elif stage == 'aris_geochem_stagingdb_results_data_loader':
+        return {'db_path': aris['db_path'], 'data_dir': aris['results_dir']}
+    elif stage == 'aris_geochem_product_creator':
+        return {'db_path': aris['db_path'], 'data_sheet': os.path.join(run_dir, 'aris_data_sheet.csv')}
+
+#Get the rows and samples processed by a stage: [rows, samples]. The product creators process the whole
+#database, counted before they run.
+#Syntax: get_stage_counts(string, dict) returns [int, int]
+def get_stage_counts(stage, manifest):
+    tilldb = manifest['tilldb']
+    aris = manifest['aris']
+    if stage in ['tillDB_data_screener', 'tillDB_data_loader']:
+        return [sum([xls['analytes'] for xls in tilldb['files']]), tilldb['samples']]
+    elif stage in ['data_screener_sample_info', 'aris_geochem_stagingdb_sample_info_data_loader']:
+        return [aris['samples'], aris['samples']]
+    elif stage in ['data_screener_certificates', 'aris_geochem_stagingdb_certificates_data_loader']:
+        return [len(aris['cert_files']), 0]
+    elif stage in ['data_screener_results', 'aris_geochem_stagingdb_results_data_loader']:
+        return [aris['analytes'], sum([xls['samples'] for xls in aris['results_files']])]
+
+    if stage == 'tillDB_product_creator':
+        db_conn = storage_backend.connect(tilldb['db_path'])
+    else:
+        db_conn = storage_backend.connect(aris['db_path'])
+    cur = db_conn.cursor()
+    cur.execute("""select count(*) from data_analyte""")
+    rows = cur.fetchone()[0]
+    cur.execute("""select count(*) from data_sample""")
+    samples = cur.fetchone()[0]
+    db_conn.close()
+    return [rows, samples]
+
+#Run a stage script in the current process and save its time, peak RSS and queries to a JSON file
+#(called in the child process started by run_stage)
+#Syntax: run_stage_child(string, string, string) returns None
+def run_stage_child(stage, kwargs_file, result_file):
+    with open(kwargs_file) as in_file:
+        kwargs = dict([[str(name), str(value)] for name, value in json.load(in_file).items()])
+    module = __import__(stage)
+
+    #Count the queries of all the connections opened by the stage
+    qprofile = query_profiler.QueryProfile(stage)
+    connect = storage_backend.connect
+    storage_backend.connect = lambda db_path: CountingConnection(connect(db_path), qprofile)
+    sys.argv = [stage + '.py']
+
+    error = None
+    start = time.time()
+    try:
+        module.main(**kwargs)
+    except SystemExit, err:
+        error = 'Exited: ' + str(err.code)
+    except Exception:
+        error = traceback.format_exc()
+    seconds = time.time() - start
+
+    queries = 0
+    commits = 0
+    for stage_stats in qprofile.stats.values():
+        for sql, [count, sql_seconds] in stage_stats.items():
+            if sql == 'commit':
+                commits = commits + count
+            else:
+                queries = queries + count
+
+    result = {'seconds': seconds, 'peak_rss_mb': get_peak_rss(), 'queries': queries, 'commits': commits,
+              'error': error}
+    with open(result_file, 'w') as out_file:
+        json.dump(result, out_file, indent = 1)
+
+#Run a stage script in a child process (see Operation note 1 and 2)
+#Syntax: run_stage(string, dict, string) returns dict
+def run_stage(stage, kwargs, run_dir):
+    kwargs_file = os.path.join(run_dir, stage + '_args.json')
+    result_file = os.path.join(run_dir, stage + '_result.json')
+    with open(kwargs_file, 'w') as out_file:
+        json.dump(kwargs, out_file, indent = 1)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(run_dir, stage + '.log'), 'w') as log_file:
+        exit_code = subprocess.call([sys.executable, os.path.abspath(__file__), '--run-stage', stage, kwargs_file,
+                                     result_file], stdout = log_file, stderr = subprocess.STDOUT, cwd = script_dir)
+
+    if not os.path.isfile(result_file):
+        return {'seconds': None, 'peak_rss_mb': None, 'queries': None, 'commits': None,
+                'error': 'Stage process failed with exit code ' + str(exit_code)}
+    with open(result_file) as in_file:
+        return json.load(in_file)
+
+#Print the benchmark table of a data set size
+#Syntax: print_runs(list) returns None
+def print_runs(runs):
+    print '%-48s %10s %10s %9s %11s %11s %9s %8s' % ('Stage', 'Rows', 'Samples', 'Time (s)', 'Rows/s',
+                                                    'Samples/s', 'RSS (MB)', 'Queries')
+    for run in runs:
+        if run['error'] is not None:
+            print '%-48s %10d %10d  failed, see %s.log' % (run['stage'], run['rows'], run['samples'], run['stage'])
+            continue
+        peak_rss = 'n/a'
+        if run['peak_rss_mb'] is not None:
+            peak_rss = '%.1f' % run['peak_rss_mb']
+        print '%-48s %10d %10d %9.2f %11.1f %11.1f %9s %8d' % (run['stage'], run['rows'], run['samples'],
+                                                              run['seconds'], run['rows_per_s'],
+                                                              run['samples_per_s'], peak_rss, run['queries'])
+
+#Run the stages over the data set of each size
+#Syntax: run_benchmark(string, dict, dict) returns dict
+def run_benchmark(work_dir, options, generator_options):
+    sizes = [int(size) for size in options['sizes'].split(',')]
+    stages = [stage for [stage, dataset] in STAGES]
+    if options['stages']:
+        stages = [stage for stage in stages if stage in options['stages'].split(',')]
+
+    benchmark = {'started': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'platform': sys.platform,
+                 'python': sys.version.split()[0], 'sizes': sizes, 'generator_options': generator_options,
+                 'runs': []}
+    for size in sizes:
+        run_dir = os.path.join(work_dir, 'size_' + str(size))
+        if os.path.isdir(run_dir):
+            shutil.rmtree(run_dir)
+        print '\n===================================== Size: %d samples per file =====================================' \
+              % size
+        generator_options['tilldb_samples'] = size
+        generator_options['aris_samples'] = size
+        manifest = synthetic_data_generator.generate(os.path.join(run_dir, 'data'), generator_options)
+
+        runs = list()
+        for stage in stages:
+            print 'Running ' + stage + ' ...'
+            [rows, samples] = get_stage_counts(stage, manifest)
+            run = {'size': size, 'stage': stage, 'rows': rows, 'samples': samples}
+            run.update(run_stage(stage, get_stage_kwargs(stage, manifest, run_dir, options), run_dir))
+            if (run['error'] is None) and (run['seconds'] > 0):
+                run['rows_per_s'] = rows / run['seconds']
+                run['samples_per_s'] = samples / run['seconds']
+            else:
+                run['rows_per_s'] = None
+                run['samples_per_s'] = None
+            runs.append(run)
+
+        print
+        print_runs(runs)
+        benchmark['runs'].extend(runs)
+    return benchmark
+
+#Compare the runs with those of a baseline, and print the differences. Returns the regressions found.
+#Syntax: compare(dict, dict, float) returns list
+def compare(benchmark, baseline, tolerance):
+    base_runs = dict([[(run['size'], run['stage']), run] for run in baseline['runs']])
+
+    print '\n---------------------------------- Comparison with baseline (%s) ----------------------------------' \
+          % baseline['started']
+    print '%-48s %8s %12s %12s %8s %9s %9s %8s %8s' % ('Stage', 'Size', 'Rows/s base', 'Rows/s now', 'Change',
+                                                      'RSS base', 'RSS now', 'Q base', 'Q now')
+    regressions = list()
+    for run in benchmark['runs']:
+        key = (run['size'], run['stage'])
+        if key not in base_runs:
+            continue
+        base = base_runs[key]
+        if (base['error'] is None) and (run['error'] is not None):
+            regressions.append([run['stage'], run['size'], 'failed (baseline did not)'])
+        if (base['error'] is not None) or (run['error'] is not None):
+            print '%-48s %8d %12s %12s' % (run['stage'], run['size'], base['error'] is None and 'ok' or 'failed',
+                                           run['error'] is None and 'ok' or 'failed')
+            continue
+
+        change = 0.0
+        if base['rows_per_s']:
+            change = 100.0 * (run['rows_per_s'] - base['rows_per_s']) / base['rows_per_s']
+        print '%-48s %8d %12.1f %12.1f %7.1f%% %9s %9s %8d %8d' % (run['stage'], run['size'], base['rows_per_s'],
+              run['rows_per_s'], change, base['peak_rss_mb'] is not None and '%.1f' % base['peak_rss_mb'] or 'n/a',
+              run['peak_rss_mb'] is not None and '%.1f' % run['peak_rss_mb'] or 'n/a', base['queries'],
+              run['queries'])
+
+        if run['rows_per_s'] < base['rows_per_s'] * (1 - tolerance):
+            regressions.append([run['stage'], run['size'], 'throughput %.1f%%' % change])
+        if (base['peak_rss_mb'] is not None) and (run['peak_rss_mb'] is not None) and \
+           (run['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance)):
+            regressions.append([run['stage'], run['size'], 'peak RSS %.1f MB -> %.1f MB' %
+                                (base['peak_rss_mb'], run['peak_rss_mb'])])
+        if run['queries'] > base['queries']:
+            regressions.append([run['stage'], run['size'], 'queries %d -> %d' % (base['queries'], run['queries'])])
+
+    if regressions:
+        print '\n' + str(len(regressions)) + ' regression(s) found:'
+        for [stage, size, problem] in regressions:
+            print '    %s (size %d): %s' % (stage, size, problem)
+    else:
+        print '\nNo regression found.'
+    return regressions
+
+#============================================= Main routine =========================================
+def main():
+    if (len(sys.argv) > 1) and (sys.argv[1] == '--run-stage'):
+        run_stage_child(sys.argv[2], sys.argv[3], sys.argv[4])
+        return
+    if (len(sys.argv) < 2) or sys.argv[1].startswith('--'):
+        print 'Usage: python pipeline_benchmark.py <work directory> [--name=value ...]'
+        sys.exit()
+
+    work_dir = os.path.abspath(sys.argv[1])
+    [options, generator_options] = get_options(sys.argv[2:])
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    benchmark = run_benchmark(work_dir, options, generator_options)
+    benchmark_file = os.path.join(work_dir, 'benchmark_' + datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") +
+                                  '.json')
+    with open(benchmark_file, 'w') as out_file:
+        json.dump(benchmark, out_file, indent = 1)
+    print '\nBenchmark saved to ' + benchmark_file
+
+    if options['baseline']:
+        with open(options['baseline']) as in_file:
+            baseline = json.load(in_file)
+        if compare(benchmark, baseline, options['tolerance']):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module writes a data product ('data_sheet.csv' of the TillDB or of the ARIS geochem staging
+   database) to spatial formats that desktop GIS open directly, with a spatial index:
+         gpkg    GeoPackage, with an R-tree spatial index (OGR "GPKG" driver)
+         fgb     FlatGeobuf, with a packed Hilbert R-tree (OGR "FlatGeobuf" driver, GDAL 3.1 or later)
+   Each sample is a point feature in NAD83 geographic (EPSG code = 4269) at its NAD83_Long and NAD83_Lat,
+   with all the columns of the product as attributes.
+
+   The product is streamed, so that the memory used does not depend on its size:
+         1) a first pass over the csv file finds the type of each column: integer for Sample_ID and the
+            UTM columns, text for the identifiers (TEXT_COLUMNS), real if all its values are numbers (e.g.
+            analyte values without "<" or ">"), text otherwise;
+         2) a second pass writes the features, committed every CHUNK_SIZE features.
+   A sample without a valid location is written without geometry.
+
+   Input
+         1) Data product csv file
+         2) Formats (gpkg, fgb)
+
+   Output
+         Data product next to the csv file, e.g. 'data_sheet.gpkg' and 'data_sheet.fgb'
+
+   Usage
+         product_export.export(data_sheet, ['gpkg', 'fgb'])
+
+         In the product creators: --export=gpkg,fgb
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, csv, math, ogr, osr
+
+#Formats: {format: [OGR driver, layer creation options]}
+EXPORT_FORMATS = {'gpkg': ['GPKG', ['SPATIAL_INDEX=YES']],
+                  'fgb': ['FlatGeobuf', ['SPATIAL_INDEX=YES']]}
+
+#Number of features written in each transaction
+CHUNK_SIZE = 5000
+
+#Columns of the location in the data products
+LONG_COLUMN = 'NAD83_Long'
+LAT_COLUMN = 'NAD83_Lat'
+
+#Columns of the data products written as integers, and identifiers kept as text even when numeric (e.g. a
+#sample name '0012'; the Pub_Issue columns are numbered Pub_Issue1, Pub_Issue2, ...)
+INTEGER_COLUMNS = ['Sample_ID', 'UTM_Easting', 'UTM_Northing', 'UTM_Zone']
+TEXT_COLUMNS = ['Sample_Code', 'Sample_Name', 'Station_Name', 'Borehole', 'NTS_Map', 'Pub_Issue']
+
+#Check whether a string is a (finite) number
+#Syntax: is_number(string) returns bool
+def is_number(n):
+    try:
+        return not (math.isinf(float(n)) or math.isnan(float(n)))
+    except ValueError:
+        return False
+
+#Get the formats to write from the command line arguments (--export=gpkg,fgb)
+#Syntax: get_export_args(list) returns list
+def get_export_args(args):
+    formats = list()
+    for arg in args:
+        if arg.startswith('--export='):
+            formats.extend(arg.partition('=')[2].split(','))
+    return formats
+
+#Find the OGR field type of each column of a csv file (first pass)
+#Syntax: get_field_types(string) returns [list, list]
+def get_field_types(csv_file):
+    csv_input = open(csv_file, 'rU')
+    rows = csv.reader(csv_input)
+    header = rows.next()
+    numeric = [True] * len(header)
+    blank = [True] * len(header)
+    for row in rows:
+        for i in range(min(len(header), len(row))):
+            if row[i] <> '':
+                blank[i] = False
+                if numeric[i] and not is_number(row[i]):
+                    numeric[i] = False
+    csv_input.close()
+
+    field_types = list()
+    for i in range(len(header)):
+        if (header[i] in INTEGER_COLUMNS) and numeric[i]:
+            field_types.append(ogr.OFTInteger)
+        elif header[i].rstrip('0123456789') in TEXT_COLUMNS:
+            field_types.append(ogr.OFTString)
+        elif numeric[i] and not blank[i]:
+            field_types.append(ogr.OFTReal)
+        else:
+            field_types.append(ogr.OFTString)
+    return [header, field_types]
+
+#Write a csv data product to a spatial format (second pass). Returns the path of the file written.
+#Syntax: write_layer(string, string, list, list) returns string
+def write_layer(csv_file, out_format, header, field_types):
+    [driver_name, options] = EXPORT_FORMATS[out_format]
+    out_file = os.path.splitext(csv_file)[0] + '.' + out_format
+    layer_name = os.path.splitext(os.path.basename(csv_file))[0]
+
+    driver = ogr.GetDriverByName(driver_name)
+    if driver is None:
+        print 'No OGR driver for ' + out_format + ' (' + driver_name + '), ' + out_file + ' not written'
+        return None
+    if os.path.exists(out_file):
+        driver.DeleteDataSource(out_file)
+    dataSource = driver.CreateDataSource(out_file)
+
+    nad83_ref = osr.SpatialReference()
+    nad83_ref.ImportFromEPSG(4269)
+    layer = dataSource.CreateLayer(layer_name, nad83_ref, ogr.wkbPoint, options)
+    for i in range(len(header)):
+        layer.CreateField(ogr.FieldDefn(header[i], field_types[i]))
+    layer_defn = layer.GetLayerDefn()
+
+    long_indx = header.index(LONG_COLUMN)
+    lat_indx = header.index(LAT_COLUMN)
+
+    csv_input = open(csv_file, 'rU')
+    rows = csv.reader(csv_input)
+    rows.next()
+    feature_count = 0
+    layer.StartTransaction()
+    for row in rows:
+        feature = ogr.Feature(layer_defn)
+        for i in range(min(len(header), len(row))):
+            if row[i] == '':
+                continue
+            if field_types[i] == ogr.OFTInteger:
+                feature.SetField(i, int(float(row[i])))
+            elif field_types[i] == ogr.OFTReal:
+                feature.SetField(i, float(row[i]))
+            else:
+                feature.SetField(i, row[i])
+        if is_number(row[long_indx]) and is_number(row[lat_indx]):
+            point = ogr.Geometry(ogr.wkbPoint)
+            point.AddPoint_2D(float(row[long_indx]), float(row[lat_indx]))
+            feature.SetGeometry(point)
+        layer.CreateFeature(feature)
+        feature_count = feature_count + 1
+
+        #Commit the chunk
+        if feature_count % CHUNK_SIZE == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+    layer.CommitTransaction()
+    csv_input.close()
+
+    #The spatial index is completed when the file is closed
+    dataSource = None
+    print str(feature_count) + ' sample(s) written to ' + out_file
+    return out_file
+
+#Write a csv data product to the given formats. Returns the paths of the files written.
+#Syntax: export(string, list) returns list
+def export(csv_file, formats):
+    for out_format in formats:
+        if out_format not in EXPORT_FORMATS:
+            print 'Unknown export format: ' + out_format + ' (' + ', '.join(sorted(EXPORT_FORMATS)) + ')'
+            sys.exit()
+
+    [header, field_types] = get_field_types(csv_file)
+    out_files = list()
+    for out_format in formats:
+        out_file = write_layer(csv_file, out_format, header, field_types)
+        if out_file is not None:
+            out_files.append(out_file)
+    return out_files
@@ -0,0 +1,359 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module builds vector tiles of the sample locations of a data product ('data_sheet.csv' of the
+   TillDB or of the ARIS geochem staging database) for the web map, in an MBTiles archive (SQLite):
+         1) one point per sample in a 'samples' layer (Mapbox vector tiles, gzipped), with the sample_id
+            as feature id and the values of the selected columns (e.g. key analytes) as attributes;
+         2) zoom levels MIN_ZOOM to MAX_ZOOM (web mercator, XYZ tiles stored with TMS rows as in the
+            MBTiles specification);
+         3) per-zoom thinning: below MAX_ZOOM, a tile keeps one sample per square of THIN_CELL tile units
+            (the lowest sample_id), so that low zoom tiles stay small; all samples are kept at MAX_ZOOM.
+
+   The archive is regenerated incrementally. The location and attribute values of each sample tiled are
+   kept in a 'tile_samples' table of the archive; on the next run only the tiles holding the old or new
+   location of a sample that was added, changed or removed are built again. The whole archive is built
+   again if the selected columns, the zoom levels or the bounding box of the data product (--bbox of the
+   product creators, kept in the 'tile_extent' metadata) changed: a sample missing from a product of
+   another extent was not removed. Nothing needs a network connection.
+
+   Input
+         1) Data product csv file
+         2) Names of the columns to keep as attributes
+         3) Bounding box of the data product, if any ([west, south, east, north], NAD83)
+
+   Output
+         MBTiles archive next to the csv file, e.g. 'data_sheet.mbtiles'
+
+   Usage
+         product_tiles.build(data_sheet, ['Au_INA_ppb_63', 'Cu_AIP_ppm_63'], [west, south, east, north])
+
+         In the product creators: --tiles=<column>[,<column>...] (--tiles for the locations only)
+         From the command line: python product_tiles.py <data_sheet.csv> [<column> ...]
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, csv, math, json, zlib, struct, sqlite3
+import numpy as np
+import product_export
+
+#Zoom levels of the archive
+MIN_ZOOM = 0
+MAX_ZOOM = 12
+
+#Size of the tiles in tile units, and of the thinning squares below MAX_ZOOM (64 units are 4 pixels of a
+#256 pixel tile)
+EXTENT = 4096
+THIN_CELL = 64
+
+#Name of the layer of the sample points
+LAYER_NAME = 'samples'
+
+#Web mercator latitude limit
+MAX_LAT = 85.0511287798
+
+#Tables of the archive, 'metadata' and 'tiles' as in the MBTiles specification
+MBTILES_DDL = ["""create table if not exists metadata (name text, value text)""",
+               """create table if not exists tiles (zoom_level integer, tile_column integer, tile_row integer,
+                  tile_data blob)""",
+               """create unique index if not exists ix_tiles on tiles (zoom_level, tile_column, tile_row)""",
+               """create table if not exists tile_samples (sample_id integer primary key, nad83_long double,
+                  nad83_lat double, tile_values text)"""]
+
+#=========================================== Vector tile encoding =====================================
+#Varints of 0 to 127 (one byte), most of those of a tile
+SMALL_VARINTS = [chr(n) for n in range(0x80)]
+
+#Encode an unsigned integer as a protocol buffer varint
+#Syntax: pb_varint(int) returns string
+def pb_varint(n):
+    if n < 0x80:
+        return SMALL_VARINTS[n]
+    data = ''
+    while n > 0x7F:
+        data = data + chr((n & 0x7F) | 0x80)
+        n = n >> 7
+    return data + chr(n)
+
+#Encode a field of a protocol buffer message: varint (wire type 0), 64-bit (1) or length delimited (2)
+#Syntax: pb_field(int, int, object) returns string
+def pb_field(field, wire_type, value):
+    key = pb_varint((field << 3) | wire_type)
+    if wire_type == 0:
+        return key + pb_varint(value)
+    elif wire_type == 1:
+        return key + struct.pack('<d', value)
+    return key + pb_varint(len(value)) + value
+
+#Zigzag encoding of the signed geometry parameters
+#Syntax: zigzag(int) returns int
+def zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+#Geometry type field of the features (POINT)
+POINT_TYPE = pb_field(3, 0, 1)
+
+#Encode a tile of one point layer: [[sample_id, x, y, [[key, value], ...]], ...] (x and y in tile units)
+#Syntax: encode_tile(list) returns string
+def encode_tile(features):
+    keys = list()
+    key_indx = {}
+    values = list()
+    value_indx = {}
+    layer = [pb_field(15, 0, 2), pb_field(1, 2, LAYER_NAME)]
+    for [sample_id, x, y, attributes] in features:
+        tags = list()
+        for [key, value] in attributes:
+            if key not in key_indx:
+                key_indx[key] = len(keys)
+                keys.append(key)
+            if value not in value_indx:
+                value_indx[value] = len(values)
+                values.append(value)
+            tags.append(pb_varint(key_indx[key]))
+            tags.append(pb_varint(value_indx[value]))
+        geometry = SMALL_VARINTS[9] + pb_varint(zigzag(x)) + pb_varint(zigzag(y))     #MoveTo(1)
+        feature = pb_field(1, 0, sample_id) + POINT_TYPE + pb_field(4, 2, geometry)
+        if tags:
+            feature = feature + pb_field(2, 2, ''.join(tags))
+        layer.append(pb_field(2, 2, feature))
+    for key in keys:
+        layer.append(pb_field(3, 2, key))
+    for value in values:
+        if isinstance(value, float):
+            layer.append(pb_field(4, 2, pb_field(3, 1, value)))
+        else:
+            layer.append(pb_field(4, 2, pb_field(1, 2, value)))
+    layer.append(pb_field(5, 0, EXTENT))
+    return pb_field(3, 2, ''.join(layer))
+
+#Gzip a tile, as expected by the MBTiles readers
+#Syntax: gzip_tile(string) returns string
+def gzip_tile(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+#================================================ Tiling =============================================
+#Get the web mercator position of arrays of NAD83 long. and lat. as fractions of the world ([0, 1) from
+#the west and from the north)
+#Syntax: get_mercator(array, array) returns [array, array]
+def get_mercator(nad83_long, nad83_lat):
+    lat = np.radians(np.clip(nad83_lat, -MAX_LAT, MAX_LAT))
+    x = (nad83_long + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return [np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)]
+
+#Get the tiles (column, row) at a zoom level of mercator positions
+#Syntax: get_tiles(array, array, int) returns [array, array]
+def get_tiles(x, y, zoom):
+    return [np.floor(x * 2 ** zoom).astype(np.int64), np.floor(y * 2 ** zoom).astype(np.int64)]
+
+#Get a text value of the product in UTF-8 (as expected in the vector tiles), from UTF-8 or cp1252
+#Syntax: to_utf8(string) returns string
+def to_utf8(text):
+    try:
+        text.decode('utf-8')
+        return text
+    except UnicodeDecodeError:
+        return text.decode('cp1252', 'replace').encode('utf-8')
+
+#Read the samples with a location from a data product: [sample_ids, nad83_long, nad83_lat,
+#[tile values of each sample]]. The tile values are [[column, value], ...] without the blanks, numbers as
+#floats (except the identifiers, see product_export.TEXT_COLUMNS).
+#Syntax: read_samples(string, list) returns list
+def read_samples(csv_file, fields):
+    csv_input = open(csv_file, 'rU')
+    rows = csv.reader(csv_input)
+    header = rows.next()
+    for field in fields:
+        if field not in header:
+            print 'No column ' + field + ' in ' + csv_file
+            sys.exit()
+    id_indx = header.index('Sample_ID')
+    long_indx = header.index(product_export.LONG_COLUMN)
+    lat_indx = header.index(product_export.LAT_COLUMN)
+    field_indx = [header.index(field) for field in fields]
+
+    [sample_ids, nad83_long, nad83_lat, tile_values] = [list(), list(), list(), list()]
+    for row in rows:
+        if not (product_export.is_number(row[long_indx]) and product_export.is_number(row[lat_indx])):
+            continue
+        sample_ids.append(int(row[id_indx]))
+        nad83_long.append(float(row[long_indx]))
+        nad83_lat.append(float(row[lat_indx]))
+        values = list()
+        for i in range(len(fields)):
+            if (field_indx[i] < len(row)) and (row[field_indx[i]] <> ''):
+                if product_export.is_number(row[field_indx[i]]) and \
+                   (fields[i].rstrip('0123456789') not in product_export.TEXT_COLUMNS):
+                    values.append([fields[i], float(row[field_indx[i]])])
+                else:
+                    values.append([fields[i], to_utf8(row[field_indx[i]])])
+        tile_values.append(values)
+    csv_input.close()
+    return [np.array(sample_ids, dtype = np.int64), np.array(nad83_long), np.array(nad83_lat), tile_values]
+
+#Build the tiles of a zoom level holding the given samples, only the tiles in 'wanted' ({(column, row)})
+#or all of them. Returns {(column, row): gzipped tile}.
+#Syntax: build_zoom(int, array, array, array, list, set) returns dict
+def build_zoom(zoom, sample_ids, x, y, tile_values, wanted = None):
+    [columns, rows] = get_tiles(x, y, zoom)
+    if wanted is not None:
+        wanted_keys = np.array([column * 2 ** zoom + row for [column, row] in wanted], dtype = np.int64)
+        indices = np.flatnonzero(np.in1d(columns * 2 ** zoom + rows, wanted_keys))
+    else:
+        indices = np.arange(len(columns))
+    if len(indices) == 0:
+        return {}
+
+    #Position of the samples in their tile
+    tile_x = np.minimum((x[indices] * 2 ** zoom - columns[indices]) * EXTENT, EXTENT - 1).astype(np.int64)
+    tile_y = np.minimum((y[indices] * 2 ** zoom - rows[indices]) * EXTENT, EXTENT - 1).astype(np.int64)
+
+    #Order by tile, thinning square and sample_id, and keep the first sample of each square below MAX_ZOOM
+    tile_keys = columns[indices] * 2 ** zoom + rows[indices]
+    if zoom < MAX_ZOOM:
+        cell_keys = (tile_x // THIN_CELL) * (EXTENT // THIN_CELL) + tile_y // THIN_CELL
+    else:
+        cell_keys = np.zeros(len(indices), dtype = np.int64)
+    order = np.lexsort((sample_ids[indices], cell_keys, tile_keys))
+    if zoom < MAX_ZOOM:
+        first = np.ones(len(order), dtype = bool)
+        first[1:] = (tile_keys[order][1:] <> tile_keys[order][:-1]) | (cell_keys[order][1:] <> cell_keys[order][:-1])
+        order = order[first]
+
+    tiles = {}
+    for j in order:
+        i = indices[j]
+        tile = (int(columns[i]), int(rows[i]))
+        if tile not in tiles:
+            tiles[tile] = list()
+        tiles[tile].append([int(sample_ids[i]), int(tile_x[j]), int(tile_y[j]), tile_values[i]])
+    return dict([[tile, gzip_tile(encode_tile(tiles[tile]))] for tile in tiles])
+
+#Read a metadata value of the archive (None if missing)
+#Syntax: get_metadata(sqlite_cursor, string) returns string
+def get_metadata(cur, name):
+    cur.execute("""select value from metadata where name = ?""", (name,))
+    record = cur.fetchone()
+    if record is None:
+        return None
+    return record[0]
+
+#Build or update the MBTiles archive of a data product, of the samples in a bounding box ([west, south,
+#east, north]) or of all of them. Returns the path of the archive.
+#Syntax: build(string, list, list) returns string
+def build(csv_file, fields, bbox = None):
+    mbtiles_file = os.path.splitext(csv_file)[0] + '.mbtiles'
+    [sample_ids, nad83_long, nad83_lat, tile_values] = read_samples(csv_file, fields)
+    signatures = [repr(values) for values in tile_values]
+
+    db_conn = sqlite3.connect(mbtiles_file)
+    db_conn.text_factory = str
+    cur = db_conn.cursor()
+    for sql in MBTILES_DDL:
+        cur.execute(sql)
+
+    #Build all the tiles again if the archive is new or was built with other columns or zoom levels, or from
+    #a data product of another extent (the samples out of the old bounding box are not removed ones)
+    settings = json.dumps([fields, MIN_ZOOM, MAX_ZOOM, EXTENT, THIN_CELL])
+    extent = json.dumps(None if bbox is None else [float(val) for val in bbox])
+    rebuild = get_metadata(cur, 'tile_settings') <> settings
+    if (not rebuild) and (get_metadata(cur, 'tile_extent') <> extent):
+        print 'The data product has another extent than the tiles of ' + mbtiles_file
+        rebuild = True
+    if rebuild:
+        cur.execute("""delete from tiles""")
+        cur.execute("""delete from tile_samples""")
+
+    #Samples added, changed or removed since the last run, with their old location
+    cur.execute("""select sample_id, nad83_long, nad83_lat, tile_values from tile_samples""")
+    stored = dict([[record[0], record[1:]] for record in cur.fetchall()])
+    positions = dict([[int(sample_ids[i]), i] for i in range(len(sample_ids))])
+    changed = [i for i in range(len(sample_ids)) if stored.get(int(sample_ids[i])) <>
+               (nad83_long[i], nad83_lat[i], signatures[i])]
+    removed = [sample_id for sample_id in stored if sample_id not in positions]
+    old_ids = [sample_id for sample_id in removed] + [int(sample_ids[i]) for i in changed
+                                                       if int(sample_ids[i]) in stored]
+    if rebuild:
+        print 'Building the tiles of ' + str(len(sample_ids)) + ' sample(s) ...'
+    else:
+        print str(len(changed)) + ' sample(s) added or changed, ' + str(len(removed)) + ' removed since the ' + \
+            'last tiling'
+
+    [x, y] = get_mercator(nad83_long, nad83_lat)
+    [old_x, old_y] = get_mercator(np.array([stored[sample_id][0] for sample_id in old_ids], dtype = float),
+                                  np.array([stored[sample_id][1] for sample_id in old_ids], dtype = float))
+    tile_count = 0
+    for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+        if rebuild:
+            wanted = None
+        else:
+            [columns, rows] = get_tiles(x[changed], y[changed], zoom)
+            [old_columns, old_rows] = get_tiles(old_x, old_y, zoom)
+            wanted = set(zip(columns.tolist() + old_columns.tolist(), rows.tolist() + old_rows.tolist()))
+            if not wanted:
+                continue
+            cur.executemany("""delete from tiles where zoom_level = ? and tile_column = ? and tile_row = ?""",
+                            [(zoom, column, 2 ** zoom - 1 - row) for [column, row] in wanted])
+        tiles = build_zoom(zoom, sample_ids, x, y, tile_values, wanted)
+        cur.executemany("""insert into tiles values (?, ?, ?, ?)""",
+                        [(zoom, tile[0], 2 ** zoom - 1 - tile[1], sqlite3.Binary(tiles[tile])) for tile in tiles])
+        tile_count = tile_count + len(tiles)
+
+    #Samples tiled
+    cur.executemany("""delete from tile_samples where sample_id = ?""", [(sample_id,) for sample_id in old_ids])
+    cur.executemany("""insert into tile_samples values (?, ?, ?, ?)""",
+                    [(int(sample_ids[i]), float(nad83_long[i]), float(nad83_lat[i]), signatures[i]) for i in changed])
+
+    #Metadata of the archive
+    if len(sample_ids) > 0:
+        bounds = [float(nad83_long.min()), float(nad83_lat.min()), float(nad83_long.max()), float(nad83_lat.max())]
+    else:
+        bounds = [-180.0, -MAX_LAT, 180.0, MAX_LAT]
+    layer_fields = dict([[field, 'Number'] for field in fields])
+    for values in tile_values:
+        for [field, value] in values:
+            if not isinstance(value, float):
+                layer_fields[field] = 'String'
+    metadata = [['name', os.path.splitext(os.path.basename(csv_file))[0]],
+                ['format', 'pbf'],
+                ['type', 'overlay'],
+                ['minzoom', str(MIN_ZOOM)],
+                ['maxzoom', str(MAX_ZOOM)],
+                ['bounds', ','.join([str(val) for val in bounds])],
+                ['center', ','.join([str((bounds[0] + bounds[2]) / 2), str((bounds[1] + bounds[3]) / 2),
+                                     str(MIN_ZOOM)])],
+                ['json', json.dumps({'vector_layers': [{'id': LAYER_NAME, 'fields': layer_fields,
+                                                         'minzoom': MIN_ZOOM, 'maxzoom': MAX_ZOOM}]})],
+                ['tile_settings', settings],
+                ['tile_extent', extent]]
+    cur.execute("""delete from metadata""")
+    cur.executemany("""insert into metadata values (?, ?)""", [tuple(item) for item in metadata])
+    db_conn.commit()
+    db_conn.close()
+
+    print str(tile_count) + ' tile(s) written to ' + mbtiles_file
+    return mbtiles_file
+
+#Get the columns to tile from the command line arguments (--tiles=<column>[,<column>...], or --tiles for
+#the locations only). Returns None without the option.
+#Syntax: get_tiles_args(list) returns list
+def get_tiles_args(args):
+    fields = None
+    for arg in args:
+        if arg == '--tiles':
+            fields = list()
+        elif arg.startswith('--tiles='):
+            fields = [field for field in arg.partition('=')[2].split(',') if field]
+    return fields
+
+#============================================= Main routine =========================================
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print 'Usage: python product_tiles.py <data_sheet.csv> [<column> ...]'
+        sys.exit()
+    build(sys.argv[1], sys.argv[2:])
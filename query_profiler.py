@@ -0,0 +1,192 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module measures the database round trips of the scripts working on the TillDB and the ARIS
+   geochem staging database. A database cursor is wrapped by an instrumented cursor which records, for
+   each stage of the script (e.g. 'next ids', 'load files'),
+         1) the number of executions of each SQL statement. Statements are grouped by normalized SQL
+            text: white spaces collapsed, lower case, and literal values replaced by '?', so that
+            'select name from code_unit where unit_id = 3' and '... unit_id = 5' are counted together;
+         2) the cumulative latency of each statement, including the fetches of its results;
+         3) the number of commits.
+   Statements executed more than a given number of times in a stage are flagged. They are usually
+   queries issued row by row in a loop (N+1 queries) which could be replaced by a single set-based
+   query or an in-memory lookup.
+
+   Input
+         1) Name of the script
+         2) Whether the profile is enabled (the scripts use the --query-profile option). When disabled,
+            cursors are not wrapped and nothing is recorded.
+         3) Number of executions above which a statement is flagged (default 100)
+
+   Output
+         1) Query-profile report printed at the end of the run
+         2) JSON file of the query profile
+
+   Usage
+         qprofile = query_profiler.QueryProfile('tillDB_data_loader', '--query-profile' in sys.argv[1:])
+         cur = qprofile.cursor(db_conn.cursor())
+         qprofile.set_stage('load files')
+         ...
+         qprofile.report(qprofile_file)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import re, time, json, datetime
+
+#Normalize SQL text so that executions of the same statement with different literal values are grouped
+#Syntax: normalize_sql(string) returns string
+def normalize_sql(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)                 #String literals
+    sql = re.sub(r'(?<![\w.])-?\d+(?:\.\d+)?\b', '?', sql)    #Numeric literals
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    return sql.lower()
+
+#Database cursor wrapper recording the executions, latency and fetches of each statement. Everything
+#else is passed to the cursor.
+class InstrumentedCursor(object):
+    def __init__(self, cur, profile):
+        self.cur = cur
+        self.profile = profile
+
+        #Statement of the last execution, its fetch time is added to it
+        self.last_sql = None
+
+    def execute(self, sql, *params):
+        self.last_sql = normalize_sql(sql)
+        start = time.time()
+        self.cur.execute(sql, *params)
+        self.profile.add(self.last_sql, time.time() - start, 1)
+        return self
+
+    def executemany(self, sql, params):
+        self.last_sql = normalize_sql(sql)
+        start = time.time()
+        self.cur.executemany(sql, params)
+        self.profile.add(self.last_sql, time.time() - start, 1)
+        return self
+
+    def fetchone(self):
+        start = time.time()
+        row = self.cur.fetchone()
+        self.profile.add(self.last_sql, time.time() - start, 0)
+        return row
+
+    def fetchall(self):
+        start = time.time()
+        rows = self.cur.fetchall()
+        self.profile.add(self.last_sql, time.time() - start, 0)
+        return rows
+
+    def fetchmany(self, size):
+        start = time.time()
+        rows = self.cur.fetchmany(size)
+        self.profile.add(self.last_sql, time.time() - start, 0)
+        return rows
+
+    def commit(self):
+        start = time.time()
+        self.cur.commit()
+        self.profile.add('commit', time.time() - start, 1)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+class QueryProfile(object):
+    #Syntax: QueryProfile(string, bool, int)
+    def __init__(self, script_name, enabled = True, loop_threshold = 100):
+        self.script_name = script_name
+        self.enabled = enabled
+        self.loop_threshold = loop_threshold
+        self.started = datetime.datetime.now()
+
+        #Stages in the order they were started, and {stage: {normalized sql: [executions, seconds]}}
+        self.stages = ['main']
+        self.stats = {'main': {}}
+        self.stage = 'main'
+        self.stage_start = {'main': time.time()}
+        self.stage_time = {'main': 0.0}
+
+    #Wrap a database cursor so its statements are recorded (returns the cursor itself if not enabled)
+    #Syntax: cursor(db_cursor) returns InstrumentedCursor
+    def cursor(self, cur):
+        if not self.enabled:
+            return cur
+        return InstrumentedCursor(cur, self)
+
+    #Start recording the statements under a new stage of the script
+    #Syntax: set_stage(string) returns None
+    def set_stage(self, stage):
+        if not self.enabled:
+            return
+        self.stage_time[self.stage] = self.stage_time[self.stage] + time.time() - self.stage_start[self.stage]
+        if stage not in self.stats:
+            self.stages.append(stage)
+            self.stats[stage] = {}
+            self.stage_time[stage] = 0.0
+        self.stage = stage
+        self.stage_start[stage] = time.time()
+
+    #Record an execution (or a fetch, with "executions" of 0) of a statement
+    #Syntax: add(string, float, int) returns None
+    def add(self, sql, seconds, executions):
+        stage_stats = self.stats[self.stage]
+        if sql not in stage_stats:
+            stage_stats[sql] = [0, 0.0]
+        stage_stats[sql][0] = stage_stats[sql][0] + executions
+        stage_stats[sql][1] = stage_stats[sql][1] + seconds
+
+    #Get the statements of a stage sorted by cumulative latency: [[sql, executions, seconds, flagged], ...]
+    #Syntax: get_statements(string) returns list
+    def get_statements(self, stage):
+        statements = [[sql, count, seconds, count > self.loop_threshold]
+                      for sql, [count, seconds] in self.stats[stage].items()]
+        statements.sort(key = lambda statement: statement[2], reverse = True)
+        return statements
+
+    #Print the query-profile report and save it to a JSON file (if a file name is given)
+    #Syntax: report(string) returns None
+    def report(self, json_file = None):
+        if not self.enabled:
+            return
+        self.set_stage(self.stage)
+
+        print '\n------------------------------------- Query profile -------------------------------------'
+        profile = {'script': self.script_name, 'started': self.started.strftime('%Y-%m-%d %H:%M:%S'),
+                   'loop_threshold': self.loop_threshold, 'stages': []}
+        for stage in self.stages:
+            statements = self.get_statements(stage)
+            if not statements:
+                continue
+            executions = sum([statement[1] for statement in statements])
+            db_time = sum([statement[2] for statement in statements])
+
+            print '\nStage: %s  (%.3f s, %d round trips, %.3f s in database)' % \
+                  (stage, self.stage_time[stage], executions, db_time)
+            print '%10s %10s %10s  %s' % ('Count', 'Time (s)', 'Avg (ms)', 'Statement')
+            for [sql, count, seconds, flagged] in statements:
+                if count > 0:
+                    average = 1000.0 * seconds / count
+                else:
+                    average = 0.0
+                flag = ''
+                if flagged:
+                    flag = '  <-- executed more than ' + str(self.loop_threshold) + ' times'
+                print '%10d %10.3f %10.3f  %s%s' % (count, seconds, average, sql[:100], flag)
+
+            profile['stages'].append({'stage': stage, 'seconds': self.stage_time[stage],
+                                      'round_trips': executions, 'db_seconds': db_time,
+                                      'statements': [{'sql': sql, 'count': count, 'seconds': seconds,
+                                                      'flagged': flagged}
+                                                     for [sql, count, seconds, flagged] in statements]})
+
+        if json_file is not None:
+            with open(json_file, 'w') as out_file:
+                json.dump(profile, out_file, indent = 1)
+            print '\nQuery profile saved to ' + json_file
@@ -0,0 +1,117 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps the code tables of the TillDB and of the ARIS geochem staging database ('code_unit',
+   'code_method', 'code_lab' and 'code_prep') in memory, so that the screeners, loaders and product
+   creators look up unit names, method groups, method_id's, ... in dicts instead of querying the
+   database for each cell or row.
+
+   The rows of the code tables are saved to a cache file next to the database, together with an md5
+   checksum of each table and the modification time and size of the database file. On the next run,
+         1) if the database file is unchanged, the code tables are read from the cache file only;
+         2) otherwise each code table is read once from the database and checksummed, and only the
+            tables whose checksum changed are replaced in the cache.
+
+   Input
+         1) Path to the database (the cache file is <database name>_refcache.pkl in the same directory)
+         2) Names of the code tables used by the script
+
+   Output
+         Cache file (python pickle)
+
+   Usage
+         refcache = reference_cache.ReferenceCache(db_path)
+         refcache.load(cur, ['code_unit', 'code_method'])
+         unit_names = refcache.lookup('code_unit', 'unit_id', 'name')          #{unit_id: name}
+         method_ids = refcache.lookup('code_method', 'method_abbr', 'method_id')    #{method_abbr: method_id}
+         unit_list = refcache.column('code_unit', 'name')                    #Names in unit_id order
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, hashlib, cPickle
+
+#Code tables and their key column
+CODE_TABLES = {'code_unit': 'unit_id', 'code_method': 'method_id', 'code_lab': 'lab_id', 'code_prep': 'prep_id'}
+
+class ReferenceCache(object):
+    #Open the reference cache of a database
+    #Syntax: ReferenceCache(string, string)
+    def __init__(self, db_path, cache_file = None):
+        if cache_file is None:
+            cache_file = os.path.splitext(db_path)[0] + '_refcache.pkl'
+        self.db_path = db_path
+        self.cache_file = cache_file
+
+        #Modification time and size of the database file when the tables were last read, and
+        #{table name: [checksum, column names, rows]}
+        self.db_stamp = None
+        self.tables = {}
+        if os.path.isfile(cache_file):
+            with open(cache_file, 'rb') as in_file:
+                [self.db_stamp, self.tables] = cPickle.load(in_file)
+
+        #Dicts built from the tables in this run: {(table, key column, value column): dict}
+        self.lookups = {}
+
+        #Number of tables read from the database and replaced in the cache in this run
+        self.read_count = 0
+        self.changed_count = 0
+
+    #Get the modification time and size of the database file (and of the SQLite write-ahead log)
+    #Syntax: get_db_stamp() returns list
+    def get_db_stamp(self):
+        stamp = list()
+        for db_file in [self.db_path, self.db_path + '-wal']:
+            if os.path.isfile(db_file):
+                db_stat = os.stat(db_file)
+                stamp.append((db_stat.st_mtime, db_stat.st_size))
+        return stamp
+
+    #Load the given code tables, from the cache file if the database is unchanged, from the database
+    #otherwise
+    #Syntax: load(db_cursor, list) returns None
+    def load(self, db_cur, table_names):
+        db_stamp = self.get_db_stamp()
+        if (db_stamp == self.db_stamp) and all([table in self.tables for table in table_names]):
+            return
+
+        for table in table_names:
+            db_cur.execute('select * from %s order by %s' % (table, CODE_TABLES[table]))
+            columns = [str(column[0]).lower() for column in db_cur.description]
+            rows = [tuple(row) for row in db_cur.fetchall()]
+            checksum = hashlib.md5(repr(columns) + repr(rows)).hexdigest()
+            self.read_count = self.read_count + 1
+
+            if (table not in self.tables) or (self.tables[table][0] <> checksum):
+                self.tables[table] = [checksum, columns, rows]
+                self.changed_count = self.changed_count + 1
+                for key in self.lookups.keys():
+                    if key[0] == table:
+                        del self.lookups[key]
+
+        self.db_stamp = db_stamp
+        with open(self.cache_file, 'wb') as out_file:
+            cPickle.dump([self.db_stamp, self.tables], out_file, 2)
+
+    #Get the checksum of a code table (e.g. as the version of reference data, see screening_cache.py)
+    #Syntax: checksum(string) returns string
+    def checksum(self, table):
+        return self.tables[table][0]
+
+    #Get the values of a column of a code table, in key order
+    #Syntax: column(string, string) returns list
+    def column(self, table, column_name):
+        [checksum, columns, rows] = self.tables[table]
+        indx = columns.index(column_name)
+        return [row[indx] for row in rows]
+
+    #Get a dict mapping the values of a column of a code table to those of another column
+    #Syntax: lookup(string, string, string) returns dict
+    def lookup(self, table, key_column, value_column):
+        key = (table, key_column, value_column)
+        if key not in self.lookups:
+            self.lookups[key] = dict(zip(self.column(table, key_column), self.column(table, value_column)))
+        return self.lookups[key]
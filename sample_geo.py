@@ -0,0 +1,291 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps the derived location attributes of the samples in a 'data_sample_geo' side table of
+   the TillDB or the ARIS geochem staging database, one row per sample:
+         1) source coordinates of the sample (x_coord, y_coord, epsg_srid, as in 'data_sample');
+         2) NAD83 geographic coordinates (nad83_long, nad83_lat);
+         3) NAD83 UTM coordinates (utm_easting, utm_northing, utm_zone), -1 outside UTM zones 1 to 23;
+         4) NTS 50k mapsheet tag (nts_map), ' ' outside the NTS grid, or blank if no grid was given;
+         5) for the NAD27 samples, the NTv2 grid shift file they were converted with (datum_grid, see
+            datum_shift.get_grid_tag()), '' if they were converted by pyproj.
+   A sample whose coordinates can not be projected (e.g. out of range) has no location: its NAD83
+   coordinates are NULL, its UTM coordinates -1 and its NTS tag ' '. See has_location().
+
+   The attributes are computed when the samples are inserted by the loaders, and read by the product
+   creators and the screeners instead of being computed sample by sample. A row is computed again only
+   when it is stale: missing, its source coordinates differ from those in 'data_sample' (the sample was
+   edited), its NTS tag is blank and an NTS grid is given, it has no UTM zone while its longitude has
+   one (rows computed when only zones 7 to 11 were supported), only one of its NAD83 coordinates is
+   NULL or one is infinite (rows computed before the locations that can not be projected were stored as
+   NULL), or it is a NAD27 sample not converted with the NTv2 grid shift file now available (e.g. rows
+   computed by pyproj before the file was installed). The datum_grid column is added to the tables
+   created without it, so that their NAD27 rows are computed again once. The computation is done in
+   batches:
+         1) one pyproj transformation per source EPSG code (arrays of coordinates), instead of one per
+            sample; NAD27 coordinates (e.g. EPSG codes 26709 and 26710) are shifted with the NTv2 grid
+            instead (see datum_shift.py);
+         2) one pyproj transformation per UTM zone, the zones being computed from the longitudes
+            (zone = floor((long. + 180) / 6) + 1, NAD83 UTM zone N is EPSG code 26900 + N);
+         3) the envelopes of the NTS grid sheets are read from the geometry cache of the grid shape file
+            (see geometry_cache.py), and the samples are tagged with array comparisons against the
+            envelopes of the sheets of their grid index cell (same rule as the former "get_ntssheet": the
+            first sheet whose envelope holds the sample, west and south edges included).
+
+   Input
+         1) Database cursor
+         2) NTS 50k map grid shape file in NAD83 geographic (grid_50k_nts_ll83_poly.shp), optional (the
+            NTS tags are left blank if it is not given or missing)
+         3) Range of sample_ids to refresh, optional (all samples by default)
+
+   Output
+         Rows inserted and replaced in the 'data_sample_geo' table (created if missing)
+
+   Usage
+         sample_geo.create_table(cur)
+         sample_geo.refresh(cur, nts_mapsheet, [first_sample_id, next_sample_id]); cur.commit()
+         geo = sample_geo.read_geo(cur, nts_mapsheet)
+         [nad83_long, nad83_lat, utm_easting, utm_northing, utm_zone, nts_map] = geo[sample_id]
+         geo = sample_geo.force_utm_zone(geo, 10)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os
+import numpy as np
+from pyproj import Proj, transform
+import datum_shift, geometry_cache
+
+#Column types are those understood by both MS Access and SQLite
+GEO_DDL = """create table data_sample_geo (sample_id integer, x_coord double, y_coord double, epsg_srid integer,
+             nad83_long double, nad83_lat double, utm_easting integer, utm_northing integer, utm_zone integer,
+             nts_map varchar(16), datum_grid varchar(64))"""
+
+#NAD83 UTM zones (EPSG codes 26901 to 26923, zone N is 26900 + N), 6 degrees wide from long. -180
+UTM_FIRST_ZONE = 1
+UTM_LAST_ZONE = 23
+
+#Number of rows in each executemany() batch
+BATCH_SIZE = 1000
+
+#Coordinate systems already set up, {EPSG code: Proj}
+projections = {}
+
+#Get the pyproj coordinate system of an EPSG code
+#Syntax: get_proj(int) returns Proj
+def get_proj(epsg):
+    if epsg not in projections:
+        projections[epsg] = Proj('+init=EPSG:' + str(epsg))
+    return projections[epsg]
+
+#Check whether a row of 'data_sample_geo' (as read by read_geo()) has a location: finite NAD83 long. and lat.
+#Syntax: has_location(list) returns bool
+def has_location(geo_row):
+    try:
+        return bool(np.isfinite(float(geo_row[0])) and np.isfinite(float(geo_row[1])))
+    except (TypeError, ValueError):
+        return False
+
+#Create the 'data_sample_geo' table if missing, or add its datum_grid column (tables created before it was
+#added), and commit
+#Syntax: create_table(db_cursor) returns None
+def create_table(db_cur):
+    try:
+        db_cur.execute("""select count(*) from data_sample_geo""")
+        db_cur.fetchone()
+    except Exception:
+        db_cur.execute(GEO_DDL)
+        db_cur.commit()
+        return
+    try:
+        db_cur.execute("""select count(datum_grid) from data_sample_geo""")
+        db_cur.fetchone()
+    except Exception:
+        db_cur.execute("""alter table data_sample_geo add column datum_grid varchar(64)""")
+        db_cur.commit()
+
+#Project arrays of source coordinates to NAD83 long. and lat., one transformation per EPSG code. NAD27
+#coordinates are shifted with the NTv2 grid (see datum_shift.py), and by pyproj outside the grid.
+#Syntax: project2nad83(array, array, array) returns [array, array]
+def project2nad83(x_coords, y_coords, epsg_codes):
+    nad83_long = x_coords.copy()
+    nad83_lat = y_coords.copy()
+    for epsg in np.unique(epsg_codes):
+        if epsg == 4269: #Already in NAD83 and no projection needed
+            continue
+        mask = epsg_codes == epsg
+        if datum_shift.is_nad27(epsg):
+            shifted = datum_shift.nad27_to_nad83(x_coords[mask], y_coords[mask], epsg)
+            if shifted is not None:
+                nad83_long[mask], nad83_lat[mask] = shifted
+                outside = mask & np.isnan(nad83_long) & np.isfinite(x_coords) & np.isfinite(y_coords)
+                if not outside.any():
+                    continue
+                print 'Warning: ' + str(outside.sum()) + ' NAD27 point(s) outside the NTv2 grid, projected by pyproj'
+                mask = outside
+        nad83_long[mask], nad83_lat[mask] = transform(get_proj(int(epsg)), get_proj(4269),
+                                                      x_coords[mask], y_coords[mask])
+    return [nad83_long, nad83_lat]
+
+#Get the NAD83 UTM zones of an array of NAD83 longitudes (-1 outside the zones). A longitude on the edge of
+#two zones goes to the eastern one.
+#Syntax: get_utm_zones(array) returns array
+def get_utm_zones(nad83_long):
+    zones = np.zeros(len(nad83_long), dtype = np.int64) - 1
+    valid = np.isfinite(nad83_long)
+    zones[valid] = np.floor((nad83_long[valid] + 180.0) / 6.0).astype(np.int64) + 1
+    zones[(zones < UTM_FIRST_ZONE) | (zones > UTM_LAST_ZONE)] = -1
+    return zones
+
+#Project arrays of NAD83 long. and lat. to NAD83 UTM coordinates, one transformation per zone (-1 outside
+#the zones). With forced_zone, all the points are projected to that zone (e.g. a map across two zones).
+#Syntax: project2utm(array, array, int) returns [array, array, array]
+def project2utm(nad83_long, nad83_lat, forced_zone = None):
+    eastings = np.zeros(len(nad83_long), dtype = np.int64) - 1
+    northings = np.zeros(len(nad83_long), dtype = np.int64) - 1
+    if forced_zone is None:
+        zones = get_utm_zones(nad83_long)
+    else:
+        zones = np.zeros(len(nad83_long), dtype = np.int64) + forced_zone
+        zones[~(np.isfinite(nad83_long) & np.isfinite(nad83_lat))] = -1
+    for zone in np.unique(zones):
+        if zone == -1:
+            continue
+        mask = zones == zone
+        utm_x, utm_y = transform(get_proj(4269), get_proj(26900 + int(zone)), nad83_long[mask], nad83_lat[mask])
+        eastings[mask] = np.asarray(utm_x).astype(np.int64)
+        northings[mask] = np.asarray(utm_y).astype(np.int64)
+    return [eastings, northings, zones]
+
+#Tag arrays of NAD83 long. and lat. with the NTS 50k mapsheets of the grid shape file (' ' outside the grid).
+#The sheets are read from the geometry cache of the grid (see geometry_cache.py).
+#Syntax: get_ntssheets(string, array, array) returns list
+def get_ntssheets(mapsheet_file, nad83_long, nad83_lat):
+    layer = geometry_cache.get_layer(mapsheet_file)
+    tile_indx = layer.field_index('map_tile')
+    sheets = layer.first_envelope(nad83_long, nad83_lat)
+    return [' ' if i == -1 else layer.values[i][tile_indx] for i in sheets]
+
+#Compute the rows of 'data_sample_geo' for the given samples: [[sample_id, x, y, epsg], ...]
+#Syntax: compute_rows(list, string) returns list
+def compute_rows(samples, nts_mapsheet):
+    x_coords = np.array([float(sample[1]) for sample in samples])
+    y_coords = np.array([float(sample[2]) for sample in samples])
+    epsg_codes = np.array([int(sample[3]) for sample in samples])
+
+    [nad83_long, nad83_lat] = project2nad83(x_coords, y_coords, epsg_codes)
+
+    #The samples that can not be projected have no location (NULL, see the module notes)
+    located = np.isfinite(nad83_long) & np.isfinite(nad83_lat)
+    nad83_long[~located] = np.nan
+    nad83_lat[~located] = np.nan
+
+    [eastings, northings, zones] = project2utm(nad83_long, nad83_lat)
+    if nts_mapsheet is None:
+        tags = [None] * len(samples)
+    else:
+        tags = get_ntssheets(nts_mapsheet, nad83_long, nad83_lat)
+
+    #Grid shift file of the NAD27 samples (see datum_shift.py)
+    nad27 = [datum_shift.is_nad27(epsg) for epsg in epsg_codes]
+    grid_tag = None
+    if any(nad27):
+        grid_tag = datum_shift.get_grid_tag()
+
+    rows = list()
+    for i in range(len(samples)):
+        [row_long, row_lat] = [None, None]
+        if located[i]:
+            [row_long, row_lat] = [float(nad83_long[i]), float(nad83_lat[i])]
+        rows.append([samples[i][0], float(x_coords[i]), float(y_coords[i]), int(epsg_codes[i]), row_long, row_lat,
+                     int(eastings[i]), int(northings[i]), int(zones[i]), tags[i], grid_tag if nad27[i] else None])
+    return rows
+
+#Compute the stale rows of 'data_sample_geo' (see the module notes), in the given range of sample_ids
+#[first, next] or for all the samples. The caller creates the table beforehand and commits. Returns the
+#number of rows computed.
+#Syntax: refresh(db_cursor, string, list) returns int
+def refresh(db_cur, nts_mapsheet = None, id_range = None):
+    #A missing grid is reported and the tags left blank, to be filled in by a later refresh
+    if (nts_mapsheet is not None) and not os.path.exists(nts_mapsheet):
+        print 'Warning: no NTS 50k grid shape file ' + nts_mapsheet + ', the NTS mapsheets are left blank'
+        nts_mapsheet = None
+
+    sql = """select s.sample_id, s.x_coord, s.y_coord, s.EPSG_SRID, g.x_coord, g.y_coord, g.epsg_srid, g.nts_map,
+                    g.utm_zone, g.nad83_long, g.nad83_lat, g.datum_grid
+             from data_sample s left join data_sample_geo g on s.sample_id = g.sample_id"""
+    if id_range is None:
+        db_cur.execute(sql)
+    else:
+        db_cur.execute(sql + """ where (s.sample_id >= ?) and (s.sample_id < ?)""", id_range[0], id_range[1])
+
+    records = db_cur.fetchall()
+
+    #Rows computed without a UTM zone while their longitude has one (e.g. before the zones were extended)
+    zones = get_utm_zones(np.array([float(record[9]) if (record[8] == -1) and (record[9] is not None)
+                                    else np.nan for record in records]))
+
+    #NAD27 rows not converted with the grid shift file now available (none if it is missing)
+    grid_tag = ''
+    if [record for record in records if (record[6] is not None) and datum_shift.is_nad27(record[6])]:
+        grid_tag = datum_shift.get_grid_tag()
+
+    stale = list()
+    replaced = list()
+    for i in range(len(records)):
+        record = records[i]
+        if (record[1] is None) or (record[2] is None) or (record[3] is None):
+            continue    #No location to derive from
+        if record[6] is not None:
+            if (float(record[1]) == record[4]) and (float(record[2]) == record[5]) and \
+               (int(record[3]) == record[6]) and ((record[7] is not None) or (nts_mapsheet is None)) and \
+               (zones[i] == -1) and ((record[9] is None and record[10] is None) or has_location(record[9:11])) and \
+               ((grid_tag == '') or (record[11] == grid_tag) or not datum_shift.is_nad27(record[6])):
+                continue
+            replaced.append([record[0]])
+        stale.append(record[:4])
+    if not stale:
+        return 0
+
+    rows = compute_rows(stale, nts_mapsheet)
+    for i in range(0, len(replaced), BATCH_SIZE):
+        db_cur.executemany("""delete from data_sample_geo where sample_id = ?""", replaced[i:i + BATCH_SIZE])
+    for i in range(0, len(rows), BATCH_SIZE):
+        db_cur.executemany("""insert into data_sample_geo values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                           rows[i:i + BATCH_SIZE])
+    return len(rows)
+
+#Refresh the stale rows of 'data_sample_geo', commit, and read the table:
+#{sample_id: [nad83_long, nad83_lat, utm_easting, utm_northing, utm_zone, nts_map]} (nad83_long and
+#nad83_lat are None for the samples without location)
+#Syntax: read_geo(db_cursor, string) returns dict
+def read_geo(db_cur, nts_mapsheet = None):
+    create_table(db_cur)
+    row_count = refresh(db_cur, nts_mapsheet)
+    db_cur.commit()
+    if row_count > 0:
+        print str(row_count) + ' sample location(s) computed in data_sample_geo'
+
+    geo = {}
+    db_cur.execute("""select sample_id, nad83_long, nad83_lat, utm_easting, utm_northing, utm_zone, nts_map
+                      from data_sample_geo""")
+    for record in db_cur.fetchall():
+        geo[record[0]] = list(record[1:])
+    return geo
+
+#Project the locations read by read_geo() to a single UTM zone (e.g. for a map across two zones). Returns a
+#new dict; the samples without a location are kept as they are.
+#Syntax: force_utm_zone(dict, int) returns dict
+def force_utm_zone(geo, zone):
+    sample_ids = sorted([sample_id for sample_id in geo if has_location(geo[sample_id])])
+    nad83_long = np.array([float(geo[sample_id][0]) for sample_id in sample_ids])
+    nad83_lat = np.array([float(geo[sample_id][1]) for sample_id in sample_ids])
+    [eastings, northings, zones] = project2utm(nad83_long, nad83_lat, zone)
+
+    forced = dict([[sample_id, list(geo[sample_id])] for sample_id in geo])
+    for i in range(len(sample_ids)):
+        forced[sample_ids[i]] = geo[sample_ids[i]][:2] + [int(eastings[i]), int(northings[i]), int(zones[i])] + \
+            geo[sample_ids[i]][5:]
+    return forced
@@ -0,0 +1,216 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps a grid spatial index of the samples of the TillDB or the ARIS geochem staging
+   database in a 'data_sample_grid' table: one row per sample with its NAD83 long. and lat. (from the
+   'data_sample_geo' table, see sample_geo.py) and the grid cell holding it. The cells are CELL_SIZE
+   degrees wide and high and the table is indexed on the cell columns, so that the samples of an area are
+   found with a single "cell_x between ... and cell_y between ..." query on the cells covering it:
+         1) bounding box: the samples in [west, east] x [south, north];
+         2) radius: the samples within a distance (km) of a point, closest first;
+         3) nearest: the k samples closest to a point, found on squares of cells doubled in size until
+            the k-th closest sample is nearer than the edge of the square.
+   The distances are great circle distances on a sphere of radius EARTH_RADIUS.
+
+   The loaders add the new samples of each staged file to the index after their locations are computed,
+   and the rows whose location changed in 'data_sample_geo' since are moved to their new cell when the
+   index is updated again. The samples without a location (NULL NAD83 coordinates, see sample_geo.py) are
+   left out of the index and their number is printed.
+
+   Input
+         1) Database cursor
+         2) Query: bounding box, point and radius (km), or point and number of samples
+
+   Output
+         Rows inserted and replaced in the 'data_sample_grid' table (created if missing), sample_ids
+
+   Usage
+         sample_index.create_table(cur)
+         sample_index.update(cur, [first_sample_id, next_sample_id]); cur.commit()
+         index = sample_index.SampleIndex(cur)
+         sample_ids = index.bbox(west, south, east, north)
+         [[sample_id, km], ...] = index.radius(nad83_long, nad83_lat, km)
+         [[sample_id, km], ...] = index.nearest(nad83_long, nad83_lat, k)
+
+         From the command line (the locations and the index are brought up to date first):
+         python sample_index.py <database path> bbox <west> <south> <east> <north>
+         python sample_index.py <database path> radius <long.> <lat.> <km>
+         python sample_index.py <database path> nearest <long.> <lat.> <k>
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import sys, math
+import storage_backend, sample_geo
+
+#Column types are those understood by both MS Access and SQLite
+GRID_DDL = ["""create table data_sample_grid (sample_id integer, cell_x integer, cell_y integer,
+               nad83_long double, nad83_lat double)""",
+            """create index ix_data_sample_grid_cell on data_sample_grid (cell_x, cell_y)""",
+            """create index ix_data_sample_grid_sample on data_sample_grid (sample_id)"""]
+
+#Size of the grid cells in degrees (about 11 km north-south, 6 to 8 km east-west in the province)
+CELL_SIZE = 0.1
+
+#Mean earth radius in km
+EARTH_RADIUS = 6371.0
+
+#Number of rows in each executemany() batch
+BATCH_SIZE = 1000
+
+#Get the grid cell of a NAD83 long. and lat. (None without a location: NULL or non-finite coordinates)
+#Syntax: get_cell(float, float) returns [int, int]
+def get_cell(nad83_long, nad83_lat):
+    if not sample_geo.has_location([nad83_long, nad83_lat]):
+        return None
+    return [int(math.floor(nad83_long / CELL_SIZE)), int(math.floor(nad83_lat / CELL_SIZE))]
+
+#Get the great circle distance in km between 2 points in long. and lat.
+#Syntax: get_distance(float, float, float, float) returns float
+def get_distance(long1, lat1, long2, lat2):
+    [long1, lat1, long2, lat2] = [math.radians(val) for val in [long1, lat1, long2, lat2]]
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+#Create the 'data_sample_grid' table if missing, and commit
+#Syntax: create_table(db_cursor) returns None
+def create_table(db_cur):
+    try:
+        db_cur.execute("""select count(*) from data_sample_grid""")
+        db_cur.fetchone()
+    except Exception:
+        for sql in GRID_DDL:
+            db_cur.execute(sql)
+        db_cur.commit()
+
+#Add the samples of 'data_sample_geo' missing from the index and move the samples whose location changed,
+#in the given range of sample_ids [first, next] or for all the samples. The caller creates the table
+#beforehand and commits. Returns the number of rows written.
+#Syntax: update(db_cursor, list) returns int
+def update(db_cur, id_range = None):
+    sql = """select g.sample_id, g.nad83_long, g.nad83_lat, i.nad83_long, i.nad83_lat
+             from data_sample_geo g left join data_sample_grid i on g.sample_id = i.sample_id"""
+    if id_range is None:
+        db_cur.execute(sql)
+    else:
+        db_cur.execute(sql + """ where (g.sample_id >= ?) and (g.sample_id < ?)""", id_range[0], id_range[1])
+
+    rows = list()
+    replaced = list()
+    unlocated = 0
+    for record in db_cur.fetchall():
+        if (record[3] is not None) and (record[1] == record[3]) and (record[2] == record[4]):
+            continue
+        if record[3] is not None:
+            replaced.append([record[0]])
+
+        #The samples without a location are left out of the index (see sample_geo.has_location)
+        cell = get_cell(record[1], record[2])
+        if cell is None:
+            unlocated = unlocated + 1
+            continue
+        rows.append([record[0]] + cell + [record[1], record[2]])
+    if unlocated > 0:
+        print str(unlocated) + ' sample(s) without a location in data_sample_geo not indexed'
+
+    for i in range(0, len(replaced), BATCH_SIZE):
+        db_cur.executemany("""delete from data_sample_grid where sample_id = ?""", replaced[i:i + BATCH_SIZE])
+    for i in range(0, len(rows), BATCH_SIZE):
+        db_cur.executemany("""insert into data_sample_grid values (?, ?, ?, ?, ?)""", rows[i:i + BATCH_SIZE])
+    return len(rows)
+
+class SampleIndex(object):
+    #Query the index of a database
+    #Syntax: SampleIndex(db_cursor)
+    def __init__(self, db_cur):
+        self.cur = db_cur
+
+    #Get the samples in a range of cells: [[sample_id, nad83_long, nad83_lat], ...]
+    #Syntax: get_cells(int, int, int, int) returns list
+    def get_cells(self, cell_x1, cell_y1, cell_x2, cell_y2):
+        self.cur.execute("""select sample_id, nad83_long, nad83_lat from data_sample_grid
+                            where (cell_x between ? and ?) and (cell_y between ? and ?)""",
+                         cell_x1, cell_x2, cell_y1, cell_y2)
+        return [list(record) for record in self.cur.fetchall()]
+
+    #Get the samples in a bounding box (edges included), in sample_id order
+    #Syntax: bbox(float, float, float, float) returns list
+    def bbox(self, west, south, east, north):
+        [cell_x1, cell_y1] = get_cell(west, south)
+        [cell_x2, cell_y2] = get_cell(east, north)
+        return sorted([sample_id for [sample_id, nad83_long, nad83_lat] in
+                       self.get_cells(cell_x1, cell_y1, cell_x2, cell_y2)
+                       if (west <= nad83_long <= east) and (south <= nad83_lat <= north)])
+
+    #Get the samples within a distance (km) of a point, closest first: [[sample_id, km], ...]
+    #Syntax: radius(float, float, float) returns list
+    def radius(self, nad83_long, nad83_lat, km):
+        #Bounding box of the circle (long. degrees are shorter towards the pole)
+        lat_deg = math.degrees(km / EARTH_RADIUS)
+        cos_lat = math.cos(math.radians(min(89.0, abs(nad83_lat) + lat_deg)))
+        long_deg = min(180.0, lat_deg / cos_lat)
+        [cell_x1, cell_y1] = get_cell(nad83_long - long_deg, nad83_lat - lat_deg)
+        [cell_x2, cell_y2] = get_cell(nad83_long + long_deg, nad83_lat + lat_deg)
+
+        found = list()
+        for [sample_id, sample_long, sample_lat] in self.get_cells(cell_x1, cell_y1, cell_x2, cell_y2):
+            distance = get_distance(nad83_long, nad83_lat, sample_long, sample_lat)
+            if distance <= km:
+                found.append([sample_id, distance])
+        return sorted(found, key = lambda item: [item[1], item[0]])
+
+    #Get the k samples closest to a point, closest first: [[sample_id, km], ...]
+    #Syntax: nearest(float, float, int) returns list
+    def nearest(self, nad83_long, nad83_lat, k):
+        self.cur.execute("""select count(*) from data_sample_grid""")
+        sample_count = self.cur.fetchone()[0]
+        if (k <= 0) or (sample_count == 0):
+            return list()
+
+        [cell_x, cell_y] = get_cell(nad83_long, nad83_lat)
+        ring = 1
+        while True:
+            found = sorted([[get_distance(nad83_long, nad83_lat, sample_long, sample_lat), sample_id]
+                            for [sample_id, sample_long, sample_lat] in
+                            self.get_cells(cell_x - ring, cell_y - ring, cell_x + ring, cell_y + ring)])
+
+            #Distance from the point to the nearest edge of the square of cells: any sample closer than it
+            #is in the square
+            lat_edge = min(nad83_lat - (cell_y - ring) * CELL_SIZE, (cell_y + ring + 1) * CELL_SIZE - nad83_lat)
+            long_edge = min(nad83_long - (cell_x - ring) * CELL_SIZE, (cell_x + ring + 1) * CELL_SIZE - nad83_long)
+            cos_lat = math.cos(math.radians(min(89.0, abs(nad83_lat) + lat_edge)))
+            edge_km = math.radians(min(lat_edge, long_edge * cos_lat)) * EARTH_RADIUS
+
+            if (len(found) == sample_count) or ((len(found) >= k) and (found[k - 1][0] <= edge_km)):
+                return [[sample_id, distance] for [distance, sample_id] in found[:k]]
+            ring = ring * 2
+
+#============================================= Main routine =========================================
+def main(db_path, query, values):
+    db_conn = storage_backend.connect(db_path)
+    cur = db_conn.cursor()
+    sample_geo.create_table(cur)
+    sample_geo.refresh(cur)
+    create_table(cur)
+    update(cur)
+    cur.commit()
+
+    index = SampleIndex(cur)
+    if query == 'bbox':
+        for sample_id in index.bbox(*values):
+            print sample_id
+    elif query == 'radius':
+        for [sample_id, km] in index.radius(*values):
+            print str(sample_id) + ',' + ('%.3f' % km)
+    elif query == 'nearest':
+        for [sample_id, km] in index.nearest(values[0], values[1], int(values[2])):
+            print str(sample_id) + ',' + ('%.3f' % km)
+    db_conn.close()
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 4) or (sys.argv[2] not in ['bbox', 'radius', 'nearest']):
+        print 'Usage: python sample_index.py <database path> bbox|radius|nearest <values>'
+        sys.exit()
+    main(sys.argv[1], sys.argv[2], [float(val) for val in sys.argv[3:]])
@@ -0,0 +1,123 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module holds the routine shared by the data screeners to run their numbered checks over the
+   staged xlsx files.
+
+   Each screener describes its checks as a list of [title, check_function, reference_names]:
+         title              line printed before the problems of the check, e.g. '\n2. Examine analyte names ...'
+         check_function     check_function(xls_file, worksheet, refs) returns the list of problems found
+                            in one staged file. It only reads the worksheet and the reference data in "refs".
+         reference_names    keys of "refs" (code table values, hardcoded lists, ...) used by the check
+
+   Every staged file is opened once and all the checks are run on it. The problems are then reported
+   check by check, in the order of the list, through the "report" function of the screener, so the output
+   reads the same as when each check looped through all the files.
+
+   A check that raises an error on a file (e.g. a value missing from a reference list) does not stop the
+   screening: the error is reported in the section of the check, with the file name, after its problems,
+   and the other checks and files are run as usual. The failed check is not cached and is run again on the
+   next screening.
+
+   With a screening cache (see screening_cache.py), a check is only run on a file if the file or the check
+   inputs changed since the last run. Otherwise the cached problems are replayed.
+
+   With a screening profile (see screening_profiler.py), the wall time, cells visited, database queries
+   and workbook loads of each check on each file are recorded.
+
+   The problems found are also returned check by check, so the watch mode (see staging_watcher.py) can
+   keep them between re-screens.
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import time
+from openpyxl import load_workbook
+import screening_profiler
+
+#Run the given checks over the staged xlsx files and report the problems check by check, and the errors of the
+#checks that failed (see the module notes). With "skip_empty" set to True, the titles of the checks without
+#any problem or error are not printed.
+#Syntax: run_checks(string, list, list, dict, function, ScreeningCache, bool, ScreeningProfile) returns list
+def run_checks(data_dir, xls_list, checks, refs, report, cache = None, skip_empty = False, profile = None):
+    if profile is not None:
+        profile.end_stage()
+
+    #Problems found, [[xls_file, problems], ...] for each check, and errors raised, [[xls_file, error], ...]
+    results = [list() for check in checks]
+    failures = [list() for check in checks]
+
+    for xls_file in xls_list:
+        xls_name = data_dir + xls_file
+        if cache is not None:
+            cache.open_file(xls_file, xls_name)
+
+        #The file is only opened if at least one check has to be run on it
+        ws = None
+        for i in range(len(checks)):
+            [title, check_func, ref_names] = checks[i]
+
+            problems = None
+            if cache is not None:
+                start = time.time()
+                problems = cache.lookup(xls_file, check_func, ref_names)
+                if (problems is not None) and (profile is not None):
+                    profile.record(check_func.__name__, xls_file, time.time() - start, 0, 0, 0, True)
+
+            if problems is None:
+                if ws is None:
+                    start = time.time()
+                    wb = load_workbook(filename = xls_name)
+                    ws = wb[wb.sheetnames[0]]
+                    if profile is not None:
+                        profile.record('load workbook', xls_file, time.time() - start, 0, 0, 1)
+                        ws = screening_profiler.CountingSheet(ws)
+
+                if profile is not None:
+                    start = time.time()
+                    cells = ws.cell_count
+                    queries = profile.query_count
+                failed = False
+                try:
+                    problems = check_func(xls_file, ws, refs)
+                except Exception as error:
+                    problems = list()
+                    failed = True
+                    failures[i].append([xls_file, type(error).__name__ + ': ' + str(error)])
+                if profile is not None:
+                    profile.record(check_func.__name__, xls_file, time.time() - start, ws.cell_count - cells,
+                                   profile.query_count - queries, 0)
+
+                if (cache is not None) and not failed:
+                    cache.store(xls_file, check_func, ref_names, problems)
+
+            results[i].append([xls_file, problems])
+
+    #Report problems check by check
+    if profile is not None:
+        profile.start_stage('report')
+    for i in range(len(checks)):
+        found = [problems for [xls_file, problems] in results[i] if len(problems) > 0]
+        if skip_empty and not found and not failures[i]:
+            continue
+        print checks[i][0]
+        for [xls_file, problems] in results[i]:
+            for problem in problems:
+                report(xls_file, problem)
+        for [xls_file, error] in failures[i]:
+            print '    ' + data_dir + xls_file + ': check failed, ' + error
+
+    failure_count = sum([len(failure) for failure in failures])
+    if failure_count > 0:
+        print '\n' + str(failure_count) + ' check(s) failed, they are run again at the next screening'
+
+    if profile is not None:
+        profile.end_stage()
+
+    if cache is not None:
+        cache.save()
+        print '\n' + str(cache.run_count) + ' check(s) run, ' + str(cache.replay_count) + ' replayed from cache'
+
+    return results
@@ -0,0 +1,172 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module keeps the problems found by the data screeners between runs, so that a re-run only
+   re-screens the staged files and checks whose inputs have changed.
+
+   The problems found by a check in a staged file are saved together with
+         1) the md5 hash of the staged file content;
+         2) the version of the check, which is made of the rule-set version of the screener, the code of
+            the check function, the code of the helpers it calls (see code_version()) and the versions of the
+            reference data the check uses (e.g. the unit names read from 'code_unit', the cert_no's read from
+            'data_cert' or the hardcoded analyte list).
+
+   On the next run, the saved problems are replayed as long as the file hash and the check version
+   are unchanged. Otherwise the check is run again on the file. The entries of the staged files that no
+   longer exist in the directories screened are dropped when the cache file is written.
+
+   Input
+         1) Path to the cache file (one per screener)
+         2) Rule-set version of the screener
+         3) Versions of the reference data, see get_ref_versions()
+
+   Output
+         Cache file (python pickle)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, types, hashlib, cPickle
+
+#Get md5 hash of the content of a given file
+#Syntax: file_hash(string) returns string
+def file_hash(file_name):
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(1048576), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+#Get a version tag of reference data (list, dict, string, ...) from the md5 hash of their values
+#Syntax: data_version(object) returns string
+def data_version(values):
+    if isinstance(values, dict):
+        values = sorted(values.items())
+    elif isinstance(values, (set, frozenset)):
+        values = sorted(values)
+    return hashlib.md5(repr(values)).hexdigest()
+
+#Add the code of a function to an md5 hash, with the code of its nested functions and of the helpers it
+#refers to by name: the functions and classes (all their methods) of the modules in the directory of the
+#screeners, either global names of its module (e.g. get_lastrow) or attributes of the modules it uses (e.g.
+#sample_geo.project2nad83), followed recursively. "seen" holds the code already added.
+#Syntax: code_version(md5, code, dict, string, set) returns None
+def code_version(md5, code, global_vars, code_dir, seen):
+    if code in seen:
+        return
+    seen.add(code)
+    md5.update(code.co_code)
+    md5.update(repr([const for const in code.co_consts if not hasattr(const, 'co_code')]))
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            code_version(md5, const, global_vars, code_dir, seen)
+
+    #Helpers referred to by name, in the order of the names
+    modules = sorted([value for value in global_vars.values() if isinstance(value, types.ModuleType)],
+                     key = lambda module: module.__name__)
+    for name in code.co_names:
+        for value in [global_vars.get(name)] + [getattr(module, name, None) for module in modules]:
+            functions = [value]
+            if isinstance(value, (type, types.ClassType)):
+                functions = [vars(value)[attr] for attr in sorted(vars(value))]
+            for function in functions:
+                if isinstance(function, types.FunctionType) and \
+                   (os.path.dirname(os.path.abspath(function.__code__.co_filename)) == code_dir):
+                    md5.update(function.__module__ + '.' + function.__name__)
+                    code_version(md5, function.__code__, function.__globals__, code_dir, seen)
+
+#Get the versions of all reference data used by the checks of a screener. Reference data that can not be
+#hashed by value (e.g. an OGR layer) are versioned by the hash of the file they are read from.
+#Syntax: get_ref_versions(dict, dict) returns dict
+def get_ref_versions(refs, ref_files = None):
+    if ref_files is None:
+        ref_files = {}
+
+    ref_versions = {}
+    for ref_name in refs:
+        if ref_name in ref_files:
+            ref_versions[ref_name] = file_hash(ref_files[ref_name])
+        else:
+            ref_versions[ref_name] = data_version(refs[ref_name])
+    return ref_versions
+
+class ScreeningCache(object):
+    #Open the cache file of a screener. With "fresh" set to True the saved problems are discarded.
+    #Syntax: ScreeningCache(string, string, dict, bool)
+    def __init__(self, cache_file, ruleset_version, ref_versions, fresh = False):
+        self.cache_file = cache_file
+        self.ruleset_version = ruleset_version
+        self.ref_versions = ref_versions
+
+        #{file name: [file hash, {check name: [check version, problems]}]}
+        self.entries = {}
+        if (not fresh) and os.path.isfile(cache_file):
+            with open(cache_file, 'rb') as in_file:
+                self.entries = cPickle.load(in_file)
+
+        #Hashes of the files being screened in this run, and the directories they are in
+        self.hashes = {}
+        self.data_dirs = set()
+
+        #Versions of the code of the checks and their helpers, {check function: md5 hash}
+        self.code_versions = {}
+
+        #Number of checks run and replayed in this run
+        self.run_count = 0
+        self.replay_count = 0
+
+    #Get the version of a check (rule-set version, code of the check and its helpers and versions of the
+    #reference data used)
+    #Syntax: check_version(function, list) returns string
+    def check_version(self, check_func, ref_names):
+        if check_func not in self.code_versions:
+            code_md5 = hashlib.md5()
+            code_version(code_md5, check_func.__code__, check_func.__globals__,
+                         os.path.dirname(os.path.abspath(check_func.__code__.co_filename)), set())
+            self.code_versions[check_func] = code_md5.hexdigest()
+
+        md5 = hashlib.md5()
+        md5.update(self.ruleset_version)
+        md5.update(check_func.__name__)
+        md5.update(self.code_versions[check_func])
+        for ref_name in sorted(ref_names):
+            md5.update(ref_name + '=' + self.ref_versions[ref_name])
+        return md5.hexdigest()
+
+    #Hash a staged file before its checks are looked up
+    #Syntax: open_file(string, string) returns string
+    def open_file(self, xls_file, xls_name):
+        self.hashes[xls_file] = file_hash(xls_name)
+        self.data_dirs.add(xls_name[:len(xls_name) - len(xls_file)])
+        entry = self.entries.get(xls_file)
+        if (entry is None) or (entry[0] <> self.hashes[xls_file]):
+            self.entries[xls_file] = [self.hashes[xls_file], {}]
+        return self.hashes[xls_file]
+
+    #Get the saved problems of a check in a staged file, or None if the check has to be run again
+    #Syntax: lookup(string, function, list) returns list
+    def lookup(self, xls_file, check_func, ref_names):
+        saved = self.entries[xls_file][1].get(check_func.__name__)
+        if (saved is None) or (saved[0] <> self.check_version(check_func, ref_names)):
+            return None
+        self.replay_count = self.replay_count + 1
+        return saved[1]
+
+    #Save the problems found by a check in a staged file
+    #Syntax: store(string, function, list, list) returns None
+    def store(self, xls_file, check_func, ref_names, problems):
+        self.run_count = self.run_count + 1
+        self.entries[xls_file][1][check_func.__name__] = [self.check_version(check_func, ref_names), problems]
+
+    #Write the cache file, without the entries of the staged files that no longer exist in the directories
+    #screened in this run
+    #Syntax: save() returns None
+    def save(self):
+        if self.data_dirs:
+            for xls_file in self.entries.keys():
+                if not [data_dir for data_dir in self.data_dirs if os.path.isfile(data_dir + xls_file)]:
+                    del self.entries[xls_file]
+        with open(self.cache_file, 'wb') as out_file:
+            cPickle.dump(self.entries, out_file, 2)
@@ -0,0 +1,150 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module records where the data screeners spend their time. For each check and each staged file
+   it records
+         1) wall time;
+         2) number of worksheet cells visited (ws.cell() calls);
+         3) number of database queries issued;
+         4) number of workbook loads.
+   The screener stages outside the checks (e.g. reading the reference data from the database) are
+   recorded as well.
+
+   Input
+         Name of the screener
+
+   Output
+         1) Summary table printed at the end of the run (per check, and the slowest files)
+         2) JSON file of all the records, to compare the hot checks across releases
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import time, json, datetime
+
+#Worksheet wrapper counting the cells visited by the checks. Everything else is passed to the worksheet.
+class CountingSheet(object):
+    def __init__(self, ws):
+        self.ws = ws
+        self.cell_count = 0
+
+    def cell(self, *args, **kwargs):
+        self.cell_count = self.cell_count + 1
+        return self.ws.cell(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.ws, name)
+
+#Database cursor wrapper counting the queries issued. Everything else is passed to the cursor.
+class CountingCursor(object):
+    def __init__(self, cur, profile):
+        self.cur = cur
+        self.profile = profile
+
+    def execute(self, *args, **kwargs):
+        self.profile.query_count = self.profile.query_count + 1
+        return self.cur.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+class ScreeningProfile(object):
+    #Syntax: ScreeningProfile(string)
+    def __init__(self, screener_name):
+        self.screener_name = screener_name
+        self.started = datetime.datetime.now()
+
+        #Number of queries issued so far through the counting cursors
+        self.query_count = 0
+
+        #[[stage or check name, file name, seconds, cells, queries, workbook loads, replayed], ...]
+        self.records = list()
+
+        #Stage being timed: [name, start time, query count at start]
+        self.stage = None
+
+    #Wrap a database cursor so its queries are counted
+    #Syntax: cursor(db_cursor) returns CountingCursor
+    def cursor(self, cur):
+        return CountingCursor(cur, self)
+
+    #Time a screener stage outside the checks, e.g. 'reference data'. The stage ends at the next call of
+    #start_stage() or end_stage().
+    #Syntax: start_stage(string) returns None
+    def start_stage(self, name):
+        self.end_stage()
+        self.stage = [name, time.time(), self.query_count]
+
+    #Syntax: end_stage() returns None
+    def end_stage(self):
+        if self.stage is not None:
+            [name, start, queries] = self.stage
+            self.records.append([name, '', time.time() - start, 0, self.query_count - queries, 0, False])
+            self.stage = None
+
+    #Record the run (or the replay from the screening cache) of a check on a staged file
+    #Syntax: record(string, string, float, int, int, int, bool) returns None
+    def record(self, name, xls_file, seconds, cells, queries, loads, replayed = False):
+        self.records.append([name, xls_file, seconds, cells, queries, loads, replayed])
+
+    #Add up the records by check (or stage) name, in the order they were first recorded
+    #Syntax: totals(int) returns list
+    def totals(self, key_index):
+        names = list()
+        sums = {}
+        for rec in self.records:
+            key = rec[key_index]
+            if key not in sums:
+                names.append(key)
+                sums[key] = [0, 0.0, 0, 0, 0, 0]
+            total = sums[key]
+            total[0] = total[0] + 1
+            total[1] = total[1] + rec[2]
+            total[2] = total[2] + rec[3]
+            total[3] = total[3] + rec[4]
+            total[4] = total[4] + rec[5]
+            if rec[6]:
+                total[5] = total[5] + 1
+        return [[name] + sums[name] for name in names]
+
+    #Print the summary tables: time by check and stage, then the slowest files
+    #Syntax: print_summary(int) returns None
+    def print_summary(self, top_files = 10):
+        self.end_stage()
+        run_time = sum([rec[2] for rec in self.records])
+
+        print '\n------------------------------------ Screening profile ------------------------------------'
+        print '%-40s %6s %9s %6s %10s %8s %6s %8s' % ('Check / stage', 'Count', 'Time (s)', '%', 'Cells',
+                                                     'Queries', 'Loads', 'Replayed')
+        for [name, count, seconds, cells, queries, loads, replayed] in self.totals(0):
+            if run_time > 0:
+                share = 100.0 * seconds / run_time
+            else:
+                share = 0.0
+            print '%-40s %6d %9.3f %6.1f %10d %8d %6d %8d' % (name[:40], count, seconds, share, cells, queries,
+                                                            loads, replayed)
+
+        file_totals = [total for total in self.totals(1) if total[0] <> '']
+        file_totals.sort(key = lambda total: total[2], reverse = True)
+        if file_totals:
+            print '\nSlowest files'
+            print '%-40s %9s %10s %6s' % ('File', 'Time (s)', 'Cells', 'Loads')
+            for [name, count, seconds, cells, queries, loads, replayed] in file_totals[:top_files]:
+                print '%-40s %9.3f %10d %6d' % (name[:40], seconds, cells, loads)
+        print 'Total time recorded: %.3f s' % run_time
+
+    #Write all the records and the totals to a JSON file
+    #Syntax: save_json(string) returns None
+    def save_json(self, json_file):
+        self.end_stage()
+        fields = ['name', 'file', 'seconds', 'cells', 'queries', 'loads', 'replayed']
+        total_fields = ['name', 'count', 'seconds', 'cells', 'queries', 'loads', 'replayed']
+        profile = {'screener': self.screener_name,
+                   'started': self.started.strftime('%Y-%m-%d %H:%M:%S'),
+                   'checks': [dict(zip(total_fields, total)) for total in self.totals(0)],
+                   'files': [dict(zip(total_fields, total)) for total in self.totals(1) if total[0] <> ''],
+                   'records': [dict(zip(fields, rec)) for rec in self.records]}
+        with open(json_file, 'w') as out_file:
+            json.dump(profile, out_file, indent = 1)
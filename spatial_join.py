@@ -0,0 +1,150 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module tags sample locations with the attributes of the polygon of a shape file they fall in
+   (mineral tenures, ARIS report footprints, geology units, BCGS or NTS sheets, ...). Instead of setting
+   a spatial filter on the OGR layer and testing the polygons for each point:
+         1) the shape file is read once: the polygons are loaded as shapely geometries with the values of
+            the requested attribute fields;
+         2) an STRtree (packed R-tree) is built over the polygons;
+         3) the points are projected to the coordinate system of the shape file in one pyproj
+            transformation, and each point only tests the polygons whose bounding box holds it, with
+            prepared geometries.
+   A point takes the values of the first polygon (in the order of the shape file) that contains it, or
+   blanks (None) if no polygon contains it. Points on a polygon edge are not contained, as with
+   OGR "Within".
+
+   The coordinate system of the shape file is read from its .prj file (EPSG code), or given, and is NAD83
+   geographic (EPSG code = 4269) if unknown.
+
+   Input
+         1) Polygon shape file
+         2) Names of the attribute fields to assign
+         3) NAD83 long. and lat. of the points (arrays)
+
+   Output
+         Attribute values of each point
+
+   Usage
+         layer = spatial_join.PolygonLayer('C:\\Project\\ProvinceData\\tenure\\mta_tenures.shp', ['TENURE_NO'])
+         values = layer.join(nad83_long, nad83_lat)      #[[tenure_no], [None], ...]
+
+         In the product creators: --join=<shape file>,<field>[,<field>...] (repeated for several layers)
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import sys, ogr
+import numpy as np
+from pyproj import transform
+from shapely import wkb
+from shapely.geometry import Point
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+import sample_geo
+
+class PolygonLayer(object):
+    #Load the polygons of a shape file with the values of the given attribute fields, and build the STRtree
+    #Syntax: PolygonLayer(string, list, int)
+    def __init__(self, shp_file, fields, layer_epsg = None):
+        self.shp_file = shp_file
+        self.fields = fields
+        self.polygons = list()      #Prepared polygons, in the order of the shape file
+        self.values = list()        #[values of the fields] of each polygon
+
+        driver = ogr.GetDriverByName("ESRI Shapefile")
+        dataSource = driver.Open(shp_file, 0)
+        if dataSource is None:
+            print 'Can not open ' + shp_file
+            sys.exit()
+        layer = dataSource.GetLayer()
+        if layer_epsg is None:
+            layer_epsg = get_epsg(layer)
+        self.epsg = layer_epsg
+
+        geoms = list()
+        for feature in layer:
+            geom = feature.GetGeometryRef()
+            if geom is None:
+                continue
+            polygon = wkb.loads(bytes(geom.ExportToWkb()))
+            geoms.append(polygon)
+            self.polygons.append(prep(polygon))
+            self.values.append([feature.GetField(field) for field in fields])
+
+        #The tree returns the polygons themselves: {id(polygon): position in the shape file}
+        self.tree = None
+        if geoms:
+            self.tree = STRtree(geoms)
+        self.positions = dict([[id(geoms[i]), i] for i in range(len(geoms))])
+        self.geoms = geoms      #Kept alive for the ids above
+
+    #Get the values of the polygon holding each point: [[values of the fields], ...], [None, ...] outside
+    #the polygons
+    #Syntax: join(array, array) returns list
+    def join(self, nad83_long, nad83_lat):
+        [x_coords, y_coords] = [np.asarray(nad83_long, dtype = float), np.asarray(nad83_lat, dtype = float)]
+        if (self.epsg <> 4269) and (len(x_coords) > 0):
+            x_coords, y_coords = transform(sample_geo.get_proj(4269), sample_geo.get_proj(self.epsg),
+                                           x_coords, y_coords)
+
+        blank = [None] * len(self.fields)
+        joined = list()
+        for i in range(len(x_coords)):
+            if (self.tree is None) or not (np.isfinite(x_coords[i]) and np.isfinite(y_coords[i])):
+                joined.append(blank)
+                continue
+            point = Point(x_coords[i], y_coords[i])
+            found = [self.positions[id(geom)] for geom in self.tree.query(point)]
+            joined.append(blank)
+            for position in sorted(found):
+                if self.polygons[position].contains(point):
+                    joined[-1] = self.values[position]
+                    break
+        return joined
+
+#Get the EPSG code of the coordinate system of an OGR layer (4269 if unknown)
+#Syntax: get_epsg(ogr_layer) returns int
+def get_epsg(layer):
+    srs = layer.GetSpatialRef()
+    if srs is not None:
+        srs.AutoIdentifyEPSG()
+        code = srs.GetAuthorityCode(None)
+        if code is not None:
+            return int(code)
+    return 4269
+
+#Get the layers to join from the command line arguments (--join=<shape file>,<field>[,<field>...]):
+#[[shape file, [fields]], ...]
+#Syntax: get_join_args(list) returns list
+def get_join_args(args):
+    layers = list()
+    for arg in args:
+        if arg.startswith('--join='):
+            items = arg.partition('=')[2].split(',')
+            layers.append([items[0], items[1:]])
+    return layers
+
+#Join the samples of the locations read by sample_geo.read_geo() to the layers given on the command line.
+#Returns the headers of the joined columns and {sample_id: [values]} (blank outside the polygons, and for
+#the samples without a location, see sample_geo.has_location).
+#Syntax: join_samples(dict, list) returns [list, dict]
+def join_samples(geo, join_args):
+    sample_ids = sorted([sample_id for sample_id in geo if sample_geo.has_location(geo[sample_id])])
+    nad83_long = np.array([float(geo[sample_id][0]) for sample_id in sample_ids])
+    nad83_lat = np.array([float(geo[sample_id][1]) for sample_id in sample_ids])
+
+    headers = list()
+    joined = dict([[sample_id, list()] for sample_id in geo])
+    for [shp_file, fields] in join_args:
+        print 'Joining the samples to ' + shp_file + ' ...'
+        layer = PolygonLayer(shp_file, fields)
+        headers.extend(fields)
+        values = layer.join(nad83_long, nad83_lat)
+        for i in range(len(sample_ids)):
+            joined[sample_ids[i]].extend(['' if value is None else str(value) for value in values[i]])
+    for sample_id in joined:
+        joined[sample_id].extend([''] * (len(headers) - len(joined[sample_id])))
+    return [headers, joined]
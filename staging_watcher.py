@@ -0,0 +1,113 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module holds the watch mode of the data screeners. Instead of exiting after screening, the
+   screener keeps its reference data (code table values, hardcoded lists, BC boundary and ARIS buffer
+   layers, ...) in memory and polls the staging directory. When a staged xlsx file is added or changed,
+   only that file is re-screened and its problems are printed right away.
+
+   The staging directory is polled (a stat() of each file) rather than watched with inotify, as the
+   staging directories are on Windows and network drives.
+
+   Input
+         1) Path to the staging directory being watched
+         2) Checks, reference data, report function and screening cache of the screener
+            (see screener_runner.py)
+         3) Optional "refresh" function of the screener, called with the problems of all the staged files
+            after each re-screen, e.g. to re-write a check report xlsx file
+
+   Output
+         Display identified problems of the changed files
+
+   Operation note
+         1) Stop the watch with Ctrl+C.
+
+         2) Reference data are read once when the screener starts. Restart the screener after the code
+            tables are updated (e.g. after a load into the staging database).
+
+         3) Excel lock files (~$*.xlsx) are ignored. A file that can not be opened (e.g. still being saved)
+            is re-screened on the next poll.
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, time, zipfile, datetime
+from collections import OrderedDict
+import screener_runner
+
+#Get the staged files of a directory with their modification time and size
+#Syntax: scan_dir(string) returns OrderedDict
+def scan_dir(data_dir):
+    stamps = OrderedDict()
+    for xls_file in os.listdir(data_dir):
+        if xls_file.startswith('~$'):
+            continue
+        xls_stat = os.stat(data_dir + xls_file)
+        stamps[xls_file] = (xls_stat.st_mtime, xls_stat.st_size)
+    return stamps
+
+#Screen the given files and keep their problems in "file_results" ({file name: [problems of each check]})
+#Syntax: screen_files(string, list, list, dict, function, ScreeningCache, OrderedDict, bool) returns list
+def screen_files(data_dir, xls_list, checks, refs, report, cache, file_results, skip_empty):
+    if cache is not None:
+        cache.run_count = 0
+        cache.replay_count = 0
+
+    try:
+        results = screener_runner.run_checks(data_dir, xls_list, checks, refs, report, cache, skip_empty)
+    except (IOError, zipfile.BadZipfile), err:
+        print '    Can not open staged file, will retry: ' + str(err)
+        return list()
+
+    for xls_file in xls_list:
+        file_results[xls_file] = [None] * len(checks)
+    for i in range(len(checks)):
+        for [xls_file, problems] in results[i]:
+            file_results[xls_file][i] = problems
+    return xls_list
+
+#Screen all the staged files, then re-screen each file added or changed until interrupted
+#Syntax: watch(string, list, dict, function, ScreeningCache, function, float) returns None
+def watch(data_dir, checks, refs, report, cache = None, refresh = None, interval = 1.0):
+    stamps = scan_dir(data_dir)
+    file_results = OrderedDict()
+    if not screen_files(data_dir, stamps.keys(), checks, refs, report, cache, file_results, False):
+        stamps = OrderedDict()
+    if refresh is not None:
+        refresh(file_results)
+
+    print '\nWatching ' + data_dir + ' (Ctrl+C to stop) ...'
+    try:
+        while True:
+            time.sleep(interval)
+            new_stamps = scan_dir(data_dir)
+
+            changed = [xls_file for xls_file in new_stamps if new_stamps[xls_file] <> stamps.get(xls_file)]
+            removed = [xls_file for xls_file in file_results if xls_file not in new_stamps]
+            if not (changed or removed):
+                continue
+
+            for xls_file in removed:
+                print '\n' + datetime.datetime.now().strftime("%H:%M:%S") + ' ' + xls_file + ' removed'
+                del file_results[xls_file]
+
+            screened = list()
+            for xls_file in changed:
+                print '\n' + datetime.datetime.now().strftime("%H:%M:%S") + ' Re-screen ' + xls_file + ' ...'
+                start = time.time()
+                if screen_files(data_dir, [xls_file], checks, refs, report, cache, file_results, True):
+                    problem_count = sum([len(problems) for problems in file_results[xls_file]])
+                    print '    ' + str(problem_count) + ' problem(s) found in ' + \
+                          str(round(time.time() - start, 2)) + ' s'
+                    screened.append(xls_file)
+                else:
+                    #Keep the old stamp so the file is tried again on the next poll
+                    new_stamps[xls_file] = stamps.get(xls_file)
+
+            stamps = new_stamps
+            if (refresh is not None) and (screened or removed):
+                refresh(file_results)
+    except KeyboardInterrupt:
+        print '\nWatch stopped.'
@@ -0,0 +1,242 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This module is the storage backend layer of the TillDB and ARIS geochem scripts. The backend is
+   chosen from the extension of the database path:
+         .accdb, .mdb               MS Access database through pyodbc (the production databases)
+         .sqlite, .sqlite3, .db     SQLite stand-in database (for testing, benchmarking and batch jobs)
+
+   The SQLite stand-in reproduces the schemas of the TillDB and of the ARIS geochem staging database:
+   the data tables ('data_sample', 'data_analyte', 'data_publish', 'data_ar', 'data_cert'), the code
+   tables ('code_unit', 'code_method', 'code_lab', 'code_prep') and the views used by the scripts
+   ('vw_sample_dblkey', 'vw_ar_no_sampid_link', 'vw_certs_in_data_analyte', 'vw_data_analyte_ppm'). The
+   columns are in the same order as in the Access tables, so "insert into ... values (?, ...)" works on
+   both. Indexes are created on the columns the scripts look up row by row and the database is opened
+   in WAL mode.
+
+   The SQLite connection behaves like a pyodbc connection: cursor.execute() takes the parameters either
+   as separate arguments or as a single list, and cursor.commit() commits the connection. So the
+   loaders, screeners and product creators run unchanged against either backend.
+
+   Input
+         1) Database path
+         2) Schema ('tilldb' or 'aris') when creating or copying a SQLite database
+
+   Output
+         Database connection, or a new SQLite database
+
+   Usage
+         db_conn = storage_backend.connect(db_path)
+
+         Create an empty SQLite database:   python storage_backend.py tilldb C:\\temp\\tillDB.sqlite
+         Copy an Access database to SQLite: python storage_backend.py aris C:\\temp\\aris.sqlite
+                                                   C:\\Project\\ARIS_Geochem_dev\\data\\ARIS_geochem_stage.accdb
+
+  Status
+      Operational
+
+  Last update
+      2026-10-18
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, sqlite3
+
+#Database file extensions of each backend
+ACCESS_EXTENSIONS = ['.accdb', '.mdb']
+SQLITE_EXTENSIONS = ['.sqlite', '.sqlite3', '.db']
+
+#================================================ Schemas ================================================
+#Tables of each schema: [table name, [[column name, type], ...]]. Column order is that of the Access tables.
+TILLDB_TABLES = [
+    ['code_unit', [['unit_id', 'INTEGER PRIMARY KEY'], ['name', 'TEXT']]],
+    ['code_method', [['method_id', 'INTEGER PRIMARY KEY'], ['method_abbr', 'TEXT'], ['method_group', 'TEXT'],
+                     ['method_desp', 'TEXT']]],
+    ['code_lab', [['lab_id', 'INTEGER PRIMARY KEY'], ['lab_name', 'TEXT']]],
+    ['data_sample', [['sample_id', 'INTEGER PRIMARY KEY'], ['sample_code', 'TEXT'], ['sample_name', 'TEXT'],
+                     ['sample_type', 'TEXT'], ['depth', 'TEXT'], ['duplicate', 'TEXT'], ['borehole', 'TEXT'],
+                     ['core_top', 'TEXT'], ['core_bottom', 'TEXT'], ['azimuth', 'TEXT'], ['dip', 'TEXT'],
+                     ['drill_type', 'TEXT'], ['material_type', 'TEXT'], ['sample_desp', 'TEXT'],
+                     ['x_coord', 'REAL'], ['y_coord', 'REAL'], ['z_coord', 'REAL'], ['EPSG_SRID', 'INTEGER'],
+                     ['coord_conf', 'TEXT']]],
+    ['data_analyte', [['analyte_id', 'INTEGER PRIMARY KEY'], ['analyte', 'TEXT'], ['abundance', 'TEXT'],
+                      ['mdl', 'TEXT'], ['size_frac', 'TEXT'], ['unit_id', 'INTEGER'], ['method_id', 'INTEGER'],
+                      ['lab_id', 'INTEGER'], ['sample_id', 'INTEGER']]],
+    ['data_publish', [['pub_id', 'INTEGER PRIMARY KEY'], ['pub_issue', 'TEXT'], ['sample_id', 'INTEGER']]]]
+
+TILLDB_INDEXES = [
+    'create index ix_data_sample_code on data_sample (sample_code)',
+    'create index ix_data_analyte_sample on data_analyte (sample_id, analyte)',
+    'create index ix_data_publish_sample on data_publish (sample_id, pub_issue)',
+    'create index ix_code_method_abbr on code_method (method_abbr)']
+
+TILLDB_VIEWS = []
+
+ARIS_TABLES = [
+    ['code_unit', [['unit_id', 'INTEGER PRIMARY KEY'], ['name', 'TEXT']]],
+    ['code_method', [['method_id', 'INTEGER PRIMARY KEY'], ['method_abbr', 'TEXT'], ['method_group', 'TEXT'],
+                     ['method_desp', 'TEXT']]],
+    ['code_lab', [['lab_id', 'INTEGER PRIMARY KEY'], ['lab_name', 'TEXT']]],
+    ['code_prep', [['prep_id', 'INTEGER PRIMARY KEY'], ['prep_desp', 'TEXT']]],
+    ['data_sample', [['sample_id', 'INTEGER PRIMARY KEY'], ['sample_name', 'TEXT'], ['station_name', 'TEXT'],
+                     ['sample_type', 'TEXT'], ['sample_subtype', 'TEXT'], ['sample_depth', 'TEXT'],
+                     ['sample_colour', 'TEXT'], ['sample_desp', 'TEXT'], ['duplicate', 'TEXT'],
+                     ['x_coord', 'REAL'], ['y_coord', 'REAL'], ['z_coord', 'REAL'], ['EPSG_SRID', 'INTEGER'],
+                     ['coord_conf', 'TEXT'], ['sample_date', 'TEXT']]],
+    ['data_ar', [['ar_id', 'INTEGER PRIMARY KEY'], ['ar_number', 'TEXT'], ['sample_id', 'INTEGER']]],
+    ['data_cert', [['cert_id', 'INTEGER PRIMARY KEY'], ['cert_no', 'TEXT'], ['cert_date', 'TEXT'],
+                   ['lab_id', 'INTEGER'], ['prep_id', 'INTEGER'], ['comments', 'TEXT']]],
+    ['data_analyte', [['analyte_id', 'INTEGER PRIMARY KEY'], ['analyte', 'TEXT'], ['abundance', 'TEXT'],
+                      ['mdl', 'TEXT'], ['unit_id', 'INTEGER'], ['method_id', 'INTEGER'], ['sample_id', 'INTEGER'],
+                      ['cert_id', 'INTEGER']]]]
+
+ARIS_INDEXES = [
+    'create index ix_data_sample_name on data_sample (sample_name)',
+    'create index ix_data_ar_sample on data_ar (sample_id, ar_number)',
+    'create index ix_data_ar_number on data_ar (ar_number)',
+    'create index ix_data_cert_no on data_cert (cert_no)',
+    'create index ix_data_analyte_sample on data_analyte (sample_id, analyte)',
+    'create index ix_data_analyte_cert on data_analyte (cert_id)',
+    'create index ix_code_method_abbr on code_method (method_abbr)']
+
+#Analyte values converted to ppm in 'vw_data_analyte_ppm': unit name and factor
+PPM_FACTORS = [['ppm', 1.0], ['g/t', 1.0], ['ppb', 0.001], ['%', 10000.0], ['pct', 10000.0],
+               ['oz/t', 34.2857]]
+
+ARIS_VIEWS = [
+    """create view vw_sample_dblkey as
+           select data_ar.ar_number || '_' || data_sample.sample_name as samp_dbl_key
+           from data_ar inner join data_sample on data_ar.sample_id = data_sample.sample_id""",
+    """create view vw_ar_no_sampid_link as
+           select data_ar.ar_number, data_sample.sample_name, data_sample.sample_id
+           from data_ar inner join data_sample on data_ar.sample_id = data_sample.sample_id""",
+    """create view vw_certs_in_data_analyte as
+           select distinct data_cert.cert_no
+           from data_cert inner join data_analyte on data_cert.cert_id = data_analyte.cert_id""",
+    """create view vw_data_analyte_ppm as
+           select data_analyte.analyte,
+                  cast(cast(data_analyte.abundance as real) * (case code_unit.name %s end) as text) as abundance,
+                  data_analyte.method_id,
+                  (select unit_id from code_unit where name = 'ppm') as unit_id,
+                  data_analyte.sample_id
+           from data_analyte inner join code_unit on data_analyte.unit_id = code_unit.unit_id
+           where code_unit.name in (%s)""" %
+        (' '.join(["when '%s' then %s" % (name, factor) for [name, factor] in PPM_FACTORS]),
+         ', '.join(["'%s'" % name for [name, factor] in PPM_FACTORS]))]
+
+SCHEMAS = {'tilldb': [TILLDB_TABLES, TILLDB_INDEXES, TILLDB_VIEWS],
+           'aris': [ARIS_TABLES, ARIS_INDEXES, ARIS_VIEWS]}
+
+#========================================== SQLite connection ============================================
+#SQLite cursor taking the parameters the pyodbc way. Everything else is passed to the sqlite3 cursor.
+class SQLiteCursor(object):
+    def __init__(self, cur, conn):
+        self.cur = cur
+        self.conn = conn
+
+    def execute(self, sql, *params):
+        if (len(params) == 1) and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self.cur.execute(sql, params)
+        return self
+
+    def executemany(self, sql, params):
+        self.cur.executemany(sql, params)
+        return self
+
+    def commit(self):
+        self.conn.commit()
+
+    def __iter__(self):
+        return iter(self.cur)
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+#SQLite connection giving SQLiteCursor's. Everything else is passed to the sqlite3 connection.
+class SQLiteConnection(object):
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.text_factory = str    #Text read and written as plain strings, as in the scripts
+        self.conn.execute('pragma journal_mode = WAL')
+        self.conn.execute('pragma synchronous = NORMAL')
+
+    def cursor(self):
+        return SQLiteCursor(self.conn.cursor(), self.conn)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+#========================================== Sub-routines =================================================
+#Get the backend of a database path: 'access' or 'sqlite'
+#Syntax: get_backend(string) returns string
+def get_backend(db_path):
+    extension = os.path.splitext(db_path)[1].lower()
+    if extension in ACCESS_EXTENSIONS:
+        return 'access'
+    elif extension in SQLITE_EXTENSIONS:
+        return 'sqlite'
+    else:
+        print 'Unknown database type: ' + db_path
+        sys.exit()
+
+#Connect to a database (MS Access or SQLite, depending on the file extension)
+#Syntax: connect(string) returns db_connection
+def connect(db_path):
+    if get_backend(db_path) == 'access':
+        import pyodbc
+        return pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' + db_path)
+    else:
+        if not os.path.isfile(db_path):
+            print 'No such database: ' + db_path
+            sys.exit()
+        return SQLiteConnection(db_path)
+
+#Create an empty SQLite database with the given schema ('tilldb' or 'aris')
+#Syntax: create_database(string, string) returns None
+def create_database(db_path, schema):
+    [tables, indexes, views] = SCHEMAS[schema]
+    if os.path.isfile(db_path):
+        print db_path + ' already exists!'
+        sys.exit()
+
+    db_conn = SQLiteConnection(db_path)
+    for [table, columns] in tables:
+        db_conn.execute('create table %s (%s)' % (table, ', '.join([name + ' ' + col_type
+                                                                    for [name, col_type] in columns])))
+    for sql in indexes + views:
+        db_conn.execute(sql)
+    db_conn.commit()
+    db_conn.close()
+
+#Copy the tables of a database (e.g. the Access production database) to a new SQLite database
+#Syntax: copy_database(string, string, string) returns None
+def copy_database(source_path, db_path, schema):
+    create_database(db_path, schema)
+    source_conn = connect(source_path)
+    source_cur = source_conn.cursor()
+    db_conn = connect(db_path)
+    db_cur = db_conn.cursor()
+
+    for [table, columns] in SCHEMAS[schema][0]:
+        col_names = ', '.join([name for [name, col_type] in columns])
+        source_cur.execute('select %s from %s' % (col_names, table))
+        rows = source_cur.fetchall()
+        db_cur.executemany('insert into %s values (%s)' % (table, ', '.join(['?'] * len(columns))),
+                           [tuple(row) for row in rows])
+        db_cur.commit()
+        print '    ' + table + ': ' + str(len(rows)) + ' rows copied'
+
+    source_conn.close()
+    db_conn.close()
+
+def main():
+    if (len(sys.argv) < 3) or (sys.argv[1] not in SCHEMAS):
+        print 'Usage: python storage_backend.py tilldb|aris <sqlite db path> [<source db path>]'
+        sys.exit()
+
+    if len(sys.argv) > 3:
+        copy_database(sys.argv[3], sys.argv[2], sys.argv[1])
+    else:
+        create_database(sys.argv[2], sys.argv[1])
+    print 'Job done!'
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+# -*- coding: cp1252 -*-
+'''+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+   This script generates synthetic staged xlsx files and pre-populated SQLite databases (see
+   storage_backend.py) for testing and benchmarking the screeners, loaders and product creators at
+   volumes larger than the real data.
+
+   The staged xlsx files follow the 4 staging layouts:
+         1) TillDB combined sheet (<pub_issue>.xlsx): analyte, unit, d_limit, method_id, lab_id and
+            size_fraction in rows 1 to 6, column headers in row 7 and samples from row 8;
+         2) ARIS location sheet (<ar_number>_loc.xlsx);
+         3) ARIS certificate sheet (<ar_number>_<cert_no>_cert.xlsx);
+         4) ARIS results sheet (<ar_number>_<cert_no>_results.xlsx).
+
+   The generated data are valid, i.e. they pass the screeners, except for the censored values (e.g.
+   '<5') which are part of the real data as well. The same options and seed always give the same data.
+
+   Input
+         1) Output directory
+         2) Options (--name=value), all optional:
+               seed             random seed (default 1)
+               tilldb_files     number of TillDB publications, one staged file each (default 5)
+               tilldb_samples   number of samples per TillDB publication (default 200)
+               aris_reports     number of ARIS reports, one location file each (default 5)
+               aris_samples     number of samples per ARIS report (default 200)
+               aris_certs       number of certificates per ARIS report (default 2)
+               analytes         number of analyte columns per staged file (default 30)
+               republish        fraction of the samples of a publication/report re-published from an
+                                earlier one or from the database, once at most (default 0.1)
+               censored         fraction of the analyte values below detection limit (default 0.05)
+               epsg             EPSG mix of the sample coordinates as code:weight pairs
+                                (default 4269:0.3,3157:0.3,26710:0.2,3156:0.1,2955:0.1)
+               db_samples       number of samples already in each database (default 0)
+
+   Output
+         <output directory>\\tilldb\\tillDB.sqlite and \\tilldb\\staging\\*.xlsx
+         <output directory>\\aris\\ARIS_geochem_stage.sqlite, \\aris\\_AR Data Staging Location\\*.xlsx,
+             \\aris\\_AR Data Staging Certificate\\*.xlsx and \\aris\\_AR Data Staging Results\\*.xlsx
+         <output directory>\\aris\\aris_report_locations.csv, the center of the project area of each report
+             in the format of the ARIS report locations export (see aris_report_index.py)
+         <output directory>\\manifest.json (options used, file names and row counts)
+
+   Usage
+         python synthetic_data_generator.py C:\\temp\\synthetic --tilldb_samples=2000 --analytes=60
+
+  Status
+      Operational
+
+  Last update
+      2026-10-19
+  +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
+import os, sys, math, json, random, datetime, openpyxl
+from pyproj import Proj, transform
+import storage_backend, aris_report_index
+
+#Default options
+DEFAULTS = {'seed': 1, 'tilldb_files': 5, 'tilldb_samples': 200, 'aris_reports': 5, 'aris_samples': 200,
+            'aris_certs': 2, 'analytes': 30, 'republish': 0.1, 'censored': 0.05,
+            'epsg': '4269:0.3,3157:0.3,26710:0.2,3156:0.1,2955:0.1', 'db_samples': 0}
+
+#Project areas (long. and lat. ranges, NAD83) well inside BC, one per UTM zone 9, 10 and 11
+PROJECT_AREAS = [[-129.5, -126.5, 54.0, 58.0], [-125.5, -120.5, 49.5, 56.0], [-119.5, -115.5, 49.1, 50.3]]
+
+#UTM spatial references of the same datum for UTM zones 9, 10 and 11 (no NAD27 zone 11 in the screeners)
+UTM_EPSGS = [[3156, 3157, 2955], [26709, 26710, None]]
+
+#---------------------------------------------- Code tables -----------------------------------------------
+TILLDB_UNITS = [[1, 'unknown'], [2, 'ppm'], [3, 'ppb'], [4, '%'], [5, 'g']]
+
+#method_id's 7, 11, 20 and 21 are those of the fixed analyte-method combos in tillDB_data_screener.py
+TILLDB_METHODS = [[1, 'UNK', 'UNK', 'Unknown'], [2, 'INA', 'INA', 'Instrumental neutron activation'],
+                  [3, 'AIP', 'AIP', 'Aqua regia digestion, ICP-ES'],
+                  [4, 'MIP', 'MIP', 'Aqua regia digestion, ICP-MS'],
+                  [5, 'FUS', 'FUS', 'Lithium borate fusion, ICP-ES'], [6, 'XRF', 'XRF', 'X-ray fluorescence'],
+                  [7, 'GRAV', 'GRAV', 'Gravimetric'], [8, 'TIP', 'TIP', 'Total digestion, ICP-ES'],
+                  [9, 'TMS', 'TMS', 'Total digestion, ICP-MS'], [10, 'AAS', 'AAS', 'Atomic absorption'],
+                  [11, 'LECO', 'LECO', 'Combustion, infrared'], [12, 'FA', 'FA', 'Fire assay'],
+                  [13, 'CV', 'CV', 'Cold vapour AA'], [14, 'HG', 'HG', 'Hydride generation AA'],
+                  [15, 'COL', 'COL', 'Colorimetric'], [16, 'DNC', 'DNC', 'Delayed neutron counting'],
+                  [17, 'EMS', 'EMS', 'Emission spectrography'], [18, 'OES', 'OES', 'Optical emission'],
+                  [19, 'ISE0', 'ISE0', 'Ion selective electrode, old'], [20, 'ISE', 'ISE', 'Ion selective electrode'],
+                  [21, 'TITR', 'TITR', 'Titration']]
+
+TILLDB_LABS = [[1, 'unknown'], [2, 'Becquerel Laboratories'], [3, 'Acme Analytical Laboratories'],
+               [4, 'Activation Laboratories'], [5, 'ALS Minerals']]
+
+#Analyte columns: [analyte, unit, detection limit, method_id]
+TILLDB_ANALYTES = [['Au', 'ppb', 2, 2], ['As', 'ppm', 0.5, 2], ['Ba', 'ppm', 50, 2], ['Br', 'ppm', 0.5, 2],
+                   ['Ce', 'ppm', 3, 2], ['Co', 'ppm', 1, 2], ['Cr', 'ppm', 5, 2], ['Cs', 'ppm', 1, 2],
+                   ['Eu', 'ppm', 0.2, 2], ['Fe', '%', 0.01, 2], ['Hf', 'ppm', 1, 2], ['La', 'ppm', 0.5, 2],
+                   ['Lu', 'ppm', 0.05, 2], ['Na', '%', 0.01, 2], ['Rb', 'ppm', 15, 2], ['Sb', 'ppm', 0.1, 2],
+                   ['Sc', 'ppm', 0.1, 2], ['Sm', 'ppm', 0.1, 2], ['Ta', 'ppm', 0.5, 2], ['Th', 'ppm', 0.2, 2],
+                   ['U', 'ppm', 0.5, 2], ['W', 'ppm', 1, 2], ['Yb', 'ppm', 0.2, 2], ['Ag', 'ppm', 0.2, 3],
+                   ['Cu', 'ppm', 1, 3], ['Pb', 'ppm', 2, 3], ['Zn', 'ppm', 1, 3], ['Ni', 'ppm', 1, 3],
+                   ['Mo', 'ppm', 1, 3], ['Mn', 'ppm', 5, 3], ['Cd', 'ppm', 0.2, 3], ['Bi', 'ppm', 2, 3],
+                   ['V', 'ppm', 1, 3], ['Au', 'ppb', 0.5, 4], ['Hg', 'ppb', 5, 4], ['Se', 'ppm', 0.1, 4],
+                   ['Te', 'ppm', 0.02, 4], ['Tl', 'ppm', 0.02, 4], ['Ga', 'ppm', 0.1, 4], ['SiO2', '%', 0.01, 5],
+                   ['Al2O3', '%', 0.01, 5], ['CaO', '%', 0.01, 5], ['MgO', '%', 0.01, 5], ['K2O', '%', 0.01, 5],
+                   ['TiO2', '%', 0.01, 5], ['MnO', '%', 0.01, 5], ['P2O5', '%', 0.01, 5], ['LOI', '%', 0.1, 7],
+                   ['C(T)', '%', 0.01, 11], ['F', 'ppm', 10, 20]]
+
+#Size fractions of the till samples
+TILLDB_SIZES = ['63', '63', '63', '2']
+
+ARIS_UNITS = [[1, 'unknown'], [2, 'ppm'], [3, 'ppb'], [4, '%'], [5, 'g/t']]
+
+ARIS_METHODS = [[1, 'UNK', 'UNK', 'Unknown'], [2, 'AR-ICP', 'ICP', 'Aqua regia digestion, ICP-ES'],
+                [3, 'AR-MS', 'ICP', 'Aqua regia digestion, ICP-MS'], [4, '4A-ICP', 'ICP', 'Four acid digestion, ICP-ES'],
+                [5, 'FA-AA', 'FA', 'Fire assay, AA finish'], [6, 'FA-ICP', 'FA', 'Fire assay, ICP finish'],
+                [7, 'INA', 'INA', 'Instrumental neutron activation']]
+
+ARIS_LABS = [[1, 'unknown'], [2, 'ALS Minerals'], [3, 'Bureau Veritas'], [4, 'SGS Canada'], [5, 'Activation Laboratories']]
+
+ARIS_PREPS = [[1, 'unknown'], [2, 'Dry, sieve to -80 mesh'], [3, 'Dry, sieve to -180 um'], [4, 'Crush, pulverize']]
+
+#Analyte columns: [analyte, unit, detection limit, method_abbr]
+ARIS_ANALYTES = [['Au', 'ppb', 5, 'FA-AA'], ['Ag', 'ppm', 0.2, 'AR-ICP'], ['Cu', 'ppm', 1, 'AR-ICP'],
+                 ['Pb', 'ppm', 2, 'AR-ICP'], ['Zn', 'ppm', 2, 'AR-ICP'], ['Mo', 'ppm', 1, 'AR-ICP'],
+                 ['Ni', 'ppm', 1, 'AR-ICP'], ['Co', 'ppm', 1, 'AR-ICP'], ['Mn', 'ppm', 5, 'AR-ICP'],
+                 ['Fe', '%', 0.01, 'AR-ICP'], ['As', 'ppm', 2, 'AR-ICP'], ['Sb', 'ppm', 2, 'AR-ICP'],
+                 ['Bi', 'ppm', 2, 'AR-ICP'], ['Cd', 'ppm', 0.5, 'AR-ICP'], ['Ca', '%', 0.01, 'AR-ICP'],
+                 ['Mg', '%', 0.01, 'AR-ICP'], ['Al', '%', 0.01, 'AR-ICP'], ['K', '%', 0.01, 'AR-ICP'],
+                 ['Na', '%', 0.01, 'AR-ICP'], ['P', '%', 0.001, 'AR-ICP'], ['Ba', 'ppm', 10, 'AR-ICP'],
+                 ['Cr', 'ppm', 1, 'AR-ICP'], ['V', 'ppm', 1, 'AR-ICP'], ['W', 'ppm', 10, 'AR-ICP'],
+                 ['La', 'ppm', 10, 'AR-ICP'], ['Sr', 'ppm', 1, 'AR-ICP'], ['Th', 'ppm', 20, 'AR-ICP'],
+                 ['Ti', '%', 0.01, 'AR-ICP'], ['Hg', 'ppb', 10, 'AR-MS'], ['Se', 'ppm', 0.2, 'AR-MS'],
+                 ['Te', 'ppm', 0.02, 'AR-MS'], ['Tl', 'ppm', 0.02, 'AR-MS'], ['Ga', 'ppm', 0.1, 'AR-MS'],
+                 ['Sc', 'ppm', 0.1, 'AR-MS'], ['U', 'ppm', 0.1, 'AR-MS'], ['Pt', 'ppb', 2, 'FA-ICP'],
+                 ['Pd', 'ppb', 2, 'FA-ICP']]
+
+ARIS_SAMPLE_TYPES = [['soil', 'B Horizon'], ['soil', 'A Horizon'], ['soil', 'C Horizon'], ['silt', None],
+                     ['stream sediment', None], ['till', None], ['moss mat', None], ['soil-mmi', 'A-B Horizons']]
+
+#============================================= Sub-routines ===============================================
+#Get the options from the command line arguments (--name=value), with defaults for those not given
+#Syntax: get_options(list) returns dict
+def get_options(args):
+    options = dict(DEFAULTS)
+    for arg in args:
+        if not arg.startswith('--'):
+            continue
+        [name, sep, value] = arg[2:].partition('=')
+        if name not in DEFAULTS:
+            print 'Unknown option: ' + arg
+            sys.exit()
+        if isinstance(DEFAULTS[name], int):
+            options[name] = int(value)
+        elif isinstance(DEFAULTS[name], float):
+            options[name] = float(value)
+        else:
+            options[name] = value
+    return options
+
+#Get the EPSG mix from the 'epsg' option: [[epsg code, weight], ...]
+#Syntax: get_epsg_mix(string) returns list
+def get_epsg_mix(epsg_option):
+    epsg_mix = list()
+    for item in epsg_option.split(','):
+        [epsg, sep, weight] = item.partition(':')
+        epsg_mix.append([int(epsg), float(weight or 1)])
+    return epsg_mix
+
+#Pick an item from a list of [item, weight]
+#Syntax: pick_weighted(Random, list) returns object
+def pick_weighted(rnd, weighted):
+    total = sum([weight for [item, weight] in weighted])
+    pick = rnd.uniform(0, total)
+    for [item, weight] in weighted:
+        pick = pick - weight
+        if pick <= 0:
+            return item
+    return weighted[-1][0]
+
+#Project NAD83 long./lat. to the given spatial reference (projections are kept for re-use)
+#Syntax: project_from_nad83(dict, float, float, int) returns [float, float]
+def project_from_nad83(projections, nad83_long, nad83_lat, target_epsg):
+    if target_epsg == 4269:
+        return [round(nad83_long, 6), round(nad83_lat, 6)]
+    if 4269 not in projections:
+        projections[4269] = Proj("+init=EPSG:4269")
+    if target_epsg not in projections:
+        projections[target_epsg] = Proj("+init=EPSG:" + str(target_epsg))
+
+    target_x, target_y = transform(projections[4269], projections[target_epsg], nad83_long, nad83_lat)
+    if target_epsg == 4326:
+        return [round(target_x, 6), round(target_y, 6)]
+    return [round(target_x, 1), round(target_y, 1)]
+
+#Get the analyte columns of a staged file: a random selection of the pool, in pool order. If more columns
+#than the pool are asked for, the pool is repeated (re-analyses by the same method).
+#Syntax: get_analyte_columns(Random, list, int) returns list
+def get_analyte_columns(rnd, pool, width):
+    columns = list()
+    while len(columns) < width:
+        count = min(width - len(columns), len(pool))
+        picked = sorted(rnd.sample(range(len(pool)), count))
+        columns.extend([pool[i] for i in picked])
+    return columns
+
+#Get an analyte value: log-normal around 20 times the detection limit, or censored ('<' detection limit)
+#Syntax: get_value(Random, list, float) returns float or string
+def get_value(rnd, column, censored):
+    mdl = column[2]
+    if rnd.random() < censored:
+        return '<' + str(mdl)
+
+    value = mdl * math.exp(rnd.gauss(math.log(20), 1.2))
+    if column[1] == '%':
+        value = min(value, 80.0)
+    digits = 2 - int(math.floor(math.log10(value)))
+    value = round(value, digits)
+    if digits <= 0:
+        return int(value)
+    return value
+
+#Get a sample location: NAD83 long./lat. near the center of the project area of a staged file
+#Syntax: get_location(Random, list) returns [float, float]
+def get_location(rnd, center):
+    return [center[0] + rnd.uniform(-0.05, 0.05), center[1] + rnd.uniform(-0.05, 0.05)]
+
+#Get the center of the project area of a staged file: [long., lat., UTM zone index]
+#Syntax: get_center(Random) returns [float, float, int]
+def get_center(rnd):
+    zone = rnd.randrange(len(PROJECT_AREAS))
+    area = PROJECT_AREAS[zone]
+    return [rnd.uniform(area[0], area[1]), rnd.uniform(area[2], area[3]), zone]
+
+#Pick the spatial reference of a sample from the EPSG mix. A UTM spatial reference is replaced by the
+#one of the same datum for the UTM zone of the project area, if there is one.
+#Syntax: pick_epsg(Random, list, list) returns int
+def pick_epsg(rnd, epsg_mix, center):
+    epsg = pick_weighted(rnd, epsg_mix)
+    for utm_epsgs in UTM_EPSGS:
+        if (epsg in utm_epsgs) and (utm_epsgs[center[2]] is not None):
+            return utm_epsgs[center[2]]
+    return epsg
+
+#Write a list of rows to the first sheet of a new xlsx file
+#Syntax: write_xlsx(string, list) returns None
+def write_xlsx(xls_name, rows):
+    wb = openpyxl.Workbook(write_only = True)
+    ws = wb.create_sheet()
+    for row in rows:
+        ws.append(row)
+    wb.save(xls_name)
+
+#Create a SQLite database and fill its code tables
+#Syntax: create_database(string, string, list) returns db_connection
+def create_database(db_path, schema, code_tables):
+    if os.path.isfile(db_path):
+        os.remove(db_path)
+    storage_backend.create_database(db_path, schema)
+    db_conn = storage_backend.connect(db_path)
+    cur = db_conn.cursor()
+    for [table, rows] in code_tables:
+        cur.executemany('insert into %s values (%s)' % (table, ', '.join(['?'] * len(rows[0]))), rows)
+    cur.commit()
+    return db_conn
+
+#==================================================== TillDB ==================================================
+#Get a TillDB sample: [sample_name, sample_code, ..., coord_conf] (pub_issue is set when written)
+#Syntax: get_tilldb_sample(Random, dict, list, list, string) returns list
+def get_tilldb_sample(rnd, projections, epsg_mix, center, sample_code):
+    [nad83_long, nad83_lat] = get_location(rnd, center)
+    epsg = pick_epsg(rnd, epsg_mix, center)
+    [x_coord, y_coord] = project_from_nad83(projections, nad83_long, nad83_lat, epsg)
+    return [sample_code.split('-')[-1], sample_code, 'till', round(rnd.uniform(0.3, 3.0), 1), None, None, None,
+            None, None, None, None, 'diamicton', 'Synthetic till sample', x_coord, y_coord,
+            int(rnd.uniform(300, 2000)), epsg, None, rnd.choice(['L', 'M', 'H'])]
+
+#Generate the TillDB database and staged files
+#Syntax: generate_tilldb(string, dict, Random, dict) returns dict
+def generate_tilldb(out_dir, options, rnd, projections):
+    db_path = os.path.join(out_dir, 'tilldb', 'tillDB.sqlite')
+    data_dir = os.path.join(out_dir, 'tilldb', 'staging')
+    os.makedirs(data_dir)
+    epsg_mix = get_epsg_mix(options['epsg'])
+    methods = dict([[method[0], method] for method in TILLDB_METHODS])
+    units = dict([[unit[1], unit[0]] for unit in TILLDB_UNITS])
+
+    db_conn = create_database(db_path, 'tilldb', [['code_unit', TILLDB_UNITS], ['code_method', TILLDB_METHODS],
+                                                  ['code_lab', TILLDB_LABS]])
+    cur = db_conn.cursor()
+
+    #Samples already in the database (loaded from an earlier publication)
+    published = list()
+    analyte_id = 1
+    if options['db_samples'] > 0:
+        columns = get_analyte_columns(rnd, TILLDB_ANALYTES, options['analytes'])
+        center = get_center(rnd)
+        for s in range(options['db_samples']):
+            sample = get_tilldb_sample(rnd, projections, epsg_mix, center, 'DB1979-%06d' % (s + 1))
+            sample[17] = 'OF1979-1'
+            cur.execute('insert into data_sample values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [s + 1, sample[1], sample[0], sample[2], str(sample[3]), 'NA', 'NA', 'NA', 'NA', 'NA',
+                         'NA', 'NA', sample[11], sample[12], sample[13], sample[14], sample[15], sample[16],
+                         sample[18]])
+            cur.execute('insert into data_publish values (?, ?, ?)', s + 1, 'OF1979-1', s + 1)
+            for column in columns:
+                cur.execute('insert into data_analyte values (?, ?, ?, ?, ?, ?, ?, ?, ?)', analyte_id, column[0],
+                            str(get_value(rnd, column, options['censored'])), str(column[2]), '63',
+                            units[column[1]], column[3], 2, s + 1)
+                analyte_id = analyte_id + 1
+            published.append(sample)
+        cur.commit()
+    db_conn.close()
+
+    #Staged files, one per publication
+    files = list()
+    sample_count = 0
+    for f in range(options['tilldb_files']):
+        pub_issue = 'OF%04d-%d' % (1980 + f, f + 1)
+        columns = get_analyte_columns(rnd, TILLDB_ANALYTES, options['analytes'])
+        lab_id = rnd.choice(TILLDB_LABS[1:])[0]
+        size = rnd.choice(TILLDB_SIZES)
+        center = get_center(rnd)
+
+        rows = [[None] * 18 + ['Analyte'] + [column[0] for column in columns],
+                [None] * 18 + ['Unit'] + [column[1] for column in columns],
+                [None] * 18 + ['D_Limit'] + [column[2] for column in columns],
+                [None] * 18 + ['Method_ID'] + [column[3] for column in columns],
+                [None] * 18 + ['Lab_ID'] + [lab_id] * len(columns),
+                [None] * 18 + ['Size_Fraction'] + [size] * len(columns),
+                ['Sample_Name', 'Sample_Code', 'Sample_Type', 'Depth', 'Duplicate', 'Borehole', 'Core_Top',
+                 'Core_Bottom', 'Azimuth', 'Dip', 'Drill_Type', 'Material_Type', 'Sample_Desc', 'X-Coord',
+                 'Y-Coord', 'Z-Coord', 'EPSG_SRID', 'Pub_Issue', 'Coord_Conf']]
+
+        samples = list()
+        for s in range(options['tilldb_samples']):
+            if published and (rnd.random() < options['republish']):
+                sample = list(published.pop(rnd.randrange(len(published))))
+            else:
+                sample = get_tilldb_sample(rnd, projections, epsg_mix, center, 'T%02d-%06d' % (f + 1, s + 1))
+            sample[17] = pub_issue
+            samples.append(sample)
+            rows.append(sample + [get_value(rnd, column, options['censored']) for column in columns])
+
+        write_xlsx(os.path.join(data_dir, pub_issue + '.xlsx'), rows)
+        published.extend([sample for sample in samples if sample[1].startswith('T%02d-' % (f + 1))])
+        files.append({'file': pub_issue + '.xlsx', 'samples': len(samples),
+                      'analytes': len(samples) * len(columns)})
+        sample_count = sample_count + len(samples)
+
+    return {'db_path': db_path, 'data_dir': data_dir + os.sep, 'files': files, 'samples': sample_count}
+
+#====================================================== ARIS ==================================================
+#Generate the ARIS geochem staging database and staged files
+#Syntax: generate_aris(string, dict, Random, dict) returns dict
+def generate_aris(out_dir, options, rnd, projections):
+    db_path = os.path.join(out_dir, 'aris', 'ARIS_geochem_stage.sqlite')
+    loc_dir = os.path.join(out_dir, 'aris', '_AR Data Staging Location')
+    cert_dir = os.path.join(out_dir, 'aris', '_AR Data Staging Certificate')
+    results_dir = os.path.join(out_dir, 'aris', '_AR Data Staging Results')
+    report_export = os.path.join(out_dir, 'aris', 'aris_report_locations.csv')
+    for data_dir in [loc_dir, cert_dir, results_dir]:
+        os.makedirs(data_dir)
+    epsg_mix = get_epsg_mix(options['epsg'])
+    units = dict([[unit[1], unit[0]] for unit in ARIS_UNITS])
+    methods = dict([[method[1], method[0]] for method in ARIS_METHODS])
+
+    db_conn = create_database(db_path, 'aris', [['code_unit', ARIS_UNITS], ['code_method', ARIS_METHODS],
+                                                ['code_lab', ARIS_LABS], ['code_prep', ARIS_PREPS]])
+    cur = db_conn.cursor()
+
+    #Get an ARIS sample: the 15 columns of the location sheet
+    def get_aris_sample(center, sample_name):
+        [nad83_long, nad83_lat] = get_location(rnd, center)
+        epsg = pick_epsg(rnd, epsg_mix, center)
+        [x_coord, y_coord] = project_from_nad83(projections, nad83_long, nad83_lat, epsg)
+        [sample_type, sample_subtype] = rnd.choice(ARIS_SAMPLE_TYPES)
+        return [sample_name, 'L%dS%d' % (rnd.randint(1, 40), rnd.randint(1, 40)), sample_type, sample_subtype,
+                rnd.choice([None, 10, 20, 30]), rnd.choice([None, 'brown', 'orange-brown', 'grey']),
+                None, None, x_coord, y_coord, rnd.choice([None, int(rnd.uniform(300, 2000))]), epsg,
+                rnd.choice(['l', 'm', 'h']), '%d-%02d-%02d' % (rnd.randint(1990, 2016), rnd.randint(5, 9),
+                                                             rnd.randint(1, 28))]
+
+    #Samples already in the database (loaded from an earlier report)
+    published = list()
+    if options['db_samples'] > 0:
+        columns = get_analyte_columns(rnd, ARIS_ANALYTES, options['analytes'])
+        center = get_center(rnd)
+        cur.execute('insert into data_cert values (?, ?, ?, ?, ?, ?)', 1, 'DB00000001', '1989-10-01', 2, 2, '')
+        analyte_id = 1
+        for s in range(options['db_samples']):
+            sample = get_aris_sample(center, 'DB%06d' % (s + 1))
+            cur.execute('insert into data_sample values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [s + 1] + [('' if value is None else value) for value in sample[:10]] +
+                        [sample[10], sample[11], sample[12].upper(), sample[13]])
+            cur.execute('insert into data_ar values (?, ?, ?)', s + 1, '20000', s + 1)
+            for column in columns:
+                cur.execute('insert into data_analyte values (?, ?, ?, ?, ?, ?, ?, ?)', analyte_id, column[0],
+                            str(get_value(rnd, column, options['censored'])).replace('<', '-'), str(column[2]),
+                            units[column[1]], methods[column[3]], s + 1, 1)
+                analyte_id = analyte_id + 1
+            published.append(sample)
+        cur.commit()
+    db_conn.close()
+
+    #Staged files: one location file per report, and a certificate and a results file per certificate
+    loc_files = list()
+    cert_files = list()
+    results_files = list()
+    report_locations = list()
+    sample_count = 0
+    analyte_count = 0
+    for f in range(options['aris_reports']):
+        ar_number = str(30000 + f)
+        center = get_center(rnd)
+        report_locations.append([ar_number, center[0], center[1]])
+
+        samples = list()
+        for s in range(options['aris_samples']):
+            if published and (rnd.random() < options['republish']):
+                samples.append(list(published.pop(rnd.randrange(len(published)))))
+            else:
+                samples.append(get_aris_sample(center, 'R%05dS%05d' % (30000 + f, s + 1)))
+
+        loc_name = ar_number + '_loc.xlsx'
+        write_xlsx(os.path.join(loc_dir, loc_name),
+                   [['sample_name', 'station_name', 'sample_type', 'sample_subtype', 'sample_depth',
+                     'sample_colour', 'sample_desp', 'duplicate', 'x_coord', 'y_coord', 'z_coord', 'epsg_srid',
+                     'coord_conf', 'sample_date']] + samples)
+        loc_files.append({'file': loc_name, 'samples': len(samples)})
+        published.extend([sample for sample in samples if sample[0].startswith('R%05d' % (30000 + f))])
+        sample_count = sample_count + len(samples)
+
+        #Samples are split over the certificates of the report
+        cert_count = max(1, options['aris_certs'])
+        for c in range(cert_count):
+            cert_no = 'VA%02d%06d' % (f % 100, c + 1)
+            cert_samples = samples[c::cert_count]
+            if not cert_samples:
+                continue
+
+            cert_name = ar_number + '_' + cert_no + '_cert.xlsx'
+            write_xlsx(os.path.join(cert_dir, cert_name),
+                       [['cert_no', 'cert_date', 'lab_id', 'prep_id'],
+                        [cert_no, '%d-%02d-%02d' % (rnd.randint(1990, 2016), rnd.randint(1, 12), rnd.randint(1, 28)),
+                         rnd.choice(ARIS_LABS[1:])[0], rnd.choice(ARIS_PREPS[1:])[0]]])
+            cert_files.append({'file': cert_name})
+
+            columns = get_analyte_columns(rnd, ARIS_ANALYTES, options['analytes'])
+            rows = [[None, 'Analyte'] + [column[0] for column in columns],
+                    [None, 'Unit'] + [column[1] for column in columns],
+                    [None, 'D_Limit'] + [column[2] for column in columns],
+                    [None, 'Method_ID'] + [column[3] for column in columns],
+                    ['Sample_Name', 'Cert_No']]
+            for sample in cert_samples:
+                rows.append([sample[0], cert_no] + [get_value(rnd, column, options['censored']) for column in columns])
+
+            results_name = ar_number + '_' + cert_no + '_results.xlsx'
+            write_xlsx(os.path.join(results_dir, results_name), rows)
+            results_files.append({'file': results_name, 'samples': len(cert_samples),
+                                  'analytes': len(cert_samples) * len(columns)})
+            analyte_count = analyte_count + len(cert_samples) * len(columns)
+
+    #Report locations for the ARIS distance check of the sample info screener
+    aris_report_index.write_export(report_export, report_locations)
+
+    return {'db_path': db_path, 'loc_dir': loc_dir + os.sep, 'cert_dir': cert_dir + os.sep,
+            'results_dir': results_dir + os.sep, 'report_export': report_export, 'loc_files': loc_files,
+            'cert_files': cert_files, 'results_files': results_files, 'samples': sample_count,
+            'analytes': analyte_count}
+
+#Generate the synthetic databases and staged files under the given directory
+#Syntax: generate(string, dict) returns dict
+def generate(out_dir, options):
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        print out_dir + ' is not empty!'
+        sys.exit()
+
+    rnd = random.Random(options['seed'])
+    projections = {}
+
+    print 'Generating TillDB data ...'
+    tilldb = generate_tilldb(out_dir, options, rnd, projections)
+    print 'Generating ARIS geochem data ...'
+    aris = generate_aris(out_dir, options, rnd, projections)
+
+    manifest = {'options': options, 'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'tilldb': tilldb, 'aris': aris}
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as out_file:
+        json.dump(manifest, out_file, indent = 1)
+    return manifest
+
+def main():
+    if (len(sys.argv) < 2) or sys.argv[1].startswith('--'):
+        print 'Usage: python synthetic_data_generator.py <output directory> [--name=value ...]'
+        sys.exit()
+
+    generate(sys.argv[1], get_options(sys.argv[2:]))
+    print 'Job done!'
+
+if __name__ == "__main__":
+    main()
@@ -64,6 +64,8 @@
 import os, ogr, osr, datetime, openpyxl
 from openpyxl import load_workbook
 from dateutil.parser import parse
+import numpy as np
+import aris_report_index
 
 # This function is to check if a given string can be converted to a decimal number
 # Syntax: is_number(string) return logic
@@ -110,11 +112,11 @@ def main():
     data_dir = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\_AR Data Staging Location\\'
     chkrpt_nm = 'C:\\Project\\ARIS_Geochem_dev\\data_testing\\checkreports\\SampleInfoCheckReport_' + \
         datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.xlsx'
-    min_aris_path = 'C:\\min_aris\\min_aris.mdb'
 
-    #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+min_aris_path)
-    cur = db_conn.cursor()
+    #ARIS report locations, read once from min_aris.mdb or its csv export (see aris_report_index.py)
+    aris_index = aris_report_index.get_index()
+    if aris_index is None:
+        return
 
     #Minimum long. and lat. difference between sample locations in degree
     min_lon = 0.001
@@ -190,29 +192,24 @@ def main():
                 [cell_xc, cell_yc] = project2nad83 (float(cell_xc), float(cell_yc), int(cell_epsg))
             xls_xc.append(cell_xc)
             xls_yc.append(cell_yc)
-            xls_file.append(xls_name)
+            xls_file.append(xls_list[f].partition('_')[0])
             xls_row.append(cell_row)
 
 
-    #Loop through to check each sample coord
+    #Distance of each sample to the location of its own report (ARIS number of the file name) and the
+    #nearest other report, all the samples at once
+    xls_long = np.array([float(val) for val in xls_xc])
+    xls_lat = np.array([float(val) for val in xls_yc])
+    km = aris_index.distances(xls_file, xls_long, xls_lat)
+    nearest = aris_index.nearest(xls_long, xls_lat, 1, xls_file)
     for i in range(len(xls_sample)):
-        #Examine sample locations
-
-        # create point geometry
-        pt = ogr.Geometry(ogr.wkbPoint)
-        pt.SetPoint_2D(0, float(xls_xc[i]), float(xls_yc[i]))
-
-        aris_pt = ogr.Geometry(ogr.wkbPoint)
-        aris_pt.SetPoint_2D(0,-121.793333,52.520556)
-        inSpatialRef = osr.SpatialReference()
-        inSpatialRef.ImportFromEPSG(4269)
-        outSpatialRef = osr.SpatialReference()
-        outSpatialRef.ImportFromEPSG(3153)
-        coordTransform = osr.CoordinateTransformation(inSpatialRef,outSpatialRef)
-        pt.Transform(coordTransform)
-        aris_pt.Transform(coordTransform)
-
-        print pt.Distance(aris_pt)
+        if np.isnan(km[i]):
+            print xls_file[i] + ', Row: ' + xls_row[i] + ', Sample: ' + xls_sample[i] + ': No ARIS record'
+            continue
+        line = xls_file[i] + ', Row: ' + xls_row[i] + ', Sample: ' + xls_sample[i] + ': ' + ('%.3f' % km[i]) + 'km'
+        if nearest[i]:
+            line = line + ', nearest report: ' + nearest[i][0][0] + ' at ' + ('%.3f' % nearest[i][0][1]) + 'km'
+        print line
 
     chkwb.save(chkrpt_nm)  # save results to the xlsx report
 
@@ -6,7 +6,7 @@
    
    Input
          1) Path to the directory containing the staged xlsx files
-         2) Path to the till geochem database, TillDB (MS Access)
+         2) Path to the till geochem database, TillDB (MS Access, or SQLite stand-in, see storage_backend.py)
          
   Output
          Data inserted into the above 3 tables in the TillDB
@@ -55,6 +55,32 @@
 
             All these problems are difficult to spot in data screening. They need to be examined visually in
             the final data products.
+
+         9) The inserts of each data row are committed together with a checkpoint in the 'load_manifest'
+            table (see load_manifest.py). Files already loaded are skipped, a file partly loaded (e.g. the
+            script died halfway) is resumed after its last committed row, and a file modified since it was
+            loaded is rejected: nothing is loaded until it is restored or renamed.
+
+        10) Run with --plan for a dry run: the new samples, publication links and analyte rows, and the
+            skipped duplicates, of each staged file are computed from in-memory indexes of the database
+            (see load_planner.py) and printed. Nothing is written to the database.
+
+        11) The staged files are read by worker processes (--workers=N, default: number of CPUs - 1) and
+            written one after the other by this script while the next ones are being read, in the order
+            of the directory listing (see load_pipeline.py). The ids are assigned as in a serial load.
+
+        12) Run with --merge to load each staged file through staging tables (see load_merge.py): the rows
+            are copied in bulk, the duplicate samples, publication links and analyte rows are found by a
+            few set-based queries and the new rows are merged with "insert ... select". The rows inserted
+            and their ids are the same as in the row by row load.
+
+        13) The NAD83 geographic and UTM coordinates of the new samples of each staged file are computed in
+            batches once the file is loaded, and stored in the 'data_sample_geo' table (see sample_geo.py),
+            where the product creator and the screener read them. The new samples are also added to the
+            grid spatial index of the samples (see sample_index.py). A file resumed is located from its
+            first sample, so that the samples inserted before the interruption are included. The NTS 50k
+            map grid tags are left to the product creator, unless the grid shape file is given
+            (nts_mapsheet); a missing grid shape file is reported and the tags are left blank.
   Status
       Operational
 
@@ -62,10 +88,12 @@
       T. Han
       
   Last update
-      2017-03-17
+      2026-10-19
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
+import query_profiler, storage_backend, reference_cache, load_manifest, load_planner, load_pipeline, load_merge
+import sample_geo, sample_index
 #========================================== Sub-routines =================================================
 #Get next row number of a given field and table
 #Syntax: get_rownum(db_cursor, string, string) return int
@@ -79,15 +107,9 @@ def get_rownum(db_cur, fld_name, tab_name):
         return int(max_val[0]) + 1
     
 #Get unit_id with the given unit_name as defined in 'code_unit' table
-#Syntax: get_unitid (db_cursor, list) return list
-def get_unitid(db_cur, name_list):
-    temp_id = []
-    temp_name = []
-    db_cur.execute("""select unit_id, name from code_unit""")
-    all_records = db_cur.fetchall()
-    for record in all_records:
-        temp_id.append(record[0])
-        temp_name.append(record[1])
+#Syntax: get_unitid (ReferenceCache, list) return list
+def get_unitid(refcache, name_list):
+    unit_ids = refcache.lookup('code_unit', 'name', 'unit_id')
         
     unitid_list = []
     for i in range(len(name_list)):
@@ -98,25 +120,337 @@ def get_unitid(db_cur, name_list):
             name_list[i] = 'g'
 
         #Validate
-        if name_list[i] in temp_name:
-            indx = temp_name.index(name_list[i])
-            unitid_list.append(temp_id[indx])
+        if name_list[i] in unit_ids:
+            unitid_list.append(unit_ids[name_list[i]])
         else:
             print 'Invalid unit: ' + name_list[i] 
             sys.exit()
 
     return unitid_list
+
+#Staging tables of the merge load path (see Additional info 12 and load_merge.py)
+STAGE_TABLES = [
+    ['load_stage_sample', [['row_no', 'integer'], ['sample_id', 'integer'], ['new_sample', 'integer'],
+                           ['pub_issue', 'varchar(255)'], ['ins', 'integer'], ['pub_id', 'integer'],
+                           ['sample_code', 'varchar(255)'], ['sample_name', 'varchar(255)'],
+                           ['sample_type', 'varchar(255)'], ['depth', 'varchar(255)'], ['duplicate', 'varchar(255)'],
+                           ['borehole', 'varchar(255)'], ['core_top', 'varchar(255)'], ['core_bottom', 'varchar(255)'],
+                           ['azimuth', 'varchar(255)'], ['dip', 'varchar(255)'], ['drill_type', 'varchar(255)'],
+                           ['material_type', 'longtext'], ['sample_desp', 'longtext'], ['x_coord', 'varchar(255)'],
+                           ['y_coord', 'varchar(255)'], ['z_coord', 'varchar(255)'], ['epsg_srid', 'integer'],
+                           ['coord_conf', 'varchar(255)']],
+     [['sample_id', 'pub_issue'], ['row_no']]],
+    ['load_stage_analyte', [['row_no', 'integer'], ['col_no', 'integer'], ['new_sample', 'integer'],
+                            ['ins', 'integer'], ['analyte_id', 'integer'], ['analyte', 'varchar(255)'],
+                            ['abundance', 'varchar(255)'], ['mdl', 'varchar(255)'], ['size_frac', 'varchar(255)'],
+                            ['unit_id', 'integer'], ['method_id', 'integer'], ['lab_id', 'integer'],
+                            ['sample_id', 'integer']],
+     [['sample_id', 'analyte'], ['row_no', 'col_no']]]]
+
+#Merge the rows of a staged file into the database through the staging tables (the caller commits).
+#next_ids is updated with the ids used.
+#Syntax: merge_file(db_cursor, list, list, dict) returns None
+def merge_file(db_cur, staged_file, unitid_list, next_ids):
+    [analyte_list, unit_list, mdl_list, method_list, labid_list, size_list, row_count, sample_rows] = staged_file
+    load_merge.clear_stage_tables(db_cur, STAGE_TABLES)
+
+    #Samples of the file already in the database, looked up in bulk
+    sample_ids = {}
+    for record in load_planner.select_in(db_cur, """select sample_code, min(sample_id) from data_sample
+                                                    where sample_code in (%s) group by sample_code""",
+                                         [row[0] for row in sample_rows]):
+        sample_ids[str(record[0])] = record[1]
+
+    #Copy the rows and the analyte values to the staging tables, with the sample_id of each row (a new
+    #sample is inserted by its first row)
+    stage_samples = list()
+    stage_analytes = list()
+    for r in range(len(sample_rows)):
+        [sample_code, pub_issue, abundance, sample_values] = sample_rows[r]
+        if sample_code in sample_ids:
+            new_sample = 0
+            epsg_srid = None
+        else:
+            new_sample = 1
+            epsg_srid = int(sample_values[16])
+            sample_ids[sample_code] = next_ids['sample_id']
+            next_ids['sample_id'] = next_ids['sample_id'] + 1
+        sample_id = sample_ids[sample_code]
+
+        stage_samples.append([r, sample_id, new_sample, pub_issue, 0, None] + sample_values[:16] +
+                             [epsg_srid, sample_values[17]])
+        for c in range(len(analyte_list)):
+            if (abundance[c] <> '') and (abundance[c] <> 'None'):
+                stage_analytes.append([r, c, new_sample, 0, None, analyte_list[c], abundance[c], mdl_list[c],
+                                       size_list[c], int(unitid_list[c]), int(method_list[c]), int(labid_list[c]),
+                                       sample_id])
+    load_merge.copy_rows(db_cur, 'load_stage_sample', stage_samples)
+    load_merge.copy_rows(db_cur, 'load_stage_analyte', stage_analytes)
+
+    #----------------------------- Add to the "data_sample" table ------------------------------------------
+    db_cur.execute("""insert into data_sample
+                      select sample_id, sample_code, sample_name, sample_type, depth, duplicate, borehole, core_top,
+                             core_bottom, azimuth, dip, drill_type, material_type, sample_desp, x_coord, y_coord,
+                             z_coord, epsg_srid, coord_conf
+                      from load_stage_sample where new_sample = 1""")
+
+    #---------------------------------- Update 'data_publish' table ----------------------------------------
+    #Links neither in the database nor on a previous row of the file
+    db_cur.execute("""update load_stage_sample set ins = 1
+                      where not exists (select * from data_publish d
+                                        where (d.sample_id = load_stage_sample.sample_id) and
+                                              (d.pub_issue = load_stage_sample.pub_issue))
+                        and not exists (select * from load_stage_sample e
+                                        where (e.sample_id = load_stage_sample.sample_id) and
+                                              (e.pub_issue = load_stage_sample.pub_issue) and
+                                              (e.row_no < load_stage_sample.row_no))""")
+    next_ids['pub_id'] = load_merge.number_rows(db_cur, 'load_stage_sample', 'pub_id', ['row_no'],
+                                                next_ids['pub_id'])
+    db_cur.execute("""insert into data_publish select pub_id, pub_issue, sample_id from load_stage_sample
+                      where ins = 1""")
+
+    #----------------------------- Add to the "data_analyte" table -----------------------------------------
+    #All the values of a new sample, and the values of the other samples neither in the database nor
+    #before in the file
+    db_cur.execute("""update load_stage_analyte set ins = 1
+                      where (new_sample = 1)
+                         or (not exists (select * from data_analyte d
+                                         where (d.sample_id = load_stage_analyte.sample_id) and
+                                               (d.analyte = load_stage_analyte.analyte) and
+                                               (d.abundance = load_stage_analyte.abundance) and
+                                               (d.size_frac = load_stage_analyte.size_frac) and
+                                               (d.unit_id = load_stage_analyte.unit_id) and
+                                               (d.method_id = load_stage_analyte.method_id) and
+                                               (d.lab_id = load_stage_analyte.lab_id))
+                             and not exists (select * from load_stage_analyte e
+                                             where (e.sample_id = load_stage_analyte.sample_id) and
+                                                   (e.analyte = load_stage_analyte.analyte) and
+                                                   (e.abundance = load_stage_analyte.abundance) and
+                                                   (e.size_frac = load_stage_analyte.size_frac) and
+                                                   (e.unit_id = load_stage_analyte.unit_id) and
+                                                   (e.method_id = load_stage_analyte.method_id) and
+                                                   (e.lab_id = load_stage_analyte.lab_id) and
+                                                   ((e.row_no < load_stage_analyte.row_no) or
+                                                    ((e.row_no = load_stage_analyte.row_no) and
+                                                     (e.col_no < load_stage_analyte.col_no)))))""")
+    next_ids['analyte_id'] = load_merge.number_rows(db_cur, 'load_stage_analyte', 'analyte_id', ['row_no', 'col_no'],
+                                                    next_ids['analyte_id'])
+    db_cur.execute("""insert into data_analyte
+                      select analyte_id, analyte, abundance, mdl, size_frac, unit_id, method_id, lab_id, sample_id
+                      from load_stage_analyte where ins = 1""")
+
+#Columns of the load plan (see Additional info 10)
+PLAN_COLUMNS = [['rows', 'rows'], ['samples_new', 'new samples'], ['samples_found', 'samples in db'],
+                ['links_new', 'new pub links'], ['links_skipped', 'skipped links'],
+                ['analytes_new', 'new analytes'], ['analytes_skipped', 'skipped dups'], ['values_empty', 'empty']]
+
+#Read and normalize the data rows of a staged file, after the rows_loaded first ones (run in the worker
+#processes of the load pipeline, see load_pipeline.py). Returns the top 6 rows and the data rows:
+#[analyte_list, unit_list, mdl_list, method_list, labid_list, size_list, number of data rows,
+# [[sample_code, pub_issue, abundance list, 'data_sample' values without sample_id], ...]]
+#Syntax: read_staged_file(string, string, int) returns list
+def read_staged_file(data_dir, xls_file, rows_loaded):
+    #Open and exam the xls file
+    wb = load_workbook(filename = data_dir + xls_file)
+    ws = wb[wb.sheetnames[0]]
+
+    #Extract the top 6 rows from 'XXXXX.xlsx'
+    analyte_list = list()
+    unit_list = list()
+    mdl_list = list()
+    method_list = list()
+    labid_list = list()
+    size_list = list()
+    for c in range(20, ws.max_column + 1):
+        analyte_list.append(str(ws.cell(row = 1, column = c).value).replace(' ', ''))
+        unit_list.append(str(ws.cell(row = 2, column = c).value).replace(' ', ''))
+        mdl_list.append(str(ws.cell(row = 3, column = c).value).replace(' ', ''))
+        method_list.append(str(ws.cell(row = 4, column = c).value).replace(' ', ''))
+        labid_list.append(str(ws.cell(row = 5, column = c).value).replace(' ', ''))
+        size_list.append(str(ws.cell(row = 6, column = c).value).replace(' ', ''))
+
+    #Step through the remaining rows (values are all read in as strings)
+    sample_rows = list()
+    for r in range(8 + rows_loaded, ws.max_row + 1):
+        #Retrieve 'pub_issue'
+        pub_issue = str(ws.cell(row = r, column = 18).value).replace(' ', '')
+
+        #Retrieve analyte values
+        abundance = list()
+        for c in range(20, ws.max_column + 1):
+            abundance.append(str(ws.cell(row = r, column = c).value).replace(' ', ''))
+
+        sample_code = str(ws.cell(row = r, column = 2).value).replace(' ', '')
+
+        sample_name = str(ws.cell(row = r, column = 1).value).replace(' ', '')
+        if sample_name == '':
+            sample_name = 'NA'
+            
+        sample_type = str(ws.cell(row = r, column = 3).value).replace(' ', '')
+        if sample_type == '':
+            sample_type = 'NA'
+
+        depth = str(ws.cell(row = r, column = 4).value).replace(' ', '')
+        if depth == '':
+            depth = 'NA'
+
+        duplicate = str(ws.cell(row = r, column = 5).value).replace(' ', '')
+        if duplicate == '':
+            duplicate = 'NA'
+
+        borehole = str(ws.cell(row = r, column = 6).value).replace(' ', '')
+        if borehole == '':
+            borehole = 'NA'
+        
+        core_top = str(ws.cell(row = r, column = 7).value).replace(' ', '')
+        if core_top == '':
+            core_top = 'NA'
+
+        core_bottom = str(ws.cell(row = r, column = 8).value).replace(' ', '')
+        if core_bottom == '':
+            core_bottom = 'NA'
+
+        azimuth = str(ws.cell(row = r, column = 9).value).replace(' ', '')
+        if azimuth == '':
+            azimuth = 'NA'
+
+        dip = str(ws.cell(row = r, column = 10).value).replace(' ', '')
+        if dip == '':
+            dip = 'NA'
+
+        drill_type = str(ws.cell(row = r, column = 11).value).replace(' ', '')
+        if drill_type == '':
+            drill_type = 'NA'
+
+        material_type = str(ws.cell(row = r, column = 12).value)
+        if material_type == '':
+            material_type = 'NA'
+
+        sample_desc = str(ws.cell(row = r, column = 13).value)
+        if sample_desc == '':
+            sample_desc = 'NA'
+            
+        x_coord = str(ws.cell(row = r, column = 14).value).replace(' ', '')
+        y_coord = str(ws.cell(row = r, column = 15).value).replace(' ', '')
+        
+        z_coord = str(ws.cell(row = r, column = 16).value).replace(' ', '')
+        if z_coord == '':
+            z_coord = 'NA'
+            
+        epsg_srid = str(ws.cell(row = r, column = 17).value).replace(' ', '')
+        coord_conf = str(ws.cell(row = r, column = 19).value).replace(' ', '').upper()
+
+        #'data_sample' values (the EPSG code is converted to int when the sample is inserted)
+        sample_values = [sample_code, sample_name, sample_type, depth, duplicate, borehole, core_top, core_bottom,
+                         azimuth, dip, drill_type, material_type, sample_desc, x_coord, y_coord, z_coord, epsg_srid,
+                         coord_conf]
+        sample_rows.append([sample_code, pub_issue, abundance, sample_values])
+
+    return [analyte_list, unit_list, mdl_list, method_list, labid_list, size_list, ws.max_row - 7, sample_rows]
+
+#Compute the plan of the load from in-memory indexes of the database, without writing anything
+#Syntax: plan_load(db_cursor, ReferenceCache, string, list, dict, int) returns LoadPlan
+def plan_load(db_cur, refcache, data_dir, load_list, next_ids, workers):
+    plan = load_planner.LoadPlan('tillDB_data_loader', PLAN_COLUMNS)
+    unit_ids = refcache.lookup('code_unit', 'name', 'unit_id')
+
+    #Read the staged files: [[file name, analyte keys, [[sample_code, pub_issue, abundance], ...]], ...]
+    staged = list()
+    for [[data_dir, xls_file, rows_loaded], staged_file] in load_pipeline.read_files(read_staged_file,
+            [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list], workers):
+        print data_dir + xls_file + ' has been read ...'
+        [analyte_list, unit_list, mdl_list, method_list, labid_list, size_list, row_count, sample_rows] = staged_file
+
+        #Analyte, size fraction, unit_id, method_id and lab_id of each column
+        analyte_keys = list()
+        for c in range(len(analyte_list)):
+            unit_name = unit_list[c].lower()
+            if unit_name not in unit_ids:
+                plan.add_problem(xls_file, 'invalid unit: ' + unit_name)
+                continue
+            analyte_keys.append([analyte_list[c], size_list[c], int(unit_ids[unit_name]), int(method_list[c]),
+                                 int(labid_list[c])])
+        if len(analyte_keys) < len(analyte_list):
+            continue
+
+        staged.append([xls_file, analyte_keys, [row[:3] for row in sample_rows]])
+
+    #Bulk indexes: {sample_code: sample_id}, and the publication links and analyte rows of the samples of
+    #the batch already in the database
+    db_cur.execute("""select sample_code, sample_id from data_sample order by sample_id""")
+    sample_ids = {}
+    for record in db_cur.fetchall():
+        sample_ids.setdefault(str(record[0]), record[1])
+    found_ids = [sample_ids[row[0]] for [xls_file, analyte_keys, sample_rows] in staged
+                 for row in sample_rows if row[0] in sample_ids]
+
+    pub_links = set([(record[0], str(record[1])) for record in
+                     load_planner.select_in(db_cur, """select sample_id, pub_issue from data_publish
+                                                        where sample_id in (%s)""", found_ids)])
+    analyte_rows = set([(str(record[0]), str(record[1]), str(record[2]), record[3], record[4], record[5], record[6])
+                        for record in load_planner.select_in(db_cur, """select analyte, abundance, size_frac, unit_id,
+                                                              method_id, lab_id, sample_id from data_analyte
+                                                              where sample_id in (%s)""", found_ids)])
+
+    #Step through the rows with the rules of the load
+    for [xls_file, analyte_keys, sample_rows] in staged:
+        counts = plan.add_file(xls_file)
+        for [sample_code, pub_issue, abundance] in sample_rows:
+            counts['rows'] = counts['rows'] + 1
+            sample_found = sample_code in sample_ids
+            if sample_found:
+                counts['samples_found'] = counts['samples_found'] + 1
+                sample_id = sample_ids[sample_code]
+            else:
+                counts['samples_new'] = counts['samples_new'] + 1
+                sample_id = next_ids['sample_id']
+                sample_ids[sample_code] = sample_id
+                next_ids['sample_id'] = sample_id + 1
+
+            if (sample_id, pub_issue) in pub_links:
+                counts['links_skipped'] = counts['links_skipped'] + 1
+            else:
+                counts['links_new'] = counts['links_new'] + 1
+                pub_links.add((sample_id, pub_issue))
+                next_ids['pub_id'] = next_ids['pub_id'] + 1
+
+            for i in range(len(analyte_keys)):
+                [analyte, size_frac, unit_id, method_id, lab_id] = analyte_keys[i]
+                key = (analyte, abundance[i], size_frac, unit_id, method_id, lab_id, sample_id)
+                #The analyte rows of a new sample are inserted without checking for duplicates, as in the load
+                if sample_found and (key in analyte_rows):
+                    counts['analytes_skipped'] = counts['analytes_skipped'] + 1
+                elif (abundance[i] == '') or (abundance[i] == 'None'):
+                    counts['values_empty'] = counts['values_empty'] + 1
+                else:
+                    counts['analytes_new'] = counts['analytes_new'] + 1
+                    analyte_rows.add(key)
+                    next_ids['analyte_id'] = next_ids['analyte_id'] + 1
+
+    return plan
 #============================================= Main routine =========================================
-def main():   
+def main(db_path = 'C:\\Project\\TillDB\\data\\tillDB_curr.accdb',
+         data_dir = 'C:\\Project\\TillDB\\data\\workspace\\',
+         nts_mapsheet = None):
     #File path
-    db_path = 'C:\\Project\\TillDB\\data\\tillDB_curr.accdb'
-    data_dir = 'C:\\Project\\TillDB\\data\\workspace\\'
+    qprofile_file = 'C:\\Project\\TillDB\\data\\query_profile_tillDB_data_loader_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
 
     #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
+    db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('tillDB_data_loader', '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Code tables are looked up in memory (see reference_cache.py)
+    qprofile.set_stage('reference data')
+    refcache = reference_cache.ReferenceCache(db_path)
+    refcache.load(cur, ['code_unit'])
+
     #Get next id values from tables: 'data_sample', 'data_analyte', and 'data_publish' 
+    qprofile.set_stage('next ids')
     sample_id = get_rownum(cur, 'sample_id', 'data_sample')
     analyte_id = get_rownum(cur, 'analyte_id', 'data_analyte')
     pub_id = get_rownum(cur, 'pub_id', 'data_publish')
@@ -124,44 +458,72 @@ def main():
     #Collect all xls file name under the specified directory
     xls_list = os.listdir(data_dir)
 
-    #Loop through each file in the drectory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        print xls_name + ' is being loaded ...'
-
-        #Extract the top 6 rows from 'XXXXX.xlsx'
-        analyte_list = list()
-        unit_list = list()
-        mdl_list = list()
-        method_list = list()
-        labid_list = list()
-        size_list = list()
-        for c in range(20, ws.max_column + 1):
-            analyte_list.append(str(ws.cell(row = 1, column = c).value).replace(' ', ''))
-            unit_list.append(str(ws.cell(row = 2, column = c).value).replace(' ', ''))
-            mdl_list.append(str(ws.cell(row = 3, column = c).value).replace(' ', ''))
-            method_list.append(str(ws.cell(row = 4, column = c).value).replace(' ', ''))
-            labid_list.append(str(ws.cell(row = 5, column = c).value).replace(' ', ''))
-            size_list.append(str(ws.cell(row = 6, column = c).value).replace(' ', ''))
+    #Skip the files already loaded, resume a file partly loaded and reject the modified ones (see Additional
+    #info 9)
+    qprofile.set_stage('load manifest')
+    plan_mode = '--plan' in sys.argv[1:]
+    merge_mode = '--merge' in sys.argv[1:]
+    workers = load_pipeline.get_workers(sys.argv[1:])
+    manifest = load_manifest.LoadManifest(cur, 'tillDB_data_loader', data_dir, plan_mode)
+    [load_list, skipped, rejected] = manifest.check_files(xls_list)
+    if not manifest.report(skipped, rejected) and not plan_mode:
+        db_conn.close()
+        sys.exit()
+
+    #Dry run: print the plan of the load and stop (see Additional info 10)
+    if plan_mode:
+        qprofile.set_stage('plan')
+        next_ids = {'sample_id': sample_id, 'analyte_id': analyte_id, 'pub_id': pub_id}
+        plan = plan_load(cur, refcache, data_dir, load_list, next_ids, workers)
+        plan.report(skipped, rejected, next_ids)
+        qprofile.report(qprofile_file)
+        db_conn.close()
+        return
+
+    #Side table of the sample locations and spatial index (see Additional info 13)
+    sample_geo.create_table(cur)
+    sample_index.create_table(cur)
+
+    #Merge load path: staging tables (see Additional info 12)
+    if merge_mode:
+        qprofile.set_stage('staging tables')
+        load_merge.create_stage_tables(cur, STAGE_TABLES)
+
+    #Loop through each file in the drectory. The files are read in worker processes while the previous ones
+    #are being written (see Additional info 11).
+    qprofile.set_stage('load files')
+    for [[data_dir, xls_file, rows_loaded], staged_file] in load_pipeline.read_files(read_staged_file,
+            [[data_dir, xls_file, rows_loaded] for [xls_file, rows_loaded] in load_list], workers):
+        [analyte_list, unit_list, mdl_list, method_list, labid_list, size_list, row_count, sample_rows] = staged_file
+        xls_name = data_dir + xls_file
+        if rows_loaded > 0:
+            print xls_name + ' is being loaded from row ' + str(8 + rows_loaded) + ' (resumed) ...'
+        else:
+            print xls_name + ' is being loaded ...'
 
         #Get 'unit_id' for the retrieved unit names
-        unitid_list = get_unitid(cur, unit_list)
+        unitid_list = get_unitid(refcache, unit_list)
+        #The samples inserted by an interrupted load of the file are located too (see Additional info 13)
+        first_ids = manifest.start(xls_file, row_count, {'sample_id': sample_id, 'analyte_id': analyte_id,
+                                                         'pub_id': pub_id})
+        first_sample_id = first_ids.get('sample_id', sample_id)
 
-        #Step through the remaining rows (values are all read in as strings)
-        for r in range(8, ws.max_row + 1):
-            #Retrieve 'pub_issue'
-            pub_issue = str(ws.cell(row = r, column = 18).value).replace(' ', '')
-            
-            #Retrieve analyte values
-            abundance = list()
-            for c in range(20, ws.max_column + 1):
-                abundance.append(str(ws.cell(row = r, column = c).value).replace(' ', ''))
+        #Merge the whole file in one transaction (see Additional info 12)
+        if merge_mode:
+            next_ids = {'sample_id': sample_id, 'analyte_id': analyte_id, 'pub_id': pub_id}
+            merge_file(cur, staged_file, unitid_list, next_ids)
+            [sample_id, analyte_id, pub_id] = [next_ids['sample_id'], next_ids['analyte_id'], next_ids['pub_id']]
+            sample_geo.refresh(cur, nts_mapsheet, [first_sample_id, sample_id])
+            sample_index.update(cur, [first_sample_id, sample_id])
+            manifest.checkpoint(xls_file, rows_loaded + len(sample_rows), next_ids)
+            cur.commit()
+            manifest.finish(xls_file)
+            continue
+
+        #Step through the remaining rows
+        for r in range(len(sample_rows)):
+            [sample_code, pub_issue, abundance, sample_values] = sample_rows[r]
             #-------------------------------------- Update the 3 relevent tables  -----------------------------------
-            sample_code = str(ws.cell(row = r, column = 2).value).replace(' ', '')
             cur.execute("""select sample_id from data_sample where sample_code = ?""", sample_code)
             check_sample = cur.fetchone()
             
@@ -173,7 +535,6 @@ def main():
                 rec_count = cur.fetchone()
                 if rec_count[0] == 0:
                     cur.execute("""insert into data_publish values (?, ?, ?)""", pub_id, pub_issue, check_sample[0])
-                    cur.commit()
                     pub_id = pub_id + 1
                 #----------------------------- Update 'data_analyte' table if applicable ----------------------------    
                 for i in range(len(analyte_list)):
@@ -188,85 +549,22 @@ def main():
                         cur.execute("""insert into data_analyte values (?, ?, ?, ?, ?, ?, ?, ?, ?)""", analyte_id, \
                                     analyte_list[i], abundance[i], mdl_list[i], size_list[i], int(unitid_list[i]), \
                                     int(method_list[i]), int(labid_list[i]), check_sample[0])
-                        cur.commit()
                         analyte_id = analyte_id + 1
                         
             #The current sample is not in 'data_sample' table (which is to be updated)
             else:
-                sample_name = str(ws.cell(row = r, column = 1).value).replace(' ', '')
-                if sample_name == '':
-                    sample_name = 'NA'
-                    
-                sample_type = str(ws.cell(row = r, column = 3).value).replace(' ', '')
-                if sample_type == '':
-                    sample_type = 'NA'
-
-                depth = str(ws.cell(row = r, column = 4).value).replace(' ', '')
-                if depth == '':
-                    depth = 'NA'
-
-                duplicate = str(ws.cell(row = r, column = 5).value).replace(' ', '')
-                if duplicate == '':
-                    duplicate = 'NA'
-
-                borehole = str(ws.cell(row = r, column = 6).value).replace(' ', '')
-                if borehole == '':
-                    borehole = 'NA'
-                
-                core_top = str(ws.cell(row = r, column = 7).value).replace(' ', '')
-                if core_top == '':
-                    core_top = 'NA'
-
-                core_bottom = str(ws.cell(row = r, column = 8).value).replace(' ', '')
-                if core_bottom == '':
-                    core_bottom = 'NA'
-
-                azimuth = str(ws.cell(row = r, column = 9).value).replace(' ', '')
-                if azimuth == '':
-                    azimuth = 'NA'
-
-                dip = str(ws.cell(row = r, column = 10).value).replace(' ', '')
-                if dip == '':
-                    dip = 'NA'
-
-                drill_type = str(ws.cell(row = r, column = 11).value).replace(' ', '')
-                if drill_type == '':
-                    drill_type = 'NA'
-
-                material_type = str(ws.cell(row = r, column = 12).value)
-                if material_type == '':
-                    material_type = 'NA'
-
-                sample_desc = str(ws.cell(row = r, column = 13).value)
-                if sample_desc == '':
-                    sample_desc = 'NA'
-                    
-                x_coord = str(ws.cell(row = r, column = 14).value).replace(' ', '')
-                y_coord = str(ws.cell(row = r, column = 15).value).replace(' ', '')
-                
-                z_coord = str(ws.cell(row = r, column = 16).value).replace(' ', '')
-                if z_coord == '':
-                    z_coord = 'NA'
-                    
-                epsg_srid = str(ws.cell(row = r, column = 17).value).replace(' ', '')
-                coord_conf = str(ws.cell(row = r, column = 19).value).replace(' ', '').upper()
-                
                 #Assemble a row of values to be written to 'data_sample' table
-                sample_values = [sample_id, sample_code, sample_name, sample_type, depth, duplicate, borehole,
-                                 core_top, core_bottom, azimuth, dip, drill_type, material_type,
-                                 sample_desc, x_coord, y_coord, z_coord, int(epsg_srid), coord_conf]
+                sample_values = [sample_id] + sample_values[:16] + [int(sample_values[16]), sample_values[17]]
 
                 #----------------------------- Add to the "data_sample" table ------------------------------------------
                 cur.execute("""insert into data_sample values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                                sample_values)
-                cur.commit()
                 #----------------------------- Add to the "data_analyte" table -----------------------------------------
                 for a in range(len(analyte_list)):
                     if (abundance[a] <> '') and (abundance[a] <> 'None'):
                         analyte_values = [analyte_id, analyte_list[a], abundance[a], mdl_list[a], size_list[a],
                                           int(unitid_list[a]), int(method_list[a]), int(labid_list[a]), sample_id]
                         cur.execute("""insert into data_analyte values (?, ?, ?, ?, ?, ?, ?, ?, ?)""", analyte_values)
-                        cur.commit()
                         analyte_id = analyte_id + 1
                 #---------------------------------- Update 'data_publish' table ----------------------------------------
                 cur.execute("""select count(*) from data_publish where (sample_id = ?) and (pub_issue = ?)""",
@@ -274,11 +572,24 @@ def main():
                 rec_count = cur.fetchone()
                 if rec_count[0] == 0:
                     cur.execute("""insert into data_publish values (?, ?, ?)""", pub_id, pub_issue, sample_id)
-                    cur.commit()
                     pub_id = pub_id + 1
 
                 sample_id = sample_id + 1
+
+            #Commit the row together with its checkpoint in the load manifest
+            manifest.checkpoint(xls_file, rows_loaded + r + 1, {'sample_id': sample_id, 'analyte_id': analyte_id,
+                                                               'pub_id': pub_id})
+            cur.commit()
+
+        #Locations of the new samples, committed with the end of the file (see Additional info 13)
+        sample_geo.refresh(cur, nts_mapsheet, [first_sample_id, sample_id])
+        sample_index.update(cur, [first_sample_id, sample_id])
+        manifest.finish(xls_file)
+
+    if merge_mode:
+        load_merge.drop_stage_tables(cur, STAGE_TABLES)
             
+    qprofile.report(qprofile_file)
     db_conn.close() 
     print 'Job done!'
     
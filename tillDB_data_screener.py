@@ -6,24 +6,34 @@
    
    Input
          1) Path to the directory where the staged xlsx files reside
-         2) tillDB Database path
+         2) tillDB Database path (MS Access, or SQLite stand-in, see storage_backend.py)
          3) Some hardcoded parameteres 
          
    Output
          Display identified problems
 
    Operation note
-         1) The script has many independent code-blocks targeting different types of errors as listed
-            below. Though each code-block can be executed randomly, it is strongly recommended to
-            run them sequentially in the given order, one at a time. For example, it should start with
-            checking format related problems in the xlsx files by commenting out all other code-blocks
-            which are for checking other types of errors. Once the format-related errors are identified
-            and fixed, the format-checking code-block should be commented out and then move on to the
-            "analyte name checking block" ...
+         1) The script has many independent checks targeting different types of errors as listed
+            below. Each check is an entry of the "checks" list in main(). Though each check can be
+            executed randomly, it is strongly recommended to run them sequentially in the given order,
+            one at a time. For example, it should start with checking format related problems in the
+            xlsx files by commenting out all other entries which are for checking other types of errors.
+            Once the format-related errors are identified and fixed, the format-checking entry should be
+            commented out and then move on to the "analyte name checking" entry ...
 
          2) Duplicate samples should be given different "sample_code". Re-published samples should
             have the same 'sample_code' across all publications. Sections 15 and 16 are designed to
             ensure if the above requirements are met.
+
+         3) The problems found are kept in a screening cache (see screening_cache.py). A re-run only
+            re-screens the files whose content changed and the checks whose rules or reference data
+            (code tables, hardcoded lists) changed. The problems of the rest are replayed from the cache.
+            Run the script with --rescreen to discard the cache and screen all files again.
+
+         4) Run the script with --profile to record the wall time, cells visited, database queries and
+            workbook loads of each check on each file (see screening_profiler.py). A summary table is
+            printed at the end of the run and all the records are saved to a JSON file next to the
+            screening cache.
             
     This script is able to check the following:
          1)  if format of staged xlsx files is correct;
@@ -79,8 +89,17 @@
   Last update
       2016-12-15
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, ogr, osr
+import os, sys, csv, ogr, osr, datetime
 from openpyxl import load_workbook
+import screener_runner, screening_cache, screening_profiler
+import query_profiler, storage_backend, reference_cache, sample_geo, datum_shift
+import numpy as np
+
+#Version of the rule set below. It is part of the screening cache key. The code of the checks and of the
+#helpers they call, and the reference data in "refs", are versioned by the cache itself (see
+#screening_cache.py), so bump it only for a change the cache can not see: a module-level constant read by a
+#check, a file read by a check outside "refs", or a library upgrade (openpyxl, pyproj) changing the results.
+RULESET_VERSION = '2017.2'
 
 # This function is to check if a given string can be converted to a decimal number
 # Syntax: is_number(string) return logic
@@ -104,6 +123,12 @@ def is_string(s):
 #Syntax: project2nad83(float, float, int) returns [nad83_long, nad83_lat]
 def project2nad83 (x_coord, y_coord, source_epsg):
 
+    #NAD27 coordinates are shifted with the NTv2 grid, as when the samples are loaded (see datum_shift.py)
+    if datum_shift.is_nad27(source_epsg):
+        [nad83_long, nad83_lat] = sample_geo.project2nad83(np.array([x_coord]), np.array([y_coord]),
+                                                           np.array([source_epsg]))
+        return [str(float(nad83_long[0])), str(float(nad83_lat[0]))]
+
     #Create a point geometry using the given coordinates
     point = ogr.Geometry(ogr.wkbPoint)
     point.AddPoint(x_coord, y_coord)
@@ -121,16 +146,292 @@ def project2nad83 (x_coord, y_coord, source_epsg):
     point.Transform(transform)
     
     return [str(point.GetX(0)), str(point.GetY(0))]
-    
-def main():   
+
+#============================================ Checks ==================================================
+#Each check examines the worksheet of one staged xlsx file and returns the problems found in it. A problem
+#is the text printed after the file name. See screener_runner.py.
+#Syntax: check_xxx(string, worksheet, dict) returns list
+
+#====================================== 1. Check xls file format ======================================
+def check_format(xls_file, ws, refs):
+    problems = list()
+    if (str(ws.cell(row = 7, column = 1).value)).lower() <> 'sample_name':
+        problems.append(': Wrong Sample_Name column header')
+    if (str(ws.cell(row = 7, column = 2).value)).lower() <> 'sample_code':
+        problems.append(': Wrong Sample_Code column header')
+    if (str(ws.cell(row = 7, column = 3).value)).lower() <> 'sample_type':
+        problems.append(': Wrong Sample_Name column header')
+    if (str(ws.cell(row = 7, column = 4).value)).lower() <> 'depth':
+        problems.append(': Wrong Depth column header')
+    if (str(ws.cell(row = 7, column = 5).value)).lower() <> 'duplicate':
+        problems.append(': Wrong Duplicate column header')
+    if (str(ws.cell(row = 7, column = 6).value)).lower() <> 'borehole':
+        problems.append(': Wrong Borehole column header')
+    if (str(ws.cell(row = 7, column = 7).value)).lower() <> 'core_top':
+        problems.append(': Wrong Core_Top column header')
+    if (str(ws.cell(row = 7, column = 8).value)).lower() <> 'core_bottom':
+        problems.append(': Wrong Core_Botton column header')
+    if (str(ws.cell(row = 7, column = 9).value)).lower() <> 'azimuth':
+        problems.append(': Wrong Azimuth column header')
+    if (str(ws.cell(row = 7, column = 10).value)).lower() <> 'dip':
+        problems.append(': Wrong Dip column header')
+    if (str(ws.cell(row = 7, column = 11).value)).lower() <> 'drill_type':
+        problems.append(': Wrong Drill_Type column header')
+    if (str(ws.cell(row = 7, column = 12).value)).lower() <> 'material_type':
+        problems.append(': Wrong Material_Type column header')
+    if (str(ws.cell(row = 7, column = 13).value)).lower() <> 'sample_desc':
+        problems.append(': Wrong Sample_Desc column header')
+    if (str(ws.cell(row = 7, column = 14).value)).lower() <> 'x-coord':
+        problems.append(': Wrong X-Coord column header')
+    if (str(ws.cell(row = 7, column = 15).value)).lower() <> 'y-coord':
+        problems.append(': Wrong Y-Coord column header')
+    if (str(ws.cell(row = 7, column = 16).value)).lower() <> 'z-coord':
+        problems.append(': Wrong Z-Coord column header')
+    if (str(ws.cell(row = 7, column = 17).value)).lower() <> 'epsg_srid':
+        problems.append(': Wrong EPSG_SRID column header')
+    if (str(ws.cell(row = 7, column = 18).value)).lower() <> 'pub_issue':
+        problems.append(': Wrong Pub_Issue column header')
+    if (str(ws.cell(row = 7, column = 19).value)).lower() <> 'coord_conf':
+        problems.append(': Wrong Coord_Conf column header')
+
+    if (str(ws.cell(row = 1, column = 19).value)).lower() <> 'analyte':
+        problems.append(': Wrong Analyte row header')
+    if (str(ws.cell(row = 2, column = 19).value)).lower() <> 'unit':
+        problems.append(': Wrong Unit row header')
+    if (str(ws.cell(row = 3, column = 19).value)).lower() <> 'd_limit':
+        problems.append(': Wrong D_Limit row header')
+    if (str(ws.cell(row = 4, column = 19).value)).lower() <> 'method_id':
+        problems.append(': Wrong Method_ID row header')
+    if (str(ws.cell(row = 5, column = 19).value)).lower() <> 'lab_id':
+        problems.append(': Wrong Lab_ID row header')
+    if (str(ws.cell(row = 6, column = 19).value)).lower() <> 'size_fraction':
+        problems.append(': Wrong Size_Fraction row header')
+    return problems
+
+#===================================== 2. Check analyte name =======================================
+def check_analyte_name(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        if str(ws.cell(row = 1, column = c).value) not in refs['element_list']:
+            problems.append(': ' + str(ws.cell(row = 1, column = c).value) + ' analyte not in DB')
+    return problems
+
+#=============================== 3. Verify analyte unit against database ===========================
+def check_unit(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        if str(ws.cell(row = 2, column = c).value) not in refs['unit_list']:
+            problems.append(': ' + str(ws.cell(row = 2, column = c).value) + ' unit not in DB')
+    return problems
+
+#==================================== 4. Check detection limit ======================================
+#Detection limit is not mandatory, which can be left blank.
+def check_detection_limit(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        dlimit_cell = str(ws.cell(row = 3, column = c).value)
+        analyte_cell = str(ws.cell(row = 1, column = c).value)
+        if (dlimit_cell == 'None') or dlimit_cell.isspace():
+            if analyte_cell not in refs['nolimit_list']:
+                problems.append(': ' + dlimit_cell + ' missing detection limit')
+    return problems
+
+#==================================== 5. Check method_id ======================================
+def check_method(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        if str(ws.cell(row = 4, column = c).value) not in refs['method_list']:
+            problems.append(': ' + str(ws.cell(row = 4, column = c).value) + ' not in DB')
+    return problems
+
+#==================================== 6. Check lab_id ======================================
+def check_lab(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        if str(ws.cell(row = 5, column = c).value) not in refs['lab_list']:
+            problems.append(': ' + str(ws.cell(row = 5, column = c).value) + ' not in DB')
+    return problems
+
+#==================================== 7. Check size_fraction ===================================
+def check_size_fraction(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        if (str(ws.cell(row = 6, column = c).value) == '') or (str(ws.cell(row = 6, column = c).value) == None):
+            problems.append(': blank size_fraction')
+    return problems
+
+#================= 8. Check duplicate columns (i.e. same analyte, method, and lab) =============
+# It should be noted that duplicate columns may exist. For example, an analyte was initally
+# and re-analyzed using the same method by the same lab and with the same size fration. This will
+# result in 2 columns for this analyte. Extra caution should be excersized when dealing with these
+# cases.
+def check_duplicate_column(xls_file, ws, refs):
+    problems = list()
+    work_analyte = []
+    work_method = []
+    work_lab = []
+    work_size = []
+    for c in range(20, ws.max_column + 1):
+        work_analyte.append(str(ws.cell(row = 1, column = c).value))
+        work_method.append(str(ws.cell(row = 4, column = c).value))
+        work_lab.append(str(ws.cell(row = 5, column = c).value))
+        work_size.append(str(ws.cell(row = 6, column = c).value))
+
+    temp_analyte = list(work_analyte)
+    for i in range(len(work_analyte)):
+        temp_analyte[i] = str(i)
+        if work_analyte[i] in temp_analyte:
+            indx = temp_analyte.index(work_analyte[i])
+            if (work_method[i] == work_method[indx]) and (work_lab[i] == work_lab[indx]) and \
+               (work_size[i] == work_size[indx]):
+                problems.append(': ' + work_analyte[i] + ' duplicate')
+    return problems
+
+#======================== 9. local Sample_Code problems (dupicate or blank) ========================
+def check_sample_code(xls_file, ws, refs):
+    problems = list()
+    work_list = list()
+    for r in range(8, ws.max_row + 1):
+        work_cell = str(ws.cell(row = r, column = 2).value)
+        if (work_cell == '') or (work_cell == ' ') or (work_cell == 'None'):
+            problems.append(': ' + work_cell + ' blank sample name')
+        elif  work_cell not in work_list:
+            work_list.append(work_cell)
+        else:
+            problems.append(': ' + work_cell + ' duplicate')
+    return problems
+
+#============================ 10. Check x_coord, y_coord, z_coord, and epsg_srid ==========================
+def check_coordinates(xls_file, ws, refs):
+    problems = list()
+    for r in range(8, ws.max_row + 1):
+
+        x_cell = str(ws.cell(row = r, column = 14).value).replace(' ', '')
+        if not is_number(x_cell):
+            problems.append(': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 14).value) + ' invalid x-coord')
+
+        y_cell = str(ws.cell(row = r, column = 15).value).replace(' ', '')
+        if not is_number(y_cell):
+            problems.append(': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 15).value) + ' invalid y-coord')
+
+        z_cell = str(ws.cell(row = r, column = 16).value).replace(' ', '')
+        if not ((z_cell == '') or (z_cell == 'None')):
+            if (not is_number(z_cell)):
+                problems.append(': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 16).value) + ' invalid z-coord')
+
+        epsg_cell = str(ws.cell(row = r, column = 17).value).replace(' ', '')
+        if not is_number(epsg_cell):
+            problems.append(': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 17).value) + ' invalid epsg_srid')
+    return problems
+
+#====================================== 11. Check pub_issue =======================================
+def check_pub_issue(xls_file, ws, refs):
+    problems = list()
+    for r in range(8, ws.max_row + 1):
+        work_cell = str(ws.cell(row = r, column = 18).value).replace(' ', '')
+        if work_cell <> xls_file[:-5]:
+            problems.append(': ' + work_cell + ' not match file name')
+    return problems
+
+#====================================== 12. Check coord_conf =====================================
+def check_coord_conf(xls_file, ws, refs):
+    problems = list()
+    for r in range(8, ws.max_row + 1):
+        work_cell = (str(ws.cell(row = r, column = 19).value).replace(' ', '')).lower()
+        if (work_cell <> 'l') and (work_cell <> 'm') and (work_cell <> 'h'):
+            problems.append(': ' + work_cell + ' invalid coord_conf')
+    return problems
+
+#===================================== 13. Check method-dependent unit =================================
+def check_dependent_unit(xls_file, ws, refs):
+    problems = list()
+    element_list = refs['element_list']
+    dependent_analyte = refs['dependent_analyte']
+    for c in range(20, ws.max_column + 1):
+        analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
+        unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
+        method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
+
+        right_unit = refs['standard_unit'][element_list.index(analyte_cell)]
+        check_code = refs['group_list'][refs['method_all'].index(method_cell)]
+        if analyte_cell in dependent_analyte:
+            if check_code == refs['dependent_method'][dependent_analyte.index(analyte_cell)]:
+                right_unit = refs['dependent_unit'][dependent_analyte.index(analyte_cell)]
+
+        if unit_cell <> right_unit:
+            problems.append(': ' + analyte_cell + ' ' + unit_cell + ' should be ' + right_unit)
+    return problems
+
+#======================================== 14. Check fixed analyte-method combo ====================================
+def check_fixed_method(xls_file, ws, refs):
+    problems = list()
+    fix_analyte = refs['fix_analyte']
+    for c in range(20, ws.max_column + 1):
+        analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
+        method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
+        if analyte_cell in fix_analyte:
+            right_method = refs['fix_method'][fix_analyte.index(analyte_cell)]
+            if method_cell <> right_method:
+                problems.append(': ' + analyte_cell + ' ' + method_cell + ' should be ' + right_method)
+    return problems
+
+#========================================== 15. Check analyte value =================================================
+def check_analyte_value(xls_file, ws, refs):
+    problems = list()
+    for c in range(20, ws.max_column + 1):
+        analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
+        unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
+
+        for r in range(8, ws.max_row + 1):
+            analyte_value = str(ws.cell(row = r, column = c).value)
+
+            if analyte_value == 'None':
+                continue
+            elif analyte_value == '0':
+                problems.append('->' + analyte_cell + ': ' + \
+                                analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value')
+            elif (not is_number(analyte_value)):
+                if (analyte_value[0] <> '>') and (analyte_value[0] <> '<'):
+                    problems.append('->' + analyte_cell + ': ' + \
+                                    analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value')
+            elif (unit_cell == '%') and (is_number(analyte_value)):
+                #Greater-than-100% value is not allowed if anayte unit is %
+                if (analyte_cell <> 'Total') and float(analyte_value) > 100.0:
+                    problems.append('->' + analyte_cell + ': ' + analyte_value + ' > 100%')
+
+    #Examine rows without any analytic values
+    for r in range(8, ws.max_row + 1):
+        val_count = 0
+        for c in range(20, ws.max_column + 1):
+            if is_number(str(ws.cell(row = r, column = c).value).replace(' ', '')):
+                val_count = val_count + 1
+        if val_count == 0:
+            problems.append(': Row = ' + str(r) + ' Blank row with any analytic values')
+    return problems
+
+def main(db_path = 'C:\\Project\\TillDB\\data\\tillDB_curr.accdb',
+         data_dir = 'C:\\Project\\TillDB\\data\\uploaded\\',
+         cache_file = 'C:\\Project\\TillDB\\data\\screening_cache_tillDB.pkl'):
     #File path
-    db_path = 'C:\\Project\\TillDB\\data\\tillDB_curr.accdb'
-    data_dir = 'C:\\Project\\TillDB\\data\\uploaded\\'
+    profile_file = 'C:\\Project\\TillDB\\data\\screening_profile_tillDB_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
+    qprofile_file = 'C:\\Project\\TillDB\\data\\query_profile_tillDB_data_screener_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
 
     #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
+    db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('tillDB_data_screener', '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Record the time, cells, queries and workbook loads of each check (see Operation note 4)
+    profile = None
+    if '--profile' in sys.argv[1:]:
+        profile = screening_profiler.ScreeningProfile('tillDB_data_screener')
+        cur = profile.cursor(cur)
+
     #Standard list of analyte elements (provided by Alexei).
     element_list = ['Si','Al','Ca','Fe','K','Mg','Na','P','S(T)','SO3','CO2','Sn','Sr','SiO2',\
                     'TiO2', 'Al2O3','Fe2O3(T)','FeO(T)','FeO','MnO','MgO','CaO','Na2O','K2O','P2O5',\
@@ -171,366 +472,66 @@ def main():
     
     #Collect year sub-directories under given "data_dir" 
     xls_list = os.listdir(data_dir)
-    #====================================== 1. Check xls file format ======================================
-    print '1. Examine file format ...'
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-        if (str(ws.cell(row = 7, column = 1).value)).lower() <> 'sample_name':
-            print '    ' + xls_name + ': Wrong Sample_Name column header'
-        if (str(ws.cell(row = 7, column = 2).value)).lower() <> 'sample_code':
-            print '    ' + xls_name + ': Wrong Sample_Code column header'
-        if (str(ws.cell(row = 7, column = 3).value)).lower() <> 'sample_type':
-            print '    ' + xls_name + ': Wrong Sample_Name column header'
-        if (str(ws.cell(row = 7, column = 4).value)).lower() <> 'depth':
-            print '    ' + xls_name + ': Wrong Depth column header'
-        if (str(ws.cell(row = 7, column = 5).value)).lower() <> 'duplicate':
-            print '    ' + xls_name + ': Wrong Duplicate column header'
-        if (str(ws.cell(row = 7, column = 6).value)).lower() <> 'borehole':
-            print '    ' + xls_name + ': Wrong Borehole column header'
-        if (str(ws.cell(row = 7, column = 7).value)).lower() <> 'core_top':
-            print '    ' + xls_name + ': Wrong Core_Top column header'
-        if (str(ws.cell(row = 7, column = 8).value)).lower() <> 'core_bottom':
-            print '    ' + xls_name + ': Wrong Core_Botton column header'
-        if (str(ws.cell(row = 7, column = 9).value)).lower() <> 'azimuth':
-            print '    ' + xls_name + ': Wrong Azimuth column header'
-        if (str(ws.cell(row = 7, column = 10).value)).lower() <> 'dip':
-            print '    ' + xls_name + ': Wrong Dip column header'
-        if (str(ws.cell(row = 7, column = 11).value)).lower() <> 'drill_type':
-            print '    ' + xls_name + ': Wrong Drill_Type column header'
-        if (str(ws.cell(row = 7, column = 12).value)).lower() <> 'material_type':
-            print '    ' + xls_name + ': Wrong Material_Type column header'
-        if (str(ws.cell(row = 7, column = 13).value)).lower() <> 'sample_desc':
-            print '    ' + xls_name + ': Wrong Sample_Desc column header'
-        if (str(ws.cell(row = 7, column = 14).value)).lower() <> 'x-coord':
-            print '    ' + xls_name + ': Wrong X-Coord column header'
-        if (str(ws.cell(row = 7, column = 15).value)).lower() <> 'y-coord':
-            print '    ' + xls_name + ': Wrong Y-Coord column header'
-        if (str(ws.cell(row = 7, column = 16).value)).lower() <> 'z-coord':
-            print '    ' + xls_name + ': Wrong Z-Coord column header'
-        if (str(ws.cell(row = 7, column = 17).value)).lower() <> 'epsg_srid':
-            print '    ' + xls_name + ': Wrong EPSG_SRID column header'
-        if (str(ws.cell(row = 7, column = 18).value)).lower() <> 'pub_issue':
-            print '    ' + xls_name + ': Wrong Pub_Issue column header'
-        if (str(ws.cell(row = 7, column = 19).value)).lower() <> 'coord_conf':
-            print '    ' + xls_name + ': Wrong Coord_Conf column header'
-                
-        if (str(ws.cell(row = 1, column = 19).value)).lower() <> 'analyte':
-            print '    ' + xls_name + ': Wrong Analyte row header'
-        if (str(ws.cell(row = 2, column = 19).value)).lower() <> 'unit':
-            print '    ' + xls_name + ': Wrong Unit row header'
-        if (str(ws.cell(row = 3, column = 19).value)).lower() <> 'd_limit':
-            print '    ' + xls_name + ': Wrong D_Limit row header'
-        if (str(ws.cell(row = 4, column = 19).value)).lower() <> 'method_id':
-            print '    ' + xls_name + ': Wrong Method_ID row header'
-        if (str(ws.cell(row = 5, column = 19).value)).lower() <> 'lab_id':
-            print '    ' + xls_name + ': Wrong Lab_ID row header'
-        if (str(ws.cell(row = 6, column = 19).value)).lower() <> 'size_fraction':
-            print '    ' + xls_name + ': Wrong Size_Fraction row header' 
-    #===================================== 2. Check analyte name =======================================
-    print '\n2. Examine analyte names ...'
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            if str(ws.cell(row = 1, column = c).value) not in element_list:
-                print '    ' + xls_name + ': ' + str(ws.cell(row = 1, column = c).value) + ' analyte not in DB' 
-    #=============================== 3. Verify analyte unit against database ===========================
-    print '\n3. Examine unit name ...'
-    unit_list = list()  #Build a list of unit name using current database values
-    cur.execute("""select name from code_unit""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        unit_list.append(str(val_rows[i][0]))
-    unit_list.pop(0)    #Remove 1st item: 'unknown'
-
-    #Loop through xls file
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            if str(ws.cell(row = 2, column = c).value) not in unit_list:
-                print '    ' + xls_name + ': ' + str(ws.cell(row = 2, column = c).value) + ' unit not in DB' 
-    #==================================== 4. Check detection limit ======================================
-    #Detection limit is not mandatory, which can be left blank.
-    #Loop through xls files
-    print '\n4. Examine detection limit ...'
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            dlimit_cell = str(ws.cell(row = 3, column = c).value)
-            analyte_cell = str(ws.cell(row = 1, column = c).value)
-            if (dlimit_cell == 'None') or dlimit_cell.isspace():
-                if analyte_cell not in nolimit_list:
-                    print '    ' + xls_name + ': ' + dlimit_cell + ' missing detection limit' 
-    #==================================== 5. Check method_id ======================================
-    print '\n5. Examine method_id ...'
-    method_list = list()   #Build a list of method_id using current database values
-    cur.execute("""select method_id from code_method""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        method_list.append(str(val_rows[i][0]))
-    method_list.pop(0)     #Remove 1st item: 'unknown'
-       
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            if str(ws.cell(row = 4, column = c).value) not in method_list:
-                print '    ' + xls_name + ': ' + str(ws.cell(row = 4, column = c).value) + ' not in DB' 
-    #==================================== 6. Check lab_id ======================================
-    print '\n6. Examine lab_id ...'
-    lab_list = list()  #Build a list of lab using current database values
-    cur.execute("""select lab_id from code_lab""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        lab_list.append(str(val_rows[i][0]))
-    
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            if str(ws.cell(row = 5, column = c).value) not in lab_list:
-                print '    ' + xls_name + ': ' + str(ws.cell(row = 5, column = c).value) + ' not in DB' 
-    #==================================== 7. Check size_fraction ===================================
-    print '\n7. Examine size_fraction ...'
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            if (str(ws.cell(row = 6, column = c).value) == '') or (str(ws.cell(row = 6, column = c).value) == None):
-                print '    ' + xls_name + ': blank size_fraction' 
-    #================= 8. Check duplicate columns (i.e. same analyte, method, and lab) =============
-    # It should be noted that duplicate columns may exist. For example, an analyte was initally
-    # and re-analyzed using the same method by the same lab and with the same size fration. This will
-    # result in 2 columns for this analyte. Extra caution should be excersized when dealing with these
-    # cases.
-    print '\n8. Examine duplicate comlumns within each xls file ...'    
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
 
-        work_analyte = []
-        work_method = []
-        work_lab = []
-        work_size = []
-        for c in range(20, ws.max_column + 1):
-            work_analyte.append(str(ws.cell(row = 1, column = c).value))
-            work_method.append(str(ws.cell(row = 4, column = c).value))
-            work_lab.append(str(ws.cell(row = 5, column = c).value))
-            work_size.append(str(ws.cell(row = 6, column = c).value))
-
-        temp_analyte = list(work_analyte)
-        for i in range(len(work_analyte)):
-            temp_analyte[i] = str(i)
-            if work_analyte[i] in temp_analyte:
-                indx = temp_analyte.index(work_analyte[i])
-                if (work_method[i] == work_method[indx]) and (work_lab[i] == work_lab[indx]) and \
-                   (work_size[i] == work_size[indx]):
-                    print '    ' + xls_name + ': ' + work_analyte[i] + ' duplicate' 
-    #======================== 9. local Sample_Code problems (dupicate or blank) ========================
-    print '\n9. Examine duplicate or blank Sample_Code within each xls file ...'
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        work_list = list()
-        for r in range(8, ws.max_row + 1):
-            work_cell = str(ws.cell(row = r, column = 2).value)
-            if (work_cell == '') or (work_cell == ' ') or (work_cell == 'None'):
-                print '    ' + xls_name + ': ' + work_cell + ' blank sample name' 
-            elif  work_cell not in work_list:
-                work_list.append(work_cell)
-            else:
-                print '    ' + xls_name + ': ' + work_cell + ' duplicate' 
-    #============================ 10. Check x_coord, y_coord, z_coord, and epsg_srid ==========================
-    print '\n10.Examine x-coord, y-coord, z-coord and epsg_srid ...'
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-
-        for r in range(8, ws.max_row + 1):
-            
-            x_cell = str(ws.cell(row = r, column = 14).value).replace(' ', '')
-            if not is_number(x_cell):
-                print '    ' + xls_name + ': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 14).value) + ' invalid x-coord'
-
-            y_cell = str(ws.cell(row = r, column = 15).value).replace(' ', '')
-            if not is_number(y_cell):
-                print '    ' + xls_name + ': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 15).value) + ' invalid y-coord'
-
-            z_cell = str(ws.cell(row = r, column = 16).value).replace(' ', '')
-            if not ((z_cell == '') or (z_cell == 'None')):
-                if (not is_number(z_cell)):
-                    print '    ' + xls_name + ': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 16).value) + ' invalid z-coord'
-            
-            epsg_cell = str(ws.cell(row = r, column = 17).value).replace(' ', '')
-            if not is_number(epsg_cell):
-                print '    ' + xls_name + ': Row = ' + str(r) + ' ' + str(ws.cell(row = r, column = 17).value) + ' invalid epsg_srid' 
-    #====================================== 11. Check pub_issue =======================================
-    print '\n11.Examine pub_issue ...'
-    #Loop through xls files
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
+    #------------------------------- Reference data from the database ----------------------------------
+    qprofile.set_stage('reference data')
+    if profile is not None:
+        profile.start_stage('reference data')
+    refcache = reference_cache.ReferenceCache(db_path)    #Code tables kept in memory (see reference_cache.py)
+    refcache.load(cur, ['code_unit', 'code_method', 'code_lab'])
 
-        for r in range(8, ws.max_row + 1):
-            work_cell = str(ws.cell(row = r, column = 18).value).replace(' ', '')
-            if work_cell <> xls_list[f][:-5]:
-                print '    ' + xls_name + ': ' + work_cell + ' not match file name' 
-    #====================================== 12. Check coord_conf =====================================
-    print '\n12.Examine Coord_Conf ...'
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
+    #Build a list of unit name using current database values
+    unit_list = [str(name) for name in refcache.column('code_unit', 'name')]
+    unit_list.pop(0)    #Remove 1st item: 'unknown'
 
-        for r in range(8, ws.max_row + 1):
-            work_cell = (str(ws.cell(row = r, column = 19).value).replace(' ', '')).lower()
-            if (work_cell <> 'l') and (work_cell <> 'm') and (work_cell <> 'h'):
-                print '    ' + xls_name + ': ' + work_cell + ' invalid coord_conf' 
-    #===================================== 13. Check method-dependent unit =================================
-    print '\n13.Examine method-dependent analyte unit ...'
-    method_list = list()    #Build a list of method_id using current database values
-    cur.execute("""select method_id from code_method""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        method_list.append(str(val_rows[i][0]))
-    
-    group_list = list()     #Build a list of method_group using current database values
-    cur.execute("""select method_group from code_method""")
-    val_rows = cur.fetchall()
-    for i in range(len(val_rows)):
-        group_list.append(str(val_rows[i][0]))
+    #Build lists of method_id and method_group using current database values
+    method_all = [str(method_id) for method_id in refcache.column('code_method', 'method_id')]
+    group_list = [str(method_group) for method_group in refcache.column('code_method', 'method_group')]
+    method_list = method_all[1:]    #Remove 1st item: 'unknown'
+
+    #Build a list of lab using current database values
+    lab_list = [str(lab_id) for lab_id in refcache.column('code_lab', 'lab_id')]
+
+    refs = {'element_list': element_list, 'standard_unit': standard_unit, 'dependent_analyte': dependent_analyte,
+            'dependent_method': dependent_method, 'dependent_unit': dependent_unit, 'nolimit_list': nolimit_list,
+            'fix_analyte': fix_analyte, 'fix_method': fix_method, 'unit_list': unit_list, 'method_all': method_all,
+            'method_list': method_list, 'group_list': group_list, 'lab_list': lab_list}
+
+    #------------------------------------------- Checks ------------------------------------------------
+    #Comment out entries to skip checks (see Operation note 1)
+    checks = [['1. Examine file format ...', check_format, []],
+              ['\n2. Examine analyte names ...', check_analyte_name, ['element_list']],
+              ['\n3. Examine unit name ...', check_unit, ['unit_list']],
+              ['\n4. Examine detection limit ...', check_detection_limit, ['nolimit_list']],
+              ['\n5. Examine method_id ...', check_method, ['method_list']],
+              ['\n6. Examine lab_id ...', check_lab, ['lab_list']],
+              ['\n7. Examine size_fraction ...', check_size_fraction, []],
+              ['\n8. Examine duplicate comlumns within each xls file ...', check_duplicate_column, []],
+              ['\n9. Examine duplicate or blank Sample_Code within each xls file ...', check_sample_code, []],
+              ['\n10.Examine x-coord, y-coord, z-coord and epsg_srid ...', check_coordinates, []],
+              ['\n11.Examine pub_issue ...', check_pub_issue, []],
+              ['\n12.Examine Coord_Conf ...', check_coord_conf, []],
+              ['\n13.Examine method-dependent analyte unit ...', check_dependent_unit,
+               ['element_list', 'standard_unit', 'dependent_analyte', 'dependent_method', 'dependent_unit',
+                'method_all', 'group_list']],
+              ['\n14.Examine fixed analyte-method combo ...', check_fixed_method, ['fix_analyte', 'fix_method']],
+              ['\n15.Examine analyte values ...', check_analyte_value, []]]
+
+    #Problems are printed after the file name
+    def report(xls_file, problem):
+        print '    ' + data_dir + xls_file + problem
+
+    #Replay the problems of unchanged files from the screening cache (see Operation note 3)
+    if profile is not None:
+        profile.start_stage('screening cache')
+    cache = screening_cache.ScreeningCache(cache_file, RULESET_VERSION, screening_cache.get_ref_versions(refs),
+                                           '--rescreen' in sys.argv[1:])
+
+    screener_runner.run_checks(data_dir, xls_list, checks, refs, report, cache, profile = profile)
+    if profile is not None:
+        profile.print_summary()
+        profile.save_json(profile_file)
 
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
-            unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
-            method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
-
-            right_unit = standard_unit[element_list.index(analyte_cell)]
-            check_code = group_list[method_list.index(method_cell)]
-            if analyte_cell in dependent_analyte:
-                if check_code == dependent_method[dependent_analyte.index(analyte_cell)]:
-                    right_unit = dependent_unit[dependent_analyte.index(analyte_cell)]
-                        
-            if unit_cell <> right_unit:
-                print '    ' + xls_name + ': ' + analyte_cell + ' ' + unit_cell + ' should be ' + right_unit 
-    #======================================== 14. Check fixed analyte-method combo ====================================
-    print '\n14.Examine fixed analyte-method combo ...'
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
-            method_cell = str(ws.cell(row = 4, column = c).value).replace(' ', '')
-            if analyte_cell in fix_analyte:
-                right_method = fix_method[fix_analyte.index(analyte_cell)]
-                if method_cell <> right_method:
-                    print '    ' + xls_name + ': ' + analyte_cell + ' ' + method_cell + ' should be ' + right_method 
-    #========================================== 15. Check analyte value =================================================
-    print '\n15.Examine analyte values ...'
-    #Loop through xls file under year directory
-    for f in range(len(xls_list)):
-        xls_name = data_dir + xls_list[f]
-            
-        #Open and exam each xls file
-        wb = load_workbook(filename = xls_name)
-        ws = wb[wb.sheetnames[0]]
-            
-        for c in range(20, ws.max_column + 1):
-            analyte_cell = str(ws.cell(row = 1, column = c).value).replace(' ', '')
-            unit_cell = str(ws.cell(row = 2, column = c).value).replace(' ', '')
-
-            for r in range(8, ws.max_row + 1):
-                analyte_value = str(ws.cell(row = r, column = c).value)
-                
-                if analyte_value == 'None':
-                    continue
-                elif analyte_value == '0':
-                    print '    ' + xls_name + '->' + analyte_cell + ': ' + \
-                            analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value'
-                elif (not is_number(analyte_value)):
-                    if (analyte_value[0] <> '>') and (analyte_value[0] <> '<'):
-                        print '    ' + xls_name + '->' + analyte_cell + ': ' + \
-                        analyte_value + '(' + str(r) + ',' + str(c) + ') wrong analyte value'
-                elif (unit_cell == '%') and (is_number(analyte_value)):
-                    #Greater-than-100% value is not allowed if anayte unit is % 
-                    if (analyte_cell <> 'Total') and float(analyte_value) > 100.0:
-                        print '    ' + xls_name + '->' + analyte_cell + ': ' + analyte_value + ' > 100%'
-
-        #Examine rows without any analytic values
-        for r in range(8, ws.max_row + 1):
-            val_count = 0
-            for c in range(20, ws.max_column + 1):
-                if is_number(str(ws.cell(row = r, column = c).value).replace(' ', '')):
-                    val_count = val_count + 1
-            if val_count == 0:
-                print '    ' + xls_name + ': Row = ' + str(r) + ' Blank row with any analytic values' 
     #================== 16. Check global duplicate samples among the xlsx files being screened =============
     '''print '\n16.Examine duplicate samples among those in the xlsx files  ...' 
     #Looking for samples which are closely located; having similar sample names, and in different publications
@@ -627,24 +628,19 @@ def main():
             xls_pub.append(cell_pub)
             xls_file.append(xls_name)
             
-    #Collect data in database
+    #Collect data in database (NAD83 locations from 'data_sample_geo', see sample_geo.py)
     db_sample = list()  #Build a list for sample_code in database
-    db_xc = list()      #Build a list for x_coord in database
-    db_yc = list()      #Build a list for y_coord in database
-    db_epsg = list()    #Build a list for EPSG_SRID in database
+    db_xc = list()      #Build a list for NAD83 long. in database
+    db_yc = list()      #Build a list for NAD83 lat. in database
 
-    cur.execute("""select sample_code, x_coord, y_coord, EPSG_SRID from data_sample""")
+    geo = sample_geo.read_geo(cur)
+    cur.execute("""select sample_id, sample_code from data_sample""")
     val_rows = cur.fetchall()
     for i in range(len(val_rows)):
-        db_sample.append(val_rows[i][0])
-        
-        if str(val_rows[i][3]) <> '4269': #NAD83 geographic
-            [cell_xc, cell_yc] = project2nad83 (float(val_rows[i][1]), float(val_rows[i][2]), int(val_rows[i][3]))
-            db_xc.append(cell_xc)
-            db_yc.append(cell_yc)
-        else:
-            db_xc.append(float(val_rows[i][1]))
-            db_yc.append(float(val_rows[i][2]))
+        if val_rows[i][0] in geo:
+            db_sample.append(val_rows[i][1])
+            db_xc.append(geo[val_rows[i][0]][0])
+            db_yc.append(geo[val_rows[i][0]][1])
         
     #Compare each sample in the xls files with those in the database
     for i in range(len(xls_sample)):
@@ -677,6 +673,7 @@ def main():
             if (pos_match == 1) and (name_match == 1):
                 print '    Duplicate samples: ' + 'DB - ' + db_sample[j] + ' -> ' + xls_file[i] + '-' + xls_sample[i] '''
     
+    qprofile.report(qprofile_file)
     db_conn.close()
     print '\nJob done.' 
     
@@ -4,7 +4,7 @@
   This product is preferred for conducting geochem data QA/QC and analysis.
 
   Input
-         1) TillDB path
+         1) TillDB path (MS Access, or SQLite stand-in, see storage_backend.py)
          2) Output file path
          3) BCGS mapsheet path
            
@@ -15,9 +15,10 @@
   Additonal info
          1) The structure of "data_sheet.csv" is the similar to the one derived from the lithoDB.
          
-         2) Sub-routine "get_ntssheet" is for NTS 50k map grid tag retrieval based on the given sample
-            location and NTS map grid shape file. Both of them are assumed using the same
-            spatial reference system: NAD83 geographic (EPSG code = 4269).
+         2) The NAD83 geographic and UTM coordinates and the NTS 50k map grid tag of the samples are read
+            from the 'data_sample_geo' table, filled by the data loader (see sample_geo.py). Only the
+            samples missing from it, or whose coordinates were edited since, are computed, in batches. The
+            NTS map grid shape file is assumed in NAD83 geographic (EPSG code = 4269).
             
          3) Pyproj replaces OGR/OSR for coordinate re-projecting, because the later does not address
             datum shift during re-projection. 
@@ -42,6 +43,29 @@
             (analyzed by the same method). This caused 2 columns: "Au_ppb_MA" and "Au1_ppb_MA" being
             created in the data product file. So these all columns of this type in the data product file
             should be examined mannually.
+
+         7) The UTM coordinates are in the zone of each sample (NAD83 UTM zones 1 to 23). Run with
+            --utm-zone=N to project all the samples to zone N instead, e.g. for a map across two zones.
+
+         8) Run with --bbox=west,south,east,north (NAD83 long. and lat.) to create the data product of the
+            samples in a bounding box only, found with the grid spatial index of the samples (see
+            sample_index.py).
+
+         9) Run with --join=<shape file>,<field>[,<field>...] to add the values of the given attribute fields
+            of the polygon holding each sample (e.g. mineral tenure, geology unit), after the UTM columns.
+            The shape file is read once and the samples are joined in bulk (see spatial_join.py). Repeat
+            the option to join several shape files.
+
+        10) Run with --export=gpkg,fgb to also write the data product to GeoPackage ('data_sheet.gpkg', with
+            an R-tree spatial index) and/or FlatGeobuf ('data_sheet.fgb', with a packed Hilbert R-tree),
+            as NAD83 points, so that it opens in desktop GIS without conversion. The csv file is streamed
+            and the features are written in chunks (see product_export.py).
+
+        11) Run with --tiles=<column>[,<column>...] to also build vector tiles of the samples for the web
+            map ('data_sheet.mbtiles', MBTiles), with the values of the given columns (e.g. key analytes)
+            as attributes, or with --tiles for the locations only. The samples are thinned at low zoom
+            levels. On the next run, only the tiles of the samples added, changed or removed are built
+            again, all of them if the run has another --bbox (see product_tiles.py).
           
   Status
          Operational
@@ -52,106 +76,83 @@
   Future improvement
          1) The hardcoded maximum number of repeated headers (mentioned above) should be removed.
   +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'''
-import os, sys, csv, pyodbc, re, ogr, osr
-from pyproj import Proj, transform
+import os, sys, csv, re, datetime
+import query_profiler, storage_backend, reference_cache, sample_geo, sample_index, spatial_join, product_export, product_tiles
 #========================================== Sub-routines =======================================
-#Get an attribute value from a given table based on a given key attribute
-#Syntax: get_name(db_cursor, string, string, string, int) return string
-def get_name(db_cur, fld_name, tab_name, key_name, key_val):
-    db_cur.execute('select %s from %s where %s = %s' %(fld_name, tab_name, key_name, key_val))
-    record = db_cur.fetchone()
-    if record == None:
+#Get an attribute value from a given code table based on a given key attribute (see reference_cache.py)
+#Syntax: get_name(ReferenceCache, string, string, string, int) return string
+def get_name(refcache, fld_name, tab_name, key_name, key_val):
+    values = refcache.lookup(tab_name, key_name, fld_name)
+    if key_val not in values:
         print 'No such ' + key_name + ' exists in ' + tab_name + ' table!'
         sys.exit()
     else:
-        return record[0]
-
-#Project input coordinates to NAD83 long. and lat.
-#Syntax: project2nad83(float, float, int) returns [float, float]
-def project2nad83 (source_x, source_y, source_epsg):
-
-    if source_epsg == 4269: #Already in NAD83 and no projection needed
-        return [source_x, source_y]
-    
-    else:
-        source_epsg = "+init=EPSG:" + str(source_epsg)
-        source_srf = Proj(source_epsg)
-        target_srf = Proj("+init=EPSG:4269")
+        return values[key_val]
 
-        target_x, target_y = transform(source_srf, target_srf, source_x, source_y)
-        
-        return [target_x, target_y]
-
-#Project a pair of NAD83 long. and lat. to NAD83_UTM coordinates
-#Syntax: project2utm(float, float) returns [int, int, int]
-def project2utm (nad83_long, nad83_lat):
-
-    #Determine UTM zone
-    utm_zone = 0
-    epsg_id = 0
-    if (nad83_long >= -144) and (nad83_long <= -138):
-        utm_zone = 7
-        epsg_id = 26907
-    elif (nad83_long >= -138) and (nad83_long <= -132):
-        utm_zone = 8
-        epsg_id = 26908
-    elif (nad83_long >= -132) and (nad83_long <= -126):
-        utm_zone = 9
-        epsg_id = 26909
-    elif (nad83_long >= -126) and (nad83_long <= -120):
-        utm_zone = 10
-        epsg_id = 26910
-    elif (nad83_long >= -120) and (nad83_long <= -114):
-        utm_zone = 11
-        epsg_id = 26911
-    
-    if (utm_zone == 0) or (epsg_id == 0):
-        return [-1, -1, -1]
-    else:
-        source_srf = Proj("+init=EPSG:4269")
-        target_epsg = "+init=EPSG:" + str(epsg_id)
-        target_srf = Proj(target_epsg)
-
-        target_x, target_y = transform(source_srf, target_srf, nad83_long, nad83_lat)
-
-        return [int(target_x), int(target_y), utm_zone]
-    
-#Get NTS 50k mapsheet based on the given lat and long
-#Syntax: get_ntssheet(str, float, float) return str
-def get_ntssheet(mapsheet_file, nad83_long, nad83_lat):    
-    driver = ogr.GetDriverByName("ESRI Shapefile")
-    dataSource = driver.Open(mapsheet_file, 0)
-    layer = dataSource.GetLayer()
-    for feature in layer:
-        geom = feature.GetGeometryRef()
-        bbox = geom.GetEnvelope()
-        sheet_tag = feature.GetField("map_tile")
-        if ((nad83_long >= bbox[0]) and (nad83_long < bbox[1]) and \
-            (nad83_lat >= bbox[2]) and (nad83_lat < bbox[3])):
-            return sheet_tag
-    return ' ' #indicating boundary fall (out of provincial boudary)
 #========================================================================================================
-def main():
+def main(db_path = 'C:\\Project\\TillDB\data\\tillDB_curr.accdb',
+         data_sheet = 'C:\\Project\\TillDB\\data\\data_sheet.csv',
+         nts_mapsheet = 'C:\\Project\\ProvinceData\\topo_data\\nts_50k\\grid_50k_nts_ll83_poly.shp'):
     #Input info
-    db_path = 'C:\\Project\\TillDB\data\\tillDB_curr.accdb'
-    data_sheet = 'C:\\Project\\TillDB\\data\\data_sheet.csv'
-    nts_mapsheet = 'C:\\Project\\ProvinceData\\topo_data\\nts_50k\\grid_50k_nts_ll83_poly.shp'
+    qprofile_file = 'C:\\Project\\TillDB\\data\\query_profile_tillDB_product_creator_' + \
+        datetime.datetime.now().strftime("%Y_%m_%d_%H_%M") + '.json'
     
     #Database connection
-    db_conn = pyodbc.connect('Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ='+db_path)
+    db_conn = storage_backend.connect(db_path)
     cur = db_conn.cursor()
 
+    #Record the database round trips of each stage (run with --query-profile, see query_profiler.py)
+    qprofile = query_profiler.QueryProfile('tillDB_product_creator', '--query-profile' in sys.argv[1:])
+    cur = qprofile.cursor(cur)
+
+    #Code tables are looked up in memory (see reference_cache.py)
+    qprofile.set_stage('reference data')
+    refcache = reference_cache.ReferenceCache(db_path)
+    refcache.load(cur, ['code_unit', 'code_method'])
+
     csv_output = open(data_sheet, 'wb')
     csv_writer = csv.writer(csv_output, delimiter = ',')
     
+    #Derived sample locations, the stale ones computed first, optionally in a single UTM zone (see
+    #Additional info 2 and 7)
+    qprofile.set_stage('sample locations')
+    geo = sample_geo.read_geo(cur, nts_mapsheet)
+    for arg in sys.argv[1:]:
+        if arg.startswith('--utm-zone='):
+            geo = sample_geo.force_utm_zone(geo, int(arg.partition('=')[2]))
+
     #Get all "sample_id"s from 'data_sample' table
+    qprofile.set_stage('sample list')
     sample_list = []
     cur.execute("""select sample_id from data_sample order by sample_id""")
     all_records = cur.fetchall()
     for record in all_records:
         sample_list.append(record[0])
+
+    #Keep the samples in a bounding box only (run with --bbox=west,south,east,north, see Additional info 8)
+    bbox = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--bbox='):
+            sample_index.create_table(cur)
+            sample_index.update(cur)
+            cur.commit()
+            [west, south, east, north] = [float(val) for val in arg.partition('=')[2].split(',')]
+            bbox = [west, south, east, north]
+            subset = set(sample_index.SampleIndex(cur).bbox(west, south, east, north))
+            sample_list = [sample for sample in sample_list if sample in subset]
+            print str(len(sample_list)) + ' sample(s) in the bounding box'
+
+    #Attributes of the polygons holding the samples (run with --join=<shape file>,<field>[,<field>...], see
+    #Additional info 9)
+    qprofile.set_stage('spatial join')
+    join_headers = list()
+    join_args = spatial_join.get_join_args(sys.argv[1:])
+    if join_args:
+        [join_headers, joined] = spatial_join.join_samples(dict([[sample, geo[sample]] for sample in sample_list]),
+                                                           join_args)
     #+++++++++++++++++++++++++++++++++ Construct "data_sheet.csv" header ++++++++++++++++++++++++++
     print 'Creating header row ...'
+    qprofile.set_stage('header row')
     #Working variale to store the maximum number of publications related to a single sample
     max_issue = 0
 
@@ -171,10 +172,10 @@ def main():
             size_frac = str(record[1])
             
             method_id = record[2]
-            method_group = get_name(cur, 'method_group', 'code_method', 'method_id', method_id)
+            method_group = get_name(refcache, 'method_group', 'code_method', 'method_id', method_id)
 
             unit_id = record[3]
-            unit_name = get_name(cur, 'name', 'code_unit', 'unit_id', unit_id)
+            unit_name = get_name(refcache, 'name', 'code_unit', 'unit_id', unit_id)
 
             item = analyte + '_' + method_group + '_' + unit_name + '_' + size_frac
 
@@ -221,6 +222,11 @@ def main():
     file_header.insert(19, 'UTM_Easting')
     file_header.insert(20, 'UTM_Northing')
     file_header.insert(21, 'UTM_Zone')
+    for j in range(len(join_headers)):
+        file_header.insert(22 + j, join_headers[j])
+
+    #Number of static columns (kept even if blank)
+    static_count = 22 + len(join_headers)
 
     #Add pub_issues (dynamic) to the file_header
     for issue in range(0, max_issue):
@@ -233,6 +239,7 @@ def main():
     csv_writer.writerow(file_header)
     #+++++++++++++++++++++++++++++++++++++++++ Create file content ++++++++++++++++++++++++++++++++++++++++
     print 'Constructing data rows ...'
+    qprofile.set_stage('data rows')
     for sample in sample_list:
         #Create a list to store all values to be writen as a row to the output csv file
         data_row = ['']*len(file_header)
@@ -251,14 +258,12 @@ def main():
         if data_row[16] <> '':
             data_row[16] = str(int(round(float(data_row[16]))))
 
-        #Project to NAD83 geographic if needed
-        [data_row[14], data_row[15]] = project2nad83 (float(sample_row[14]), float(sample_row[15]), int(sample_row[18]))
-
-        #Project to NAD83 UTM if needed
-        [data_row[19], data_row[20], data_row[21]] = project2utm(data_row[14], data_row[15])
+        #NAD83 geographic and UTM coordinates, and NTS mapsheet
+        [data_row[14], data_row[15], data_row[19], data_row[20], data_row[21], data_row[18]] = geo[sample]
 
-        #Get NTS mapsheet
-        data_row[18] = get_ntssheet(nts_mapsheet, data_row[14], data_row[15])
+        #Attributes of the polygons holding the sample
+        for j in range(len(join_headers)):
+            data_row[22 + j] = joined[sample][j]
         
         #Retrieve and populate "analyte_method_unit_size" items (dynamic) in "data_row"         
         cur.execute("""select analyte, abundance, size_frac, method_id, unit_id from data_analyte
@@ -271,10 +276,10 @@ def main():
             size_frac = record[2]
             
             method_id = record[3]
-            method_group = get_name(cur, 'method_group', 'code_method', 'method_id', method_id)
+            method_group = get_name(refcache, 'method_group', 'code_method', 'method_id', method_id)
 
             unit_id = record[4]
-            unit_name = get_name(cur, 'name', 'code_unit', 'unit_id', unit_id)
+            unit_name = get_name(refcache, 'name', 'code_unit', 'unit_id', unit_id)
 
             item = analyte + '_' + method_group + '_' + unit_name + '_' + size_frac
             
@@ -313,6 +318,7 @@ def main():
         csv_writer.writerow(data_row)
           
     csv_output.close()
+    qprofile.report(qprofile_file)
     db_conn.close()
     #+++++++++++++++++++++++++++++++++++++++++ Remove blank columns ++++++++++++++++++++++++++++++++++++++++++
     #The logic used above creates blank columns, which have to be removed
@@ -324,15 +330,15 @@ def main():
     #Get empty column indices
     old_header = old_rows.next()
     col_indx = [0]*len(old_header)
-    col_indx[0:22] = [1]*22
+    col_indx[0:static_count] = [1]*static_count
     for old_row in old_rows:
-        for ci in range(22, len(old_header)):
+        for ci in range(static_count, len(old_header)):
             if old_row[ci] <> '':
                 col_indx[ci] = 1
 
     #Create a temp csv file
     file_path = os.path.dirname(data_sheet)
-    temp_sheet = file_path + '\\temp_sheet.csv'
+    temp_sheet = os.path.join(file_path, 'temp_sheet.csv')
     temp_file = open(temp_sheet, 'wb')
     temp_writer = csv.writer(temp_file, delimiter = ',')
 
@@ -367,7 +373,7 @@ def main():
             p2 = curr_item[curr_item.find('_'):]
             new_header[i] = p1 + p2
 
-    temp_sheet = file_path + '\\temp_sheet.csv'
+    temp_sheet = os.path.join(file_path, 'temp_sheet.csv')
     new_file = open(temp_sheet, 'wb')
     new_writer = csv.writer(new_file, delimiter = ',')
     new_writer.writerow(new_header)              
@@ -406,10 +412,10 @@ def main():
             pub_count = pub_count + 1
     
     #Add the remaining static columns
-    new_header.extend(old_header[3:22])
+    new_header.extend(old_header[3:static_count])
 
     #Extract 'analyte_method_unit_frac' part (dynamic) from the old_header
-    part4sort = old_header[22:(len(old_header) - max_issue)]
+    part4sort = old_header[static_count:(len(old_header) - max_issue)]
     
     method_part = []    #Extract 'method' from part4sort list
     analyte_part = []   #Extract analyte name from part4sort list
@@ -438,7 +444,7 @@ def main():
 
     #Create a temp csv file and write out the new header row
     file_path = os.path.dirname(data_sheet)
-    temp_sheet = file_path + '\\temp_sheet.csv'
+    temp_sheet = os.path.join(file_path, 'temp_sheet.csv')
     new_file = open(temp_sheet, 'wb')
     new_writer = csv.writer(new_file, delimiter = ',')
     new_writer.writerow(new_header)
@@ -459,6 +465,16 @@ def main():
     os.remove(data_sheet)
     os.rename(temp_sheet, data_sheet)
     
+    #Spatial formats of the data product (run with --export=gpkg,fgb, see Additional info 10)
+    export_formats = product_export.get_export_args(sys.argv[1:])
+    if export_formats:
+        product_export.export(data_sheet, export_formats)
+
+    #Vector tiles of the data product (run with --tiles=<column>[,<column>...], see Additional info 11)
+    tiles_fields = product_tiles.get_tiles_args(sys.argv[1:])
+    if tiles_fields is not None:
+        product_tiles.build(data_sheet, tiles_fields, bbox)
+
     print 'Job done!'
     
 if __name__ == "__main__":